@@ -1,6 +1,8 @@
-from fastapi import HTTPException, APIRouter, Request, Depends, BackgroundTasks
-from fastapi.responses import HTMLResponse
+from fastapi import HTTPException, APIRouter, Request, Depends, BackgroundTasks, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 
+import math
 from datetime import datetime, timezone
 from typing import Optional
 from fastapi.responses import JSONResponse
@@ -8,33 +10,40 @@ from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from starlette.responses import HTMLResponse
 
-from server.app.db.db_interaction import get_ntp_v4_historical_measurements
+from server.app.db.db_interaction import get_ntp_v4_historical_measurements, get_historical_ripe_results, \
+    get_ntp_v4_historical_page, decode_history_cursor
+from server.app.db.rollups import choose_history_resolution, get_rollups
 # from server.app.db.db_interaction import get_historical_measurements
 from server.app.utils.convert_measurement_to_format import full_measurement_dn_to_dict, full_measurement_ip_to_dict, \
     partial_measurement_dn_to_dict, ntp_versions_to_dict, partial_measurement_ip_to_dict
-from server.app.utils.domain_name_to_ip import domain_name_to_ip_list
+from server.app.utils.domain_name_to_ip import domain_name_to_ip_list_async
 from server.app.utils.validate import sanitize_string
 from server.app.dtos.full_ntp_measurement import FullMeasurementIP, FullMeasurementDN, NTPVersions
 from server.app.utils.validate import is_ip_address
 from server.app.dtos.AdvancedSettings import AdvancedSettings
 from server.app.utils.nts_check import perform_nts_measurement_domain_name, perform_nts_measurement_ip
-from server.app.utils.load_config_data import get_rate_limit_per_client_ip
+from server.app.utils.load_config_data import get_rate_limit_per_client_ip, get_history_max_page_size
 from server.app.dtos.RipeMeasurementResponse import RipeResult
 from server.app.dtos.NtpMeasurementResponse import MeasurementResponse
 from server.app.dtos.RipeMeasurementTriggerResponse import RipeMeasurementTriggerResponse
-from server.app.utils.location_resolver import get_country_for_ip, get_coordinates_for_ip, get_asn_for_ip
-from server.app.utils.ip_utils import client_ip_fetch, get_server_ip_if_possible, get_server_ip
+from server.app.utils.ip_utils import client_ip_fetch_async, get_vantage_point_if_possible, get_server_ip
 from server.app.models.CustomError import DNSError, MeasurementQueryError
 from server.app.utils.ip_utils import ip_to_str
-from server.app.models.CustomError import InputError, RipeMeasurementError
+from server.app.models.CustomError import InputError, RipeMeasurementError, CircuitOpenError
 from server.app.db_config import get_db
 
 from server.app.services.api_services import fetch_ripe_data, override_desired_ip_type_if_input_is_ip, \
-    complete_this_measurement_dn, complete_this_measurement_ip, check_and_get_settings
+    complete_this_measurement_dn, complete_this_measurement_ip, check_and_get_settings, get_ntp_versions_capabilities
 from server.app.services.api_services import perform_ripe_measurement
 from server.app.rate_limiter import limiter
+from server.app.utils.circuit_breaker import get_circuit_breakers_status
+from server.app.utils.metrics import render_metrics_text
+from server.app.utils.downsampling import MIN_MAX_POINTS, downsample_measurements
+from server.app.utils.measurement_cache import MeasurementCacheKey, get_measurement_max_age, \
+    get_measurement_cache_key, get_cached_measurement, cache_measurement
 from server.app.dtos.MeasurementRequest import MeasurementRequest
-from server.app.services.api_services import get_format, measure, fetch_historic_data_with_timestamps
+from server.app.services.api_services import get_format, measure, fetch_historic_data_with_timestamps, \
+    stream_historic_measurements
 
 router = APIRouter()
 
@@ -61,6 +70,102 @@ def read_root() -> str:
     """
 
 
+@router.get(
+    "/health/",
+    summary="Health of the API and of its external dependencies",
+    description="""
+Report the state of the circuit breakers of the external dependencies (RIPE Atlas, stat.ripe.net, ipify, EDNS resolvers).
+
+- "ok" if all of them are closed, "degraded" otherwise.
+- A dependency appears only after it was used at least once.
+""",
+    responses={
+        200: {"description": "The API is running"}
+    }
+)
+def read_health() -> JSONResponse:
+    """
+    Report the health of the API and the state of the circuit breakers of its external dependencies.
+    The API itself is up if it can answer, so it always returns HTTP 200. The status is "degraded" if at least one
+    dependency is failing (its circuit breaker is not closed), because some measurements may fail fast.
+
+    Returns:
+        JSONResponse: A json response containing:
+            - status (str): "ok" or "degraded".
+            - dependencies (dict): The state, consecutive failures and retry time of each circuit breaker.
+    """
+    dependencies = get_circuit_breakers_status()
+    degraded = any(d["state"] != "closed" for d in dependencies.values())
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status": "degraded" if degraded else "ok",
+            "dependencies": dependencies
+        }
+    )
+
+
+@router.get(
+    "/metrics/",
+    summary="Internal metrics",
+    description="""
+Expose the internal metrics (circuit breakers, outbound HTTP requests...) in the Prometheus text format.
+""",
+    response_class=PlainTextResponse,
+    responses={
+        200: {"description": "The metrics"}
+    }
+)
+def read_metrics() -> str:
+    """
+    Expose the internal metrics in the Prometheus text format. (one "<name>{<labels>} <value>" per line)
+
+    Returns:
+        str: The metrics.
+    """
+    return render_metrics_text()
+
+
+def get_request_max_age(payload: MeasurementRequest) -> float:
+    """
+    It returns how old (seconds) a cached measurement result can be for this request.
+
+    Args:
+        payload (MeasurementRequest): The parameters that the client inputted.
+
+    Returns:
+        float: The maximum age in seconds.
+
+    Raises:
+        HTTPException: 422 - If "max_age" is negative.
+    """
+    try:
+        return get_measurement_max_age(payload.max_age)
+    except InputError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def find_cached_measurement(cache_key: MeasurementCacheKey, max_age: float) -> Optional[JSONResponse]:
+    """
+    It returns the response of a cached measurement result, if there is one that is recent enough.
+    The "Age" header says how old it is, like an HTTP cache.
+
+    Args:
+        cache_key (MeasurementCacheKey): The key of the measurement.
+        max_age (float): How old (seconds) the result can be.
+
+    Returns:
+        Optional[JSONResponse]: The response, or None if there is no result that is recent enough.
+    """
+    cached = get_cached_measurement(cache_key, max_age)
+    if cached is None:
+        return None
+    age_s, content = cached
+    content["from_cache"] = True
+    content["age_s"] = round(age_s, 3)
+    return JSONResponse(status_code=200, content=content, headers={"Age": str(int(age_s))})
+
+
 @router.post(
     "/measurements/",
     summary="Perform a live NTP measurement",
@@ -69,6 +174,7 @@ Compute a live NTP synchronization measurement for a specified server.
 
 - Accepts an IP or domain name.
 - Returns data about the measurement
+- A recent result of the same measurement from the same network is reused. Use "max_age" to choose how old it can be (0 forces a new measurement).
 - Limited to 5 requests per second.
 """,
     response_model=MeasurementResponse,
@@ -95,17 +201,19 @@ async def read_data_measurement(payload: MeasurementRequest, request: Request,
             A Pydantic model containing:
                 - server (str): IP address (IPv4/IPv6) or domain name of the NTP server.
                 - ipv6_measurement (bool): True if the type of IPs that we want to measure is IPv6. False otherwise.
+                - max_age (Optional[float]): How old (seconds) a cached result can be. 0 forces a new measurement.
         request (Request): The Request object that gives you the IP of the client.
         session (Session): The currently active database session.
 
     Returns:
-        JSONResponse: A json response containing a list of formatted measurements under "measurements".
+        JSONResponse: A json response containing a list of formatted measurements under "measurement",
+        whether they come from the cache ("from_cache") and how old they are. ("age_s")
 
     Raises:
         HTTPException: 400 - If the `server` field is empty or no response.
         HTTPException: 422 - If the server cannot perform the desired IP type (IPv4 or IPv6) measurements,
-              or if the domain name could not be resolved.
-        HTTPException: 503 - If we could not get client IP address or our server's IP address.
+              if the domain name could not be resolved, or if "max_age" is negative.
+        HTTPException: 503 - If we could not get the client IP address.
         HTTPException: 500 - If an unexpected server error occurs.
 
     Notes:
@@ -114,6 +222,7 @@ async def read_data_measurement(payload: MeasurementRequest, request: Request,
     server = payload.server
     if len(server) == 0:
         raise HTTPException(status_code=400, detail="Either 'ip' or 'dn' must be provided.")
+    max_age = get_request_max_age(payload)
 
     wanted_ip_type = 6 if payload.ipv6_measurement else 4
     # Override it if we received an IP, not a domain name:
@@ -127,18 +236,26 @@ async def read_data_measurement(payload: MeasurementRequest, request: Request,
                             detail=f"Our server cannot perform IPv{wanted_ip_type} measurements currently. Try the other IP type.")
 
     # get the client IP (the same type as wanted_ip_type)
-    client_ip: Optional[str] = client_ip_fetch(request=request, wanted_ip_type=wanted_ip_type)
+    client_ip: Optional[str] = await client_ip_fetch_async(request=request, wanted_ip_type=wanted_ip_type)
+    cache_key = get_measurement_cache_key("live", server, wanted_ip_type, client_ip, {})
+    cached_response = find_cached_measurement(cache_key, max_age)
+    if cached_response is not None:
+        return cached_response
     try:
-        response = measure(server, wanted_ip_type, session, client_ip)
+        # the measurement blocks (NTP requests and DNS queries), so it must not run in this event loop
+        response = await run_in_threadpool(measure, server, wanted_ip_type, session, client_ip)
         if response is not None:
             new_format = []
             for r in response:
                 result, jitter, nr_jitter_measurements = r
                 new_format.append(get_format(result, jitter, nr_jitter_measurements))
+            cache_measurement(cache_key, {"measurement": new_format})
             return JSONResponse(
                 status_code=200,
                 content={
-                    "measurement": new_format
+                    "measurement": new_format,
+                    "from_cache": False,
+                    "age_s": 0.0
                 }
             )
         else:
@@ -154,6 +271,180 @@ async def read_data_measurement(payload: MeasurementRequest, request: Request,
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}.")
 
 
+def check_history_range(server: str, start: datetime, end: datetime) -> None:
+    """
+    It checks the server and the time range of the historical measurements.
+
+    Args:
+        server (str): IP address or domain name of the NTP server.
+        start (datetime): The start of the time range.
+        end (datetime): The end of the time range.
+
+    Raises:
+        HTTPException: 400 - If the server is empty, if start is not earlier than end, or if end is in the future.
+    """
+    if len(server) == 0:
+        raise HTTPException(status_code=400, detail="Either 'ip' or 'domain name' must be provided")
+
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'start' must be earlier than 'end'")
+
+    if end > datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="'end' cannot be in the future")
+
+
+def check_history_page(limit: Optional[int], cursor: Optional[str]) -> None:
+    """
+    It checks the pagination parameters of the historical measurements.
+
+    Args:
+        limit (Optional[int]): The maximum number of measurements in the page.
+        cursor (Optional[str]): The cursor of the page.
+
+    Raises:
+        HTTPException: 400 - If the limit is not between 1 and the maximum page size, or if the cursor is invalid.
+    """
+    max_page_size = get_history_max_page_size()
+    if limit is not None and not 0 < limit <= max_page_size:
+        raise HTTPException(status_code=400, detail=f"'limit' must be between 1 and {max_page_size}")
+    if cursor is not None:
+        try:
+            decode_history_cursor(cursor)
+        except InputError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+def check_history_mode(limit: Optional[int], cursor: Optional[str], stream: bool, point_budget: Optional[int],
+                       max_points: Optional[int]) -> None:
+    """
+    It checks that only one way of returning the historical measurements is asked: a page ("limit" and "cursor"),
+    a stream (which may start after a "cursor"), a point budget or max_points.
+
+    Args:
+        limit (Optional[int]): The maximum number of measurements in the page.
+        cursor (Optional[str]): The cursor of the page, or where the stream starts.
+        stream (bool): Whether to stream the measurements.
+        point_budget (Optional[int]): The maximum number of points wanted.
+        max_points (Optional[int]): The maximum number of downsampled measurements.
+
+    Raises:
+        HTTPException: 400 - If several of them are combined.
+    """
+    modes = []
+    if stream:
+        modes.append("'stream'")
+    if point_budget is not None:
+        modes.append("'point_budget'")
+    if max_points is not None:
+        modes.append("'max_points'")
+    if limit is not None or (cursor is not None and not stream):
+        modes.append("'limit'/'cursor'")
+    if len(modes) > 1:
+        raise HTTPException(status_code=400, detail=f"{', '.join(modes)} cannot be used together")
+
+
+def read_historic_page(session: Session, server: str, start: datetime, end: datetime, limit: int,
+                       cursor: Optional[str]) -> JSONResponse:
+    """
+    It returns a page of historical measurements and the cursor of the next page. (None after the last page)
+
+    Args:
+        session (Session): The currently active database session.
+        server (str): IP address or domain name of the NTP server.
+        start (datetime): The start of the time range.
+        end (datetime): The end of the time range.
+        limit (int): The maximum number of measurements in the page.
+        cursor (Optional[str]): The cursor of the page. (None for the first page)
+
+    Returns:
+        JSONResponse: The measurements under "measurements", and "next_cursor".
+
+    Raises:
+        HTTPException: 500 - If there's an error with accessing the database.
+    """
+    try:
+        measurements, next_cursor = get_ntp_v4_historical_page(session, server, start, end, limit, cursor)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There was an error with accessing the database: {str(e)}.")
+    return JSONResponse(
+        status_code=200,
+        content={
+            "measurements": measurements,
+            "next_cursor": next_cursor
+        }
+    )
+
+
+def read_historic_with_budget(session: Session, server: str, start: datetime, end: datetime,
+                              point_budget: int) -> JSONResponse:
+    """
+    It returns the historical measurements of a server with at most about "point_budget" points: the raw measurements
+    if there are not more of them, otherwise the finest rollups (see choose_history_resolution) that fit in it.
+
+    Args:
+        session (Session): The currently active database session.
+        server (str): IP address or domain name of the NTP server.
+        start (datetime): The start of the time range.
+        end (datetime): The end of the time range.
+        point_budget (int): The maximum number of points wanted.
+
+    Returns:
+        JSONResponse: "resolution_s" and the raw "measurements" (resolution 0) or the "buckets".
+
+    Raises:
+        HTTPException: 400 - If the point budget is not positive.
+        HTTPException: 500 - If there's an error with accessing the database.
+    """
+    if point_budget <= 0:
+        raise HTTPException(status_code=400, detail="'point_budget' must be > 0")
+    try:
+        resolution_s = choose_history_resolution(session, server, start, end, point_budget)
+        if resolution_s == 0:
+            content = {"resolution_s": 0,
+                       "measurements": get_ntp_v4_historical_measurements(session, server, start, end)}
+        else:
+            content = {"resolution_s": resolution_s,
+                       "buckets": get_rollups(session, server, start, end, resolution_s)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There was an error with accessing the database: {str(e)}.")
+    return JSONResponse(status_code=200, content=content)
+
+
+def read_historic_downsampled(session: Session, server: str, start: datetime, end: datetime,
+                              max_points: int) -> JSONResponse:
+    """
+    It returns at most "max_points" historical measurements of a server, chosen to keep the shape of the offset
+    and RTT series in the charts. (see downsample_measurements)
+
+    Args:
+        session (Session): The currently active database session.
+        server (str): IP address or domain name of the NTP server.
+        start (datetime): The start of the time range.
+        end (datetime): The end of the time range.
+        max_points (int): The maximum number of measurements.
+
+    Returns:
+        JSONResponse: The kept "measurements", and "total_measurements" in the time range.
+
+    Raises:
+        HTTPException: 400 - If max_points is too small.
+        HTTPException: 500 - If there's an error with accessing the database.
+    """
+    if max_points < MIN_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"'max_points' must be at least {MIN_MAX_POINTS}")
+    try:
+        measurements = get_ntp_v4_historical_measurements(session, server, start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There was an error with accessing the database: {str(e)}.")
+    return JSONResponse(
+        status_code=200,
+        content={
+            "measurements": downsample_measurements(measurements, max_points),
+            "total_measurements": len(measurements)
+        }
+    )
+
+
 @router.get(
     "/measurements/history/",
     summary="Retrieve historic NTP measurements",
@@ -163,6 +454,11 @@ Fetch historic NTP measurement data for a given server over a specified time ran
 - Accepts a server IP or domain name.
 - Filters data between `start` and `end` timestamps (UTC).
 - Rejects queries with invalid or future timestamps.
+- With `limit`, returns a page of measurements and a `next_cursor` to pass as `cursor` for the next page.
+- With `stream`, streams all the measurements (after `cursor`, if set) chunk by chunk.
+- With `point_budget`, returns the raw measurements if there are not more of them than the budget, otherwise the statistics of the finest time buckets (1 minute, 1 hour or 1 day) that fit in the budget.
+- With `max_points`, returns at most this many measurements, downsampled (LTTB) to keep the shape of the offset and RTT series.
+- `limit`, `stream`, `point_budget` and `max_points` cannot be combined (`cursor` goes with `limit` or `stream`).
 - Limited to 5 requests per second.
 """,
     response_model=MeasurementResponse,
@@ -175,7 +471,9 @@ Fetch historic NTP measurement data for a given server over a specified time ran
 @limiter.limit(get_rate_limit_per_client_ip())
 async def read_historic_data_time(server: str,
                                   start: datetime, end: datetime, request: Request,
-                                  session: Session = Depends(get_db)) -> JSONResponse:
+                                  limit: Optional[int] = None, cursor: Optional[str] = None, stream: bool = False,
+                                  point_budget: Optional[int] = None, max_points: Optional[int] = None,
+                                  session: Session = Depends(get_db)) -> Response:
     """
     Retrieve historic NTP measurements for a given server and optional time range.
 
@@ -188,15 +486,95 @@ async def read_historic_data_time(server: str,
         start (datetime, optional): Start timestamp for data filtering.
         end (datetime, optional): End timestamp for data filtering.
         request (Request): Request object for making the limiter work.
+        limit (Optional[int]): If set, the maximum number of measurements in the page. (pagination)
+        cursor (Optional[str]): If set, the measurements start right after it. (the "next_cursor" of the previous page)
+        stream (bool): Whether to stream all the measurements in chunks, instead of building the whole response.
+        point_budget (Optional[int]): If set, the maximum number of points wanted. (raw measurements or buckets)
+        max_points (Optional[int]): If set, the maximum number of measurements, downsampled for the charts.
         session (Session): The currently active database session.
 
     Returns:
-        JSONResponse: A json response containing a list of formatted measurements under "measurements".
+        Response: A json response containing a list of formatted measurements under "measurements",
+        and "next_cursor" for the pages. With a point budget, "resolution_s" says whether it contains
+        the raw "measurements" (0) or "buckets" of this length. With max_points, "total_measurements"
+        is the number of measurements before downsampling.
 
     Raises:
-        HTTPException: 400 - If `server` parameter is empty, or the start and end dates are badly formatted (e.g., `start >= end`, `end` in future).
+        HTTPException: 400 - If `server` parameter is empty, or the start and end dates are badly formatted (e.g., `start >= end`, `end` in future),
+            or if the limit, the cursor, the point budget or max_points is invalid, or if several of them are combined.
         HTTPException: 500 - If there's an internal server error, such as a database access issue (`MeasurementQueryError`) or any other unexpected server-side exception.
 
+    Notes:
+        - This endpoint is also limited to <`see config file`> to prevent abuse and reduce server load.
+    """
+    check_history_range(server, start, end)
+    check_history_mode(limit, cursor, stream, point_budget, max_points)
+    check_history_page(limit, cursor)
+    if stream:
+        return StreamingResponse(stream_historic_measurements(server, start, end, cursor),
+                                 media_type="application/json")
+    if point_budget is not None:
+        return await run_in_threadpool(read_historic_with_budget, session, server, start, end, point_budget)
+    if max_points is not None:
+        return await run_in_threadpool(read_historic_downsampled, session, server, start, end, max_points)
+    if limit is not None or cursor is not None:
+        return await run_in_threadpool(read_historic_page, session, server, start, end,
+                                       limit or get_history_max_page_size(), cursor)
+    try:
+        # result = fetch_historic_data_with_timestamps(server, start, end, session)
+        # formatted_results = [get_format(entry, nr_jitter_measurements=0) for entry in result]
+        result = get_ntp_v4_historical_measurements(session, host=server, start_time=start, end_time=end)
+        return JSONResponse(
+            status_code=200,
+            content={
+                "measurements": result
+            }
+        )
+    except MeasurementQueryError as e:
+        raise HTTPException(status_code=500, detail=f"There was an error with accessing the database: {str(e)}.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Sever error: {str(e)}.")
+
+
+@router.get(
+    "/measurements/history/ripe/",
+    summary="Retrieve historic RIPE Atlas measurements",
+    description="""
+Fetch the saved RIPE Atlas results for a given server over a specified time range.
+
+- Accepts a server IP or domain name.
+- Returns the results of every probe (vantage point) of the finished RIPE measurements.
+- Filters data between `start` and `end` timestamps (UTC).
+- Rejects queries with invalid or future timestamps.
+- Limited to 5 requests per second.
+""",
+    responses={
+        200: {"description": "Successful retrieval of historic RIPE measurements"},
+        400: {"description": "Invalid parameters or malformed datetime values"},
+        500: {"description": "Server error or database access issue"}
+    }
+)
+@limiter.limit(get_rate_limit_per_client_ip())
+async def read_historic_ripe_data_time(server: str,
+                                       start: datetime, end: datetime, request: Request,
+                                       session: Session = Depends(get_db)) -> JSONResponse:
+    """
+    Retrieve the saved RIPE Atlas results for a given server in a time range.
+
+    Args:
+        server (str): IP address or domain name of the NTP server.
+        start (datetime): Start timestamp for data filtering.
+        end (datetime): End timestamp for data filtering.
+        request (Request): Request object for making the limiter work.
+        session (Session): The currently active database session.
+
+    Returns:
+        JSONResponse: A json response containing a list of RIPE results (one per probe) under "measurements".
+
+    Raises:
+        HTTPException: 400 - If `server` parameter is empty, or the start and end dates are badly formatted (e.g., `start >= end`, `end` in future).
+        HTTPException: 500 - If there's an internal server error, such as a database access issue.
+
     Notes:
         - This endpoint is also limited to <`see config file`> to prevent abuse and reduce server load.
     """
@@ -210,9 +588,7 @@ async def read_historic_data_time(server: str,
         raise HTTPException(status_code=400, detail="'end' cannot be in the future")
 
     try:
-        # result = fetch_historic_data_with_timestamps(server, start, end, session)
-        # formatted_results = [get_format(entry, nr_jitter_measurements=0) for entry in result]
-        result = get_ntp_v4_historical_measurements(session, host=server, start_time=start, end_time=end)
+        result = get_historical_ripe_results(session, host=server, start_time=start, end_time=end)
         return JSONResponse(
             status_code=200,
             content={
@@ -263,11 +639,12 @@ async def trigger_full_measurement(payload: MeasurementRequest, request: Request
         settings = check_and_get_settings(payload)
     except Exception as e:
         raise HTTPException(status_code=422, detail=str(e))
+    max_age = get_request_max_age(payload)
 
     # if the client wants to use its IP address
     if settings.custom_client_ip == "":
         # get the client IP (the same type as wanted_ip_type)
-        client_ip: Optional[str] = client_ip_fetch(request=request, wanted_ip_type=settings.wanted_ip_type)
+        client_ip: Optional[str] = await client_ip_fetch_async(request=request, wanted_ip_type=settings.wanted_ip_type)
         # just in case
         if client_ip is None:
             raise HTTPException(status_code=503, detail="Could not retrieve the client IP address.")
@@ -275,6 +652,13 @@ async def trigger_full_measurement(payload: MeasurementRequest, request: Request
 
     # from now on, we would consider "settings.custom_client_ip" to be the client_ip
 
+    # the same full measurement from the same network was triggered recently: the client gets its ID
+    cache_key = get_measurement_cache_key("full", server, settings.wanted_ip_type, settings.custom_client_ip,
+                                          settings.model_dump(exclude={"custom_client_ip"}))
+    cached_response = find_cached_measurement(cache_key, max_age)
+    if cached_response is not None:
+        return cached_response
+
     prefix_id = ""
     id = ""
     status = ""
@@ -297,7 +681,7 @@ async def trigger_full_measurement(payload: MeasurementRequest, request: Request
     else:
         # firstly validate that the domain name exists
         try:
-            dn_ips = domain_name_to_ip_list(server, settings.custom_client_ip, settings.wanted_ip_type)
+            dn_ips = await domain_name_to_ip_list_async(server, settings.custom_client_ip, settings.wanted_ip_type)
         except Exception as e:
             raise HTTPException(status_code=422, detail="Domain name is invalid or cannot be resolved.")
         # now we are sure the domain name has at least an IP address
@@ -315,11 +699,14 @@ async def trigger_full_measurement(payload: MeasurementRequest, request: Request
         id = str(full_m_dn.id_m_dn)
         # add content to this measurement
         background_tasks.add_task(complete_this_measurement_dn, full_m_dn.id_m_dn, dn_ips, settings)
+    cache_measurement(cache_key, {"id": prefix_id + str(id), "status": status})
     return JSONResponse(
         status_code=200,
         content={
             "id": prefix_id + str(id),
-            "status": status
+            "status": status,
+            "from_cache": False,
+            "age_s": 0.0
         })
 
 
@@ -461,6 +848,47 @@ async def poll_ntp_versions(m_id: Optional[int], request: Request, session: Sess
         content=ntp_versions_to_dict(session, m_vs))
 
 
+@router.get(
+    "/measurements/ntp-capabilities/",
+    summary="get the NTP versions supported by a server",
+    description="""
+Get the NTP versions supported by a server (with a confidence from 0 to 100 for each version).
+The analysis is cached, so it is returned instantly if the server was analysed recently. Use "refresh" to analyse it again.
+""",
+    responses={
+        200: {"description": "The NTP versions supported by the server"},
+        400: {"description": "Invalid server"},
+        503: {"description": "The NTP versions could not be analysed"},
+    }
+)
+@limiter.limit(get_rate_limit_per_client_ip())
+async def read_ntp_capabilities(server: str, request: Request, ntpv5_draft: str = "",
+                                refresh: bool = False) -> JSONResponse:
+    """
+    This API returns which NTP versions a server supports. It uses the cached analysis if it is available.
+    Args:
+        server (str): IP address or domain name of the NTP server.
+        request (Request): The Request object that gives you the IP of the client.
+        ntpv5_draft (str): The NTPv5 draft to use.
+        refresh (bool): Whether to analyse the NTP versions again, even if a cached analysis is available.
+    Returns:
+        JSONResponse: The confidence and the analysis of each NTP version, and how old the analysis is.
+    Raises:
+        HTTPException: 400 - If the `server` is empty.
+        HTTPException: 503 - If the NTP versions could not be analysed.
+    """
+    server = server.strip()
+    if len(server) == 0:
+        raise HTTPException(status_code=400, detail="Either 'ip' or 'dn' must be provided.")
+    try:
+        ans = await run_in_threadpool(get_ntp_versions_capabilities, server, ntpv5_draft, refresh)
+    except MeasurementQueryError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse(
+        status_code=200,
+        content=ans)
+
+
 @router.get(
     "/measurements/ntpinfo-server-details/{ip_type}",
     summary="get measurement results",
@@ -487,15 +915,15 @@ async def get_this_server_details(ip_type: Optional[int], request: Request,
     """
     if ip_type is None:
         ip_type = 4
-    this_server_ip = get_server_ip_if_possible(ip_type)  # it should always return an IP address
+    vantage_point = get_vantage_point_if_possible(ip_type)  # it is kept in memory (and refreshed in the background)
     return JSONResponse(
         status_code=200,
         content={
-            "vantage_point_ip": ip_to_str(this_server_ip),
-            "vantage_point_asn": get_asn_for_ip(str(this_server_ip)) if this_server_ip is not None else None,
+            "vantage_point_ip": ip_to_str(vantage_point.ip) if vantage_point is not None else None,
+            "vantage_point_asn": vantage_point.asn if vantage_point is not None else None,
             "vantage_point_location": {
-                "country_code": get_country_for_ip(ip_to_str(this_server_ip)),
-                "coordinates": get_coordinates_for_ip(ip_to_str(this_server_ip))
+                "country_code": vantage_point.country_code if vantage_point is not None else None,
+                "coordinates": vantage_point.coordinates if vantage_point is not None else None
             },
             "ripe_message": "You can fetch ripe results at /measurements/ripe/{measurement_id}",
             "ntpv_message": "You can fetch ntp versions analysis results at /measurements/ntp_versions/{m_id}",
@@ -548,10 +976,11 @@ async def perform_and_read_nts_measurement(payload: MeasurementRequest, request:
     settings.wanted_ip_type = wanted_ip_type
 
     ans: dict = {}
+    # the ntp-nts tool blocks until it exits, so it must not run in this event loop
     if is_ip_address(server) is None:  # domain name case
-        ans = perform_nts_measurement_domain_name(server, settings)
+        ans = await run_in_threadpool(perform_nts_measurement_domain_name, server, settings)
     else:
-        ans = perform_nts_measurement_ip(server)
+        ans = await run_in_threadpool(perform_nts_measurement_ip, server)
         # add this warning to make things clear (It is hard to try to find the right domain name of an IP address)
         ans["warning_ip"] = "NTS measurements on IPs cannot check TLS certificate."
     return JSONResponse(
@@ -576,7 +1005,7 @@ Initiate a RIPE Atlas NTP measurement for the specified server.
         200: {"description": "Measurement successfully initiated"},
         400: {"description": "Invalid input parameters"},
         502: {"description": "RIPE Atlas measurement failed after initiation"},
-        503: {"description": "Failed to retrieve client or server IP"},
+        503: {"description": "Failed to retrieve client or server IP, or RIPE Atlas is temporarily unavailable"},
         500: {"description": "Internal server error"}
     }
 )
@@ -608,7 +1037,8 @@ async def trigger_ripe_measurement(payload: MeasurementRequest, request: Request
         HTTPException: 400 - If the `server` field is invalid.
         HTTPException: 500 - If the RIPE measurement could not be initiated.
         HTTPException: 502 - If the RIPE measurement was initiated but failed.
-        HTTPException: 503 - If we could not get client IP address or our server's IP address.
+        HTTPException: 503 - If we could not get the client IP address,
+                             or if RIPE Atlas failed too many times recently. (circuit breaker is open)
 
     Notes:
         - This endpoint is also limited to <`see config file`> to prevent abuse and reduce server load.
@@ -618,19 +1048,21 @@ async def trigger_ripe_measurement(payload: MeasurementRequest, request: Request
     if len(server) == 0:
         raise HTTPException(status_code=400, detail="Either 'ip' or 'dn' must be provided")
 
-    client_ip: Optional[str] = client_ip_fetch(request=request, wanted_ip_type=wanted_ip_type)
+    client_ip: Optional[str] = await client_ip_fetch_async(request=request, wanted_ip_type=wanted_ip_type)
     print("client IP is: ", client_ip)
     try:
-        measurement_id = perform_ripe_measurement(server, client_ip=client_ip, wanted_ip_type=wanted_ip_type)
-        this_server_ip = get_server_ip_if_possible(wanted_ip_type)  # this does not affect the measurement
+        # run in a worker thread, so that the other requests can join the same RIPE batch meanwhile
+        measurement_id = await run_in_threadpool(perform_ripe_measurement, server, client_ip=client_ip,
+                                                 wanted_ip_type=wanted_ip_type)
+        vantage_point = get_vantage_point_if_possible(wanted_ip_type)  # this does not affect the measurement
         return JSONResponse(
             status_code=200,
             content={
                 "measurement_id": measurement_id,
-                "vantage_point_ip": ip_to_str(this_server_ip),
+                "vantage_point_ip": ip_to_str(vantage_point.ip) if vantage_point is not None else None,
                 "vantage_point_location": {
-                    "country_code": get_country_for_ip(ip_to_str(this_server_ip)),
-                    "coordinates": get_coordinates_for_ip(ip_to_str(this_server_ip))
+                    "country_code": vantage_point.country_code if vantage_point is not None else None,
+                    "coordinates": vantage_point.coordinates if vantage_point is not None else None
                 },
                 "status": "started",
                 "message": "You can fetch the result at /measurements/ripe/{measurement_id}",
@@ -640,6 +1072,10 @@ async def trigger_ripe_measurement(payload: MeasurementRequest, request: Request
         print(e)
         raise HTTPException(status_code=400,
                             detail=f"Input parameter is invalid. Failed to initiate measurement: {str(e)}")
+    except CircuitOpenError as e:
+        print(e)
+        raise HTTPException(status_code=503, detail=f"RIPE Atlas is temporarily unavailable: {str(e)}",
+                            headers={"Retry-After": str(math.ceil(e.retry_after_s))})
     except RipeMeasurementError as e:
         print(e)
         raise HTTPException(status_code=502, detail=f"Ripe measurement initiated, but it failed: {str(e)}")
@@ -666,12 +1102,14 @@ Retrieve the result of a previously triggered RIPE Atlas NTP measurement.
         202: {"description": "Measurement still being processed"},
         206: {"description": "Partial results available"},
         405: {"description": "RIPE API error"},
+        503: {"description": "RIPE Atlas is temporarily unavailable"},
         504: {"description": "Timeout or incomplete probe data"},
         500: {"description": "Internal server error"}
     }
 )
 @limiter.limit(get_rate_limit_per_client_ip())
-async def get_ripe_measurement_result(measurement_id: str, request: Request) -> JSONResponse:
+async def get_ripe_measurement_result(measurement_id: str, request: Request,
+                                      session: Session = Depends(get_db)) -> JSONResponse:
     """
     Retrieve the results of a previously triggered RIPE Atlas measurement.
 
@@ -679,10 +1117,12 @@ async def get_ripe_measurement_result(measurement_id: str, request: Request) ->
     if the measurement is complete (all probes responded, or measurement was stopped by RIPE Atlas) and returns
     the data accordingly. If the results are not yet ready, it informs the client
     that the measurement is still pending, or that partial results have been returned.
+    The results of a complete measurement are saved, so they are served from the database afterward.
 
     Args:
         measurement_id (str): The ID of the RIPE measurement to fetch.
         request (Request): The FastAPI Request object (used for rate limiting).
+        session (Session): The currently active database session.
 
     Returns:
         JSONResponse: A JSON-formatted HTTP response containing the measurement status and results:
@@ -724,6 +1164,7 @@ async def get_ripe_measurement_result(measurement_id: str, request: Request) ->
 
     Raises:
         HTTPException: 405 - If the RIPE API request fails (e.g., network or service error).
+        HTTPException: 503 - If RIPE Atlas failed too many times recently. (circuit breaker is open)
         HTTPException: 500 - If an unexpected internal error occurs during processing.
 
     Notes:
@@ -731,7 +1172,7 @@ async def get_ripe_measurement_result(measurement_id: str, request: Request) ->
         - The endpoint is rate-limited to <`see config file`> to prevent abuse and manage system load.
     """
     try:
-        ripe_measurement_result, status = fetch_ripe_data(measurement_id=measurement_id)
+        ripe_measurement_result, status = fetch_ripe_data(measurement_id=measurement_id, session=session)
         if not ripe_measurement_result:
             return JSONResponse(status_code=202, content="Measurement is still being processed.")
         if status == "Complete":
@@ -760,6 +1201,10 @@ async def get_ripe_measurement_result(measurement_id: str, request: Request) ->
                 "message": "RIPE data likely completed but incomplete probe responses."
             }
         )
+    except CircuitOpenError as e:
+        print(e)
+        raise HTTPException(status_code=503, detail=f"RIPE Atlas is temporarily unavailable: {str(e)}",
+                            headers={"Retry-After": str(math.ceil(e.retry_after_s))})
     except RipeMeasurementError as e:
         print(e)
         raise HTTPException(status_code=405, detail=f"RIPE call failed: {str(e)}. Try again later!")
@@ -1,14 +1,19 @@
 from datetime import datetime, timezone
 from ipaddress import IPv4Address, IPv6Address, ip_address
 
-from sqlalchemy import Row
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, insert, select, Select, or_, and_, func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, selectinload, aliased
 
-from server.app.dtos.full_ntp_measurement import NTPv4Measurement
+from server.app.dtos.full_ntp_measurement import NTPv4Measurement, NTPv4ServerInfo, RipeProbeResult, \
+    ripe_format_to_row
 from server.app.utils.convert_measurement_to_format import full_measurement_dn_to_dict, full_measurement_ip_to_dict, \
-    ntpv4_or_v5_measurement_to_dict, ntpv4_measurement_to_dict
+    ntpv4_measurement_to_dict, ripe_probe_result_to_dict, load_measurements
 from server.app.dtos.full_ntp_measurement import FullMeasurementDN, FullMeasurementIP
-from server.app.utils.validate import sanitize_string
+from server.app.utils.validate import sanitize_string, is_ip_address
+from server.app.db.server_stats import lock_or_create_servers_stats, add_to_server_stats
+from server.app.services.NtpCalculator import NtpCalculator
 from server.app.dtos.ProbeData import ServerLocation
 from server.app.utils.location_resolver import get_country_for_ip, get_coordinates_for_ip
 from server.app.dtos.NtpExtraDetails import NtpExtraDetails
@@ -23,7 +28,8 @@ from server.app.dtos.NtpMeasurement import NtpMeasurement
 from server.app.models.CustomError import InvalidMeasurementDataError
 from server.app.models.CustomError import DatabaseInsertError
 from server.app.models.CustomError import MeasurementQueryError
-from typing import Any, List
+from server.app.models.CustomError import InputError
+from typing import Any, List, Optional, Iterable, Iterator
 
 
 def row_to_dict(m: Measurement, t: Time) -> dict[str, Any]:
@@ -148,14 +154,122 @@ def rows_to_measurements(rows: list[Row[tuple[Measurement, Time]]]) -> list[NtpM
     return [dict_to_measurement(d) for d in rows_to_dicts(rows)]
 
 
-def insert_measurement(measurement: NtpMeasurement, session: Session) -> None:
+def measurement_to_rows(measurement: NtpMeasurement) -> tuple[dict[str, Any], dict[str, Any]]:
     """
-    Inserts a new NTP measurement into the database. Before inserting, it sanitizes the string fields,
+    Converts an NTP measurement to its `times` and `measurements` rows. Before that, it sanitizes the string fields,
     because some fields may have a null character at the end which should be removed.
 
+    Args:
+        measurement (NtpMeasurement): The measurement data to store.
+
+    Returns:
+        tuple[dict[str, Any], dict[str, Any]]: The time row and the measurement row. (without its `time_id`)
+    """
+    time = {
+        "client_sent": measurement.timestamps.client_sent_time.seconds,
+        "client_sent_prec": measurement.timestamps.client_sent_time.fraction,
+        "server_recv": measurement.timestamps.server_recv_time.seconds,
+        "server_recv_prec": measurement.timestamps.server_recv_time.fraction,
+        "server_sent": measurement.timestamps.server_sent_time.seconds,
+        "server_sent_prec": measurement.timestamps.server_sent_time.fraction,
+        "client_recv": measurement.timestamps.client_recv_time.seconds,
+        "client_recv_prec": measurement.timestamps.client_recv_time.fraction
+    }
+    measurement_entry = {
+        "vantage_point_ip": ip_to_str(measurement.vantage_point_ip),
+        "ntp_server_ip": ip_to_str(measurement.server_info.ntp_server_ip),
+        "ntp_server_name": sanitize_string(measurement.server_info.ntp_server_name),
+        "ntp_version": measurement.server_info.ntp_version,
+        "ntp_server_ref_parent": sanitize_string(ip_to_str(measurement.server_info.ntp_server_ref_parent_ip)),
+        "ref_name": sanitize_string(measurement.server_info.ref_name),
+        "time_offset": measurement.main_details.offset,
+        "rtt": measurement.main_details.rtt,
+        "stratum": measurement.main_details.stratum,
+        "precision": measurement.main_details.precision,
+        "reachability": sanitize_string(measurement.main_details.reachability),
+        "root_delay": measurement.extra_details.root_delay.seconds,
+        "root_delay_prec": measurement.extra_details.root_delay.fraction,
+        "poll": measurement.extra_details.poll,
+        "root_dispersion": measurement.extra_details.root_dispersion.seconds,
+        "root_dispersion_prec": measurement.extra_details.root_dispersion.fraction,
+        "ntp_last_sync_time": measurement.extra_details.ntp_last_sync_time.seconds,
+        "ntp_last_sync_time_prec": measurement.extra_details.ntp_last_sync_time.fraction
+    }
+    return time, measurement_entry
+
+
+def bulk_insert_measurement_rows(session: Session, measurements: list[NtpMeasurement]) -> list[int]:
+    """
+    Writes the `times` and `measurements` rows of many NTP measurements with two multi-row
+    `INSERT ... RETURNING` statements: the IDs of the times (in the order of the rows) are put in the measurements.
+    SQLAlchemy sends the rows in pages of multi-row VALUES, so it works the same for a few measurements
+    (a request) and for many of them (a sweep, a background job). It does not commit.
+
+    Args:
+        session (Session): The currently active database session.
+        measurements (list[NtpMeasurement]): The measurements to store.
+
+    Returns:
+        list[int]: The IDs of the stored measurements, in the same order.
+    """
+    if len(measurements) == 0:
+        return []
+    rows = [measurement_to_rows(m) for m in measurements]
+    time_ids = session.execute(
+        insert(Time).returning(Time.id, sort_by_parameter_order=True),
+        [time for time, _ in rows]
+    ).scalars().all()
+    return list(session.execute(
+        insert(Measurement).returning(Measurement.id, sort_by_parameter_order=True),
+        [{**measurement_entry, "time_id": time_id} for (_, measurement_entry), time_id in zip(rows, time_ids)]
+    ).scalars().all())
+
+
+def insert_measurements(measurements: list[NtpMeasurement], session: Session) -> list[int]:
+    """
+    Inserts several NTP measurements (for example, those of all the IPs of a domain name, or of a sweep)
+    into the database, in a single transaction, with the statistics of their servers (see server_stats).
+
+    The statistics of the servers are locked with one query, the rows are written in bulk
+    (see bulk_insert_measurement_rows), and there is one commit. If any insert fails, the transaction is rolled back.
+
+    Args:
+        measurements (list[NtpMeasurement]): The measurements to store.
+        session (Session): The currently active database session.
+
+    Returns:
+        list[int]: The IDs of the stored measurements, in the same order.
+
+    Raises:
+        DatabaseInsertError: If inserting the measurements or timestamps fails.
+    """
+    if len(measurements) == 0:
+        return []
+    try:
+        server_ips = [ip_to_str(m.server_info.ntp_server_ip) for m in measurements]
+        all_stats = lock_or_create_servers_stats(session, server_ips)
+        ids = bulk_insert_measurement_rows(session, measurements)
+        for measurement, ip in zip(measurements, server_ips):
+            if ip is not None:
+                add_to_server_stats(all_stats[ip], NtpCalculator.calculate_offset(measurement.timestamps),
+                                    measurement.main_details.rtt, measurement.main_details.stratum,
+                                    sanitize_string(measurement.server_info.ref_name),
+                                    sanitize_string(ip_to_str(measurement.server_info.ntp_server_ref_parent_ip)))
+        session.commit()
+        return ids
+    except Exception as e:
+        session.rollback()
+        raise DatabaseInsertError(f"Failed to insert measurements: {e}")
+
+
+def insert_measurement(measurement: NtpMeasurement, session: Session) -> None:
+    """
+    Inserts a new NTP measurement into the database. (see insert_measurements)
+
     This function stores both the raw timestamps (in the `times` table) and the
     processed measurement data (in the `measurements` table).
     It wraps operations in a single transaction to ensure consistency and atomicity.
+    The statistics of the server (see server_stats) are updated in the same transaction.
     If any insert fails, the transaction is rolled back.
 
     Args:
@@ -171,46 +285,7 @@ def insert_measurement(measurement: NtpMeasurement, session: Session) -> None:
         - Any failure within the transaction block results in automatic rollback.
 
     """
-    try:
-        time = Time(
-            client_sent=measurement.timestamps.client_sent_time.seconds,
-            client_sent_prec=measurement.timestamps.client_sent_time.fraction,
-            server_recv=measurement.timestamps.server_recv_time.seconds,
-            server_recv_prec=measurement.timestamps.server_recv_time.fraction,
-            server_sent=measurement.timestamps.server_sent_time.seconds,
-            server_sent_prec=measurement.timestamps.server_sent_time.fraction,
-            client_recv=measurement.timestamps.client_recv_time.seconds,
-            client_recv_prec=measurement.timestamps.client_recv_time.fraction
-        )
-        session.add(time)
-        session.flush()
-        measurement_entry = Measurement(
-            vantage_point_ip=ip_to_str(measurement.vantage_point_ip),
-            ntp_server_ip=ip_to_str(measurement.server_info.ntp_server_ip),
-            ntp_server_name=sanitize_string(measurement.server_info.ntp_server_name),
-            ntp_version=measurement.server_info.ntp_version,
-            ntp_server_ref_parent=sanitize_string(ip_to_str(measurement.server_info.ntp_server_ref_parent_ip)),
-            ref_name=sanitize_string(measurement.server_info.ref_name),
-            time_id=time.id,
-            time_offset=measurement.main_details.offset,
-            rtt=measurement.main_details.rtt,
-            stratum=measurement.main_details.stratum,
-            precision=measurement.main_details.precision,
-            reachability=sanitize_string(measurement.main_details.reachability),
-            root_delay=measurement.extra_details.root_delay.seconds,
-            root_delay_prec=measurement.extra_details.root_delay.fraction,
-            poll=measurement.extra_details.poll,
-            root_dispersion=measurement.extra_details.root_dispersion.seconds,
-            root_dispersion_prec=measurement.extra_details.root_dispersion.fraction,
-            ntp_last_sync_time=measurement.extra_details.ntp_last_sync_time.seconds,
-            ntp_last_sync_time_prec=measurement.extra_details.ntp_last_sync_time.fraction,
-            timestamps=time
-        )
-        session.add(measurement_entry)
-        session.commit()
-    except Exception as e:
-        session.rollback()
-        raise DatabaseInsertError(f"Failed to insert measurement: {e}")
+    insert_measurements([measurement], session)
 
 
 def get_measurements_timestamps_ip(session: Session, ip: IPv4Address | IPv6Address | None, start: PreciseTime,
@@ -325,6 +400,55 @@ def get_measurements_for_jitter_ip(session: Session, ip: IPv4Address | IPv6Addre
         raise MeasurementQueryError(f"Failed to fetch measurements for jitter for IP {ip}: {e}")
 
 
+def get_measurements_for_jitter_ips(session: Session, ips: list[str], number: int = 7) -> dict[str, list[
+    NtpMeasurement]]:
+    """
+    Fetches the last specified number (default 7) of measurements of each IP address, for calculating the jitter
+    of several servers with one query.
+
+    The measurements of each IP are numbered from the most recent one with a window function
+    (`ROW_NUMBER() OVER (PARTITION BY ntp_server_ip ORDER BY client_sent DESC)`), and only the first ones are kept.
+
+    Args:
+        session (Session): The currently active database session.
+        ips (list[str]): The IP addresses of the NTP servers.
+        number (int): The number of measurements to get for each IP address.
+
+    Returns:
+        dict[str, list[NtpMeasurement]]: The last measurements of each IP address (most recent first),
+        for the IP addresses that have some.
+
+    Raises:
+        MeasurementQueryError: If the database query fails.
+    """
+    if len(ips) == 0 or number <= 0:
+        return {}
+    try:
+        row_number = func.row_number().over(
+            partition_by=Measurement.ntp_server_ip,
+            order_by=(Time.client_sent.desc(), Time.client_sent_prec.desc(), Measurement.id.desc())
+        ).label("row_number")
+        ranked = (
+            select(Measurement.id.label("m_id"), row_number)
+            .join(Time, Measurement.time_id == Time.id)
+            .where(Measurement.ntp_server_ip.in_(ips))
+            .subquery()
+        )
+        query = (
+            session.query(Measurement, Time)
+            .join(Time, Measurement.time_id == Time.id)
+            .join(ranked, ranked.c.m_id == Measurement.id)
+            .filter(ranked.c.row_number <= number)
+            .order_by(Measurement.ntp_server_ip, ranked.c.row_number)
+        )
+        ans: dict[str, list[NtpMeasurement]] = {}
+        for m in rows_to_measurements(query.all()):
+            ans.setdefault(str(ip_to_str(m.server_info.ntp_server_ip)), []).append(m)
+        return ans
+    except Exception as e:
+        raise MeasurementQueryError(f"Failed to fetch measurements for jitter for IPs {ips}: {e}")
+
+
 def get_full_historical_domain_measurements(
         db: Session,
         domain: str,
@@ -333,10 +457,11 @@ def get_full_historical_domain_measurements(
 ) -> List[dict]:
     """
     Retrieve historical domain-based NTP measurements between two timestamps.
-    Returns full JSON representations.
+    Returns full JSON representations. Everything they reference is loaded with a constant number of queries.
     """
     measurements = (
         db.query(FullMeasurementDN)
+        .options(selectinload(FullMeasurementDN.ip_measurements))
         .filter(
             FullMeasurementDN.server == domain,
             FullMeasurementDN.created_at_time >= start_time,
@@ -346,8 +471,9 @@ def get_full_historical_domain_measurements(
         .all()
     )
 
+    loaded = load_measurements(db, [*measurements, *(m_ip for m in measurements for m_ip in m.ip_measurements)])
     return [
-        full_measurement_dn_to_dict(db, m)
+        full_measurement_dn_to_dict(db, m, loaded)
         for m in measurements
     ]
 
@@ -360,7 +486,7 @@ def get_full_historical_ip_measurements(
 ) -> List[dict]:
     """
     Retrieve historical IP-based NTP measurements between two timestamps.
-    Returns full JSON representations.
+    Returns full JSON representations. Everything they reference is loaded with a constant number of queries.
     """
     measurements = (
         db.query(FullMeasurementIP)
@@ -373,8 +499,9 @@ def get_full_historical_ip_measurements(
         .all()
     )
 
+    loaded = load_measurements(db, measurements)
     return [
-        full_measurement_ip_to_dict(db, m, part_of_dn_measurement=False)
+        full_measurement_ip_to_dict(db, m, part_of_dn_measurement=False, loaded=loaded)
         for m in measurements
     ]
 
@@ -407,6 +534,125 @@ def datetime_to_ntp_timestamp(dt: datetime) -> int:
     return int(ntp_seconds * (2 ** 32))  # 32 bits fractional seconds
 
 
+# the columns sent for each historical measurement (see ntpv4_measurement_to_dict)
+NTPV4_HISTORICAL_COLUMNS = ("id", "host", "measured_server_ip", "offset", "rtt", "stratum", "poll",
+                            "client_sent_time", "server_recv_time", "server_sent_time", "client_recv_time", "ref_time",
+                            "leap", "mode", "version", "precision", "root_delay", "root_disp", "ref_id", "extensions")
+NTPV4_SERVER_INFO_COLUMNS = ("ip_is_anycast", "country_code", "asn_ntp_server", "coordinates_x", "coordinates_y",
+                             "vantage_point_ip")
+
+
+def ntpv4_historical_row_to_dict(row: Any) -> dict:
+    """
+    Converts a row of the historical NTPv4 query (the measurement columns and the server information columns,
+    prefixed with "info_") to the same dict/JSON as ntpv4_measurement_to_dict.
+    """
+    ans = {column: row[column] for column in NTPV4_HISTORICAL_COLUMNS}
+    for column in ("client_sent_time", "server_recv_time", "server_sent_time", "client_recv_time", "ref_time"):
+        ans[column] = int(ans[column]) if ans[column] is not None else None
+    if row["info_id"] is not None:
+        ans["ntp_server_location"] = {column: row["info_" + column] for column in NTPV4_SERVER_INFO_COLUMNS}
+    ans["analysis"] = row["analysis"]
+    return ans
+
+
+def encode_history_cursor(measurement: dict) -> str:
+    """
+    Returns the cursor that points after this historical measurement: its client_sent_time and its ID.
+    """
+    return f"{measurement['client_sent_time']}_{measurement['id']}"
+
+
+def decode_history_cursor(cursor: str) -> tuple[int, int]:
+    """
+    Returns the client_sent_time and the ID of the measurement of a cursor. (see encode_history_cursor)
+
+    Raises:
+        InputError: If the cursor is invalid.
+    """
+    try:
+        client_sent_time, m_id = cursor.split("_")
+        return int(client_sent_time), int(m_id)
+    except ValueError:
+        raise InputError(f"Invalid cursor: {cursor}")
+
+
+def ntpv4_historical_query(
+        column: Any,
+        value: str,
+        start_time: datetime,
+        end_time: datetime,
+        after: Optional[tuple[int, int]] = None
+) -> Select:
+    """
+    Builds the query of the historical NTP measurements between two timestamps, for one value of a column
+    (IP address or domain name). It joins the server information and selects only the sent columns, and it uses
+    the composite index on (column, client_sent_time). The rows are ordered by (client_sent_time, id), so "after"
+    (a cursor) continues right after a measurement, even if several measurements have the same client_sent_time.
+    Only the first server information of a measurement is joined (like .first()), so there is one row per measurement
+    and a LIMIT counts measurements.
+    """
+    other_info = aliased(NTPv4ServerInfo)
+    first_info_id = (
+        select(func.min(other_info.id))
+        .where(other_info.m_id == NTPv4Measurement.id)
+        .correlate(NTPv4Measurement)
+        .scalar_subquery()
+    )
+    query = (
+        select(*(getattr(NTPv4Measurement, c) for c in NTPV4_HISTORICAL_COLUMNS), NTPv4Measurement.analysis,
+               NTPv4ServerInfo.id.label("info_id"),
+               *(getattr(NTPv4ServerInfo, c).label("info_" + c) for c in NTPV4_SERVER_INFO_COLUMNS))
+        .outerjoin(NTPv4ServerInfo, and_(NTPv4ServerInfo.m_id == NTPv4Measurement.id,
+                                         NTPv4ServerInfo.id == first_info_id))
+        .where(
+            column == value,
+            NTPv4Measurement.client_sent_time >= datetime_to_ntp_timestamp(start_time),
+            NTPv4Measurement.client_sent_time <= datetime_to_ntp_timestamp(end_time),
+        )
+        .order_by(NTPv4Measurement.client_sent_time, NTPv4Measurement.id)
+    )
+    if after is not None:
+        query = query.where(or_(NTPv4Measurement.client_sent_time > after[0],
+                                and_(NTPv4Measurement.client_sent_time == after[0], NTPv4Measurement.id > after[1])))
+    return query
+
+
+def historical_rows_to_dicts(rows: Iterable[Any]) -> Iterator[dict]:
+    """
+    Converts the rows of the historical query (one per measurement) to dicts.
+    """
+    for row in rows:
+        yield ntpv4_historical_row_to_dict(row)
+
+
+def get_historical_column(host: str) -> Any:
+    """
+    Returns the column used to find the historical measurements of this server: the IP address or the domain name.
+    """
+    return NTPv4Measurement.measured_server_ip if is_ip_address(host) is not None else NTPv4Measurement.host
+
+
+def get_ntp_v4_historical_measurements_by(
+        db: Session,
+        column: Any,
+        value: str,
+        start_time: datetime,
+        end_time: datetime,
+        after: Optional[tuple[int, int]] = None,
+        limit: Optional[int] = None
+) -> List[dict]:
+    """
+    Retrieve historical NTP measurements between two timestamps, for one value of a column (IP address or domain name).
+    A single query projects only the sent columns straight into dicts. The measurements are ordered by client_sent_time.
+    With "limit", only the first rows after the cursor "after" are returned. (a page)
+    """
+    query = ntpv4_historical_query(column, value, start_time, end_time, after)
+    if limit is not None:
+        query = query.limit(limit)
+    return list(historical_rows_to_dicts(db.execute(query).mappings()))
+
+
 def get_ntp_v4_historical_measurements_ip(
         db: Session,
         host: str,
@@ -417,22 +663,7 @@ def get_ntp_v4_historical_measurements_ip(
     Retrieve historical NTP measurements between two timestamps.
     Returns only NTPv4 JSON representations for performance.
     """
-    measurements = (
-        db.query(NTPv4Measurement)
-        .filter(
-            NTPv4Measurement.measured_server_ip == host,
-            NTPv4Measurement.client_sent_time >= datetime_to_ntp_timestamp(start_time),
-            NTPv4Measurement.client_sent_time <= datetime_to_ntp_timestamp(end_time),
-        )
-        .all()
-    )
-
-    result = []
-    for m in measurements:
-        d = ntpv4_or_v5_measurement_to_dict(db, m.id, "ntpv4", from_ntp_versions=False)
-        if d is not None:
-            result.append(d)
-    return result
+    return get_ntp_v4_historical_measurements_by(db, NTPv4Measurement.measured_server_ip, host, start_time, end_time)
 
 
 def get_ntp_v4_historical_measurements_dn(
@@ -445,22 +676,7 @@ def get_ntp_v4_historical_measurements_dn(
     Retrieve historical NTP measurements between two timestamps.
     Returns only NTPv4 JSON representations for performance.
     """
-    measurements = (
-        db.query(NTPv4Measurement)
-        .filter(
-            NTPv4Measurement.host == host,
-            NTPv4Measurement.client_sent_time >= datetime_to_ntp_timestamp(start_time),
-            NTPv4Measurement.client_sent_time <= datetime_to_ntp_timestamp(end_time),
-        )
-        .all()
-    )
-
-    result = []
-    for m in measurements:
-        d = ntpv4_or_v5_measurement_to_dict(db, m.id, "ntpv4", from_ntp_versions=False)
-        if d is not None:
-            result.append(d)
-    return result
+    return get_ntp_v4_historical_measurements_by(db, NTPv4Measurement.host, host, start_time, end_time)
 
 
 def get_ntp_v4_historical_measurements(
@@ -478,3 +694,185 @@ def get_ntp_v4_historical_measurements(
         return get_ntp_v4_historical_measurements_ip(db, host, start_time, end_time)
     except ValueError:
         return get_ntp_v4_historical_measurements_dn(db, host, start_time, end_time)
+
+
+def get_ntp_v4_historical_page(
+        db: Session,
+        host: str,
+        start_time: datetime,
+        end_time: datetime,
+        limit: int,
+        cursor: Optional[str] = None
+) -> tuple[List[dict], Optional[str]]:
+    """
+    Retrieve a page of historical NTP measurements between two timestamps (keyset pagination on
+    (client_sent_time, id)). The cost of a page does not depend on how many pages came before it.
+
+    Returns:
+        tuple[List[dict], Optional[str]]: The measurements, and the cursor of the next page (None if it was the last page).
+
+    Raises:
+        InputError: If the cursor is invalid.
+    """
+    after = decode_history_cursor(cursor) if cursor is not None else None
+    # one more row says whether there is a next page
+    measurements = get_ntp_v4_historical_measurements_by(db, get_historical_column(host), host, start_time, end_time,
+                                                         after, limit + 1)
+    if len(measurements) <= limit:
+        return measurements, None
+    measurements = measurements[:limit]
+    return measurements, encode_history_cursor(measurements[-1])
+
+
+def iter_ntp_v4_historical_measurements(
+        db: Session,
+        host: str,
+        start_time: datetime,
+        end_time: datetime,
+        chunk_size: int,
+        cursor: Optional[str] = None
+) -> Iterator[List[dict]]:
+    """
+    Retrieve the historical NTP measurements between two timestamps in chunks. The rows are pulled through
+    a server-side cursor (yield_per), so only one chunk is in memory at a time, whatever the range size.
+
+    Raises:
+        InputError: If the cursor is invalid.
+    """
+    after = decode_history_cursor(cursor) if cursor is not None else None
+    query = ntpv4_historical_query(get_historical_column(host), host, start_time, end_time, after)
+    rows = db.execute(query.execution_options(yield_per=chunk_size)).mappings()
+    chunk: List[dict] = []
+    for measurement in historical_rows_to_dicts(rows):
+        chunk.append(measurement)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def insert_ignoring_duplicates(session: Session, model: Any, index_elements: list[str]) -> Any:
+    """
+    Returns an INSERT of this model that skips the rows that conflict with a unique index
+    ("ON CONFLICT DO NOTHING"). It is a plain INSERT on the databases that do not support it.
+
+    Args:
+        session (Session): The currently active database session.
+        model (Any): The model of the table.
+        index_elements (list[str]): The columns of the unique index.
+
+    Returns:
+        Any: The INSERT statement.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql_insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    if dialect == "sqlite":
+        return sqlite_insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    return insert(model)
+
+
+def insert_ripe_results(session: Session, measurement_id: int, results: list[dict]) -> None:
+    """
+    Saves the results of a finished RIPE Atlas measurement, one row per probe result, in a single bulk insert.
+    The results that were already saved (the same measurement and probe) are skipped by the database,
+    so concurrent fetches of the same measurement do not save them twice.
+
+    Args:
+        session (Session): The currently active database session.
+        measurement_id (int): The ID of the RIPE measurement. (the "id_ripe" of the full measurements)
+        results (list[dict]): The results, as returned by get_ripe_format.
+
+    Raises:
+        DatabaseInsertError: If inserting the results fails.
+    """
+    if not results:
+        return
+    try:
+        statement = insert_ignoring_duplicates(session, RipeProbeResult, ["id_ripe", "probe_id"])
+        session.execute(statement, [ripe_format_to_row(measurement_id, r) for r in results])
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise DatabaseInsertError(f"Failed to insert the results of RIPE measurement {measurement_id}: {e}")
+
+
+def get_ripe_results(session: Session, measurement_id: int) -> list[dict]:
+    """
+    Fetches the saved results of a RIPE Atlas measurement. Only finished measurements are saved.
+
+    Args:
+        session (Session): The currently active database session.
+        measurement_id (int): The ID of the RIPE measurement.
+
+    Returns:
+        list[dict]: The results in the same format as get_ripe_format, or an empty list if they were not saved.
+
+    Raises:
+        MeasurementQueryError: If the database query fails.
+    """
+    try:
+        rows = (
+            session.query(RipeProbeResult)
+            .filter(RipeProbeResult.id_ripe == measurement_id)
+            .order_by(RipeProbeResult.id)
+            .all()
+        )
+        return [ripe_probe_result_to_dict(r) for r in rows]
+    except Exception as e:
+        raise MeasurementQueryError(f"Failed to fetch the results of RIPE measurement {measurement_id}: {e}")
+
+
+def get_historical_ripe_results(
+        db: Session,
+        host: str,
+        start_time: datetime,
+        end_time: datetime
+) -> List[dict]:
+    """
+    Retrieve the saved RIPE Atlas results of a server (IP address or domain name) between two timestamps.
+    Unlike the other historical measurements, they come from many vantage points (the RIPE Atlas probes).
+    The time range applies to when the probes measured (client_sent_time), not to when the results were saved.
+
+    Args:
+        db (Session): The currently active database session.
+        host (str): The IP address or the domain name of the NTP server.
+        start_time (datetime): The start of the time range.
+        end_time (datetime): The end of the time range.
+
+    Returns:
+        List[dict]: The results in the same format as get_ripe_format, the most recent first.
+
+    Raises:
+        MeasurementQueryError: If the database query fails.
+    """
+    import ipaddress
+    try:
+        ipaddress.ip_address(host)
+        host_filter = RipeProbeResult.ntp_server_ip == host
+    except ValueError:
+        host_filter = RipeProbeResult.ntp_server_name == host
+    # the results keep the seconds and the fraction of the NTP timestamps in two columns
+    start_ts, end_ts = datetime_to_ntp_timestamp(start_time), datetime_to_ntp_timestamp(end_time)
+    start_seconds, start_fraction = start_ts >> 32, start_ts & 0xFFFFFFFF
+    end_seconds, end_fraction = end_ts >> 32, end_ts & 0xFFFFFFFF
+    try:
+        rows = (
+            db.query(RipeProbeResult)
+            .filter(
+                host_filter,
+                or_(RipeProbeResult.client_sent_time > start_seconds,
+                    and_(RipeProbeResult.client_sent_time == start_seconds,
+                         RipeProbeResult.client_sent_time_prec >= start_fraction)),
+                or_(RipeProbeResult.client_sent_time < end_seconds,
+                    and_(RipeProbeResult.client_sent_time == end_seconds,
+                         RipeProbeResult.client_sent_time_prec <= end_fraction)),
+            )
+            .order_by(RipeProbeResult.client_sent_time.desc(), RipeProbeResult.client_sent_time_prec.desc(),
+                      RipeProbeResult.id)
+            .all()
+        )
+        return [ripe_probe_result_to_dict(r) for r in rows]
+    except Exception as e:
+        raise MeasurementQueryError(f"Failed to fetch the RIPE results of {host}: {e}")
@@ -0,0 +1,355 @@
+import asyncio
+import math
+import time
+from datetime import datetime
+from typing import Any, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, delete, func
+from sqlalchemy.orm import Session
+
+from server.app.db.db_interaction import datetime_to_ntp_timestamp, get_historical_column
+from server.app.dtos.full_ntp_measurement import NTPv4Measurement, NTPv4Rollup, NTPv4RollupState
+from server.app.utils.load_config_data import get_rollups_compaction_interval_s, get_rollups_compaction_batch_size
+from server.app.utils.validate import is_ip_address
+
+# Precomputed statistics of the historical NTPv4 measurements, per server IP address and per domain name, in buckets
+# of 1 minute, 1 hour and 1 day. A compaction job reads the measurements inserted since its last run (by ID) and
+# recomputes the buckets they fall in from the raw measurements, so the statistics are exact (percentiles included).
+# A long time range can then be sent as a few hundred buckets instead of every raw point.
+# The IDs are given when a measurement is inserted, but concurrent transactions commit in any order: an ID that is
+# missing below the position may still appear, so it is checked again at the next compactions (for a while).
+
+ROLLUP_RESOLUTIONS_S = (60, 3600, 86400)
+# the 64-bit NTP timestamps have 32 bits of fraction of a second
+NTP_FRACTION_BITS = 32
+# the ID of the only row of NTPv4RollupState
+ROLLUP_STATE_ID = 1
+# how long (in seconds) a missing ID is checked again. (a transaction that commits later than this is not compacted,
+# and the IDs of rolled back transactions are never used)
+LATE_COMMIT_WINDOW_S = 600
+# a bigger jump of the IDs does not come from transactions in progress (for example the sequence was moved)
+MAX_MISSING_ID_GAP = 10000
+
+RollupKey = tuple[int, str, str, int]  # (resolution, key type, server, bucket start)
+
+
+def get_bucket_start(ntp_timestamp: int, resolution_s: int) -> int:
+    """
+    It returns the start (seconds since the NTP epoch) of the bucket that contains this NTP timestamp.
+
+    Args:
+        ntp_timestamp (int): The 64-bit NTP timestamp.
+        resolution_s (int): The length of the buckets in seconds.
+
+    Returns:
+        int: The start of the bucket.
+    """
+    seconds = int(ntp_timestamp) >> NTP_FRACTION_BITS
+    return seconds - seconds % resolution_s
+
+
+def compute_bucket_stats(offsets: list[Optional[float]], rtts: list[Optional[float]],
+                         strata: list[Optional[int]]) -> dict[str, Any]:
+    """
+    It computes the statistics of the measurements of a bucket (ordered by time). The missing values are ignored.
+
+    Args:
+        offsets (list[Optional[float]]): The offsets of the measurements.
+        rtts (list[Optional[float]]): The RTTs of the measurements.
+        strata (list[Optional[int]]): The strata of the measurements.
+
+    Returns:
+        dict[str, Any]: The statistics. (the columns of NTPv4Rollup)
+    """
+    stats: dict[str, Any] = {"count": len(offsets)}
+    offset_values = np.array([o for o in offsets if o is not None], dtype=float)
+    if offset_values.size > 0:
+        stats.update(offset_min=float(offset_values.min()), offset_max=float(offset_values.max()),
+                     offset_mean=float(offset_values.mean()), offset_stddev=float(offset_values.std()))
+    rtt_values = np.array([r for r in rtts if r is not None], dtype=float)
+    if rtt_values.size > 0:
+        p50, p90, p99 = np.percentile(rtt_values, [50, 90, 99])
+        stats.update(rtt_p50=float(p50), rtt_p90=float(p90), rtt_p99=float(p99))
+    strata_values = np.array([s for s in strata if s is not None], dtype=int)
+    stats["stratum_changes"] = int(np.count_nonzero(np.diff(strata_values))) if strata_values.size > 1 else 0
+    if strata_values.size > 0:
+        stats.update(stratum_min=int(strata_values.min()), stratum_max=int(strata_values.max()))
+    return stats
+
+
+def get_rollup_keys(measurements: Sequence[Any]) -> set[RollupKey]:
+    """
+    It returns the buckets that contain these measurements, for each resolution, for their IP address
+    and for their domain name.
+
+    Args:
+        measurements (Sequence[Any]): The measurements. (rows with host, measured_server_ip and client_sent_time)
+
+    Returns:
+        set[RollupKey]: The buckets.
+    """
+    keys: set[RollupKey] = set()
+    for m in measurements:
+        if m.client_sent_time is None:
+            continue
+        for resolution_s in ROLLUP_RESOLUTIONS_S:
+            bucket_start = get_bucket_start(m.client_sent_time, resolution_s)
+            if m.measured_server_ip is not None:
+                keys.add((resolution_s, "ip", m.measured_server_ip, bucket_start))
+            if m.host is not None:
+                keys.add((resolution_s, "host", m.host, bucket_start))
+    return keys
+
+
+def recompute_rollup(db: Session, key: RollupKey) -> None:
+    """
+    It computes a bucket again from the raw measurements, and replaces it. (it does not commit)
+
+    Args:
+        db (Session): The database session.
+        key (RollupKey): The bucket.
+    """
+    resolution_s, key_type, server, bucket_start = key
+    column = NTPv4Measurement.measured_server_ip if key_type == "ip" else NTPv4Measurement.host
+    rows = db.execute(
+        select(NTPv4Measurement.offset, NTPv4Measurement.rtt, NTPv4Measurement.stratum)
+        .where(column == server,
+               NTPv4Measurement.client_sent_time >= bucket_start << NTP_FRACTION_BITS,
+               NTPv4Measurement.client_sent_time < (bucket_start + resolution_s) << NTP_FRACTION_BITS)
+        .order_by(NTPv4Measurement.client_sent_time, NTPv4Measurement.id)
+    ).all()
+    db.execute(delete(NTPv4Rollup).where(NTPv4Rollup.resolution_s == resolution_s, NTPv4Rollup.key_type == key_type,
+                                         NTPv4Rollup.server == server, NTPv4Rollup.bucket_start == bucket_start))
+    if len(rows) == 0:
+        return
+    stats = compute_bucket_stats([r.offset for r in rows], [r.rtt for r in rows], [r.stratum for r in rows])
+    db.add(NTPv4Rollup(resolution_s=resolution_s, key_type=key_type, server=server, bucket_start=bucket_start,
+                       **stats))
+
+
+def get_missing_ids(last_id: int, ids: Sequence[int]) -> list[int]:
+    """
+    It returns the IDs that are missing between the last compacted ID and these new (sorted) IDs.
+
+    Args:
+        last_id (int): The last compacted ID.
+        ids (Sequence[int]): The new IDs, in increasing order.
+
+    Returns:
+        list[int]: The missing IDs. (the gaps bigger than MAX_MISSING_ID_GAP are ignored)
+    """
+    missing: list[int] = []
+    for m_id in ids:
+        if m_id - last_id - 1 <= MAX_MISSING_ID_GAP:
+            missing.extend(range(last_id + 1, m_id))
+        last_id = m_id
+    return missing
+
+
+def compact_measurements(db: Session, measurements: Sequence[Any]) -> None:
+    """
+    It computes again the buckets these measurements fall in. (it does not commit)
+
+    Args:
+        db (Session): The database session.
+        measurements (Sequence[Any]): The measurements. (with host, measured_server_ip and client_sent_time)
+    """
+    for key in sorted(get_rollup_keys(measurements)):
+        recompute_rollup(db, key)
+
+
+def compact_late_measurements(db: Session, missing: dict[int, float], now: float) -> int:
+    """
+    It compacts the missing measurements that were committed since they were seen missing, and forgets them
+    and the IDs that have been missing for longer than LATE_COMMIT_WINDOW_S. (it does not commit)
+
+    Args:
+        db (Session): The database session.
+        missing (dict[int, float]): The missing IDs and when they were first seen missing. (it is updated)
+        now (float): The current time, in seconds since the Unix epoch.
+
+    Returns:
+        int: The number of measurements that were added to the rollups.
+    """
+    for m_id in [m_id for m_id, seen in missing.items() if now - seen >= LATE_COMMIT_WINDOW_S]:
+        del missing[m_id]
+    ids = sorted(missing)
+    found: list[Any] = []
+    for i in range(0, len(ids), 1000):  # not too many parameters in one query
+        found.extend(db.execute(
+            select(NTPv4Measurement.id, NTPv4Measurement.host, NTPv4Measurement.measured_server_ip,
+                   NTPv4Measurement.client_sent_time)
+            .where(NTPv4Measurement.id.in_(ids[i:i + 1000]))
+        ).all())
+    compact_measurements(db, found)
+    for m in found:
+        del missing[m.id]
+    return len(found)
+
+
+def compact_rollups(db: Session, batch_size: int, now: Optional[float] = None) -> int:
+    """
+    It adds the measurements inserted since the last compaction to the rollups: the buckets they fall in are
+    computed again. The measurements are read by ID, in batches, and each batch is committed with its position.
+    The IDs that are missing below the position are checked again at the next compactions, because their
+    transactions may commit later.
+
+    Args:
+        db (Session): The database session.
+        batch_size (int): How many measurements are read at a time.
+        now (Optional[float]): The current time, in seconds since the Unix epoch. By default, the time of the system.
+
+    Returns:
+        int: The number of measurements that were added to the rollups.
+    """
+    now = time.time() if now is None else now
+    state = db.get(NTPv4RollupState, ROLLUP_STATE_ID)
+    if state is None:
+        state = NTPv4RollupState(id=ROLLUP_STATE_ID, last_m_id=0, missing_m_ids={})
+        db.add(state)
+    missing = {int(m_id): float(seen) for m_id, seen in (state.missing_m_ids or {}).items()}
+    total = compact_late_measurements(db, missing, now)
+    while True:
+        measurements = db.execute(
+            select(NTPv4Measurement.id, NTPv4Measurement.host, NTPv4Measurement.measured_server_ip,
+                   NTPv4Measurement.client_sent_time)
+            .where(NTPv4Measurement.id > state.last_m_id)
+            .order_by(NTPv4Measurement.id)
+            .limit(batch_size)
+        ).all()
+        for m_id in get_missing_ids(state.last_m_id, [m.id for m in measurements]):
+            missing[m_id] = now
+        compact_measurements(db, measurements)
+        if len(measurements) > 0:
+            state.last_m_id = measurements[-1].id
+        state.missing_m_ids = {str(m_id): seen for m_id, seen in sorted(missing.items())}
+        db.commit()
+        total += len(measurements)
+        if len(measurements) < batch_size:
+            return total
+
+
+async def run_rollup_compactor() -> None:
+    """
+    It compacts the new measurements into the rollups, in the background, after each compaction interval.
+    It runs until it is cancelled.
+    """
+    while True:
+        await asyncio.sleep(get_rollups_compaction_interval_s())
+        # very important: keep this "import" here (Because it needs to be imported after SQLAlchemy has been initialized)
+        from server.app.db_config import _SessionLocal
+        if _SessionLocal is None:
+            continue
+        db = _SessionLocal()
+        try:
+            await asyncio.to_thread(compact_rollups, db, get_rollups_compaction_batch_size())
+        except Exception as e:
+            db.rollback()
+            print(f"Could not compact the rollups: {e}")
+        finally:
+            db.close()
+
+
+def count_raw_measurements(db: Session, host: str, start_time: datetime, end_time: datetime) -> int:
+    """
+    It returns how many raw measurements of this server are in the time range. (it uses the composite index)
+
+    Args:
+        db (Session): The database session.
+        host (str): The IP address or the domain name.
+        start_time (datetime): The start of the time range.
+        end_time (datetime): The end of the time range.
+
+    Returns:
+        int: The number of measurements.
+    """
+    count = db.execute(
+        select(func.count())
+        .select_from(NTPv4Measurement)
+        .where(get_historical_column(host) == host,
+               NTPv4Measurement.client_sent_time >= datetime_to_ntp_timestamp(start_time),
+               NTPv4Measurement.client_sent_time <= datetime_to_ntp_timestamp(end_time))
+    ).scalar_one()
+    return int(count)
+
+
+def choose_history_resolution(db: Session, host: str, start_time: datetime, end_time: datetime,
+                              point_budget: int) -> int:
+    """
+    It chooses the resolution of the historical measurements: the raw measurements (0) if there are not more
+    of them than the point budget, otherwise the finest rollup whose number of buckets fits in the budget.
+    If none fits, it is the coarsest rollup.
+
+    Args:
+        db (Session): The database session.
+        host (str): The IP address or the domain name.
+        start_time (datetime): The start of the time range.
+        end_time (datetime): The end of the time range.
+        point_budget (int): The maximum number of points wanted.
+
+    Returns:
+        int: The resolution in seconds, or 0 for the raw measurements.
+    """
+    if count_raw_measurements(db, host, start_time, end_time) <= point_budget:
+        return 0
+    range_s = (end_time - start_time).total_seconds()
+    for resolution_s in ROLLUP_RESOLUTIONS_S:
+        if math.ceil(range_s / resolution_s) <= point_budget:
+            return resolution_s
+    return ROLLUP_RESOLUTIONS_S[-1]
+
+
+def rollup_to_dict(r: NTPv4Rollup) -> dict:
+    """
+    It converts a bucket to a dict/JSON.
+
+    Args:
+        r (NTPv4Rollup): The bucket.
+
+    Returns:
+        dict: The dict/JSON version of the bucket.
+    """
+    return {
+        "bucket_start": r.bucket_start,
+        "resolution_s": r.resolution_s,
+        "count": r.count,
+        "offset_min": r.offset_min,
+        "offset_max": r.offset_max,
+        "offset_mean": r.offset_mean,
+        "offset_stddev": r.offset_stddev,
+        "rtt_p50": r.rtt_p50,
+        "rtt_p90": r.rtt_p90,
+        "rtt_p99": r.rtt_p99,
+        "stratum_min": r.stratum_min,
+        "stratum_max": r.stratum_max,
+        "stratum_changes": r.stratum_changes,
+    }
+
+
+def get_rollups(db: Session, host: str, start_time: datetime, end_time: datetime, resolution_s: int) -> list[dict]:
+    """
+    It returns the buckets of this resolution of a server (IP address or domain name) that overlap the time range,
+    ordered by time.
+
+    Args:
+        db (Session): The database session.
+        host (str): The IP address or the domain name.
+        start_time (datetime): The start of the time range.
+        end_time (datetime): The end of the time range.
+        resolution_s (int): The resolution. (one of ROLLUP_RESOLUTIONS_S)
+
+    Returns:
+        list[dict]: The buckets.
+    """
+    key_type = "ip" if is_ip_address(host) is not None else "host"
+    first_bucket = get_bucket_start(datetime_to_ntp_timestamp(start_time), resolution_s)
+    last_bucket = get_bucket_start(datetime_to_ntp_timestamp(end_time), resolution_s)
+    rollups = db.execute(
+        select(NTPv4Rollup)
+        .where(NTPv4Rollup.resolution_s == resolution_s, NTPv4Rollup.key_type == key_type,
+               NTPv4Rollup.server == host, NTPv4Rollup.bucket_start >= first_bucket,
+               NTPv4Rollup.bucket_start <= last_bucket)
+        .order_by(NTPv4Rollup.bucket_start)
+    ).scalars().all()
+    return [rollup_to_dict(r) for r in rollups]
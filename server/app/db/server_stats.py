@@ -0,0 +1,192 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from server.app.models.ServerStats import ServerStats
+from server.app.services.NtpCalculator import NtpCalculator
+from server.app.utils.load_config_data import get_nr_of_measurements_for_jitter
+
+# The recent behaviour of each NTP server (by IP address), kept up to date in the same transaction as each stored
+# measurement: the last offsets (a window of "number_of_measurements_for_calculating_jitter" of them) with their
+# running mean and sum of squared deviations (Welford), the minimum RTT and the last stratum and reference.
+# The jitter of a new measurement is then a read of one row, instead of reading and parsing the last measurements.
+
+
+def welford_add(n: int, mean: float, m2: float, x: float) -> tuple[float, float]:
+    """
+    It adds a value to a window of n values with this mean and sum of squared deviations (M2).
+
+    Args:
+        n (int): The number of values before adding x.
+        mean (float): The mean of the values.
+        m2 (float): The sum of the squared deviations from the mean.
+        x (float): The added value.
+
+    Returns:
+        tuple[float, float]: The mean and the M2 of the n + 1 values.
+    """
+    delta = x - mean
+    new_mean = mean + delta / (n + 1)
+    return new_mean, m2 + delta * (x - new_mean)
+
+
+def welford_remove(n: int, mean: float, m2: float, x: float) -> tuple[float, float]:
+    """
+    It removes a value from a window of n values with this mean and sum of squared deviations (M2).
+
+    Args:
+        n (int): The number of values before removing x. (at least 1)
+        mean (float): The mean of the values.
+        m2 (float): The sum of the squared deviations from the mean.
+        x (float): The removed value.
+
+    Returns:
+        tuple[float, float]: The mean and the M2 of the n - 1 values.
+    """
+    if n <= 1:
+        return 0.0, 0.0
+    new_mean = mean - (x - mean) / (n - 1)
+    return new_mean, max(0.0, m2 - (x - mean) * (x - new_mean))
+
+
+def get_server_stats(session: Session, ip: Optional[str], lock: bool = False) -> Optional[ServerStats]:
+    """
+    It returns the statistics of an NTP server.
+
+    Args:
+        session (Session): The currently active database session.
+        ip (Optional[str]): The IP address of the NTP server.
+        lock (bool): Whether to lock the row until the end of the transaction. (for updating it)
+
+    Returns:
+        Optional[ServerStats]: The statistics, or None if there are none.
+    """
+    if ip is None:
+        return None
+    return session.get(ServerStats, ip, with_for_update=lock, populate_existing=lock)
+
+
+def get_servers_stats(session: Session, ips: Iterable[Optional[str]], lock: bool = False) -> dict[str, ServerStats]:
+    """
+    It returns the statistics of several NTP servers, with one query.
+
+    Args:
+        session (Session): The currently active database session.
+        ips (Iterable[Optional[str]]): The IP addresses of the NTP servers. (None is ignored)
+        lock (bool): Whether to lock the rows until the end of the transaction. (for updating them)
+
+    Returns:
+        dict[str, ServerStats]: The statistics of each IP address that has some.
+    """
+    wanted = sorted({ip for ip in ips if ip is not None})
+    if len(wanted) == 0:
+        return {}
+    # the rows are always locked in the same order, so that two workers cannot wait for each other
+    query = select(ServerStats).where(ServerStats.ntp_server_ip.in_(wanted)).order_by(ServerStats.ntp_server_ip)
+    if lock:
+        query = query.with_for_update().execution_options(populate_existing=True)
+    return {str(stats.ntp_server_ip): stats for stats in session.execute(query).scalars().all()}
+
+
+def lock_or_create_servers_stats(session: Session, ips: Iterable[Optional[str]]) -> dict[str, ServerStats]:
+    """
+    It returns the statistics of several NTP servers, locked until the end of the transaction.
+    The servers that have none get new ones. (if another worker creates them first, its row is used)
+
+    Args:
+        session (Session): The currently active database session.
+        ips (Iterable[Optional[str]]): The IP addresses of the NTP servers. (None is ignored)
+
+    Returns:
+        dict[str, ServerStats]: The statistics of each IP address.
+    """
+    wanted = {ip for ip in ips if ip is not None}
+    all_stats = get_servers_stats(session, wanted, lock=True)
+    for ip in sorted(wanted - all_stats.keys()):
+        try:
+            with session.begin_nested():
+                stats = ServerStats(ntp_server_ip=ip, nr_measurements=0, window_offsets=[], offset_mean=0.0,
+                                    offset_m2=0.0)
+                session.add(stats)
+        except IntegrityError:
+            existing = get_server_stats(session, ip, lock=True)
+            if existing is None:
+                raise
+            stats = existing
+        all_stats[ip] = stats
+    return all_stats
+
+
+def add_to_server_stats(stats: ServerStats, offset: Optional[float], rtt: Optional[float], stratum: Optional[int],
+                        ref_name: Optional[str], ref_parent: Optional[str]) -> None:
+    """
+    It adds a new measurement of an NTP server to its statistics. (in memory, they are stored with the session)
+
+    Args:
+        stats (ServerStats): The statistics of the server.
+        offset (Optional[float]): The offset of the measurement.
+        rtt (Optional[float]): The RTT of the measurement.
+        stratum (Optional[int]): The stratum of the server.
+        ref_name (Optional[str]): The reference ID of the server.
+        ref_parent (Optional[str]): The IP address of the reference of the server.
+    """
+    window = list(stats.window_offsets or [])
+    mean, m2 = stats.offset_mean, stats.offset_m2
+    if offset is not None:
+        mean, m2 = welford_add(len(window), mean, m2, offset)
+        window.append(offset)
+    # the window may also be shorter than before, if the config changed
+    while len(window) > get_nr_of_measurements_for_jitter():
+        mean, m2 = welford_remove(len(window), mean, m2, window.pop(0))
+    stats.window_offsets = window
+    stats.offset_mean, stats.offset_m2 = mean, m2
+    stats.nr_measurements = (stats.nr_measurements or 0) + 1
+    if rtt is not None and (stats.min_rtt is None or rtt < stats.min_rtt):
+        stats.min_rtt = rtt
+    stats.last_stratum = stratum
+    stats.last_ref_name = ref_name
+    stats.last_ref_parent = ref_parent
+
+
+def update_server_stats(session: Session, ip: Optional[str], offset: Optional[float], rtt: Optional[float],
+                        stratum: Optional[int], ref_name: Optional[str], ref_parent: Optional[str]) -> None:
+    """
+    It adds a new measurement of an NTP server to its statistics. It does not commit, so that the statistics
+    are stored in the same transaction as the measurement.
+
+    Args:
+        session (Session): The currently active database session.
+        ip (Optional[str]): The IP address of the NTP server. (nothing is updated if it is None)
+        offset (Optional[float]): The offset of the measurement.
+        rtt (Optional[float]): The RTT of the measurement.
+        stratum (Optional[int]): The stratum of the server.
+        ref_name (Optional[str]): The reference ID of the server.
+        ref_parent (Optional[str]): The IP address of the reference of the server.
+    """
+    if ip is None:
+        return
+    stats = lock_or_create_servers_stats(session, [ip])[ip]
+    add_to_server_stats(stats, offset, rtt, stratum, ref_name, ref_parent)
+
+
+def calculate_jitter_from_server_stats(stats: ServerStats, offset: float, number: int) -> tuple[float, int]:
+    """
+    It calculates the jitter of a measurement against the last measurements of its server, from the statistics.
+    With the whole window, it only uses the mean and the M2. (see NtpCalculator.calculate_jitter_from_window)
+
+    Args:
+        stats (ServerStats): The statistics of the server.
+        offset (float): The offset of the measurement.
+        number (int): The maximum number of last measurements to use.
+
+    Returns:
+        tuple[float, int]: The jitter in seconds and the number of last measurements used.
+    """
+    window = stats.window_offsets or []
+    if number >= len(window):
+        return NtpCalculator.calculate_jitter_from_window(offset, len(window), stats.offset_mean,
+                                                          stats.offset_m2), len(window)
+    recent = window[len(window) - number:] if number > 0 else []
+    return NtpCalculator.calculate_jitter([offset] + recent), len(recent)
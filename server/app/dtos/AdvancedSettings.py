@@ -12,6 +12,7 @@ class AdvancedSettings(BaseModel):
         analyse_all_ntp_versions (bool): whether to analyze all NTP versions.
         ntp_versions_analysis_on_each_ip (bool): If you want an analysis on each IP address of the domain name.
         nts_analysis_on_each_ip (bool): If you want an analysis on each IP address of the domain name.
+        refresh_ntp_versions (bool): If you want a fresh analysis of the NTP versions, instead of the cached one.
         ntpv5_draft (str): The draft name for NTPv5.
         custom_probes_asn (str): The custom ASN for probes.
         custom_probes_country (str): The custom country for probes.
@@ -25,6 +26,7 @@ class AdvancedSettings(BaseModel):
     ntp_versions_analysis_on_each_ip: bool = False
     # NTS (by default, it is done on the server/ip you input, but not on each IP)
     nts_analysis_on_each_ip: bool = False
+    refresh_ntp_versions: bool = False
 
     ntpv5_draft: str = ""
     # custom parameters for RIPE probes
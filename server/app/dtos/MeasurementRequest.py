@@ -15,10 +15,13 @@ class MeasurementRequest(BaseModel):
         analyse_all_ntp_versions (Optional[bool]): whether to analyze all NTP versions.
         ntp_versions_analysis_on_each_ip (Optional[bool]): If you want an analysis on each IP address of the domain name.
         nts_analysis_on_each_ip (Optional[bool]): If you want an analysis on each IP address of the domain name.
+        refresh_ntp_versions (Optional[bool]): If you want a fresh analysis of the NTP versions, instead of the cached one.
         ntpv5_draft (Optional[str]): The draft name for NTPv5.
         custom_probes_asn (Optional[str]): The custom ASN for probes.
         custom_probes_country (Optional[str]): The custom country for probes.
         custom_client_ip (Optional[str]): If you want to get probes close to a specific IP address.
+        max_age (Optional[float]): How old (seconds) a cached result can be. 0 forces a new measurement.
+            By default, it is the one from the config.
     """
     server: str
     ipv6_measurement: bool = False
@@ -29,12 +32,15 @@ class MeasurementRequest(BaseModel):
     analyse_all_ntp_versions: Optional[bool] = None
     ntp_versions_analysis_on_each_ip: Optional[bool] = None
     nts_analysis_on_each_ip: Optional[bool] = None
+    refresh_ntp_versions: Optional[bool] = None
 
     ntpv5_draft: Optional[str] = None
     # custom parameters for RIPE probes
     custom_probes_asn: Optional[str] = None
     custom_probes_country: Optional[str] = None
     custom_client_ip: Optional[str] = None
+    # how old a cached result can be
+    max_age: Optional[float] = None
 
 
     @model_validator(mode='after')
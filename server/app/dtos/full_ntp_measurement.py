@@ -1,7 +1,7 @@
 from typing import Optional
 
 from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, CheckConstraint, JSON, SmallInteger, \
-    Boolean, BigInteger, Double, Numeric
+    Boolean, BigInteger, Double, Numeric, Index
 from sqlalchemy.orm import relationship, mapped_column, Mapped
 from sqlalchemy.sql import func
 from server.app.models.Base import Base
@@ -9,6 +9,11 @@ from server.app.models.Base import Base
 
 class NTPv4Measurement(Base):
     __tablename__ = "ntpv4_measurement"
+    __table_args__ = (
+        # the historical measurements of a server are a range of client_sent_time for one IP or domain name
+        Index("idx_ntpv4_server_ip_time", "measured_server_ip", "client_sent_time"),
+        Index("idx_ntpv4_host_time", "host", "client_sent_time"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     analysis: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
@@ -175,7 +180,7 @@ def put_fields_ntpv5(m: NTPv5Measurement, data: dict, analysis: Optional[str], d
 class NTPv4ServerInfo(Base):
     __tablename__ = "ntpv4_server_info"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    m_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True) # the id of the NTPv4Measurement object
+    m_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True) # the id of the NTPv4Measurement object
     ip_is_anycast: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     asn_ntp_server: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
     country_code: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
@@ -342,3 +347,149 @@ class DNIPLink(Base):
     __tablename__ = "dn_ip_link"
     id_dn = Column(Integer, ForeignKey("full_ntp_measurement_dn.id_m_dn"), primary_key=True)
     id_ip = Column(Integer, ForeignKey("full_ntp_measurement_ip.id_m_ip"), primary_key=True)
+
+
+class NTPv4Rollup(Base):
+    """
+    The statistics of the NTPv4 measurements of one server (IP address or domain name) in one time bucket.
+    The buckets are 1 minute, 1 hour and 1 day long, and they are computed from the raw measurements by the
+    compaction job. (see server.app.db.rollups)
+    """
+    __tablename__ = "ntpv4_rollup"
+    __table_args__ = (
+        Index("idx_ntpv4_rollup_bucket", "resolution_s", "key_type", "server", "bucket_start", unique=True),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    resolution_s: Mapped[int] = mapped_column(Integer, nullable=False) # 60, 3600 or 86400
+    key_type: Mapped[str] = mapped_column(String(4), nullable=False) # "ip" or "host"
+    server: Mapped[str] = mapped_column(Text, nullable=False) # the measured IP address or the domain name
+    bucket_start: Mapped[int] = mapped_column(BigInteger, nullable=False) # in seconds since the NTP epoch
+
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    offset_min: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    offset_max: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    offset_mean: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    offset_stddev: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    rtt_p50: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    rtt_p90: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    rtt_p99: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    stratum_min: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    stratum_max: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    stratum_changes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class NTPv4RollupState(Base):
+    """
+    How far the compaction job went: the NTPv4 measurements up to this ID are in the rollups, except the missing IDs
+    below it, which may still be committed. (ID -> when it was first seen missing, in seconds since the Unix epoch)
+    """
+    __tablename__ = "ntpv4_rollup_state"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    last_m_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    missing_m_ids: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)
+
+
+class RipeProbeResult(Base):
+    __tablename__ = "ripe_probe_result"
+    __table_args__ = (
+        # a probe has one result per RIPE measurement, even if the results are fetched by several workers
+        Index("idx_ripe_probe_result_probe", "id_ripe", "probe_id", unique=True),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    id_ripe: Mapped[int] = mapped_column(Integer, nullable=False, index=True) # the same as in FullMeasurementIP/DN
+    created_at_time = Column(DateTime(timezone=True), server_default=func.now())
+
+    probe_id: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    probe_ipv4: Mapped[Optional[str]] = mapped_column(String(45), nullable=True)
+    probe_ipv6: Mapped[Optional[str]] = mapped_column(String(45), nullable=True)
+    probe_country_code: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
+    probe_coordinates_x: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    probe_coordinates_y: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    vantage_point_ip: Mapped[Optional[str]] = mapped_column(String(45), nullable=True)
+    time_to_result: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+
+    ntp_version: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    ntp_server_ip: Mapped[Optional[str]] = mapped_column(String(45), nullable=True, index=True)
+    ntp_server_name: Mapped[Optional[str]] = mapped_column(Text, nullable=True, index=True)
+    ip_is_anycast: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    asn_ntp_server: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
+    country_code: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
+    coordinates_x: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    coordinates_y: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    ref_id: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+
+    offset: Mapped[Optional[float]] = mapped_column("offset", Double, nullable=True)
+    rtt: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    stratum: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    poll: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    precision: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    root_delay: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    root_dispersion: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+
+    client_sent_time: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    client_sent_time_prec: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    server_recv_time: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    server_recv_time_prec: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    server_sent_time: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    server_sent_time_prec: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    client_recv_time: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    client_recv_time_prec: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+
+
+def ripe_format_to_row(id_ripe: int, data: dict) -> dict:
+    """
+    This method converts one RIPE result (as returned by get_ripe_format) into the values of a RipeProbeResult row.
+    Args:
+        id_ripe (int): the ID of the RIPE measurement
+        data (dict): the RIPE result of one probe
+    Returns:
+        dict: the values of the row (ready for a bulk insert)
+    """
+    server_location = data.get("ntp_server_location") or {}
+    server_coordinates = server_location.get("coordinates") or (None, None)
+    probe_addr = data.get("probe_addr") or {}
+    probe_location = data.get("probe_location") or {}
+    probe_coordinates = probe_location.get("coordinates") or (None, None)
+    result = (data.get("result") or [{}])[0]
+
+    def seconds(key: str) -> Optional[int]:
+        return (result.get(key) or {}).get("seconds")
+
+    def fraction(key: str) -> Optional[int]:
+        return (result.get(key) or {}).get("fraction")
+
+    return {
+        "id_ripe": id_ripe,
+        "probe_id": data.get("probe_id"),
+        "probe_ipv4": probe_addr.get("ipv4"),
+        "probe_ipv6": probe_addr.get("ipv6"),
+        "probe_country_code": probe_location.get("country_code"),
+        "probe_coordinates_x": probe_coordinates[0],
+        "probe_coordinates_y": probe_coordinates[1],
+        "vantage_point_ip": data.get("vantage_point_ip"),
+        "time_to_result": data.get("time_to_result"),
+        "ntp_version": data.get("ntp_version"),
+        "ntp_server_ip": data.get("ntp_server_ip"),
+        "ntp_server_name": data.get("ntp_server_name"),
+        "ip_is_anycast": bool(server_location.get("ip_is_anycast", False)),
+        "asn_ntp_server": data.get("asn_ntp_server"),
+        "country_code": server_location.get("country_code"),
+        "coordinates_x": server_coordinates[0],
+        "coordinates_y": server_coordinates[1],
+        "ref_id": data.get("ref_id"),
+        "offset": result.get("offset"),
+        "rtt": result.get("rtt"),
+        "stratum": data.get("stratum"),
+        "poll": data.get("poll"),
+        "precision": data.get("precision"),
+        "root_delay": data.get("root_delay"),
+        "root_dispersion": data.get("root_dispersion"),
+        "client_sent_time": seconds("client_sent_time"),
+        "client_sent_time_prec": fraction("client_sent_time"),
+        "server_recv_time": seconds("server_recv_time"),
+        "server_recv_time_prec": fraction("server_recv_time"),
+        "server_sent_time": seconds("server_sent_time"),
+        "server_sent_time_prec": fraction("server_sent_time"),
+        "client_recv_time": seconds("client_recv_time"),
+        "client_recv_time_prec": fraction("client_recv_time"),
+    }
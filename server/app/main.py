@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from typing import Union, Any, AsyncGenerator
 from fastapi import FastAPI, Request, Response
@@ -6,8 +7,11 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from server.app.utils.load_config_data import verify_if_config_is_set
+from server.app.utils.load_config_data import verify_if_config_is_set, resolve_ntp_nts_binary_tool
 from server.app.db_config import init_engine
+from server.app.utils.http_client import aclose_http_clients
+from server.app.utils.ip_utils import run_vantage_point_refresher
+from server.app.db.rollups import run_rollup_compactor
 from server.app.models.Base import Base
 from server.app.api.routing import router
 from server.app.rate_limiter import limiter
@@ -46,7 +50,10 @@ def create_app(dev: bool = True) -> FastAPI:
         """
         Application lifespan context manager.
 
-        Initializes the database schema if in development mode.
+        Initializes the database schema if in development mode and finds the ntp-nts tool (so that the requests
+        never look for it or compile it). It starts the background tasks that keep the identity of this server
+        (public IPs, ASN, location) up to date and that compact the new measurements into the rollups.
+        On shutdown, it stops these tasks and closes the outbound HTTP clients.
 
         Args:
             app (FastAPI): The FastAPI application instance.
@@ -57,7 +64,16 @@ def create_app(dev: bool = True) -> FastAPI:
         if dev:
             engine = init_engine()
             Base.metadata.create_all(bind=engine)
+        try:
+            resolve_ntp_nts_binary_tool()
+        except RuntimeError as e:
+            print(f"The ntp-nts tool is not available, the measurements that need it will fail: {e}")
+        vantage_point_refresher = asyncio.create_task(run_vantage_point_refresher())
+        rollup_compactor = asyncio.create_task(run_rollup_compactor())
         yield
+        vantage_point_refresher.cancel()
+        rollup_compactor.cancel()
+        await aclose_http_clients()
 
     app = FastAPI(
         lifespan=lifespan,
@@ -65,3 +65,32 @@ class MeasurementQueryError(Exception):
     def __init__(self, message: str = "Failed to query measurement data") -> None:
         self.message = message
         super().__init__(self.message)
+
+
+class CircuitOpenError(Exception):
+    """
+    Exception raised when a call to an external dependency is refused because its circuit breaker is open.
+    (the dependency failed too many times recently, so we fail fast instead of waiting for its timeout)
+    """
+
+    def __init__(self, message: str = "Dependency temporarily unavailable", retry_after_s: float = 0.0) -> None:
+        """
+        Initialize the exception object.
+        """
+        self.message = message
+        self.retry_after_s = retry_after_s
+        super().__init__(self.message)
+
+
+class NtsError(Exception):
+    """
+    Exception raised when an NTP response is invalid (the packet or one of its extension fields is malformed).
+    """
+
+    def __init__(self, message: str = "invalid NTP response") -> None:
+        """
+        Initialize the exception object.
+        """
+        self.message = message
+        super().__init__(self.message)
+
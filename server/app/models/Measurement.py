@@ -43,7 +43,8 @@ class Measurement(Base):
         Index("idx_meas_time_id", "time_id"),
     )
 
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # SQLite (test db) only generates the keys of INTEGER primary keys
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer(), "sqlite"), primary_key=True)
     vantage_point_ip: Mapped[str] = mapped_column(IPAddress, nullable=True)
     ntp_server_ip: Mapped[str] = mapped_column(IPAddress, nullable=True)
     ntp_server_name: Mapped[str] = mapped_column(Text, nullable=True)
@@ -0,0 +1,23 @@
+from typing import Optional
+
+from sqlalchemy import JSON, BigInteger, Double, Integer, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from server.app.models.Base import Base
+from server.app.models.Measurement import IPAddress
+
+
+class ServerStats(Base):
+    __tablename__ = "server_stats"
+
+    # the recent behaviour of an NTP server, updated with each measurement stored in "measurements"
+    ntp_server_ip: Mapped[str] = mapped_column(IPAddress, primary_key=True)
+    nr_measurements: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # the last offsets (oldest first) and their mean and sum of squared deviations (Welford)
+    window_offsets: Mapped[list] = mapped_column(JSON, nullable=False, default=list)
+    offset_mean: Mapped[float] = mapped_column(Double, nullable=False, default=0.0)
+    offset_m2: Mapped[float] = mapped_column(Double, nullable=False, default=0.0)
+    min_rtt: Mapped[Optional[float]] = mapped_column(Double, nullable=True)
+    last_stratum: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    last_ref_name: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    last_ref_parent: Mapped[Optional[str]] = mapped_column(IPAddress, nullable=True)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import BigInteger, Index
+from sqlalchemy import BigInteger, Index, Integer
 from server.app.models.Base import Base
 
 
@@ -9,7 +9,8 @@ class Time(Base):
     __table_args__ = (
         Index("idx_times_client_sent", "client_sent"),
     )
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # SQLite (test db) only generates the keys of INTEGER primary keys
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer(), "sqlite"), primary_key=True)
     client_sent: Mapped[int] = mapped_column(BigInteger, nullable=True)
     client_sent_prec: Mapped[int] = mapped_column(BigInteger, nullable=True)
     server_recv: Mapped[int] = mapped_column(BigInteger, nullable=True)
@@ -111,3 +111,23 @@ class NtpCalculator:
         jitter: float = float(np.sqrt(s / denominator))
 
         return jitter
+
+    @staticmethod
+    def calculate_jitter_from_window(offset: float, window_size: int, window_mean: float, window_m2: float) -> float:
+        """
+        Calculates the same jitter as calculate_jitter([offset] + window) from the mean and the sum of squared
+        deviations (M2) of the window only, because sum((o - offset) ** 2) = M2 + n * (mean - offset) ** 2.
+
+        Args:
+            offset (float): The offset of the reference measurement.
+            window_size (int): The number of offsets in the window.
+            window_mean (float): The mean of the offsets in the window.
+            window_m2 (float): The sum of the squared deviations from the mean of the offsets in the window.
+
+        Returns:
+            float: Jitter in seconds.
+        """
+        if window_size <= 0:
+            return 0.0
+        s = max(0.0, window_m2) + window_size * (window_mean - offset) ** 2
+        return float(np.sqrt(s / window_size))
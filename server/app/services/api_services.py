@@ -1,3 +1,4 @@
+import json
 import pprint
 import time
 
@@ -6,7 +7,8 @@ from sqlalchemy.orm import Session
 from server.app.utils.location_resolver import get_country_for_ip, get_coordinates_for_ip
 from server.app.utils.validate import sanitize_string
 from server.app.dtos.MeasurementRequest import MeasurementRequest
-from server.app.utils.analyze_ntp_versions import run_tool_on_ntp_version
+from server.app.utils.analyze_ntp_versions import run_tool_on_ntp_version, get_cached_ntp_versions_analysis, \
+    NTP_VERSIONS
 from server.app.dtos.full_ntp_measurement import NTSMeasurement, FullMeasurementDN, NTPv4Measurement, NTPv5Measurement, \
     put_fields_ntpv4, put_fields_ntpv5, put_fields_4_or_5, NTPv4ServerInfo, NTPv5ServerInfo
 from server.app.dtos.AdvancedSettings import AdvancedSettings
@@ -18,12 +20,14 @@ from server.app.utils.ip_utils import is_this_ip_anycast
 from server.app.utils.perform_measurements import perform_ntp_measurement_domain_name_list, \
     analyze_supported_ntp_versions
 from server.app.utils.ip_utils import get_server_ip
-from server.app.models.CustomError import InputError, RipeMeasurementError, DNSError
+from server.app.models.CustomError import InputError, RipeMeasurementError, DNSError, CircuitOpenError, \
+    DatabaseInsertError, MeasurementQueryError
 from server.app.utils.load_config_data import get_nr_of_measurements_for_jitter, \
-    get_right_ntp_nts_binary_tool_for_your_os
-from server.app.utils.calculations import calculate_jitter_from_measurements, human_date_to_ntp_precise_time
+    get_right_ntp_nts_binary_tool_for_your_os, get_history_stream_chunk_size
+from server.app.utils.calculations import calculate_jitter_from_measurements, calculate_jitter_for_measurements, \
+    human_date_to_ntp_precise_time
 from server.app.utils.ip_utils import ip_to_str
-from typing import Any, Optional, Tuple
+from typing import Any, Optional, Tuple, Iterator
 
 from server.app.utils.ripe_fetch_data import check_all_measurements_scheduled
 from server.app.utils.perform_measurements import perform_ripe_measurement_domain_name
@@ -35,8 +39,9 @@ from datetime import datetime
 from server.app.dtos.ProbeData import ServerLocation
 from server.app.dtos.RipeMeasurement import RipeMeasurement
 from server.app.utils.ripe_fetch_data import parse_data_from_ripe_measurement, get_data_from_ripe_measurement
-from server.app.db.db_interaction import insert_measurement
-from server.app.db.db_interaction import get_measurements_timestamps_ip, get_measurements_timestamps_dn
+from server.app.db.db_interaction import insert_measurement, insert_measurements, insert_ripe_results, get_ripe_results
+from server.app.db.db_interaction import get_measurements_timestamps_ip, get_measurements_timestamps_dn, \
+    iter_ntp_v4_historical_measurements
 from server.app.dtos.NtpMeasurement import NtpMeasurement
 
 
@@ -264,17 +269,16 @@ def measure(server: str, wanted_ip_type: int, session: Session, client_ip: Optio
                                                                                                     client_ip,
                                                                                                     wanted_ip_type)
             if measurements is not None:
+                # all the IPs of the domain name are stored in one transaction, and their jitter is read together
+                stored = [m for m in measurements if str(m.server_info.ntp_server_ref_parent_ip) != "0.0.0.0"]
+                insert_measurements(stored, session)
+                jitters = iter(calculate_jitter_for_measurements(session, stored, measurement_no))
                 m_results = []
                 for m in measurements:
                     if str(m.server_info.ntp_server_ref_parent_ip) == "0.0.0.0":
                         m_results.append((m, 0.0, 1))
                         continue
-                    jitter = 0.0
-                    nr_jitter_measurements = 0
-                    insert_measurement(m, session)
-                    result = calculate_jitter_from_measurements(session, m, measurement_no)
-                    # if result is not None:
-                    jitter, nr_jitter_measurements = result
+                    jitter, nr_jitter_measurements = next(jitters)
                     m_results.append((m, jitter, nr_jitter_measurements))
                 return m_results
             print("The ntp server " + server + " is not responding.")
@@ -308,12 +312,7 @@ def check_and_get_settings(input_settings: MeasurementRequest) -> AdvancedSettin
     if input_settings.measurement_type is not None:
         settings.measurement_type = input_settings.measurement_type
 
-    if input_settings.ntp_versions_to_analyze is not None:
-        settings.ntp_versions_to_analyze = input_settings.ntp_versions_to_analyze
-    if input_settings.analyse_all_ntp_versions is not None:
-        settings.analyse_all_ntp_versions = input_settings.analyse_all_ntp_versions
-    if input_settings.ntp_versions_analysis_on_each_ip is not None:
-        settings.ntp_versions_analysis_on_each_ip = input_settings.ntp_versions_analysis_on_each_ip
+    copy_ntp_versions_settings(input_settings, settings)
     if input_settings.nts_analysis_on_each_ip is not None:
         settings.nts_analysis_on_each_ip = input_settings.nts_analysis_on_each_ip
 
@@ -330,6 +329,23 @@ def check_and_get_settings(input_settings: MeasurementRequest) -> AdvancedSettin
     return check_settings(settings)
 
 
+def copy_ntp_versions_settings(input_settings: MeasurementRequest, settings: AdvancedSettings) -> None:
+    """
+    This method copies the NTP versions settings that the client inputted into the settings.
+    Args:
+        input_settings (MeasurementRequest): The parameters that the client inputted.
+        settings (AdvancedSettings): The settings to be used internally in the server.
+    """
+    if input_settings.ntp_versions_to_analyze is not None:
+        settings.ntp_versions_to_analyze = input_settings.ntp_versions_to_analyze
+    if input_settings.analyse_all_ntp_versions is not None:
+        settings.analyse_all_ntp_versions = input_settings.analyse_all_ntp_versions
+    if input_settings.ntp_versions_analysis_on_each_ip is not None:
+        settings.ntp_versions_analysis_on_each_ip = input_settings.ntp_versions_analysis_on_each_ip
+    if input_settings.refresh_ntp_versions is not None:
+        settings.refresh_ntp_versions = input_settings.refresh_ntp_versions
+
+
 def check_settings(settings: AdvancedSettings) -> AdvancedSettings:
     """
     This method checks the values in the settings.
@@ -801,6 +817,45 @@ def add_ntp_measurement(db: Session, result: Optional[dict], settings: AdvancedS
     return None, None
 
 
+def get_ntp_versions_capabilities(server: str, ntpv5_draft: str = "", refresh: bool = False) -> dict[str, Any]:
+    """
+    This method returns which NTP versions a server supports. The cached analysis is returned if it is available
+    (and a refresh was not requested), otherwise the NTP versions are analysed now (and cached).
+    Args:
+        server (str): The server (IP address or domain name).
+        ntpv5_draft (str): The NTPv5 draft to use.
+        refresh (bool): Whether to analyse the NTP versions again, even if a cached analysis is available.
+    Returns:
+        dict[str, Any]: The confidence and the analysis of each NTP version, and how old the analysis is.
+    Raises:
+        MeasurementQueryError: If the NTP versions could not be analysed. (the tool is not available)
+    """
+    from_cache = False
+    age_s = 0.0
+    cached = None if refresh else get_cached_ntp_versions_analysis(server, NTP_VERSIONS, ntpv5_draft)
+    if cached is not None:
+        ntpv_ans, age_s = cached
+        from_cache = True
+    else:
+        settings = AdvancedSettings(analyse_all_ntp_versions=True, ntpv5_draft=ntpv5_draft, refresh_ntp_versions=True)
+        ntpv_ans = analyze_supported_ntp_versions(server, settings)
+        if ntpv_ans.get("error") is not None:
+            raise MeasurementQueryError(ntpv_ans["error"])
+    versions: dict[str, Any] = {}
+    for ntp_version in NTP_VERSIONS:
+        versions[ntp_version] = {
+            "supported_confidence": int(ntpv_ans.get(ntp_version + "_supported_confidence") or 0),
+            "analysis": ntpv_ans.get(ntp_version + "_analysis")
+        }
+    return {
+        "server": server,
+        "ntpv5_draft": ntpv5_draft,
+        "from_cache": from_cache,
+        "age_s": round(age_s, 3),
+        "ntp_versions": versions
+    }
+
+
 def add_ripe_measurement_id_to_db_measurement(db: Session, server: str, settings: AdvancedSettings,
                                               m: FullMeasurementDN | FullMeasurementIP) -> None:
     """
@@ -815,7 +870,8 @@ def add_ripe_measurement_id_to_db_measurement(db: Session, server: str, settings
         None: nothing
     """
     try:
-        ripe_measurement_id = perform_ripe_measurement(server, settings.custom_client_ip, settings.wanted_ip_type)
+        ripe_measurement_id = perform_ripe_measurement(server, settings.custom_client_ip, settings.wanted_ip_type,
+                                                       settings.custom_probes_asn, settings.custom_probes_country)
         m.id_ripe = int(ripe_measurement_id)
         db.commit()
     except RipeMeasurementError as e:
@@ -869,28 +925,80 @@ def fetch_historic_data_with_timestamps(server: str, start: datetime, end: datet
     return measurements
 
 
-def fetch_ripe_data(measurement_id: str) -> tuple[list[dict], str]:
+def stream_historic_measurements(server: str, start: datetime, end: datetime,
+                                 cursor: Optional[str] = None) -> Iterator[str]:
+    """
+    It streams the historical NTP measurements of a server as the JSON {"measurements": [...]}, one chunk at a time.
+    The rows are pulled from the database in chunks (see iter_ntp_v4_historical_measurements) and each chunk is
+    encoded as soon as it is read, so the memory stays flat whatever the size of the time range.
+    It uses its own database session, because the response is sent after the request's session is closed.
+
+    Args:
+        server (str): An IPv4/IPv6 address or domain name.
+        start (datetime): The start of the time range.
+        end (datetime): The end of the time range.
+        cursor (Optional[str]): If set, the measurements start right after this cursor. (it must be valid)
+
+    Returns:
+        Iterator[str]: The parts of the JSON response.
+    """
+    # very important: keep this "import" here (Because it needs to be imported after SQLAlchemy has been initialized)
+    from server.app.db_config import _SessionLocal
+    if _SessionLocal is None:  # this will never be the case. This code is to solve a mypy type error
+        raise MeasurementQueryError("No connection to the database")
+    db = _SessionLocal()
+    try:
+        yield '{"measurements":['
+        separator = ""
+        for chunk in iter_ntp_v4_historical_measurements(db, server, start, end, get_history_stream_chunk_size(),
+                                                         cursor):
+            yield separator + ",".join(json.dumps(m, allow_nan=False, separators=(",", ":")) for m in chunk)
+            separator = ","
+        yield "]}"
+    finally:
+        db.close()
+
+
+def fetch_ripe_data(measurement_id: str, session: Optional[Session] = None) -> tuple[list[dict], str]:
     """
     Fetches and formats NTP measurement data from RIPE Atlas.
 
     This function retrieves raw measurement data from the RIPE Atlas API using the given
     measurement ID, parses it into internal data structures, and formats it into a
     standardized dictionary format.
+    If a database session is given, the results of a finished measurement are saved,
+    and they are served from the database the next time instead of downloading them again.
 
     Args:
         measurement_id (str): The unique ID of the RIPE Atlas measurement to fetch.
+        session (Optional[Session]): The currently active database session.
 
     Returns:
         list[dict]: A list of dictionaries, each representing a formatted NTP measurement.
     """
+    if session is not None:
+        try:
+            saved_results = get_ripe_results(session, int(measurement_id))
+            if saved_results:
+                return saved_results, "Complete"
+        except (MeasurementQueryError, ValueError) as e:
+            print("Could not read the saved RIPE results: ", e)
+
     measurements, status = parse_data_from_ripe_measurement(get_data_from_ripe_measurement(measurement_id))
     measurements_formated = []
     for m in measurements:
         measurements_formated.append(get_ripe_format(m))
+
+    if session is not None and status == "Complete":
+        try:
+            insert_ripe_results(session, int(measurement_id), measurements_formated)
+        except (DatabaseInsertError, ValueError) as e:
+            print("Could not save the RIPE results: ", e)
     return measurements_formated, status
 
 
-def perform_ripe_measurement(ntp_server: str, client_ip: Optional[str], wanted_ip_type: int) -> str:
+def perform_ripe_measurement(ntp_server: str, client_ip: Optional[str], wanted_ip_type: int,
+                             custom_probes_asn: Optional[str] = None, custom_probes_country: Optional[str] = None) -> str:
     """
     Initiate a RIPE Atlas measurement for a given server (IP address or domain name).
 
@@ -901,11 +1009,14 @@ def perform_ripe_measurement(ntp_server: str, client_ip: Optional[str], wanted_i
         ntp_server (str): The IP address or domain name of the target NTP server.
         client_ip (Optional[str]): The IP address of the client requesting the measurement.
         wanted_ip_type (int): The IP type that we want to measure. (4 or 6)
+        custom_probes_asn (Optional[str]): The ASN from which the probes should be chosen, instead of the client's.
+        custom_probes_country (Optional[str]): The country from which the probes should be chosen, instead of the client's.
 
     Returns:
         str: The RIPE measurement ID. (as a string)
 
     Raises:
+        CircuitOpenError: If RIPE Atlas failed too many times recently. (we fail fast without contacting it)
         Exception: If the server string is invalid or the measurement failed.
     """
     # use our server as the client if the client IP is not provided
@@ -915,15 +1026,21 @@ def perform_ripe_measurement(ntp_server: str, client_ip: Optional[str], wanted_i
             raise InputError("Could not determine IP address of neither server nor client")
     try:
         if is_ip_address(ntp_server) is not None:
-            measurement_id = perform_ripe_measurement_ip(ntp_server, client_ip)
+            measurement_id = perform_ripe_measurement_ip(ntp_server, client_ip,
+                                                         custom_probes_asn=custom_probes_asn,
+                                                         custom_probes_country=custom_probes_country)
             return str(measurement_id)
         else:
-            measurement_id = perform_ripe_measurement_domain_name(ntp_server, client_ip, wanted_ip_type)
+            measurement_id = perform_ripe_measurement_domain_name(ntp_server, client_ip, wanted_ip_type,
+                                                                  custom_probes_asn=custom_probes_asn,
+                                                                  custom_probes_country=custom_probes_country)
             return str(measurement_id)
     except InputError as e:
         raise e
     except RipeMeasurementError as e:
         raise e
+    except CircuitOpenError as e:
+        raise e
     except Exception as e:
         raise ValueError(e)
 
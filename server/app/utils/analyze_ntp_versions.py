@@ -1,12 +1,155 @@
+import copy
 import json
-import os
 import pprint
-import subprocess
-from typing import Tuple
+import threading
+from typing import Optional, Tuple
 
 from server.app.utils.ip_utils import translate_ref_id
+from server.app.utils.load_config_data import get_ntp_versions_cache_ttl_s, get_ntp_versions_cache_max_entries, \
+    get_timeout_measurement_s, get_ntp_versions_failure_cache_ttl_s
+from server.app.utils.ntp_nts_tool import run_ntp_nts_tool
+from server.app.utils.ntp_versions_probe import probe_ntp_versions
+from server.app.utils.ttl_cache import TTLCache
 from server.app.models.CustomError import InputError
 
+NTP_VERSIONS = ["ntpv1", "ntpv2", "ntpv3", "ntpv4", "ntpv5"]
+
+# the key is (server, NTP version, NTPv5 draft). The draft is only part of the key for NTPv5.
+NtpVersionCacheKey = tuple[str, str, str]
+# the value is (confidence, analysis, measurement result)
+NtpVersionAnalysis = tuple[str, str, Optional[dict]]
+
+_ntp_versions_cache_lock = threading.Lock()
+_ntp_versions_cache: Optional[TTLCache[NtpVersionCacheKey, NtpVersionAnalysis]] = None
+
+
+def get_ntp_versions_cache() -> TTLCache[NtpVersionCacheKey, NtpVersionAnalysis]:
+    """
+    It returns the cache of the NTP versions analysis, creating it (with the settings from the config) if needed.
+
+    Returns:
+        TTLCache[NtpVersionCacheKey, NtpVersionAnalysis]: The cache of the NTP versions analysis.
+    """
+    global _ntp_versions_cache
+    with _ntp_versions_cache_lock:
+        if _ntp_versions_cache is None:
+            _ntp_versions_cache = TTLCache("ntp_versions", float(get_ntp_versions_cache_ttl_s()),
+                                           get_ntp_versions_cache_max_entries())
+        return _ntp_versions_cache
+
+
+def invalidate_ntp_versions_cache() -> None:
+    """
+    It forgets all the cached NTP versions analysis.
+    """
+    get_ntp_versions_cache().invalidate()
+
+
+def get_ntp_version_cache_key(server: str, ntp_version: str, ntpv5_draft: str) -> NtpVersionCacheKey:
+    """
+    It returns the key of the analysis of one NTP version of a server.
+
+    Args:
+        server (str): The server. (domain name or IP address)
+        ntp_version (str): The NTP version. (ex: "ntpv4")
+        ntpv5_draft (str): The NTPv5 draft. It is ignored for the other versions.
+
+    Returns:
+        NtpVersionCacheKey: The key.
+    """
+    return server.strip().lower(), ntp_version, ntpv5_draft if ntp_version == "ntpv5" else ""
+
+
+def get_cached_ntp_version(server: str, ntp_version: str, ntpv5_draft: str) \
+        -> Optional[tuple[float, NtpVersionAnalysis]]:
+    """
+    It returns the cached analysis of one NTP version of a server.
+
+    Args:
+        server (str): The server.
+        ntp_version (str): The NTP version.
+        ntpv5_draft (str): The NTPv5 draft.
+
+    Returns:
+        Optional[tuple[float, NtpVersionAnalysis]]: How old the analysis is (in seconds) and a copy of it,
+        or None if it is not cached.
+    """
+    entry = get_ntp_versions_cache().get_entry(get_ntp_version_cache_key(server, ntp_version, ntpv5_draft))
+    if entry is None:
+        return None
+    return entry[0], copy.deepcopy(entry[1])
+
+
+def cache_ntp_version(server: str, ntp_version: str, ntpv5_draft: str, analysis: NtpVersionAnalysis) -> None:
+    """
+    It stores the analysis of one NTP version of a server. A failed analysis (confidence "0": a timeout,
+    no response or an invalid response) may be temporary, so it is only kept for the shorter failure TTL.
+
+    Args:
+        server (str): The server.
+        ntp_version (str): The NTP version.
+        ntpv5_draft (str): The NTPv5 draft.
+        analysis (NtpVersionAnalysis): The confidence, the analysis and the measurement result.
+    """
+    cache = get_ntp_versions_cache()
+    ttl_s = cache.ttl_s
+    if analysis[0] == "0":
+        ttl_s = min(ttl_s, float(get_ntp_versions_failure_cache_ttl_s()))
+    if ttl_s > 0:
+        cache.set(get_ntp_version_cache_key(server, ntp_version, ntpv5_draft), copy.deepcopy(analysis), ttl_s)
+
+
+def get_cached_ntp_versions_analysis(server: str, ntp_versions: list[str], ntpv5_draft: str) \
+        -> Optional[tuple[dict, float]]:
+    """
+    It returns the cached analysis of these NTP versions of a server, in the same format as
+    analyze_supported_ntp_versions, if all of them are cached.
+
+    Args:
+        server (str): The server.
+        ntp_versions (list[str]): The NTP versions.
+        ntpv5_draft (str): The NTPv5 draft.
+
+    Returns:
+        Optional[tuple[dict, float]]: The analysis and the age of its oldest part (in seconds),
+        or None if one of the versions is not cached.
+    """
+    ntp_versions_analysis: dict = {}
+    oldest = 0.0
+    for ntp_version in ntp_versions:
+        cached = get_cached_ntp_version(server, ntp_version, ntpv5_draft)
+        if cached is None:
+            return None
+        age, (conf, analysis, m_result) = cached
+        oldest = max(oldest, age)
+        ntp_versions_analysis[ntp_version + "_supported_confidence"] = conf
+        ntp_versions_analysis[ntp_version + "_analysis"] = analysis
+        ntp_versions_analysis[ntp_version + "_m_result"] = m_result
+    return ntp_versions_analysis, oldest
+
+
+def cache_ntp_versions_analysis(server: str, ntp_versions: list[str], ntpv5_draft: str,
+                                ntp_versions_analysis: dict) -> None:
+    """
+    It stores the analysis of these NTP versions of a server (in the format of analyze_supported_ntp_versions).
+    Nothing is stored if the analysis itself failed (for example if the tool is not available), and the failed
+    versions are only kept for a short time. (see cache_ntp_version)
+
+    Args:
+        server (str): The server.
+        ntp_versions (list[str]): The NTP versions.
+        ntpv5_draft (str): The NTPv5 draft.
+        ntp_versions_analysis (dict): The analysis.
+    """
+    if ntp_versions_analysis.get("error") is not None:
+        return
+    for ntp_version in ntp_versions:
+        if ntp_version + "_supported_confidence" in ntp_versions_analysis:
+            cache_ntp_version(server, ntp_version, ntpv5_draft,
+                              (ntp_versions_analysis[ntp_version + "_supported_confidence"],
+                               ntp_versions_analysis[ntp_version + "_analysis"],
+                               ntp_versions_analysis.get(ntp_version + "_m_result")))
+
 
 def parse_ntp_versions_response_to_dict(content: str) -> dict:
     """
@@ -56,11 +199,7 @@ def directly_analyze_all_ntp_versions(server: str, binary_nts_tool: str, ntpv5_d
     m_data: dict = {}
     ntp_versions_analysis: dict = {}
     try:
-        result = subprocess.run(
-            [str(binary_nts_tool), "allntpv", server, "-draft", ntpv5_draft],
-            capture_output=True, text=True,
-            env=os.environ.copy()
-        )
+        result = run_ntp_nts_tool(str(binary_nts_tool), ["allntpv", server, "-draft", ntpv5_draft])
         if result.returncode != 0:  # we should never arrive here, but just to be sure
             raise Exception(f"all ntp analysis failed")
     except Exception as e:
@@ -111,24 +250,16 @@ def run_tool_on_ntp_version(server: str, binary_nts_tool: str, ntp_version: str,
     Raises:
         InputError: If the ntp_version is invalid.
     """
-    if ntp_version not in ["ntpv1", "ntpv2", "ntpv3", "ntpv4", "ntpv5"]:
+    if ntp_version not in NTP_VERSIONS:
         raise InputError(f"ntp_version {ntp_version} is invalid")
     conf: str = "0"
     analysis: str = ""
     m_data: dict = {}
     try:
         if ntp_version == "ntpv5" and ntpv5_draft != "":
-            result = subprocess.run(
-                [str(binary_nts_tool), ntp_version, server, "-draft", ntpv5_draft],
-                capture_output=True, text=True,
-                env=os.environ.copy()
-            )
+            result = run_ntp_nts_tool(str(binary_nts_tool), [ntp_version, server, "-draft", ntpv5_draft])
         else:
-            result = subprocess.run(
-                [str(binary_nts_tool), ntp_version, server],
-                capture_output=True, text=True,
-                env=os.environ.copy()
-            )
+            result = run_ntp_nts_tool(str(binary_nts_tool), [ntp_version, server])
     except Exception as e:
         conf = "0"
         analysis = "Not supported, error in measurement."
@@ -149,6 +280,48 @@ def run_tool_on_ntp_version(server: str, binary_nts_tool: str, ntp_version: str,
     return conf, analysis, m_data
 
 
+def probe_and_analyze_ntp_versions(server: str, ntp_versions: list[str], ntpv5_draft: str = "",
+                                   use_cache: bool = True) -> dict:
+    """
+    This method probes these NTP versions in-process (all of them at the same time, without the ntp-nts tool)
+    and analyses the responses. The versions with a cached analysis are not probed again, unless use_cache is False.
+    Args:
+        server (str): The server (domain name or IP address).
+        ntp_versions (list[str]): The NTP versions to analyze. (ex: ["ntpv3", "ntpv4"])
+        ntpv5_draft (str): The NTPv5 draft.
+        use_cache (bool): Whether to reuse the cached analysis of a version.
+    Returns:
+        dict: The analysis of each version, in the same format as analyze_supported_ntp_versions.
+    Raises:
+        InputError: If an ntp_version is invalid.
+    """
+    for ntp_version in ntp_versions:
+        if ntp_version not in NTP_VERSIONS:
+            raise InputError(f"ntp_version {ntp_version} is invalid")
+    analyses: dict[str, NtpVersionAnalysis] = {}
+    for ntp_version in ntp_versions:
+        cached = get_cached_ntp_version(server, ntp_version, ntpv5_draft) if use_cache else None
+        if cached is not None:
+            analyses[ntp_version] = cached[1]
+    to_probe = [ntp_version for ntp_version in ntp_versions if ntp_version not in analyses]
+    if to_probe:
+        results = probe_ntp_versions(server, [NTP_VERSIONS.index(v) + 1 for v in to_probe], ntpv5_draft,
+                                     float(get_timeout_measurement_s()))
+        for ntp_version in to_probe:
+            m_data = results[NTP_VERSIONS.index(ntp_version) + 1]
+            try:
+                conf, analysis = analyse_ntp_version_response(m_data, ntp_version)
+            except Exception as e:
+                conf, analysis = "0", "Received something, but could not parse the response."
+            analyses[ntp_version] = (conf, analysis, m_data)
+    ntp_versions_analysis: dict = {}
+    for ntp_version in ntp_versions:
+        (ntp_versions_analysis[ntp_version + "_supported_confidence"],
+         ntp_versions_analysis[ntp_version + "_analysis"],
+         ntp_versions_analysis[ntp_version + "_m_result"]) = analyses[ntp_version]
+    return ntp_versions_analysis
+
+
 def analyse_ntp_version_response(m_data: dict, ntp_version: str) -> Tuple[str, str]:
     """
     This method analyses the data according to the specified NTP version
@@ -160,7 +333,7 @@ def analyse_ntp_version_response(m_data: dict, ntp_version: str) -> Tuple[str, s
     Raises:
         InputError: If the ntp_version is invalid.
     """
-    if ntp_version not in ["ntpv1", "ntpv2", "ntpv3", "ntpv4", "ntpv5"]:
+    if ntp_version not in NTP_VERSIONS:
         raise InputError(f"ntp_version {ntp_version} is invalid")
     if ntp_version == "ntpv1":
         return analyse_ntpv1_response(m_data)
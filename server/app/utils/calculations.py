@@ -9,7 +9,8 @@ from server.app.dtos.ProbeData import ServerLocation
 from server.app.utils.ip_utils import get_server_ip, ip_to_str, get_ip_family
 from server.app.utils.location_resolver import get_country_for_ip, get_coordinates_for_ip
 from server.app.utils.load_config_data import get_nr_of_measurements_for_jitter, get_ntp_version
-from server.app.db.db_interaction import get_measurements_for_jitter_ip
+from server.app.db.db_interaction import get_measurements_for_jitter_ip, get_measurements_for_jitter_ips
+from server.app.db.server_stats import get_server_stats, get_servers_stats, calculate_jitter_from_server_stats
 from server.app.dtos.NtpMeasurement import NtpMeasurement
 from server.app.services.NtpCalculator import NtpCalculator
 from sqlalchemy.orm import Session
@@ -26,6 +27,7 @@ def calculate_jitter_from_measurements(session: Session, initial_measurement: Nt
 
     This function computes the jitter by calculating the standard deviation of the offsets
     from a given initial measurement and a number of most recent measurements from the same NTP server.
+    The recent offsets are read from the statistics of the server, kept up to date with each stored measurement.
 
     Args:
         session (Session): The active SQLAlchemy database session.
@@ -39,7 +41,12 @@ def calculate_jitter_from_measurements(session: Session, initial_measurement: Nt
             - float: The calculated jitter in seconds.
             - int: The actual number of historical measurements used for the calculation.
     """
-    offsets = [NtpCalculator.calculate_offset(initial_measurement.timestamps)]
+    offset = NtpCalculator.calculate_offset(initial_measurement.timestamps)
+    stats = get_server_stats(session, ip_to_str(initial_measurement.server_info.ntp_server_ip))
+    if stats is not None:
+        return calculate_jitter_from_server_stats(stats, offset, no_measurements)
+    # the server has no statistics yet: read its last measurements
+    offsets = [offset]
     last_measurements = get_measurements_for_jitter_ip(session=session,
                                                        ip=initial_measurement.server_info.ntp_server_ip,
                                                        number=no_measurements)
@@ -52,6 +59,40 @@ def calculate_jitter_from_measurements(session: Session, initial_measurement: Nt
     return float(NtpCalculator.calculate_jitter(offsets)), nr_m
 
 
+def calculate_jitter_for_measurements(session: Session, measurements: list[NtpMeasurement],
+                                      no_measurements: int = get_nr_of_measurements_for_jitter()) -> list[
+    tuple[float, int]]:
+    """
+    Calculates the NTP jitter of several measurements (for example, those of all the IPs of a domain name),
+    like calculate_jitter_from_measurements, with a constant number of queries: one for the statistics of all
+    the servers and, for the servers that have none yet, one for their last measurements.
+
+    Args:
+        session (Session): The active SQLAlchemy database session.
+        measurements (list[NtpMeasurement]): The reference measurements.
+        no_measurements (int): The number of recent historical measurements to use for each server.
+
+    Returns:
+        list[tuple[float, int]]: The jitter in seconds and the number of historical measurements used,
+        for each measurement. (in the same order)
+    """
+    ips = [ip_to_str(m.server_info.ntp_server_ip) for m in measurements]
+    all_stats = get_servers_stats(session, ips)
+    last_measurements = get_measurements_for_jitter_ips(
+        session, sorted({ip for ip in ips if ip is not None and ip not in all_stats}), no_measurements)
+    ans = []
+    for m, ip in zip(measurements, ips):
+        offset = NtpCalculator.calculate_offset(m.timestamps)
+        stats = all_stats.get(ip) if ip is not None else None
+        if stats is not None:
+            ans.append(calculate_jitter_from_server_stats(stats, offset, no_measurements))
+            continue
+        offsets = [offset] + [NtpCalculator.calculate_offset(last.timestamps)
+                              for last in last_measurements.get(str(ip), [])]
+        ans.append((float(NtpCalculator.calculate_jitter(offsets)), len(offsets) - 1))
+    return ans
+
+
 def ntp_precise_time_to_human_date(t: PreciseTime) -> str:
     """
     Converts a PreciseTime object to a human-readable time string in UTC. (ex:'2025-05-05 14:30:15.123456 UTC')
@@ -0,0 +1,239 @@
+import threading
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+from server.app.models.CustomError import CircuitOpenError
+from server.app.utils.load_config_data import get_circuit_breaker_failure_threshold, \
+    get_circuit_breaker_recovery_timeout_s
+from server.app.utils.metrics import increment_counter, set_gauge
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# the value of the "circuit_breaker_state" gauge for each state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker for one external dependency. (RIPE Atlas, stat.ripe.net, ipify, an EDNS resolver...)
+
+    While it is "closed", all calls go through. After "failure_threshold" consecutive failures it "opens",
+    and all calls fail fast for "recovery_timeout_s" seconds. After that, it becomes "half_open": a single trial call
+    is let through. If it succeeds, the breaker closes again, otherwise it opens for another "recovery_timeout_s".
+
+    Attributes:
+        name (str): The name of the dependency.
+        failure_threshold (int): The number of consecutive failures after which the breaker opens.
+        recovery_timeout_s (float): How long the breaker stays open before a trial call.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout_s: float,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Initialize the circuit breaker in the "closed" state.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout_s = recovery_timeout_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        set_gauge("circuit_breaker_state", STATE_VALUES[CLOSED], {"name": name})
+
+    @property
+    def state(self) -> str:
+        """
+        It returns the current state of the breaker. An open breaker whose recovery timeout passed is reported as half-open.
+
+        Returns:
+            str: "closed", "open" or "half_open".
+        """
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.recovery_timeout_s:
+                return HALF_OPEN
+            return self._state
+
+    def _set_state(self, new_state: str) -> None:
+        """
+        It changes the state and records the transition in the metrics. The lock must be held.
+
+        Args:
+            new_state (str): The new state.
+        """
+        if new_state == self._state:
+            return
+        self._state = new_state
+        set_gauge("circuit_breaker_state", STATE_VALUES[new_state], {"name": self.name})
+        increment_counter("circuit_breaker_transitions_total", {"name": self.name, "to": new_state})
+
+    def retry_after_s(self) -> float:
+        """
+        It returns how long until the breaker lets a trial call through.
+
+        Returns:
+            float: The number of seconds, or 0 if calls are allowed now.
+        """
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout_s - (self._clock() - self._opened_at))
+
+    def allow_request(self) -> bool:
+        """
+        It decides whether a call can be made now. When the breaker moves to half-open, only the first caller is allowed,
+        the others keep failing fast until the trial call finishes.
+
+        Returns:
+            bool: True if the call can be made, False if it should fail fast.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._clock() - self._opened_at >= self.recovery_timeout_s:
+                self._set_state(HALF_OPEN)
+                self._trial_in_flight = False
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        increment_counter("circuit_breaker_rejections_total", {"name": self.name})
+        return False
+
+    def record_success(self) -> None:
+        """
+        It records a successful call. It closes the breaker.
+        """
+        with self._lock:
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        """
+        It records a failed call. It opens the breaker if the trial call failed or if there were too many failures.
+        """
+        increment_counter("circuit_breaker_failures_total", {"name": self.name})
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._set_state(OPEN)
+
+    def release_trial(self) -> None:
+        """
+        It records a call that neither succeeded nor failed. (it was cancelled or interrupted)
+        If it was the trial call, the next caller can make another one, otherwise the breaker would stay half-open
+        and reject all calls forever.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def check(self) -> None:
+        """
+        It raises an exception if the call should fail fast.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable (circuit breaker is open)",
+                                   retry_after_s=self.retry_after_s())
+
+    def call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        It calls the function through the breaker. Any exception raised by the function counts as a failure.
+        A cancellation (or an interruption) does not count, but it ends the trial call.
+
+        Args:
+            func (Callable[..., T]): The function that calls the dependency.
+            *args (Any): The positional arguments of the function.
+            **kwargs (Any): The keyword arguments of the function.
+
+        Returns:
+            T: The result of the function.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        self.check()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+    def status(self) -> dict[str, Any]:
+        """
+        It returns the status of the breaker, as shown in the health endpoint.
+
+        Returns:
+            dict[str, Any]: The state, the number of consecutive failures and the time until the next trial call.
+        """
+        state = self.state
+        with self._lock:
+            consecutive_failures = self._consecutive_failures
+        return {
+            "state": state,
+            "consecutive_failures": consecutive_failures,
+            "retry_after_s": round(self.retry_after_s(), 3) if state == OPEN else 0.0,
+        }
+
+
+_registry_lock = threading.Lock()
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    It returns the circuit breaker of a dependency, creating it (with the settings from the config) if needed.
+
+    Args:
+        name (str): The name of the dependency. (ex: "atlas.ripe.net", "edns:8.8.8.8")
+
+    Returns:
+        CircuitBreaker: The circuit breaker of this dependency.
+    """
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, get_circuit_breaker_failure_threshold(),
+                                     float(get_circuit_breaker_recovery_timeout_s()))
+            _breakers[name] = breaker
+        return breaker
+
+
+def get_circuit_breakers_status() -> dict[str, dict[str, Any]]:
+    """
+    It returns the status of all the circuit breakers created so far.
+
+    Returns:
+        dict[str, dict[str, Any]]: The status of each breaker, indexed by the name of the dependency.
+    """
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in sorted(breakers, key=lambda b: b.name)}
+
+
+def reset_circuit_breakers(name: Optional[str] = None) -> None:
+    """
+    It forgets the state of one (or all) circuit breakers.
+
+    Args:
+        name (Optional[str]): The name of the dependency, or None to reset all of them.
+    """
+    with _registry_lock:
+        if name is None:
+            _breakers.clear()
+        else:
+            _breakers.pop(name, None)
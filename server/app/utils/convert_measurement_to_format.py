@@ -1,12 +1,114 @@
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, Iterable, Any
 from sqlalchemy.orm import Session
 
 from server.app.dtos.full_ntp_measurement import FullMeasurementIP, NTSMeasurement, NTPVersions, NTPv5Measurement, \
-    FullMeasurementDN, NTPv4Measurement, NTPv4ServerInfo, NTPv5ServerInfo
+    FullMeasurementDN, NTPv4Measurement, NTPv4ServerInfo, NTPv5ServerInfo, RipeProbeResult
+
+
+@dataclass
+class LoadedMeasurements:
+    """
+    The rows referenced by some full measurements, loaded with one query per table (see load_measurements),
+    so the conversion to dict/JSON does not query the database for each ID.
+
+    Attributes:
+        nts (dict[int, NTSMeasurement]): The NTS measurements by ID.
+        ntp_versions (dict[int, NTPVersions]): The NTP versions analyses by ID.
+        ntpv4 (dict[int, NTPv4Measurement]): The NTPv1-v4 measurements by ID.
+        ntpv4_server_info (dict[int, NTPv4ServerInfo]): The server information by NTPv4 measurement ID.
+        ntpv5 (dict[int, NTPv5Measurement]): The NTPv5 measurements by ID.
+        ntpv5_server_info (dict[int, NTPv5ServerInfo]): The server information by NTPv5 measurement ID.
+    """
+    nts: dict[int, NTSMeasurement] = field(default_factory=dict)
+    ntp_versions: dict[int, NTPVersions] = field(default_factory=dict)
+    ntpv4: dict[int, NTPv4Measurement] = field(default_factory=dict)
+    ntpv4_server_info: dict[int, NTPv4ServerInfo] = field(default_factory=dict)
+    ntpv5: dict[int, NTPv5Measurement] = field(default_factory=dict)
+    ntpv5_server_info: dict[int, NTPv5ServerInfo] = field(default_factory=dict)
+
+
+def query_by_ids(db: Session, model: Any, column: Any, ids: set[int]) -> list[Any]:
+    """
+    This method returns the rows of this table whose column is one of these IDs, with a single query.
+    Args:
+        db (Session): A connection to the database
+        model (Any): The table (ORM class)
+        column (Any): The column that contains the IDs
+        ids (set[int]): The IDs
+    Returns:
+        list[Any]: The rows, ordered by their primary key. (no query if there are no IDs)
+    """
+    if len(ids) == 0:
+        return []
+    primary_key = model.__mapper__.primary_key[0]
+    rows: list[Any] = db.query(model).filter(column.in_(ids)).order_by(primary_key).all()
+    return rows
+
+
+def add_ntp_measurement_id(ids_v4: set[int], ids_v5: set[int], m_id: Optional[int], m_version: Optional[str]) -> None:
+    """
+    This method adds the ID of an NTP measurement to the IDs of its format. (see ntpv4_or_v5_measurement_to_dict)
+    Args:
+        ids_v4 (set[int]): The IDs of the measurements in NTPv4 format
+        ids_v5 (set[int]): The IDs of the measurements in NTPv5 format
+        m_id (Optional[int]): The ID of the NTP measurement
+        m_version (Optional[str]): The version of the NTP measurement
+    """
+    if m_id is None or m_version is None:
+        return
+    if m_version == "ntpv5":
+        ids_v5.add(m_id)
+    else:
+        ids_v4.add(m_id)
+
+
+def load_measurements(db: Session, measurements: Iterable[FullMeasurementIP | FullMeasurementDN] = (),
+                      ntp_versions: Iterable[NTPVersions] = ()) -> LoadedMeasurements:
+    """
+    This method loads everything referenced by these full measurements (NTS, NTP versions, main measurements,
+    the measurement of each NTP version and their server information) with a constant number of queries
+    (at most one per table), no matter how many measurements there are.
+    Args:
+        db (Session): A connection to the database
+        measurements (Iterable[FullMeasurementIP | FullMeasurementDN]): The full measurements
+        ntp_versions (Iterable[NTPVersions]): NTP versions analyses that are already loaded
+    Returns:
+        LoadedMeasurements: The loaded rows.
+    """
+    loaded = LoadedMeasurements()
+    ids_v4: set[int] = set()
+    ids_v5: set[int] = set()
+    measurements = list(measurements)
+    for m in measurements:
+        if isinstance(m, FullMeasurementIP):
+            add_ntp_measurement_id(ids_v4, ids_v5, m.id_main_measurement, m.response_version)
+    loaded.nts = {m.id_nts: m for m in query_by_ids(db, NTSMeasurement, NTSMeasurement.id_nts,
+                                                     {m.id_nts for m in measurements if m.id_nts is not None})}
+    loaded.ntp_versions = {m.id_vs: m for m in ntp_versions}
+    loaded.ntp_versions.update({m.id_vs: m for m in query_by_ids(
+        db, NTPVersions, NTPVersions.id_vs,
+        {m.id_vs for m in measurements if m.id_vs is not None and m.id_vs not in loaded.ntp_versions})})
+    for vs in loaded.ntp_versions.values():
+        add_ntp_measurement_id(ids_v4, ids_v5, vs.id_v4_1, vs.ntpv1_response_version)
+        add_ntp_measurement_id(ids_v4, ids_v5, vs.id_v4_2, vs.ntpv2_response_version)
+        add_ntp_measurement_id(ids_v4, ids_v5, vs.id_v4_3, vs.ntpv3_response_version)
+        add_ntp_measurement_id(ids_v4, ids_v5, vs.id_v4_4, vs.ntpv4_response_version)
+        add_ntp_measurement_id(ids_v4, ids_v5, vs.id_v5, vs.ntpv5_response_version)
+
+    loaded.ntpv4 = {m.id: m for m in query_by_ids(db, NTPv4Measurement, NTPv4Measurement.id, ids_v4)}
+    loaded.ntpv5 = {m.id: m for m in query_by_ids(db, NTPv5Measurement, NTPv5Measurement.id, ids_v5)}
+    # like .first(), the first server information of each measurement is used
+    for info_v4 in reversed(query_by_ids(db, NTPv4ServerInfo, NTPv4ServerInfo.m_id, ids_v4)):
+        loaded.ntpv4_server_info[info_v4.m_id] = info_v4
+    for info_v5 in reversed(query_by_ids(db, NTPv5ServerInfo, NTPv5ServerInfo.m_id, ids_v5)):
+        loaded.ntpv5_server_info[info_v5.m_id] = info_v5
+    return loaded
 
 
 # methods to convert to JSON (dict)
-def ntpv4_or_v5_measurement_to_dict(db: Session, m_id: Optional[int], m_version: Optional[str], from_ntp_versions: bool = False) -> Optional[dict]:
+def ntpv4_or_v5_measurement_to_dict(db: Session, m_id: Optional[int], m_version: Optional[str], from_ntp_versions: bool = False,
+                                    loaded: Optional[LoadedMeasurements] = None) -> Optional[dict]:
     """
     This method converts an NTPVersions object to a dict/JSON. We need to choose in which format is the measurement.
     NTPv1, NTPv2, NTPv3, NTPv4 are in NTPv4 format, but NTPv5 has its own format.
@@ -15,11 +117,18 @@ def ntpv4_or_v5_measurement_to_dict(db: Session, m_id: Optional[int], m_version:
         m_id (Optional[int]): The ID of the NTP measurement
         m_version (Optional[str]): The version of the NTP measurement
         from_ntp_versions (bool): if true, do not send again the analysis
+        loaded (Optional[LoadedMeasurements]): The rows that are already loaded. If None, they are queried.
     Returns:
         Optional[dict]: The dict/JSON version or None
     """
     if m_id is None or m_version is None:
         return None
+    if loaded is not None:
+        if m_version == "ntpv5":
+            return ntpv5_measurement_to_dict(loaded.ntpv5.get(m_id), loaded.ntpv5_server_info.get(m_id),
+                                             from_ntp_versions)
+        return ntpv4_measurement_to_dict(loaded.ntpv4.get(m_id), loaded.ntpv4_server_info.get(m_id),
+                                         from_ntp_versions)
     if m_version == "ntpv5":
         m_v5: Optional[NTPv5Measurement] = db.query(NTPv5Measurement).filter_by(id=m_id).first()
         m_server_info_v5: Optional[NTPv5ServerInfo] = db.query(NTPv5ServerInfo).filter_by(m_id=m_id).first()
@@ -195,46 +304,51 @@ def nts_measurement_to_dict(m: Optional[NTSMeasurement]) -> Optional[dict]:
         "ref_id_raw": m.ref_id_raw
     }
 
-def ntp_versions_to_dict(db: Session, m: Optional[NTPVersions]) -> Optional[dict]:
+def ntp_versions_to_dict(db: Session, m: Optional[NTPVersions],
+                         loaded: Optional[LoadedMeasurements] = None) -> Optional[dict]:
     """
     This method converts an NTPVersions object to a dict/JSON.
     Args:
         db (Session): A connection to the database (we need to query some IDs)
         m (Optional[NTPVersions]): The measurement object to convert.
+        loaded (Optional[LoadedMeasurements]): The rows that are already loaded. If None, they are loaded.
     Returns:
         Optional[dict]: The dict/JSON version or None
     """
     if m is None:
         return None
+    if loaded is None:
+        loaded = load_measurements(db, ntp_versions=[m])
     ans: dict = {
         "ntpv1_supported_conf": m.ntpv1_supported_conf,
         "ntpv1_analysis": m.ntpv1_analysis,
         "ntpv1_response_version": m.ntpv1_response_version,
-        "ntpv1_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_1, m.ntpv1_response_version, True),
+        "ntpv1_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_1, m.ntpv1_response_version, True, loaded),
 
         "ntpv2_supported_conf": m.ntpv2_supported_conf,
         "ntpv2_analysis": m.ntpv2_analysis,
         "ntpv2_response_version": m.ntpv2_response_version,
-        "ntpv2_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_2, m.ntpv2_response_version, True),
+        "ntpv2_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_2, m.ntpv2_response_version, True, loaded),
 
         "ntpv3_supported_conf": m.ntpv3_supported_conf,
         "ntpv3_analysis": m.ntpv3_analysis,
         "ntpv3_response_version": m.ntpv3_response_version,
-        "ntpv3_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_3, m.ntpv3_response_version, True),
+        "ntpv3_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_3, m.ntpv3_response_version, True, loaded),
 
         "ntpv4_supported_conf": m.ntpv4_supported_conf,
         "ntpv4_analysis": m.ntpv4_analysis,
         "ntpv4_response_version": m.ntpv4_response_version,
-        "ntpv4_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_4, m.ntpv4_response_version, True),
+        "ntpv4_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v4_4, m.ntpv4_response_version, True, loaded),
 
         "ntpv5_supported_conf": m.ntpv5_supported_conf,
         "ntpv5_analysis": m.ntpv5_analysis,
         "ntpv5_response_version": m.ntpv5_response_version,
-        "ntpv5_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v5, m.ntpv5_response_version, True),
+        "ntpv5_data": ntpv4_or_v5_measurement_to_dict(db, m.id_v5, m.ntpv5_response_version, True, loaded),
     }
     return ans
 
-def full_measurement_ip_to_dict(db: Session, m: FullMeasurementIP, part_of_dn_measurement: bool=False) -> dict:
+def full_measurement_ip_to_dict(db: Session, m: FullMeasurementIP, part_of_dn_measurement: bool=False,
+                                loaded: Optional[LoadedMeasurements] = None) -> dict:
     """
     This method converts a FullMeasurementIP object to a dict/JSON. It fully takes the whole object.
     The response may be large. "part_of_dn_measurement" is used to not send again the settings, because they are the
@@ -243,20 +357,24 @@ def full_measurement_ip_to_dict(db: Session, m: FullMeasurementIP, part_of_dn_me
         db (Session): A connection to the database (we need to query some IDs)
         m (FullMeasurementIP): The measurement object to convert.
         part_of_dn_measurement (bool): Whether the measurement is part of the domain name measurement or not.
+        loaded (Optional[LoadedMeasurements]): The rows that are already loaded. If None, they are loaded.
     Returns:
         dict: The full dict/JSON version of the measurement.
     """
-    m_nts: Optional[NTSMeasurement] = db.query(NTSMeasurement).filter_by(id_nts=m.id_nts).first()
-    m_vs: Optional[NTPVersions] = db.query(NTPVersions).filter_by(id_vs=m.id_vs).first()
+    if loaded is None:
+        loaded = load_measurements(db, [m])
+    m_nts: Optional[NTSMeasurement] = loaded.nts.get(m.id_nts) if m.id_nts is not None else None
+    m_vs: Optional[NTPVersions] = loaded.ntp_versions.get(m.id_vs) if m.id_vs is not None else None
     ans: dict = {
         "search_id": "ip" + str(m.id_m_ip),
         "status": m.status,
         "server": m.server_ip,
         "created_at_time": m.created_at_time.isoformat() if m.created_at_time else None,
         "response_version": m.response_version,
-        "main_measurement": ntpv4_or_v5_measurement_to_dict(db, m.id_main_measurement, m.response_version),
+        "main_measurement": ntpv4_or_v5_measurement_to_dict(db, m.id_main_measurement, m.response_version,
+                                                            loaded=loaded),
         "nts": nts_measurement_to_dict(m_nts),
-        "ntp_versions": ntp_versions_to_dict(db, m_vs),
+        "ntp_versions": ntp_versions_to_dict(db, m_vs, loaded),
         # "id_ripe": m.id_ripe, # this ID does not exist (it is null) if it was part of a domain name measurement
         "ripe_error": m.ripe_error,
         "response_error": m.response_error,
@@ -266,20 +384,25 @@ def full_measurement_ip_to_dict(db: Session, m: FullMeasurementIP, part_of_dn_me
         ans["settings"] = m.settings
     return ans
 
-def full_measurement_dn_to_dict(db: Session, m: FullMeasurementDN) -> dict:
+def full_measurement_dn_to_dict(db: Session, m: FullMeasurementDN,
+                                loaded: Optional[LoadedMeasurements] = None) -> dict:
     """
     This method converts a FullMeasurementDN object to a dict/JSON. It fully takes the whole object.
     If this measurement has 4 full measurements on IP, then it will take all of them and return in a single large dict/JSON.
     The response may be very large (10Kb).
     It best to use after the measurement was finished (for example, when someone access this measurement through a link)
+    The whole tree is loaded with a constant number of queries. (see load_measurements)
     Args:
         db (Session): A connection to the database (we need to query some IDs)
         m (FullMeasurementDN): The measurement object to convert.
+        loaded (Optional[LoadedMeasurements]): The rows that are already loaded. If None, they are loaded.
     Returns:
         dict: The full dict/JSON version of the measurement.
     """
-    m_nts: Optional[NTSMeasurement] = db.query(NTSMeasurement).filter_by(id_nts=m.id_nts).first()
-    m_vs: Optional[NTPVersions] = db.query(NTPVersions).filter_by(id_vs=m.id_vs).first()
+    if loaded is None:
+        loaded = load_measurements(db, [m, *m.ip_measurements])
+    m_nts: Optional[NTSMeasurement] = loaded.nts.get(m.id_nts) if m.id_nts is not None else None
+    m_vs: Optional[NTPVersions] = loaded.ntp_versions.get(m.id_vs) if m.id_vs is not None else None
 
     return {
         "search_id": "dn" + str(m.id_m_dn),
@@ -287,12 +410,12 @@ def full_measurement_dn_to_dict(db: Session, m: FullMeasurementDN) -> dict:
         "server": m.server,
         "created_at_time": m.created_at_time.isoformat() if m.created_at_time else None,
         "nts": nts_measurement_to_dict(m_nts),
-        "ntp_versions": ntp_versions_to_dict(db, m_vs),
+        "ntp_versions": ntp_versions_to_dict(db, m_vs, loaded),
         "id_ripe": m.id_ripe,
         "ripe_error": m.ripe_error,
         "response_error": m.response_error,
         "ip_measurements": [
-            full_measurement_ip_to_dict(db, m_ip, True) for m_ip in m.ip_measurements
+            full_measurement_ip_to_dict(db, m_ip, True, loaded) for m_ip in m.ip_measurements
         ],
         "settings": m.settings
     }
@@ -357,4 +480,67 @@ def partial_measurement_dn_to_dict(db: Session, m: FullMeasurementDN) -> dict:
         "ripe_error": m.ripe_error,
         "response_error": m.response_error,
         "settings": m.settings #if isinstance(m.settings, dict) else getattr(m.settings, "dict", lambda: m.settings)()
-    }
\ No newline at end of file
+    }
+
+def coordinates_or_none(x: Optional[float], y: Optional[float]) -> Optional[tuple[float, float]]:
+    """
+    This method rebuilds the coordinates from their two columns.
+    Args:
+        x (Optional[float]): The latitude.
+        y (Optional[float]): The longitude.
+    Returns:
+        Optional[tuple[float, float]]: The coordinates, or None if they were not saved.
+    """
+    if x is None or y is None:
+        return None
+    return x, y
+
+
+def ripe_probe_result_to_dict(r: RipeProbeResult) -> dict:
+    """
+    This method converts a RipeProbeResult object to a dict/JSON. It has the same format as the results
+    received from RIPE Atlas (see get_ripe_format), so the saved results can be sent instead of fetching them again.
+    Args:
+        r (RipeProbeResult): The result of one probe.
+    Returns:
+        dict: The dict/JSON version of the result.
+    """
+    return {
+        "ntp_version": r.ntp_version,
+        "vantage_point_ip": r.vantage_point_ip,
+        "ripe_measurement_id": r.id_ripe,
+        "ntp_server_ip": r.ntp_server_ip,
+        "ntp_server_name": r.ntp_server_name,
+        "ntp_server_location": {
+            "ip_is_anycast": r.ip_is_anycast,
+            "country_code": r.country_code,
+            "coordinates": coordinates_or_none(r.coordinates_x, r.coordinates_y)
+        },
+        "probe_addr": {
+            "ipv4": r.probe_ipv4,
+            "ipv6": r.probe_ipv6
+        },
+        "probe_id": r.probe_id,
+        "probe_location": {
+            "country_code": r.probe_country_code,
+            "coordinates": coordinates_or_none(r.probe_coordinates_x, r.probe_coordinates_y)
+        },
+        "time_to_result": r.time_to_result,
+        "stratum": r.stratum,
+        "poll": r.poll,
+        "precision": r.precision,
+        "root_delay": r.root_delay,
+        "root_dispersion": r.root_dispersion,
+        "asn_ntp_server": r.asn_ntp_server,
+        "ref_id": r.ref_id,
+        "result": [
+            {
+                "client_sent_time": {"seconds": r.client_sent_time, "fraction": r.client_sent_time_prec},
+                "server_recv_time": {"seconds": r.server_recv_time, "fraction": r.server_recv_time_prec},
+                "server_sent_time": {"seconds": r.server_sent_time, "fraction": r.server_sent_time_prec},
+                "client_recv_time": {"seconds": r.client_recv_time, "fraction": r.client_recv_time_prec},
+                "rtt": r.rtt,
+                "offset": r.offset
+            }
+        ]
+    }
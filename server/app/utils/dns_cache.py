@@ -0,0 +1,329 @@
+import threading
+from dataclasses import dataclass
+from ipaddress import ip_network
+from typing import Optional
+import dns.edns
+import dns.message
+import dns.rdatatype
+
+from server.app.utils.load_config_data import get_dns_cache_max_ttl_s, get_dns_cache_negative_ttl_s, \
+    get_dns_cache_default_ttl_s, get_dns_cache_max_entries
+from server.app.utils.ttl_cache import TTLCache
+
+# A cache of the DNS answers. An EDNS answer is valid for the clients of the network that the resolver returned
+# in its ECS option (the scope prefix), so it is stored under this network and reused for all the clients of it.
+# A resolver that does not support ECS returns no option, and its answer is valid for everyone. (scope 0)
+# The answers of the DNS of this server (forward and reverse) are not client specific, so they are stored by name or IP.
+
+# the key is (domain name, record type, network of the clients for which the answer is valid)
+DnsCacheKey = tuple[str, int, str]
+# the key is (domain name, record type, IP family of the clients) and the value is the scope prefixes seen for it
+DnsScopesKey = tuple[str, int, int]
+
+# the answers of the DNS of this server (getaddrinfo) contain both IPv4 and IPv6 addresses and are not client specific
+SYSTEM_RESOLVER_RDTYPE = int(dns.rdatatype.ANY)
+SYSTEM_RESOLVER_NETWORK = "system"
+
+
+@dataclass(frozen=True)
+class DnsAnswer:
+    """
+    An answer kept in the DNS cache.
+
+    Attributes:
+        ips (tuple[str, ...]): The IP addresses. (empty for a negative answer)
+        next_name (Optional[str]): The end of a CNAME chain that the resolver did not resolve. (None otherwise)
+    """
+    ips: tuple[str, ...]
+    next_name: Optional[str] = None
+
+    def is_negative(self) -> bool:
+        """
+        It returns whether the domain name does not exist or has no record of this type. (NXDOMAIN or NODATA)
+
+        Returns:
+            bool: True if the answer has no IP address and no alias.
+        """
+        return len(self.ips) == 0 and self.next_name is None
+
+
+@dataclass(frozen=True)
+class ReverseDnsAnswer:
+    """
+    A reverse DNS (PTR) answer kept in the cache.
+
+    Attributes:
+        domain_name (Optional[str]): The domain name of the IP address, or None if it has no PTR record.
+    """
+    domain_name: Optional[str]
+
+
+_dns_cache_lock = threading.Lock()
+_dns_cache: Optional[TTLCache[DnsCacheKey, DnsAnswer]] = None
+_dns_scopes: Optional[TTLCache[DnsScopesKey, frozenset[int]]] = None
+_reverse_dns_cache: Optional[TTLCache[str, ReverseDnsAnswer]] = None
+
+
+def get_dns_cache() -> TTLCache[DnsCacheKey, DnsAnswer]:
+    """
+    It returns the cache of the DNS answers, creating it (with the settings from the config) if needed.
+
+    Returns:
+        TTLCache[DnsCacheKey, DnsAnswer]: The cache of the DNS answers.
+    """
+    global _dns_cache
+    with _dns_cache_lock:
+        if _dns_cache is None:
+            _dns_cache = TTLCache("dns", float(get_dns_cache_max_ttl_s()), get_dns_cache_max_entries())
+        return _dns_cache
+
+
+def get_dns_scopes_cache() -> TTLCache[DnsScopesKey, frozenset[int]]:
+    """
+    It returns the cache of the ECS scope prefixes seen for each domain name, creating it if needed.
+    They tell under which networks the answers of a domain name may be stored.
+
+    Returns:
+        TTLCache[DnsScopesKey, frozenset[int]]: The cache of the scope prefixes.
+    """
+    global _dns_scopes
+    with _dns_cache_lock:
+        if _dns_scopes is None:
+            _dns_scopes = TTLCache("dns_scopes", float(get_dns_cache_max_ttl_s()), get_dns_cache_max_entries())
+        return _dns_scopes
+
+
+def get_reverse_dns_cache() -> TTLCache[str, ReverseDnsAnswer]:
+    """
+    It returns the cache of the reverse DNS (PTR) answers, creating it if needed.
+
+    Returns:
+        TTLCache[str, ReverseDnsAnswer]: The cache of the PTR answers, by IP address.
+    """
+    global _reverse_dns_cache
+    with _dns_cache_lock:
+        if _reverse_dns_cache is None:
+            _reverse_dns_cache = TTLCache("reverse_dns", float(get_dns_cache_max_ttl_s()),
+                                          get_dns_cache_max_entries())
+        return _reverse_dns_cache
+
+
+def invalidate_dns_cache() -> None:
+    """
+    It forgets all the cached DNS answers.
+    """
+    get_dns_cache().invalidate()
+    get_dns_scopes_cache().invalidate()
+    get_reverse_dns_cache().invalidate()
+
+
+def get_cache_ttl(ttl_s: Optional[float], negative: bool) -> float:
+    """
+    It returns how long an answer of the DNS of this server can be cached.
+
+    Args:
+        ttl_s (Optional[float]): The TTL of the answer, or None if it is unknown.
+        negative (bool): Whether the answer is negative. (the name does not exist, or it has no record of this type)
+
+    Returns:
+        float: The time-to-live in seconds, limited by the config. (0 means that it should not be cached)
+    """
+    if negative:
+        ttl = float(get_dns_cache_negative_ttl_s())
+    elif ttl_s is None:
+        ttl = float(get_dns_cache_default_ttl_s())
+    else:
+        ttl = float(ttl_s)
+    return min(ttl, float(get_dns_cache_max_ttl_s()))
+
+
+def normalize_domain_name(domain_name: str) -> str:
+    """
+    It returns the domain name in the form used in the keys of the cache. (lowercase, without the final dot)
+
+    Args:
+        domain_name (str): The domain name.
+
+    Returns:
+        str: The normalized domain name.
+    """
+    return domain_name.strip().lower().rstrip(".")
+
+
+def get_ecs_family(ecs: dns.edns.ECSOption) -> int:
+    """
+    It returns the IP family of the client of an ECS option.
+
+    Args:
+        ecs (dns.edns.ECSOption): The EDNS client subnet option.
+
+    Returns:
+        int: 4 or 6.
+    """
+    return 4 if ecs.family == 1 else 6
+
+
+def get_ecs_network(ecs: dns.edns.ECSOption, prefix: int) -> str:
+    """
+    It returns the network of the client of an ECS option, with this prefix length.
+
+    Args:
+        ecs (dns.edns.ECSOption): The EDNS client subnet option.
+        prefix (int): The prefix length.
+
+    Returns:
+        str: The network. (ex: "80.211.238.0/24")
+    """
+    return str(ip_network(f"{ecs.address}/{prefix}", strict=False))
+
+
+def get_response_scope(response: dns.message.Message, ecs: dns.edns.ECSOption) -> int:
+    """
+    It returns the ECS scope prefix of a response: the answer is valid for all the clients of this network.
+    A response without an ECS option is valid for all the clients. (scope 0) A scope longer than the prefix
+    that we sent is reduced to it, because we do not know more of the client.
+
+    Args:
+        response (dns.message.Message): The response.
+        ecs (dns.edns.ECSOption): The EDNS client subnet option of the query.
+
+    Returns:
+        int: The scope prefix length.
+    """
+    for option in response.options:
+        if isinstance(option, dns.edns.ECSOption):
+            return min(option.scopelen, ecs.srclen)
+    return 0
+
+
+def get_response_ttl(response: dns.message.Message, negative: bool) -> float:
+    """
+    It returns how long a response can be cached. For a positive answer, it is the lowest TTL of the records
+    of the answer (CNAMEs included). For a negative answer, it is the negative TTL of the SOA record of
+    the authority section (RFC 2308). Both are limited by the config.
+
+    Args:
+        response (dns.message.Message): The response.
+        negative (bool): Whether the response has no IP address and no alias.
+
+    Returns:
+        float: The time-to-live in seconds. (0 means that it should not be cached)
+    """
+    if negative:
+        ttl = float(get_dns_cache_negative_ttl_s())
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                ttl = min(ttl, rrset.ttl, list(rrset.items)[0].minimum)
+        return min(ttl, float(get_dns_cache_max_ttl_s()))
+    if len(response.answer) == 0:
+        return 0.0
+    return min(float(min(rrset.ttl for rrset in response.answer)), float(get_dns_cache_max_ttl_s()))
+
+
+def get_cached_dns_answer(domain_name: str, rdtype: int, ecs: dns.edns.ECSOption) -> Optional[DnsAnswer]:
+    """
+    It returns the cached answer of an EDNS query for this client, if there is one that did not expire.
+    The answers stored for the most specific networks of the client are checked first.
+
+    Args:
+        domain_name (str): The domain name.
+        rdtype (int): The record type. (A or AAAA)
+        ecs (dns.edns.ECSOption): The EDNS client subnet option of the client.
+
+    Returns:
+        Optional[DnsAnswer]: The answer, or None if it is not cached.
+    """
+    name = normalize_domain_name(domain_name)
+    scopes = get_dns_scopes_cache().get((name, rdtype, get_ecs_family(ecs)))
+    if scopes is None:
+        return None
+    cache = get_dns_cache()
+    for prefix in sorted(scopes, reverse=True):
+        if prefix > ecs.srclen:
+            continue
+        answer = cache.get((name, rdtype, get_ecs_network(ecs, prefix)))
+        if answer is not None:
+            return answer
+    return None
+
+
+def cache_dns_answer(domain_name: str, rdtype: int, ecs: dns.edns.ECSOption, response: dns.message.Message,
+                     answer: DnsAnswer) -> None:
+    """
+    It stores the answer of an EDNS query under the network of its ECS scope, for the TTL of the response.
+
+    Args:
+        domain_name (str): The queried domain name.
+        rdtype (int): The record type. (A or AAAA)
+        ecs (dns.edns.ECSOption): The EDNS client subnet option of the query.
+        response (dns.message.Message): The response that contains the answer.
+        answer (DnsAnswer): The answer taken from the response.
+    """
+    ttl = get_response_ttl(response, answer.is_negative())
+    if ttl <= 0:
+        return
+    name = normalize_domain_name(domain_name)
+    scope = get_response_scope(response, ecs)
+    get_dns_cache().set((name, rdtype, get_ecs_network(ecs, scope)), answer, ttl)
+    scopes_cache = get_dns_scopes_cache()
+    scopes_key: DnsScopesKey = (name, rdtype, get_ecs_family(ecs))
+    with _dns_cache_lock:
+        scopes = scopes_cache.get(scopes_key) or frozenset()
+        scopes_cache.set(scopes_key, scopes | {scope})
+
+
+def get_cached_system_answer(domain_name: str, rdtype: int = SYSTEM_RESOLVER_RDTYPE) -> Optional[DnsAnswer]:
+    """
+    It returns the cached answer of the DNS of this server, if it did not expire.
+
+    Args:
+        domain_name (str): The domain name.
+        rdtype (int): The record type. (A or AAAA) By default, the answers of getaddrinfo. (both IP types)
+
+    Returns:
+        Optional[DnsAnswer]: The answer, or None if it is not cached.
+    """
+    return get_dns_cache().get((normalize_domain_name(domain_name), rdtype, SYSTEM_RESOLVER_NETWORK))
+
+
+def cache_system_answer(domain_name: str, answer: DnsAnswer, rdtype: int = SYSTEM_RESOLVER_RDTYPE,
+                        ttl_s: Optional[float] = None) -> None:
+    """
+    It stores an answer of the DNS of this server. If its TTL is unknown (getaddrinfo), the one from the config is used.
+
+    Args:
+        domain_name (str): The domain name.
+        answer (DnsAnswer): The answer.
+        rdtype (int): The record type. (A or AAAA) By default, the answers of getaddrinfo. (both IP types)
+        ttl_s (Optional[float]): The TTL of the answer, if it is known.
+    """
+    ttl = get_cache_ttl(ttl_s, answer.is_negative())
+    if ttl > 0:
+        get_dns_cache().set((normalize_domain_name(domain_name), rdtype, SYSTEM_RESOLVER_NETWORK), answer, ttl)
+
+
+def get_cached_reverse_dns(ip: str) -> Optional[ReverseDnsAnswer]:
+    """
+    It returns the cached PTR answer of an IP address, if it did not expire.
+
+    Args:
+        ip (str): The IP address.
+
+    Returns:
+        Optional[ReverseDnsAnswer]: The answer, or None if it is not cached.
+    """
+    return get_reverse_dns_cache().get(ip.strip().lower())
+
+
+def cache_reverse_dns(ip: str, domain_name: Optional[str], ttl_s: Optional[float] = None) -> None:
+    """
+    It stores the PTR answer of an IP address. An IP address without PTR record is stored too. (negative answer)
+
+    Args:
+        ip (str): The IP address.
+        domain_name (Optional[str]): Its domain name, or None if it has no PTR record.
+        ttl_s (Optional[float]): The TTL of the PTR record, if it is known.
+    """
+    ttl = get_cache_ttl(ttl_s, domain_name is None)
+    if ttl > 0:
+        get_reverse_dns_cache().set(ip.strip().lower(), ReverseDnsAnswer(domain_name), ttl)
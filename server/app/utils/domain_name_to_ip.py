@@ -1,15 +1,26 @@
+import asyncio
 import socket
 from typing import Optional
-import dns.message
-import dns.query
+import dns.asyncquery
 import dns.edns
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
 import dns.rdatatype
 
 from server.app.models.CustomError import DNSError
-from server.app.utils.ip_utils import get_ip_family
-from server.app.utils.load_config_data import get_edns_default_servers, get_mask_ipv6, get_mask_ipv4, get_edns_timeout_s
+from server.app.utils.circuit_breaker import get_circuit_breaker
+from server.app.utils.dns_cache import DnsAnswer, get_cached_dns_answer, cache_dns_answer, \
+    get_cached_system_answer, cache_system_answer
+from server.app.utils.ip_utils import get_ip_family, run_dns_coroutine
+from server.app.utils.load_config_data import get_edns_default_servers, get_mask_ipv6, get_mask_ipv4, \
+    get_edns_timeout_s, get_edns_hedge_delay_s
 from server.app.utils.validate import is_valid_domain_name
 
+# the maximum length of a CNAME chain that we follow inside one answer
+MAX_CNAME_CHAIN = 8
+
 
 def domain_name_to_ip_list(ntp_server_domain_name: str, client_ip: Optional[str], wanted_ip_type: int) -> list[str]:
     """
@@ -38,10 +49,40 @@ def domain_name_to_ip_list(ntp_server_domain_name: str, client_ip: Optional[str]
         raise DNSError(f"Could not find any IP address for {ntp_server_domain_name}.")
     return domain_ips
 
+
+async def domain_name_to_ip_list_async(ntp_server_domain_name: str, client_ip: Optional[str],
+                                       wanted_ip_type: int) -> list[str]:
+    """
+    This method is the asynchronous version of domain_name_to_ip_list, for the code that runs in the event loop.
+
+    Args:
+        ntp_server_domain_name (str): NTP server domain name.
+        client_ip (Optional[str]): Client IP address.
+        wanted_ip_type (int): The IP type of the resulting IPs that we want. (IPv4 or IPv6).
+
+    Returns:
+        list[str]: List of IP addresses that are close to the client or to the server if client IP is None
+
+    Raises:
+        DNSError: If the domain name is invalid, or it was impossible to find some IP addresses.
+    """
+    domain_ips: list[str] | None
+    if client_ip is None:
+        domain_ips = await asyncio.get_running_loop().run_in_executor(None, domain_name_to_ip_default,
+                                                                      ntp_server_domain_name)
+    else:
+        domain_ips = await domain_name_to_ip_close_to_client_async(ntp_server_domain_name, client_ip, wanted_ip_type)
+
+    if domain_ips is None or len(domain_ips) == 0:
+        raise DNSError(f"Could not find any IP address for {ntp_server_domain_name}.")
+    return domain_ips
+
+
 def domain_name_to_ip_default(domain_name: str) -> Optional[list[str]]:
     """
     It uses the DNS of this server to obtain the ip addresses of the domain name.
     This method is useful if you want IPs close to this server, or you do not care about the location of the IPs.
+    The answers (and the names that do not exist) are cached. (see dns_cache)
 
     Args:
         domain_name(str): The NTP server domain name.
@@ -52,38 +93,73 @@ def domain_name_to_ip_default(domain_name: str) -> Optional[list[str]]:
     try:
         if not is_valid_domain_name(domain_name):
             return None
+        cached = get_cached_system_answer(domain_name)
+        if cached is not None:
+            return list(cached.ips) if not cached.is_negative() else None
         results = socket.getaddrinfo(domain_name, 123, proto=socket.IPPROTO_UDP)
         ips = sorted(set(item[4][0] for item in results))
+        if len(ips) != 0:
+            cache_system_answer(domain_name, DnsAnswer(tuple(ips)))
         return ips
+    except socket.gaierror as e:
+        if e.errno in (socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME)):
+            cache_system_answer(domain_name, DnsAnswer(()))
+        print("Error in domain name to ip default: ", e)
+        return None
     except Exception as e:
         print("Error in domain name to ip default: ", e)
         return None
 
 
 def domain_name_to_ip_close_to_client(domain_name: str, client_ip: str, wanted_ip_type: int,
-                                                    resolvers: list[str] = get_edns_default_servers(),
-                                                    depth: int = 0, max_depth: int = 2) -> Optional[list[str]]:
+                                      resolvers: Optional[list[str]] = None,
+                                      max_depth: int = 2) -> Optional[list[str]]:
+    """
+    This method tries to obtain the ip addresses of the domain name from some popular DNS servers (resolvers)
+    that have (or may have) the ability to get an IP close to the client. It is the blocking version of
+    domain_name_to_ip_close_to_client_async.
+
+    Args:
+        domain_name(str): The domain name.
+        client_ip(str): The client IP.
+        wanted_ip_type(int): The IP type of the resulting IPs that we want.
+        resolvers(Optional[list[str]]): A list of popular DNS resolvers that are ECS-capable. By default, the ones
+            from the config.
+        max_depth(int): How many times we query again for the end of a CNAME chain that was not resolved.
+
+    Returns:
+        Optional[list[str]]: A list of IPs of the domain name or None if the domain name is not valid.
+
+    Raises:
+        Exception: If the client IP is invalid.
+    """
+    return run_dns_coroutine(domain_name_to_ip_close_to_client_async(domain_name, client_ip, wanted_ip_type,
+                                                                     resolvers, max_depth))
+
+
+async def domain_name_to_ip_close_to_client_async(domain_name: str, client_ip: str, wanted_ip_type: int,
+                                                  resolvers: Optional[list[str]] = None,
+                                                  max_depth: int = 2) -> Optional[list[str]]:
     """
     This method tries to obtain the ip addresses of the domain name from some popular DNS servers (resolvers)
-    that have (or may have) the ability to get an IP close to the client. It uses EDNS queries to get the IPs
-    and in case the queries return a domain name, this method recursively tries to solve them. It uses "depth"
-    and "max_depth" to prevent infinite loops in redirecting.
+    that have (or may have) the ability to get an IP close to the client. It uses EDNS queries to get the IPs.
+    The resolvers are queried concurrently (see query_resolvers_async) and the first valid answer is used.
+    A CNAME chain is followed inside the answer. Only if the answer ends with a CNAME that the resolver did not
+    resolve, the end of the chain is queried again (at most "max_depth" times, to prevent infinite loops).
 
     It is important to note that multiple servers may share the same IP address. So, some countries may use the
     same IP for the same domain name. You can check this using https://www.whatsmydns.net/. This also provides
     insights in the cases where we receive CNAME responses.
 
-
-    If the name is not a domain name, it will return an empty list.
-    If the EDNS query does not return a CNAME, depth and max_depth would not be used.
+    If the name is not a domain name, it will return None.
 
     Args:
         domain_name(str): The domain name.
         client_ip(str): The client IP.
         wanted_ip_type(int): The IP type of the resulting IPs that we want.
-        resolvers(list): A list of popular DNS resolvers that are ECS-capable.
-        depth(int): The depth of the EDNS query if it returns a CNAME. (It is recommended to set this to 0.)
-        max_depth(int): The maximum depth of the EDNS query. (It is recommended to set this to 2 or 3 to prevent long delay.)
+        resolvers(Optional[list[str]]): A list of popular DNS resolvers that are ECS-capable. By default, the ones
+            from the config.
+        max_depth(int): How many times we query again for the end of a CNAME chain that was not resolved.
 
     Returns:
         Optional[list[str]]: A list of IPs of the domain name or None if the domain name is not valid.
@@ -101,33 +177,86 @@ def domain_name_to_ip_close_to_client(domain_name: str, client_ip: str, wanted_i
     else:
         mask = get_mask_ipv4()
 
-    ips: list[str] = []
-
     try:
+        if resolvers is None:
+            resolvers = get_edns_default_servers()
         # create a EDNS client subnet, which will be used to tell a close DNS server to the client
         ecs = dns.edns.ECSOption(address=client_ip, srclen=mask, scopelen=0)
-        # we try for all resolvers because some of them may not accept some domain names
-        for r in resolvers:
-            # stop if we already found some IP addresses. Remove this "if" if you want to get more IPs
-            if len(ips) != 0:
-                break
-            response = perform_edns_query(domain_name, r, ecs, wanted_ip_type=wanted_ip_type)
-
-            if response is None:
-                continue
-            # collect the IPs or search further if we found a CNAME
-            ips = ips + edns_response_to_ips(response, client_ip, wanted_ip_type, resolvers, depth, max_depth)
+        name = domain_name
+        for _ in range(max_depth + 1):
+            ips, next_name = await query_resolvers_async(name, ecs, wanted_ip_type, resolvers)
+            if len(ips) != 0 or next_name is None:
+                return sorted(set(ips))
+            print("redirecting to ", next_name)
+            name = next_name
     except Exception as e:
         print("Error in domain name to ip close to client: ", e)
         return None
+    return []
 
-    #remove duplicates
-    ips = list(set(ips))
-    return ips
 
+async def query_resolvers_async(domain_name: str, ecs: dns.edns.ECSOption, wanted_ip_type: int,
+                                resolvers: list[str], hedge_delay_s: Optional[float | int] = None,
+                                timeout: Optional[float | int] = None) -> tuple[list[str], Optional[str]]:
+    """
+    This method queries the resolvers concurrently and returns the first valid answer. The first resolver is
+    asked immediately. The next one is asked when the previous one failed, or did not answer within
+    "hedge_delay_s" (so a resolver that is down does not delay the answer by its whole timeout).
+    When a valid answer arrives, the queries that are still running are cancelled.
+    The answers are cached for the network of their ECS scope, so the clients of the same network reuse them
+    without any query. If no resolver found an IP, a negative answer (NXDOMAIN or NODATA) is cached too.
 
-def perform_edns_query(domain_name: str, resolver_name: str, ecs: dns.edns.ECSOption,
-                       wanted_ip_type: int, timeout: float|int = get_edns_timeout_s()) -> Optional[dns.message.Message]:
+    Args:
+        domain_name(str): The domain name.
+        ecs(dns.edns.ECSOption): The EDNS client subnet option.
+        wanted_ip_type(int): The IP type of the EDNS query. (4 or 6)
+        resolvers(list[str]): The resolvers, in the order of their priority.
+        hedge_delay_s(Optional[float | int]): How long to wait before asking the next resolver. By default,
+            the one from the config.
+        timeout(Optional[float | int]): The timeout of each query. By default, the one from the config.
+
+    Returns:
+        tuple[list[str], Optional[str]]: The IPs and the end of the CNAME chain if it still has to be resolved
+        (see edns_response_to_ips). ([], None) if no resolver gave a valid answer.
+    """
+    rdtype = dns.rdatatype.A if wanted_ip_type == 4 else dns.rdatatype.AAAA
+    cached = get_cached_dns_answer(domain_name, rdtype, ecs)
+    if cached is not None:
+        return list(cached.ips), cached.next_name
+    delay = float(get_edns_hedge_delay_s() if hedge_delay_s is None else hedge_delay_s)
+    running: set[asyncio.Task] = set()
+    next_resolver = 0
+    negative_response: Optional[dns.message.Message] = None
+    try:
+        while True:
+            if next_resolver < len(resolvers):
+                running.add(asyncio.create_task(
+                    perform_edns_query_async(domain_name, resolvers[next_resolver], ecs, wanted_ip_type, timeout)))
+                next_resolver += 1
+            if not running:
+                if negative_response is not None:
+                    cache_dns_answer(domain_name, rdtype, ecs, negative_response, DnsAnswer(()))
+                return [], None
+            done, running = await asyncio.wait(running, timeout=delay if next_resolver < len(resolvers) else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                response = task.result()
+                if response is None or response.rcode() not in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+                    continue
+                ips, next_name = edns_response_to_ips(response, domain_name)
+                if len(ips) == 0 and next_name is None:
+                    negative_response = response
+                    continue
+                cache_dns_answer(domain_name, rdtype, ecs, response, DnsAnswer(tuple(ips), next_name))
+                return ips, next_name
+    finally:
+        for task in running:
+            task.cancel()
+
+
+async def perform_edns_query_async(domain_name: str, resolver_name: str, ecs: dns.edns.ECSOption,
+                                   wanted_ip_type: int, timeout: Optional[float | int] = None) \
+        -> Optional[dns.message.Message]:
     """
     This method performs a EDNS query against the domain name using the resolver as
     the DNS IP and returns the response.
@@ -137,60 +266,71 @@ def perform_edns_query(domain_name: str, resolver_name: str, ecs: dns.edns.ECSOp
          resolver_name(str): The resolver name.
          ecs(dns.edns.ECSOption): The EDNS query option. It contains information about the client IP.
          wanted_ip_type(int): The IP type of the EDNS query. (4 or 6)
-         timeout(float|int): The timeout for the EDNS query.
+         timeout(Optional[float | int]): The timeout for the EDNS query. By default, the one from the config.
 
     Returns:
-        Optional[dns.message.Message]: The response from the EDNS query.
+        Optional[dns.message.Message]: The response from the EDNS query. None if the resolver did not answer,
+        or if it failed too many times recently. (its circuit breaker is open)
     """
+    breaker = get_circuit_breaker(f"edns:{resolver_name}")
+    if not breaker.allow_request():
+        return None
+    if timeout is None:
+        timeout = get_edns_timeout_s()
     # prepare to ask the DNS
     if wanted_ip_type == 4:
         query = dns.message.make_query(domain_name, dns.rdatatype.A)
     else:
         query = dns.message.make_query(domain_name, dns.rdatatype.AAAA)
     query.use_edns(edns=True, options=[ecs])
-    # try with udp and if it fails try with tcp
+    # try with udp and if it fails (or the answer was truncated) try with tcp
     try:
-        response = dns.query.udp(query, resolver_name, timeout=timeout)
-    except Exception:
         try:
-            response = dns.query.tcp(query, resolver_name, timeout=timeout)
+            response = await dns.asyncquery.udp(query, resolver_name, timeout=timeout)
+            if response.flags & dns.flags.TC:
+                raise dns.message.Truncated()
         except Exception:
-            return None
+            response = await dns.asyncquery.tcp(query, resolver_name, timeout=timeout)
+    except Exception:
+        breaker.record_failure()
+        return None
+    except BaseException:  # cancelled: the resolver did not fail, but a half-open trial must not stay taken
+        breaker.release_trial()
+        raise
+    breaker.record_success()
     return response
 
 
-def edns_response_to_ips(response: dns.message.Message, client_ip: str, wanted_ip_type: int,
-                         resolvers: list[str], depth: int=0, max_depth: int=2) -> list[str]:
+def edns_response_to_ips(response: dns.message.Message, domain_name: str) -> tuple[list[str], Optional[str]]:
     """
-    This method takes the IPs from the response. In case the response has a CNAME, it will
-    recursively try to get an IP from that CNAME. In the worst case, it will be redirected "max_depth" times.
-    This parameter is useful for preventing an infinite loop in redirecting.
+    This method takes the IPs from the response. If the domain name is an alias (CNAME), the chain of aliases
+    is followed inside the answer (resolvers usually send the whole chain and the IPs of its end).
+    If the chain ends with a name that has no IPs in the answer, this name is returned, so that it can be queried.
 
     Args:
         response(dns.message.Message): The response from the EDNS query.
-        client_ip(str): The client IP.
-        wanted_ip_type(int): The IP type of the resulting IPs that we want.
-        resolvers(list): A list of popular DNS resolvers that are ECS-capable. They are used in the CNAME case.
-        depth(int): The depth of the EDNS query.
-        max_depth(int): The maximum depth of the EDNS query.
+        domain_name(str): The queried domain name.
 
     Returns:
-        list(str): A list of IPs taken from the response.
+        tuple[list[str], Optional[str]]: The IPs taken from the response, and the end of the CNAME chain if it
+        still has to be resolved (None otherwise).
     """
     ips: list[str] = []
+    aliases: dict[dns.name.Name, dns.name.Name] = {}
     for ans in response.answer:
         # take into consideration IPv4,IPv6 and CNAME (which redirects to another domain name)
         if ans.rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA):
             for i in ans.items:
                 ips.append(i.address)
-        else:
-            if ans.rdtype == dns.rdatatype.CNAME:
-                # there is at most 1 CNAME
-                next_domain_name = str(list(ans.items)[0]).rstrip('.')
-                print("redirecting to ", next_domain_name)
-                if depth < max_depth:
-                    a = domain_name_to_ip_close_to_client(next_domain_name, client_ip, wanted_ip_type, resolvers,
-                                                          depth + 1, max_depth)
-                    if a is not None:
-                        ips += a
-    return ips
+        elif ans.rdtype == dns.rdatatype.CNAME:
+            # there is at most 1 CNAME per name
+            aliases[ans.name] = list(ans.items)[0].target
+    if len(ips) != 0 or len(aliases) == 0:
+        return ips, None
+    # follow the chain of aliases
+    name = dns.name.from_text(domain_name)
+    for _ in range(MAX_CNAME_CHAIN):
+        if name not in aliases:
+            break
+        name = aliases[name]
+    return [], name.to_text(omit_final_dot=True)
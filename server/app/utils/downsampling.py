@@ -0,0 +1,80 @@
+import numpy as np
+
+# Downsampling of the historical measurements for the charts, with Largest-Triangle-Three-Buckets (LTTB).
+# The points are split into buckets and, in each bucket, the point that makes the largest triangle with the point
+# chosen in the previous bucket and the average of the next bucket is kept. It keeps the shape of the series
+# (the peaks too), unlike taking one point out of N, so a chart of any time range needs only a few hundred points.
+
+# the offset and the RTT series share the points, so each one gets half of them
+DOWNSAMPLED_SERIES = ("offset", "rtt")
+MIN_MAX_POINTS = 2 * len(DOWNSAMPLED_SERIES)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    It chooses at most max_points points of a series with LTTB. The first and the last points are always kept.
+    The averages of the buckets and the triangle areas are computed with NumPy, only the choice of each point
+    (which depends on the point chosen before it) is a loop over the buckets.
+
+    Args:
+        x (np.ndarray): The x values, in increasing order.
+        y (np.ndarray): The y values.
+        max_points (int): The maximum number of points to keep.
+
+    Returns:
+        np.ndarray: The indices of the kept points, in increasing order.
+    """
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1][:max_points], dtype=int)
+    # the points between the first and the last one, split into max_points - 2 non-empty buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    # the point after the last bucket is the last point
+    avg_x = np.append(avg_x, x[n - 1])
+    avg_y = np.append(avg_y, y[n - 1])
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = np.abs((x[a] - avg_x[i + 1]) * (y[start:end] - y[a]) -
+                       (x[a] - x[start:end]) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_measurements(measurements: list[dict], max_points: int) -> list[dict]:
+    """
+    It keeps at most max_points historical measurements (ordered by time) for the charts: the points chosen
+    by LTTB over the offset series and over the RTT series. (half of the points each)
+    The measurements without an offset and an RTT are not kept.
+
+    Args:
+        measurements (list[dict]): The historical measurements, ordered by client_sent_time.
+        max_points (int): The maximum number of measurements to keep.
+
+    Returns:
+        list[dict]: The kept measurements, in the same order.
+    """
+    if len(measurements) <= max_points:
+        return measurements
+    points_per_series = max_points // len(DOWNSAMPLED_SERIES)
+    kept: set[int] = set()
+    for series in DOWNSAMPLED_SERIES:
+        valid = np.array([i for i, m in enumerate(measurements)
+                          if m.get(series) is not None and m.get("client_sent_time") is not None], dtype=int)
+        if valid.size == 0:
+            continue
+        first_time = measurements[valid[0]]["client_sent_time"]
+        # relative times, because the 64-bit NTP timestamps do not fit exactly in a float
+        x = np.array([measurements[i]["client_sent_time"] - first_time for i in valid], dtype=float)
+        y = np.array([measurements[i][series] for i in valid], dtype=float)
+        kept.update(int(i) for i in valid[lttb_indices(x, y, points_per_series)])
+    return [measurements[i] for i in sorted(kept)]
@@ -0,0 +1,502 @@
+import asyncio
+import importlib.util
+import random
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from server.app.utils.circuit_breaker import get_circuit_breaker
+from server.app.utils.load_config_data import get_http_connect_timeout_s, get_http_read_timeout_s, \
+    get_http_max_retries, get_http_backoff_base_s, get_http_pool_size_per_host, \
+    get_http_max_concurrent_requests_per_host
+from server.app.utils.metrics import increment_counter, observe_duration
+
+# status codes after which a request is worth retrying (the server is overloaded or temporarily down)
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# we never wait longer than this between two retries, even if the server asks for more in "Retry-After"
+MAX_RETRY_DELAY_S = 30.0
+
+_lock = threading.Lock()
+_sessions: dict[str, requests.Session] = {}
+_host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+# the async clients and their semaphores are bound to the event loop that created them
+_async_hosts: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, tuple[httpx.AsyncClient, asyncio.Semaphore]]]" \
+    = weakref.WeakKeyDictionary()
+
+
+def get_host_key(url: str) -> str:
+    """
+    It returns the key used to share the connection pool and the concurrency cap between requests. (scheme + host + port)
+
+    Args:
+        url (str): The URL of the request.
+
+    Returns:
+        str: The key of the host. (ex: "https://atlas.ripe.net")
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def get_dependency_name(url: str) -> str:
+    """
+    It returns the name of the dependency of this URL, used for its circuit breaker and its metrics. (the host)
+
+    Args:
+        url (str): The URL of the request.
+
+    Returns:
+        str: The name of the dependency. (ex: "atlas.ripe.net")
+    """
+    return urlsplit(url).netloc.lower()
+
+
+def is_failed_response(status_code: int) -> bool:
+    """
+    It decides whether a response means that the dependency is unhealthy. (it counts as a failure for its circuit breaker)
+    Client errors like 400 or 404 are our fault, so they do not count.
+
+    Args:
+        status_code (int): The status code of the response.
+
+    Returns:
+        bool: True if the dependency is unhealthy, False otherwise.
+    """
+    return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+
+def is_http2_available() -> bool:
+    """
+    It checks whether the optional "h2" package is installed, which httpx needs to speak HTTP/2.
+
+    Returns:
+        bool: True if HTTP/2 can be used by the async client, False otherwise.
+    """
+    return importlib.util.find_spec("h2") is not None
+
+
+def get_default_timeout() -> tuple[float, float]:
+    """
+    It returns the (connect, read) timeouts used for outbound HTTP requests.
+
+    Returns:
+        tuple[float, float]: The connect timeout and the read timeout in seconds.
+    """
+    return float(get_http_connect_timeout_s()), float(get_http_read_timeout_s())
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    It returns the shared session of the host of this URL. The session keeps a pool of keep-alive connections,
+    so that consecutive requests to the same host do not pay a new TCP and TLS handshake.
+
+    Args:
+        url (str): The URL of the request.
+
+    Returns:
+        requests.Session: The session of this host.
+    """
+    key = get_host_key(url)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            # retries are handled by us, so that we can add jitter and respect "Retry-After"
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=get_http_pool_size_per_host(), max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+        return session
+
+
+def get_host_semaphore(url: str) -> threading.BoundedSemaphore:
+    """
+    It returns the semaphore that limits the number of parallel requests to the host of this URL.
+
+    Args:
+        url (str): The URL of the request.
+
+    Returns:
+        threading.BoundedSemaphore: The semaphore of this host.
+    """
+    key = get_host_key(url)
+    with _lock:
+        semaphore = _host_semaphores.get(key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(get_http_max_concurrent_requests_per_host())
+            _host_semaphores[key] = semaphore
+        return semaphore
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    It parses the "Retry-After" header. It can be a number of seconds or an HTTP date.
+
+    Args:
+        value (Optional[str]): The value of the header.
+
+    Returns:
+        Optional[float]: The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def compute_retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    It computes how long to wait before the next retry. It uses exponential backoff with "full jitter"
+    (a random delay between 0 and base * 2^attempt), so that many clients do not retry at the same moment.
+    If the server told us how long to wait, we wait at least that long.
+
+    Args:
+        attempt (int): The number of the retry. (starting from 0)
+        retry_after (Optional[float]): The delay requested by the server, if any.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    delay = random.uniform(0, get_http_backoff_base_s() * (2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return min(delay, MAX_RETRY_DELAY_S)
+
+
+def should_retry(status_code: int, method: str) -> bool:
+    """
+    It decides whether a response is worth retrying. POST requests are only retried on 429, because the server
+    did not process the request. On 5xx, it may have been processed, and we do not want to create a RIPE measurement twice.
+
+    Args:
+        status_code (int): The status code of the response.
+        method (str): The HTTP method of the request.
+
+    Returns:
+        bool: True if the request should be retried, False otherwise.
+    """
+    if method.upper() == "POST":
+        return status_code == 429
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def http_request(method: str, url: str, timeout: Optional[tuple[float, float]] = None,
+                 **kwargs: Any) -> requests.Response:
+    """
+    It performs an outbound HTTP request through the circuit breaker of the host. If the host failed too many times
+    recently, it fails fast instead of waiting for the timeouts.
+
+    Args:
+        method (str): The HTTP method. ("GET", "POST", ...)
+        url (str): The URL of the request.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+        **kwargs (Any): Other arguments passed to requests. (headers, params, data, json)
+
+    Returns:
+        requests.Response: The last response received. It can still have a 429 or 5xx status code if the retries were exhausted.
+
+    Raises:
+        CircuitOpenError: If the circuit breaker of the host is open.
+        requests.RequestException: If the request could not be performed even after all retries.
+    """
+    dependency = get_dependency_name(url)
+    breaker = get_circuit_breaker(dependency)
+    breaker.check()
+    start = time.monotonic()
+    try:
+        response = _request_with_retries(method, url, timeout, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        increment_counter("outbound_http_requests_total", {"host": dependency, "status": "error"})
+        raise
+    except BaseException:
+        # cancelled or interrupted: the host did not fail, but the trial call (if it was one) is over
+        breaker.release_trial()
+        raise
+    finally:
+        observe_duration("outbound_http_request", time.monotonic() - start, {"host": dependency})
+    if is_failed_response(response.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    increment_counter("outbound_http_requests_total", {"host": dependency, "status": str(response.status_code)})
+    return response
+
+
+def _request_with_retries(method: str, url: str, timeout: Optional[tuple[float, float]] = None,
+                          **kwargs: Any) -> requests.Response:
+    """
+    It performs an outbound HTTP request using the keep-alive pool of the host, bounded by connect/read timeouts
+    and by the concurrency cap of the host. It retries (with jitter) on 429 and 5xx responses and on connection errors.
+
+    Args:
+        method (str): The HTTP method. ("GET", "POST", ...)
+        url (str): The URL of the request.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+        **kwargs (Any): Other arguments passed to requests. (headers, params, data, json)
+
+    Returns:
+        requests.Response: The last response received. It can still have a 429 or 5xx status code if the retries were exhausted.
+
+    Raises:
+        requests.RequestException: If the request could not be performed even after all retries.
+    """
+    if timeout is None:
+        timeout = get_default_timeout()
+    session = get_session(url)
+    semaphore = get_host_semaphore(url)
+    max_retries = get_http_max_retries()
+    attempt = 0
+    while True:
+        try:
+            with semaphore:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.ConnectionError as e:
+            # a POST that timed out while connecting never reached the server, so only then it is safe to retry it
+            if attempt >= max_retries or (method.upper() == "POST" and not isinstance(e, requests.ConnectTimeout)):
+                raise
+            time.sleep(compute_retry_delay(attempt))
+            attempt += 1
+            continue
+        if attempt >= max_retries or not should_retry(response.status_code, method):
+            return response
+        delay = compute_retry_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+        response.close()
+        time.sleep(delay)
+        attempt += 1
+
+
+def http_get(url: str, headers: Optional[dict[str, str]] = None, params: Optional[dict[str, Any]] = None,
+             timeout: Optional[tuple[float, float]] = None) -> requests.Response:
+    """
+    It performs a GET request through the shared HTTP client.
+
+    Args:
+        url (str): The URL of the request.
+        headers (Optional[dict[str, str]]): The headers of the request.
+        params (Optional[dict[str, Any]]): The query parameters of the request.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+
+    Returns:
+        requests.Response: The response.
+
+    Raises:
+        requests.RequestException: If the request could not be performed.
+    """
+    return http_request("GET", url, timeout=timeout, headers=headers, params=params)
+
+
+def http_post(url: str, headers: Optional[dict[str, str]] = None, data: Optional[str | bytes] = None,
+              json: Optional[Any] = None, timeout: Optional[tuple[float, float]] = None) -> requests.Response:
+    """
+    It performs a POST request through the shared HTTP client.
+
+    Args:
+        url (str): The URL of the request.
+        headers (Optional[dict[str, str]]): The headers of the request.
+        data (Optional[str | bytes]): The raw body of the request.
+        json (Optional[Any]): The body of the request, serialized as JSON.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+
+    Returns:
+        requests.Response: The response.
+
+    Raises:
+        requests.RequestException: If the request could not be performed.
+    """
+    return http_request("POST", url, timeout=timeout, headers=headers, data=data, json=json)
+
+
+def get_async_client(url: str) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+    """
+    It returns the async client and the semaphore of the host of this URL, for the running event loop.
+    The client keeps keep-alive connections and uses HTTP/2 if the "h2" package is installed.
+
+    Args:
+        url (str): The URL of the request.
+
+    Returns:
+        tuple[httpx.AsyncClient, asyncio.Semaphore]: The client and the concurrency cap of this host.
+    """
+    loop = asyncio.get_running_loop()
+    key = get_host_key(url)
+    with _lock:
+        hosts = _async_hosts.setdefault(loop, {})
+        entry = hosts.get(key)
+        if entry is None:
+            connect_timeout, read_timeout = get_default_timeout()
+            pool_size = get_http_pool_size_per_host()
+            client = httpx.AsyncClient(
+                http2=is_http2_available(),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+            entry = (client, asyncio.Semaphore(get_http_max_concurrent_requests_per_host()))
+            hosts[key] = entry
+        return entry
+
+
+async def async_http_request(method: str, url: str, timeout: Optional[tuple[float, float]] = None,
+                             **kwargs: Any) -> httpx.Response:
+    """
+    The async variant of "http_request". It has the same circuit breaker, timeouts, retries and per-host concurrency cap.
+
+    Args:
+        method (str): The HTTP method. ("GET", "POST", ...)
+        url (str): The URL of the request.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+        **kwargs (Any): Other arguments passed to httpx. (headers, params, content, json)
+
+    Returns:
+        httpx.Response: The last response received.
+
+    Raises:
+        CircuitOpenError: If the circuit breaker of the host is open.
+        httpx.HTTPError: If the request could not be performed even after all retries.
+    """
+    dependency = get_dependency_name(url)
+    breaker = get_circuit_breaker(dependency)
+    breaker.check()
+    start = time.monotonic()
+    try:
+        response = await _async_request_with_retries(method, url, timeout, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        increment_counter("outbound_http_requests_total", {"host": dependency, "status": "error"})
+        raise
+    except BaseException:
+        # cancelled or interrupted: the host did not fail, but the trial call (if it was one) is over
+        breaker.release_trial()
+        raise
+    finally:
+        observe_duration("outbound_http_request", time.monotonic() - start, {"host": dependency})
+    if is_failed_response(response.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    increment_counter("outbound_http_requests_total", {"host": dependency, "status": str(response.status_code)})
+    return response
+
+
+async def _async_request_with_retries(method: str, url: str, timeout: Optional[tuple[float, float]] = None,
+                                      **kwargs: Any) -> httpx.Response:
+    """
+    The async variant of "_request_with_retries".
+
+    Args:
+        method (str): The HTTP method. ("GET", "POST", ...)
+        url (str): The URL of the request.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+        **kwargs (Any): Other arguments passed to httpx. (headers, params, content, json)
+
+    Returns:
+        httpx.Response: The last response received.
+
+    Raises:
+        httpx.HTTPError: If the request could not be performed even after all retries.
+    """
+    client, semaphore = get_async_client(url)
+    if timeout is not None:
+        kwargs["timeout"] = httpx.Timeout(timeout[1], connect=timeout[0])
+    max_retries = get_http_max_retries()
+    attempt = 0
+    while True:
+        try:
+            async with semaphore:
+                response = await client.request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            # the request never reached the server, so it is safe to retry it (even a POST)
+            if attempt >= max_retries:
+                raise
+            await asyncio.sleep(compute_retry_delay(attempt))
+            attempt += 1
+            continue
+        if attempt >= max_retries or not should_retry(response.status_code, method):
+            return response
+        delay = compute_retry_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+        await response.aclose()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def async_http_get(url: str, headers: Optional[dict[str, str]] = None, params: Optional[dict[str, Any]] = None,
+                         timeout: Optional[tuple[float, float]] = None) -> httpx.Response:
+    """
+    It performs a GET request through the shared async HTTP client.
+
+    Args:
+        url (str): The URL of the request.
+        headers (Optional[dict[str, str]]): The headers of the request.
+        params (Optional[dict[str, Any]]): The query parameters of the request.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+
+    Returns:
+        httpx.Response: The response.
+
+    Raises:
+        httpx.HTTPError: If the request could not be performed.
+    """
+    return await async_http_request("GET", url, timeout=timeout, headers=headers, params=params)
+
+
+async def async_http_post(url: str, headers: Optional[dict[str, str]] = None, data: Optional[str | bytes] = None,
+                          json: Optional[Any] = None, timeout: Optional[tuple[float, float]] = None) -> httpx.Response:
+    """
+    It performs a POST request through the shared async HTTP client.
+
+    Args:
+        url (str): The URL of the request.
+        headers (Optional[dict[str, str]]): The headers of the request.
+        data (Optional[str | bytes]): The raw body of the request.
+        json (Optional[Any]): The body of the request, serialized as JSON.
+        timeout (Optional[tuple[float, float]]): The (connect, read) timeouts. By default, the ones from the config.
+
+    Returns:
+        httpx.Response: The response.
+
+    Raises:
+        httpx.HTTPError: If the request could not be performed.
+    """
+    return await async_http_request("POST", url, timeout=timeout, headers=headers, content=data, json=json)
+
+
+def close_http_clients() -> None:
+    """
+    It closes all the sync sessions. (the async clients are closed by "aclose_http_clients")
+    """
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        _host_semaphores.clear()
+    for session in sessions:
+        session.close()
+
+
+async def aclose_http_clients() -> None:
+    """
+    It closes the sync sessions and the async clients that belong to the running event loop.
+    """
+    close_http_clients()
+    loop = asyncio.get_running_loop()
+    with _lock:
+        hosts = _async_hosts.pop(loop, {})
+    for client, _ in hosts.values():
+        await client.aclose()
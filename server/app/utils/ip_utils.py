@@ -1,21 +1,59 @@
+import asyncio
 import ipaddress
 import os
 import random
 import socket
+import threading
+import time
+from dataclasses import dataclass
 from ipaddress import ip_address, IPv4Address, IPv6Address
-from typing import Optional
+from typing import Any, Coroutine, Optional, TypeVar
 import ntplib
-import requests
+import dns.asyncresolver
+import dns.rdatatype
 import dns.resolver
 import dns.reversename
 
-from server.app.utils.load_config_data import get_ipv4_edns_server, get_ipv6_edns_server
+from server.app.utils.dns_cache import DnsAnswer, get_cached_system_answer, cache_system_answer, \
+    get_cached_reverse_dns, cache_reverse_dns
+from server.app.utils.http_client import http_get, async_http_get
+from server.app.utils.load_config_data import get_ipv4_edns_server, get_ipv6_edns_server, get_edns_timeout_s, \
+    get_vantage_point_refresh_interval_s, get_vantage_point_network_check_interval_s
 from server.app.utils.load_config_data import get_mask_ipv4, get_mask_ipv6
-from server.app.utils.location_resolver import get_asn_for_ip, get_country_for_ip, get_continent_for_ip
+from server.app.utils.location_resolver import get_asn_for_ip, get_country_for_ip, get_continent_for_ip, \
+    get_coordinates_for_ip
 from server.app.models.CustomError import InputError
 from server.app.utils.validate import is_ip_address
 from fastapi import HTTPException, Request
 
+T = TypeVar("T")
+
+# the last public IP addresses of our server returned by ipify (for each IP type), used when ipify is unavailable
+_last_ipify_ips: dict[int, IPv4Address | IPv6Address] = {}
+
+
+def run_dns_coroutine(coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    It runs a DNS coroutine from synchronous code (a worker thread) and returns its result.
+    It must not be called from a thread that runs an event loop, because it would block the loop until the DNS queries
+    are done: asynchronous code awaits the asynchronous version of the function instead.
+
+    Args:
+        coroutine (Coroutine[Any, Any, T]): The coroutine.
+
+    Returns:
+        T: The result of the coroutine.
+
+    Raises:
+        RuntimeError: If it is called from a running event loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    coroutine.close()
+    raise RuntimeError("a blocking DNS call was made from the event loop, await the asynchronous version instead")
+
 
 def ref_id_to_ip_or_name(ref_id: int, stratum: int, ip_family: int) \
         -> tuple[None, str] | tuple[IPv4Address | IPv6Address, None] | tuple[None, None]:
@@ -158,7 +196,7 @@ def get_prefix_from_ip(ip_str: str) -> Optional[str]:
     """
     try:
         ip_str_to_ask = ip_to_str(randomize_ip(ip_address(ip_str)))
-        response = requests.get(f"https://stat.ripe.net/data/prefix-overview/data.json?resource={ip_str_to_ask}")
+        response = http_get("https://stat.ripe.net/data/prefix-overview/data.json", params={"resource": ip_str_to_ask})
         response.raise_for_status()
         data = response.json()["data"]
         prefix: str = data.get("resource", None)
@@ -183,19 +221,41 @@ def ip_to_str(ip: Optional[IPv4Address | IPv6Address]) -> Optional[str]:
     return str(ip) if ip is not None else None
 
 
-def get_server_ip(wanted_ip_type: int) -> IPv4Address | IPv6Address | None:
+@dataclass(frozen=True)
+class VantagePoint:
     """
-    It determines the public IP address of this server by opening a dummy UDP socket
-    connection to DNS (taken from the config). It has fallbacks to ipify.org. If you want IPv4,
-    it will open an IPv4 connection, otherwise it will open an IPv6 connection.
-    It is **strict**, and it will return None if it could not return the type you wanted.
+    The identity of this server (the vantage point of the measurements) for one IP type.
+
+    Attributes:
+        ip (Optional[IPv4Address | IPv6Address]): The public IP address of this server, or None if it has none.
+        local_ip (Optional[str]): The address of the outgoing socket. When it changes, the network changed.
+        asn (Optional[str]): The ASN of the public IP address.
+        country_code (Optional[str]): The country of the public IP address.
+        coordinates (Optional[tuple[float, float]]): The location of the public IP address.
+        refreshed_at (float): When it was found. (time.monotonic)
+    """
+    ip: Optional[IPv4Address | IPv6Address]
+    local_ip: Optional[str]
+    asn: Optional[str]
+    country_code: Optional[str]
+    coordinates: Optional[tuple[float, float]]
+    refreshed_at: float
+
+
+_vantage_points_lock = threading.Lock()
+_vantage_points: dict[int, VantagePoint] = {}
+
+
+def get_local_ip(wanted_ip_type: int) -> Optional[str]:
+    """
+    It returns the address of this server used to reach the DNS (taken from the config), by opening a dummy
+    UDP socket. (no packet is sent) If you want IPv4, it will open an IPv4 connection, otherwise an IPv6 connection.
 
     Args:
         wanted_ip_type (int): The type of IP address we are looking for.
 
     Returns:
-        Optional[IPv4Address | IPv6Address]: The server's external IP address.
-        as an IPv4Address or IPv6Address object, or None if detection fails.
+        Optional[str]: The local address, or None if this server cannot reach the DNS with this IP type.
     """
     # use a dummy connection to get the outward-facing IP (IPv4 or IPv6 connection)
     family = socket.AF_INET6 if wanted_ip_type == 6 else socket.AF_INET
@@ -215,11 +275,26 @@ def get_server_ip(wanted_ip_type: int) -> IPv4Address | IPv6Address | None:
         print(f"Socket failed. Trying from ipify...")
     finally:
         s.close()
+    return ip
+
+
+def detect_server_ip(wanted_ip_type: int, local_ip: Optional[str]) -> IPv4Address | IPv6Address | None:
+    """
+    It determines the public IP address of this server from its local address. It has fallbacks to ipify.org.
+    It is **strict**, and it will return None if it could not return the type you wanted.
+
+    Args:
+        wanted_ip_type (int): The type of IP address we are looking for.
+        local_ip (Optional[str]): The local address of this server. (see get_local_ip)
 
+    Returns:
+        Optional[IPv4Address | IPv6Address]: The server's external IP address.
+        as an IPv4Address or IPv6Address object, or None if detection fails.
+    """
     try:
         # if it is public
-        if ip is not None and is_private_ip(ip) == False:
-            return ip_address(ip)
+        if local_ip is not None and is_private_ip(local_ip) == False:
+            return ip_address(local_ip)
         # if it is private
         ip_public = get_server_ip_from_ipify(wanted_ip_type)
         # print(f"fallback to public IP: {ip_to_str(ip_public)}")
@@ -227,6 +302,188 @@ def get_server_ip(wanted_ip_type: int) -> IPv4Address | IPv6Address | None:
     except ValueError:
         return None
 
+
+async def detect_server_ip_async(wanted_ip_type: int, local_ip: Optional[str]) -> IPv4Address | IPv6Address | None:
+    """
+    This method is the asynchronous version of detect_server_ip. The fallback to ipify.org does not block the loop.
+
+    Args:
+        wanted_ip_type (int): The type of IP address we are looking for.
+        local_ip (Optional[str]): The local address of this server. (see get_local_ip)
+
+    Returns:
+        Optional[IPv4Address | IPv6Address]: The server's external IP address.
+        as an IPv4Address or IPv6Address object, or None if detection fails.
+    """
+    try:
+        if local_ip is not None and is_private_ip(local_ip) == False:
+            return ip_address(local_ip)
+        return await get_server_ip_from_ipify_async(wanted_ip_type)
+    except ValueError:
+        return None
+
+
+def refresh_vantage_point(wanted_ip_type: int) -> VantagePoint:
+    """
+    It finds the public IP address of this server (and its ASN, country and location) again, and keeps it in memory.
+
+    Args:
+        wanted_ip_type (int): The IP type. (4 or 6)
+
+    Returns:
+        VantagePoint: The new identity of this server for this IP type.
+    """
+    local_ip = get_local_ip(wanted_ip_type)
+    return store_vantage_point(wanted_ip_type, local_ip, detect_server_ip(wanted_ip_type, local_ip))
+
+
+def store_vantage_point(wanted_ip_type: int, local_ip: Optional[str],
+                        ip: Optional[IPv4Address | IPv6Address]) -> VantagePoint:
+    """
+    It finds the ASN, country and location of the public IP address of this server, and keeps them in memory.
+
+    Args:
+        wanted_ip_type (int): The IP type. (4 or 6)
+        local_ip (Optional[str]): The local address of this server. (see get_local_ip)
+        ip (Optional[IPv4Address | IPv6Address]): The public IP address of this server. (see detect_server_ip)
+
+    Returns:
+        VantagePoint: The new identity of this server for this IP type.
+    """
+    ip_str = ip_to_str(ip)
+    asn, country, coordinates = None, None, None
+    if ip_str is not None:
+        try:
+            asn = get_asn_for_ip(ip_str)
+            country = get_country_for_ip(ip_str)
+            coordinates = get_coordinates_for_ip(ip_str)
+        except Exception as e:
+            print(f"Could not locate this server: {e}")
+    vantage_point = VantagePoint(ip, local_ip, asn, country, coordinates, time.monotonic())
+    with _vantage_points_lock:
+        _vantage_points[wanted_ip_type] = vantage_point
+    return vantage_point
+
+
+def refresh_vantage_points() -> None:
+    """
+    It finds the identity of this server again, for both IP types.
+    """
+    for ip_type in (4, 6):
+        refresh_vantage_point(ip_type)
+
+
+async def refresh_vantage_points_async() -> None:
+    """
+    This method is the asynchronous version of refresh_vantage_points. Only the location of the IP addresses
+    (which reads the local databases) runs in a worker thread.
+    """
+    for ip_type in (4, 6):
+        local_ip = get_local_ip(ip_type)
+        ip = await detect_server_ip_async(ip_type, local_ip)
+        await asyncio.to_thread(store_vantage_point, ip_type, local_ip, ip)
+
+
+def forget_vantage_points() -> None:
+    """
+    It forgets the identity of this server, so that it is found again the next time it is needed.
+    """
+    with _vantage_points_lock:
+        _vantage_points.clear()
+
+
+def get_vantage_point(wanted_ip_type: int) -> VantagePoint:
+    """
+    It returns the identity of this server for this IP type, from memory. It is kept up to date by
+    run_vantage_point_refresher. It is only found now if it is missing, or if it is too old. (the refresher
+    is not running) An identity without IP address is retried sooner, after the network check interval.
+
+    Args:
+        wanted_ip_type (int): The IP type. (4 or 6)
+
+    Returns:
+        VantagePoint: The identity of this server.
+    """
+    with _vantage_points_lock:
+        vantage_point = _vantage_points.get(wanted_ip_type)
+    if vantage_point is not None:
+        max_age = get_vantage_point_refresh_interval_s() if vantage_point.ip is not None \
+            else get_vantage_point_network_check_interval_s()
+        if time.monotonic() - vantage_point.refreshed_at < max_age:
+            return vantage_point
+    return refresh_vantage_point(wanted_ip_type)
+
+
+def get_vantage_point_if_possible(wanted_ip_type: int) -> Optional[VantagePoint]:
+    """
+    This method returns the identity of this server. If it has both IPv6 and IPv4, it will return whatever
+    type you wanted. If not, it returns the type it has.
+
+    Args:
+        wanted_ip_type (int): The type of IP address that you want to get. (4 or 6)
+
+    Returns:
+        Optional[VantagePoint]: The identity of this server, or None if it has no public IP address.
+    """
+    for ip_type in (wanted_ip_type, 10 - wanted_ip_type):
+        vantage_point = get_vantage_point(ip_type)
+        if vantage_point.ip is not None:
+            return vantage_point
+    return None
+
+
+def check_vantage_point_network() -> bool:
+    """
+    It checks if the local address of this server changed (for example, a new network or a new DHCP lease).
+    If so, the identity of this server is found again. It is cheap: no packet is sent.
+
+    Returns:
+        bool: Whether the network changed.
+    """
+    with _vantage_points_lock:
+        known = dict(_vantage_points)
+    changed = False
+    for ip_type, vantage_point in known.items():
+        if get_local_ip(ip_type) != vantage_point.local_ip:
+            print(f"The IPv{ip_type} network of this server changed")
+            refresh_vantage_point(ip_type)
+            changed = True
+    return changed
+
+
+async def run_vantage_point_refresher() -> None:
+    """
+    It keeps the identity of this server up to date, in the background: it is found when the server starts,
+    again after each refresh interval, and when the network changes. It runs until it is cancelled.
+    """
+    last_refresh = float("-inf")
+    while True:
+        try:
+            if time.monotonic() - last_refresh >= get_vantage_point_refresh_interval_s():
+                await refresh_vantage_points_async()
+                last_refresh = time.monotonic()
+            elif await asyncio.to_thread(check_vantage_point_network):
+                last_refresh = time.monotonic()
+        except Exception as e:
+            print(f"Could not refresh the identity of this server: {e}")
+        await asyncio.sleep(get_vantage_point_network_check_interval_s())
+
+
+def get_server_ip(wanted_ip_type: int) -> IPv4Address | IPv6Address | None:
+    """
+    It returns the public IP address of this server. It is read from memory (see get_vantage_point), so it does not
+    open a socket or call ipify.org for each measurement.
+    It is **strict**, and it will return None if it could not return the type you wanted.
+
+    Args:
+        wanted_ip_type (int): The type of IP address we are looking for.
+
+    Returns:
+        Optional[IPv4Address | IPv6Address]: The server's external IP address.
+        as an IPv4Address or IPv6Address object, or None if detection fails.
+    """
+    return get_vantage_point(wanted_ip_type).ip
+
 def get_server_ip_if_possible(wanted_ip_type: int) -> Optional[IPv4Address | IPv6Address]:
     """
     This method returns the IP address of this server. If it has both IPv6 and IPv4, it will return whatever
@@ -251,6 +508,7 @@ def get_server_ip_if_possible(wanted_ip_type: int) -> Optional[IPv4Address | IPv
 def get_server_ip_from_ipify(wanted_ip_type: int) -> Optional[IPv4Address | IPv6Address]:
     """
     This method is a fallback to try to get the public IP address of our server from ipify.org
+    If ipify is unavailable (or its circuit breaker is open), the last IP address it returned is used.
 
     Args:
         wanted_ip_type (int): The type of IP address that you want to get. (4 or 6)
@@ -259,19 +517,87 @@ def get_server_ip_from_ipify(wanted_ip_type: int) -> Optional[IPv4Address | IPv6
         Optional[IPv4Address | IPv6Address]: The public IP address of our server.
     """
     try:
-        ip_type: str = "" # which means 4
-        if wanted_ip_type == 6:
-            ip_type = "6"
-        # api64 will return ipv4 or ipv6 if it is available, but we want exactly ipv4 or ipv6
-        response = requests.get(f"https://api{ip_type}.ipify.org?format=json", timeout=3)
+        response = http_get(get_ipify_url(wanted_ip_type), params={"format": "json"}, timeout=(3, 3))
         response.raise_for_status()
+        return remember_ipify_ip(wanted_ip_type, response.json())
+    except Exception as e:
+        print(e)
+        return _last_ipify_ips.get(wanted_ip_type, None)
+
 
-        data = response.json()
-        ip_str: str = data.get("ip", None)
-        return ip_address(ip_str.strip())
+async def get_server_ip_from_ipify_async(wanted_ip_type: int) -> Optional[IPv4Address | IPv6Address]:
+    """
+    This method is the asynchronous version of get_server_ip_from_ipify. It uses the shared async HTTP client.
+
+    Args:
+        wanted_ip_type (int): The type of IP address that you want to get. (4 or 6)
+
+    Returns:
+        Optional[IPv4Address | IPv6Address]: The public IP address of our server.
+    """
+    try:
+        response = await async_http_get(get_ipify_url(wanted_ip_type), params={"format": "json"}, timeout=(3, 3))
+        response.raise_for_status()
+        return remember_ipify_ip(wanted_ip_type, response.json())
     except Exception as e:
         print(e)
-        return None
+        return _last_ipify_ips.get(wanted_ip_type, None)
+
+
+def get_ipify_url(wanted_ip_type: int) -> str:
+    """
+    It returns the URL of ipify.org that answers with exactly this IP type.
+
+    Args:
+        wanted_ip_type (int): The type of IP address that you want to get. (4 or 6)
+
+    Returns:
+        str: The URL.
+    """
+    ip_type: str = "" # which means 4
+    if wanted_ip_type == 6:
+        ip_type = "6"
+    # api64 will return ipv4 or ipv6 if it is available, but we want exactly ipv4 or ipv6
+    return f"https://api{ip_type}.ipify.org"
+
+
+def remember_ipify_ip(wanted_ip_type: int, data: dict[str, Any]) -> IPv4Address | IPv6Address:
+    """
+    It takes the IP address from the answer of ipify.org, and remembers it in case ipify becomes unavailable.
+
+    Args:
+        wanted_ip_type (int): The type of IP address that was asked. (4 or 6)
+        data (dict[str, Any]): The JSON answer of ipify.org.
+
+    Returns:
+        IPv4Address | IPv6Address: The public IP address of our server.
+    """
+    ip_str: str = data.get("ip", None)
+    ip = ip_address(ip_str.strip())
+    _last_ipify_ips[wanted_ip_type] = ip
+    return ip
+
+
+def get_request_client_ip(request: Request, wanted_ip_type: int) -> Optional[str]:
+    """
+    It returns the IP address of the client from the request. If it is missing, private or invalid,
+    the IP address of this server is used instead.
+
+    Args:
+        request (Request): The FastAPI Request object, containing information
+                           about the incoming client request.
+        wanted_ip_type (int): The type of IP address that you want to get (4 or 6).
+
+    Returns:
+        Optional[str]: The IP address of the client (or of this server).
+    """
+    client_ip = request.headers.get("X-Forwarded-For", request.client.host if request.client else None)
+    if client_ip:
+        client_ip = client_ip.split(',')[0].strip()
+    # if it is None or if it is private (a private IP is useless for us) or invalid
+    if client_ip is None or is_private_ip(client_ip) or is_ip_address(client_ip) is None:
+        client_ip = ip_to_str(get_server_ip(wanted_ip_type))
+    return client_ip
 
 
 def client_ip_fetch(request: Request, wanted_ip_type: int) -> str | None:
@@ -290,12 +616,7 @@ def client_ip_fetch(request: Request, wanted_ip_type: int) -> str | None:
          HTTPException: 503: If neither the client's IP from headers/request nor the fallback server IP can be successfully resolved.
     """
     try:
-        client_ip = request.headers.get("X-Forwarded-For", request.client.host if request.client else None)
-        if client_ip:
-            client_ip = client_ip.split(',')[0].strip()
-        # if it is None or if it is private (a private IP is useless for us) or invalid
-        if client_ip is None or is_private_ip(client_ip) or is_ip_address(client_ip) is None:
-            client_ip = ip_to_str(get_server_ip(wanted_ip_type))
+        client_ip = get_request_client_ip(request, wanted_ip_type)
 
         # test if you got the desired IP address type
         if get_ip_family(client_ip) == wanted_ip_type:
@@ -307,10 +628,114 @@ def client_ip_fetch(request: Request, wanted_ip_type: int) -> str | None:
         print(e)
         raise HTTPException(status_code=503, detail="Could not resolve client IP or fallback IP.")
 
+
+async def client_ip_fetch_async(request: Request, wanted_ip_type: int) -> str | None:
+    """
+    This method is the asynchronous version of client_ip_fetch, for the code that runs in the event loop.
+    The conversion of the IP type does not block the loop, and it is cached.
+
+    Args:
+        request (Request): The FastAPI Request object, containing information
+                           about the incoming client request.
+        wanted_ip_type (int): The type of IP address that you want to get (4 or 6).
+
+    Returns:
+        str | None: The determined IP address of the client (or a fallback server IP).
+
+    Raises:
+         HTTPException: 503: If neither the client's IP from headers/request nor the fallback server IP can be successfully resolved.
+    """
+    try:
+        client_ip = get_request_client_ip(request, wanted_ip_type)
+        if get_ip_family(client_ip) == wanted_ip_type:
+            return client_ip
+        return await try_converting_ip_async(client_ip, wanted_ip_type)
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=503, detail="Could not resolve client IP or fallback IP.")
+
+
+async def resolve_ptr_async(ip: str) -> Optional[str]:
+    """
+    It returns the domain name of an IP address (its PTR record). The answers are cached for their TTL,
+    and the IP addresses without PTR record are cached too. (negative answers)
+
+    Args:
+        ip (str): The IP address.
+
+    Returns:
+        Optional[str]: The domain name (without the final dot), or None if there is no PTR record or the DNS failed.
+    """
+    cached = get_cached_reverse_dns(ip)
+    if cached is not None:
+        return cached.domain_name
+    try:
+        answer = await dns.asyncresolver.resolve(dns.reversename.from_address(ip), "PTR",
+                                                 lifetime=float(get_edns_timeout_s()))
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        cache_reverse_dns(ip, None)
+        return None
+    except Exception as e:
+        # the DNS failed, do not remember it
+        print(f"Reverse DNS of {ip} failed: {e}")
+        return None
+    domain_name = str(answer[0]).rstrip('.')
+    cache_reverse_dns(ip, domain_name, answer.rrset.ttl if answer.rrset is not None else None)
+    return domain_name
+
+
+async def resolve_addresses_async(domain_name: str, ip_type: int) -> list[str]:
+    """
+    It returns the IP addresses (A or AAAA records) of a domain name, using the DNS of this server.
+    The answers are cached for their TTL, and the names without such records are cached too. (negative answers)
+
+    Args:
+        domain_name (str): The domain name.
+        ip_type (int): The type of the IP addresses. (4 or 6)
+
+    Returns:
+        list[str]: The IP addresses. (empty if there is none or the DNS failed)
+    """
+    rdtype = dns.rdatatype.A if ip_type == 4 else dns.rdatatype.AAAA
+    cached = get_cached_system_answer(domain_name, rdtype)
+    if cached is not None:
+        return list(cached.ips)
+    try:
+        answer = await dns.asyncresolver.resolve(domain_name, rdtype, lifetime=float(get_edns_timeout_s()))
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        cache_system_answer(domain_name, DnsAnswer(()), rdtype)
+        return []
+    except Exception as e:
+        print(f"DNS of {domain_name} failed: {e}")
+        return []
+    ips = [str(record) for record in answer]
+    cache_system_answer(domain_name, DnsAnswer(tuple(ips)), rdtype, answer.rrset.ttl if answer.rrset is not None else None)
+    return ips
+
+
 def try_converting_ip(client_ip: Optional[str], wanted_ip_type: int) -> Optional[str]:
     """
     This method tries to convert an IPv4 into IPv6 or an IPv6 into an IPv4 using reverse DNS from dnspython.
-    It only works if there is a configured PTR record + AAAA record.
+    It only works if there is a configured PTR record + AAAA record. It is the blocking version of
+    try_converting_ip_async.
+
+    Args:
+        client_ip (Optional[str]): The client IP to convert.
+        wanted_ip_type (int): The type of IP address that we want.
+
+    Returns:
+        Optional[str]: The converted IPv6 or IPv4 as a string or the original IP if the process failed.
+    """
+    return run_dns_coroutine(try_converting_ip_async(client_ip, wanted_ip_type))
+
+
+async def try_converting_ip_async(client_ip: Optional[str], wanted_ip_type: int) -> Optional[str]:
+    """
+    This method tries to convert an IPv4 into IPv6 or an IPv6 into an IPv4 using reverse DNS.
+    It only works if there is a configured PTR record + A/AAAA records. The domain name of the PTR record must be
+    forward-confirmed (its records of the same type contain the client IP), otherwise anyone could make us use
+    the IP address of another host. All the DNS answers are cached (see resolve_ptr_async), so the repeated requests
+    of a client do not need any DNS query.
 
     Args:
         client_ip (Optional[str]): The client IP to convert.
@@ -321,23 +746,36 @@ def try_converting_ip(client_ip: Optional[str], wanted_ip_type: int) -> Optional
     """
     if client_ip is None:
         return None
-    try: #getting PTR record
-        reverse_name = dns.reversename.from_address(client_ip)
-        answer = dns.resolver.resolve(reverse_name, 'PTR')
-        client_domain_name = str(answer[0]).rstrip('.')
-        # try getting IPv4 or IPv6
-        rdtype = "A"
-        if wanted_ip_type == 6:
-            rdtype = "AAAA"
-        new_ip = dns.resolver.resolve(client_domain_name, rdtype)
-        return str(new_ip[0])
+    try:
+        client_domain_name = await resolve_ptr_async(client_ip)
+        if client_domain_name is None:
+            return client_ip
+        confirmed = await resolve_addresses_async(client_domain_name, get_ip_family(client_ip))
+        if ip_address(client_ip) not in {ip_address(ip) for ip in confirmed}:
+            return client_ip
+        new_ips = await resolve_addresses_async(client_domain_name, wanted_ip_type)
+        return new_ips[0] if len(new_ips) != 0 else client_ip
     except Exception as e:
         # It failed. Return the original IP address
         return client_ip
 
+
 def try_converting_ip_to_domain_name(server_ip: str) -> str:
     """
-    It tries to get the domain name from the IP.
+    It tries to get the domain name from the IP. The PTR answers are cached. (see resolve_ptr_async)
+
+    Args:
+        server_ip (str): The IP to convert.
+
+    Returns:
+        str: The domain name of the IP if possible or the IP address.
+    """
+    return run_dns_coroutine(try_converting_ip_to_domain_name_async(server_ip))
+
+
+async def try_converting_ip_to_domain_name_async(server_ip: str) -> str:
+    """
+    This method is the asynchronous version of try_converting_ip_to_domain_name.
 
     Args:
         server_ip (str): The IP to convert.
@@ -345,15 +783,11 @@ def try_converting_ip_to_domain_name(server_ip: str) -> str:
     Returns:
         str: The domain name of the IP if possible or the IP address.
     """
-    try: #getting PTR record
-        reverse_name = dns.reversename.from_address(server_ip)
-        answer = dns.resolver.resolve(reverse_name, 'PTR')
-        domain_name = str(answer[0]).rstrip('.')
-        print(domain_name)
-        return domain_name
+    try:
+        domain_name = await resolve_ptr_async(server_ip)
     except Exception as e:
-        # It failed. Return the original IP address
         return server_ip
+    return domain_name if domain_name is not None else server_ip
 
 def is_private_ip(ip_str: str) -> bool:
     """
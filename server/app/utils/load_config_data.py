@@ -1,9 +1,11 @@
+import hashlib
 import ipaddress
 import os
 import pathlib
 import platform
 import shutil
 import subprocess
+import threading
 from pathlib import Path
 from typing import Any, cast, Optional
 import yaml
@@ -49,14 +51,47 @@ def verify_if_config_is_set() -> bool:
     get_ntp_version()
     get_timeout_measurement_s()
     get_nr_of_measurements_for_jitter()
+    get_ntp_versions_cache_ttl_s()
+    get_ntp_versions_cache_max_entries()
+    get_ntp_versions_failure_cache_ttl_s()
+    get_ntp_versions_native_probe()
+    get_measurement_cache_ttl_s()
+    get_measurement_cache_default_max_age_s()
+    get_measurement_cache_max_entries()
     get_mask_ipv4()
     get_mask_ipv6()
     get_edns_default_servers()
     get_edns_timeout_s()
+    get_edns_hedge_delay_s()
+    get_dns_cache_max_ttl_s()
+    get_dns_cache_negative_ttl_s()
+    get_dns_cache_default_ttl_s()
+    get_dns_cache_max_entries()
     get_ripe_timeout_per_probe_ms()
     get_ripe_packets_per_probe()
     get_ripe_number_of_probes_per_measurement()
     get_ripe_server_timeout()
+    get_ripe_batch_window_ms()
+    get_ripe_max_definitions_per_batch()
+    get_ripe_probes_cache_ttl_s()
+    get_ripe_probes_cache_max_entries()
+    get_http_connect_timeout_s()
+    get_http_read_timeout_s()
+    get_http_max_retries()
+    get_http_backoff_base_s()
+    get_http_pool_size_per_host()
+    get_http_max_concurrent_requests_per_host()
+    get_circuit_breaker_failure_threshold()
+    get_circuit_breaker_recovery_timeout_s()
+    get_history_max_page_size()
+    get_history_stream_chunk_size()
+    get_rollups_compaction_interval_s()
+    get_rollups_compaction_batch_size()
+    get_vantage_point_refresh_interval_s()
+    get_vantage_point_network_check_interval_s()
+    get_ntp_nts_tool_request_timeout_s()
+    get_ntp_nts_tool_expected_sha256()
+    get_ntp_nts_tool_expected_version()
     get_anycast_prefixes_v4_url()
     get_anycast_prefixes_v6_url()
     get_max_mind_path_city()
@@ -65,11 +100,12 @@ def verify_if_config_is_set() -> bool:
 
     check_geolite_account_id_and_key()
 
-    # check fi ntp_nts tool exists:
-    # commend these 3 lines if it is impossible to compile the file, and you do not care about NTS or other version than NTPv4
-    ntp_nts_tool_path = get_right_ntp_nts_binary_tool_for_your_os()
-    if not ntp_nts_tool_path.exists():
-        raise FileNotFoundError(f"File not found. Please compile it manually. {str(ntp_nts_tool_path)}\n"
+    # check fi ntp_nts tool exists (it is compiled now if it is missing, never during a request):
+    # commend these lines if it is impossible to compile the file, and you do not care about NTS or other version than NTPv4
+    try:
+        resolve_ntp_nts_binary_tool(build_if_missing=True)
+    except RuntimeError as e:
+        raise FileNotFoundError(f"{e}\n"
                                 f"You could use command: GOOS=linux GOARCH=amd64 go build -o ntpnts_linux_amd64\n")
     # everything is fine
     return True
@@ -159,6 +195,141 @@ def get_nr_of_measurements_for_jitter() -> int:
     return ntp["number_of_measurements_for_calculating_jitter"]
 
 
+def get_ntp_versions_cache_ttl_s() -> float | int:
+    """
+    This method returns how long (seconds) the analysis of the NTP versions supported by a server is reused.
+    0 means that the versions are analysed again for every measurement.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp" not in config:
+        raise ValueError("ntp section is missing")
+    ntp = config["ntp"]
+    if "ntp_versions_cache_ttl_s" not in ntp:
+        raise ValueError("ntp 'ntp_versions_cache_ttl_s' is missing")
+    if not isinstance(ntp["ntp_versions_cache_ttl_s"], float | int):
+        raise ValueError("ntp 'ntp_versions_cache_ttl_s' must be a 'float' or an 'int' in s")
+    if ntp["ntp_versions_cache_ttl_s"] < 0:
+        raise ValueError("ntp 'ntp_versions_cache_ttl_s' cannot be negative")
+    return ntp["ntp_versions_cache_ttl_s"]
+
+
+def get_ntp_versions_cache_max_entries() -> int:
+    """
+    This method returns the maximum number of NTP version analyses (one per server and NTP version) kept in the cache.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp" not in config:
+        raise ValueError("ntp section is missing")
+    ntp = config["ntp"]
+    if "ntp_versions_cache_max_entries" not in ntp:
+        raise ValueError("ntp 'ntp_versions_cache_max_entries' is missing")
+    if not isinstance(ntp["ntp_versions_cache_max_entries"], int):
+        raise ValueError("ntp 'ntp_versions_cache_max_entries' must be an 'int'")
+    if ntp["ntp_versions_cache_max_entries"] <= 0:
+        raise ValueError("ntp 'ntp_versions_cache_max_entries' must be > 0")
+    return ntp["ntp_versions_cache_max_entries"]
+
+
+def get_ntp_versions_failure_cache_ttl_s() -> float | int:
+    """
+    This method returns how long (seconds) a failed analysis of one NTP version of a server (a timeout, no response
+    or an invalid response) is reused. It is shorter than the TTL of the other analyses, because the failure
+    may be temporary. 0 means that a failed analysis is never reused.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp" not in config:
+        raise ValueError("ntp section is missing")
+    ntp = config["ntp"]
+    if "ntp_versions_failure_cache_ttl_s" not in ntp:
+        raise ValueError("ntp 'ntp_versions_failure_cache_ttl_s' is missing")
+    if not isinstance(ntp["ntp_versions_failure_cache_ttl_s"], float | int):
+        raise ValueError("ntp 'ntp_versions_failure_cache_ttl_s' must be a 'float' or an 'int' in s")
+    if ntp["ntp_versions_failure_cache_ttl_s"] < 0:
+        raise ValueError("ntp 'ntp_versions_failure_cache_ttl_s' cannot be negative")
+    return ntp["ntp_versions_failure_cache_ttl_s"]
+
+
+def get_ntp_versions_native_probe() -> bool:
+    """
+    This method returns whether the NTP versions chosen by the client (ntp_versions_to_analyze) are probed in-process,
+    all at the same time, instead of running the ntp-nts tool once per version.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp" not in config:
+        raise ValueError("ntp section is missing")
+    ntp = config["ntp"]
+    if "ntp_versions_native_probe" not in ntp:
+        raise ValueError("ntp 'ntp_versions_native_probe' is missing")
+    if not isinstance(ntp["ntp_versions_native_probe"], bool):
+        raise ValueError("ntp 'ntp_versions_native_probe' must be a 'bool'")
+    return ntp["ntp_versions_native_probe"]
+
+
+def get_measurement_cache_ttl_s() -> float | int:
+    """
+    This method returns how long (seconds) the results of the ad-hoc measurements are kept. 0 disables the cache.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp" not in config:
+        raise ValueError("ntp section is missing")
+    ntp = config["ntp"]
+    if "measurement_cache_ttl_s" not in ntp:
+        raise ValueError("ntp 'measurement_cache_ttl_s' is missing")
+    if not isinstance(ntp["measurement_cache_ttl_s"], float | int):
+        raise ValueError("ntp 'measurement_cache_ttl_s' must be a 'float' or an 'int' in s")
+    if ntp["measurement_cache_ttl_s"] < 0:
+        raise ValueError("ntp 'measurement_cache_ttl_s' cannot be negative")
+    return ntp["measurement_cache_ttl_s"]
+
+
+def get_measurement_cache_default_max_age_s() -> float | int:
+    """
+    This method returns how old (seconds) a cached measurement result can be, when the client did not choose.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp" not in config:
+        raise ValueError("ntp section is missing")
+    ntp = config["ntp"]
+    if "measurement_cache_default_max_age_s" not in ntp:
+        raise ValueError("ntp 'measurement_cache_default_max_age_s' is missing")
+    if not isinstance(ntp["measurement_cache_default_max_age_s"], float | int):
+        raise ValueError("ntp 'measurement_cache_default_max_age_s' must be a 'float' or an 'int' in s")
+    if ntp["measurement_cache_default_max_age_s"] < 0:
+        raise ValueError("ntp 'measurement_cache_default_max_age_s' cannot be negative")
+    return ntp["measurement_cache_default_max_age_s"]
+
+
+def get_measurement_cache_max_entries() -> int:
+    """
+    This method returns the maximum number of measurement results kept in the cache.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp" not in config:
+        raise ValueError("ntp section is missing")
+    ntp = config["ntp"]
+    if "measurement_cache_max_entries" not in ntp:
+        raise ValueError("ntp 'measurement_cache_max_entries' is missing")
+    if not isinstance(ntp["measurement_cache_max_entries"], int):
+        raise ValueError("ntp 'measurement_cache_max_entries' must be an 'int'")
+    if ntp["measurement_cache_max_entries"] <= 0:
+        raise ValueError("ntp 'measurement_cache_max_entries' must be > 0")
+    return ntp["measurement_cache_max_entries"]
+
+
 def get_rate_limit_per_client_ip() -> str:
     """
     This method returns the rate limit for queries per client IP to our server.
@@ -295,14 +466,115 @@ def get_edns_timeout_s() -> float | int:
     return edns["edns_timeout_s"]
 
 
-def get_right_ntp_nts_binary_tool_for_your_os() -> Path:
+def get_edns_hedge_delay_s() -> float | int:
+    """
+    This method returns how long (seconds) we wait for the answer of an EDNS resolver before asking the next one
+    at the same time. 0 asks all the resolvers at once.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "edns" not in config:
+        raise ValueError("edns section is missing")
+    edns = config["edns"]
+    if "edns_hedge_delay_s" not in edns:
+        raise ValueError("edns 'edns_hedge_delay_s' is missing")
+    if not isinstance(edns["edns_hedge_delay_s"], float | int):
+        raise ValueError("edns 'edns_hedge_delay_s' must be a 'float' or an 'int' in s")
+    if edns["edns_hedge_delay_s"] < 0:
+        raise ValueError("edns 'edns_hedge_delay_s' cannot be negative")
+    return edns["edns_hedge_delay_s"]
+
+
+def get_dns_cache_max_ttl_s() -> float | int:
+    """
+    This method returns the maximum time (seconds) a DNS answer is cached, even if its TTL is longer.
+    0 disables the DNS cache.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "edns" not in config:
+        raise ValueError("edns section is missing")
+    edns = config["edns"]
+    if "dns_cache_max_ttl_s" not in edns:
+        raise ValueError("edns 'dns_cache_max_ttl_s' is missing")
+    if not isinstance(edns["dns_cache_max_ttl_s"], float | int):
+        raise ValueError("edns 'dns_cache_max_ttl_s' must be a 'float' or an 'int' in s")
+    if edns["dns_cache_max_ttl_s"] < 0:
+        raise ValueError("edns 'dns_cache_max_ttl_s' cannot be negative")
+    return edns["dns_cache_max_ttl_s"]
+
+
+def get_dns_cache_negative_ttl_s() -> float | int:
+    """
+    This method returns the maximum time (seconds) a negative DNS answer (NXDOMAIN or no record) is cached.
+    It is also used when the answer has no SOA record.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "edns" not in config:
+        raise ValueError("edns section is missing")
+    edns = config["edns"]
+    if "dns_cache_negative_ttl_s" not in edns:
+        raise ValueError("edns 'dns_cache_negative_ttl_s' is missing")
+    if not isinstance(edns["dns_cache_negative_ttl_s"], float | int):
+        raise ValueError("edns 'dns_cache_negative_ttl_s' must be a 'float' or an 'int' in s")
+    if edns["dns_cache_negative_ttl_s"] < 0:
+        raise ValueError("edns 'dns_cache_negative_ttl_s' cannot be negative")
+    return edns["dns_cache_negative_ttl_s"]
+
+
+def get_dns_cache_default_ttl_s() -> float | int:
+    """
+    This method returns how long (seconds) the answers of the DNS of this server are cached.
+    (they do not come with a TTL)
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "edns" not in config:
+        raise ValueError("edns section is missing")
+    edns = config["edns"]
+    if "dns_cache_default_ttl_s" not in edns:
+        raise ValueError("edns 'dns_cache_default_ttl_s' is missing")
+    if not isinstance(edns["dns_cache_default_ttl_s"], float | int):
+        raise ValueError("edns 'dns_cache_default_ttl_s' must be a 'float' or an 'int' in s")
+    if edns["dns_cache_default_ttl_s"] < 0:
+        raise ValueError("edns 'dns_cache_default_ttl_s' cannot be negative")
+    return edns["dns_cache_default_ttl_s"]
+
+
+def get_dns_cache_max_entries() -> int:
+    """
+    This method returns the maximum number of DNS answers kept in the cache.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "edns" not in config:
+        raise ValueError("edns section is missing")
+    edns = config["edns"]
+    if "dns_cache_max_entries" not in edns:
+        raise ValueError("edns 'dns_cache_max_entries' is missing")
+    if not isinstance(edns["dns_cache_max_entries"], int):
+        raise ValueError("edns 'dns_cache_max_entries' must be an 'int'")
+    if edns["dns_cache_max_entries"] <= 0:
+        raise ValueError("edns 'dns_cache_max_entries' must be > 0")
+    return edns["dns_cache_max_entries"]
+
+
+def get_ntp_nts_binary_path_for_your_os() -> Path:
     """
     We use some binary tools to perform NTS measurements and analyse NTP versions. You need the one that
-    is compatible with your operating system.
+    is compatible with your operating system. This method only returns its path, it does not check that it exists.
     Args:
         none
     Returns:
         Path: The path to the right ntp-nts binary tool for the specified system.
+    Raises:
+        Exception: If there is no ntp-nts binary tool for this system.
     """
     system = platform.system().lower()
     arch = platform.machine().lower()
@@ -319,11 +591,116 @@ def get_right_ntp_nts_binary_tool_for_your_os() -> Path:
             binary_path = ntp_nts_tools_dir_path / "ntpnts_darwin_amd64"
     else:
         raise Exception(f"Unsupported platform: {system} {arch}")
-
-    if not binary_path.exists():
-        return build_ntp_nts_binary_tool(system, arch, binary_path)
     return binary_path
 
+
+# the ntp-nts tool is found (and verified) once, when the server starts. The requests only read the result.
+_ntp_nts_tool_lock = threading.Lock()
+_ntp_nts_tool_path: Optional[Path] = None
+_ntp_nts_tool_error: Optional[str] = None
+
+
+def file_sha256(path: Path) -> str:
+    """
+    It returns the SHA-256 checksum of a file.
+    Args:
+        path (Path): The path to the file.
+    Returns:
+        str: The checksum, in hexadecimal.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_ntp_nts_binary_tool(binary_path: Path) -> None:
+    """
+    It checks that the ntp-nts binary tool is the expected one: its SHA-256 checksum and the version that it prints
+    with "version" (if they are set in the config).
+    Args:
+        binary_path (Path): The path to the ntp-nts binary tool.
+    Raises:
+        RuntimeError: If the checksum or the version is not the expected one.
+    """
+    expected_sha256 = get_ntp_nts_tool_expected_sha256()
+    if expected_sha256 != "":
+        actual_sha256 = file_sha256(binary_path)
+        if actual_sha256 != expected_sha256.lower():
+            raise RuntimeError(f"The checksum of {binary_path} is {actual_sha256}, expected {expected_sha256}")
+    expected_version = get_ntp_nts_tool_expected_version()
+    if expected_version != "":
+        try:
+            result = subprocess.run([str(binary_path), "version"], capture_output=True, text=True, timeout=10)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise RuntimeError(f"Could not get the version of {binary_path}: {e}")
+        if expected_version not in result.stdout:
+            raise RuntimeError(f"The version of {binary_path} is {result.stdout.strip()[:100]!r}, "
+                               f"expected {expected_version}")
+
+
+def resolve_ntp_nts_binary_tool(build_if_missing: bool = False) -> Path:
+    """
+    It finds the ntp-nts binary tool for this system, verifies it and remembers it, so that the measurements do not
+    look for it again. It is called when the server starts. If the tool is missing or invalid, the error is remembered
+    as well, and the measurements that need the tool fail immediately with this error.
+    Args:
+        build_if_missing (bool): Whether to compile the tool (with Go) if it is missing.
+    Returns:
+        Path: The path to the right ntp-nts binary tool for the specified system.
+    Raises:
+        RuntimeError: If the tool is missing (and could not be built), or it is not the expected one.
+    """
+    global _ntp_nts_tool_path, _ntp_nts_tool_error
+    with _ntp_nts_tool_lock:
+        if _ntp_nts_tool_path is not None:
+            return _ntp_nts_tool_path
+        try:
+            binary_path = get_ntp_nts_binary_path_for_your_os()
+            if not binary_path.exists():
+                if not build_if_missing:
+                    raise RuntimeError(f"The ntp-nts tool was not found: {binary_path}. Please compile it.")
+                build_ntp_nts_binary_tool(platform.system().lower(), platform.machine().lower(), binary_path)
+            verify_ntp_nts_binary_tool(binary_path)
+        except Exception as e:
+            _ntp_nts_tool_error = str(e)
+            raise RuntimeError(_ntp_nts_tool_error)
+        _ntp_nts_tool_path = binary_path
+        _ntp_nts_tool_error = None
+        return binary_path
+
+
+def forget_ntp_nts_binary_tool() -> None:
+    """
+    It forgets the ntp-nts binary tool that was found (or the error), so that it is looked for again.
+    """
+    global _ntp_nts_tool_path, _ntp_nts_tool_error
+    with _ntp_nts_tool_lock:
+        _ntp_nts_tool_path = None
+        _ntp_nts_tool_error = None
+
+
+def get_right_ntp_nts_binary_tool_for_your_os() -> Path:
+    """
+    We use some binary tools to perform NTS measurements and analyse NTP versions. You need the one that
+    is compatible with your operating system. It returns the tool found when the server started
+    (see resolve_ntp_nts_binary_tool), it never compiles it.
+    Args:
+        none
+    Returns:
+        Path: The path to the right ntp-nts binary tool for the specified system.
+    Raises:
+        RuntimeError: If the tool is not available.
+    """
+    if _ntp_nts_tool_path is not None:
+        return _ntp_nts_tool_path
+    if _ntp_nts_tool_error is not None:
+        raise RuntimeError(_ntp_nts_tool_error)
+    # not resolved at startup (for example in a script), so look for it now, but do not build it
+    return resolve_ntp_nts_binary_tool()
+
+
 def build_ntp_nts_binary_tool(system: str, arch: str, binary_path: Path) -> Path:
     """
     This method tries to compile the ntp-nts-tool into a binary
@@ -436,6 +813,408 @@ def get_ripe_server_timeout() -> int:
     return ripe_atlas["server_timeout"]
 
 
+def get_ripe_batch_window_ms() -> float | int:
+    """
+    This method returns the window (milliseconds) during which RIPE measurements are collected to be sent in one request.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ripe_atlas" not in config:
+        raise ValueError("ripe_atlas section is missing")
+    ripe_atlas = config["ripe_atlas"]
+    if "batch_window_ms" not in ripe_atlas:
+        raise ValueError("ripe_atlas 'batch_window_ms' is missing")
+    if not isinstance(ripe_atlas["batch_window_ms"], float | int):
+        raise ValueError("ripe_atlas 'batch_window_ms' must be a 'float' or an 'int' in ms")
+    if ripe_atlas["batch_window_ms"] < 0:
+        raise ValueError("ripe_atlas 'batch_window_ms' cannot be negative")
+    return ripe_atlas["batch_window_ms"]
+
+
+def get_ripe_max_definitions_per_batch() -> int:
+    """
+    This method returns the maximum number of measurement definitions sent to RIPE Atlas in one request.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ripe_atlas" not in config:
+        raise ValueError("ripe_atlas section is missing")
+    ripe_atlas = config["ripe_atlas"]
+    if "max_definitions_per_batch" not in ripe_atlas:
+        raise ValueError("ripe_atlas 'max_definitions_per_batch' is missing")
+    if not isinstance(ripe_atlas["max_definitions_per_batch"], int):
+        raise ValueError("ripe_atlas 'max_definitions_per_batch' must be an 'int'")
+    if ripe_atlas["max_definitions_per_batch"] <= 0:
+        raise ValueError("ripe_atlas 'max_definitions_per_batch' must be > 0")
+    return ripe_atlas["max_definitions_per_batch"]
+
+
+def get_ripe_probes_cache_ttl_s() -> float | int:
+    """
+    This method returns how long (seconds) the probes selected for a client network are reused.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ripe_atlas" not in config:
+        raise ValueError("ripe_atlas section is missing")
+    ripe_atlas = config["ripe_atlas"]
+    if "probes_cache_ttl_s" not in ripe_atlas:
+        raise ValueError("ripe_atlas 'probes_cache_ttl_s' is missing")
+    if not isinstance(ripe_atlas["probes_cache_ttl_s"], float | int):
+        raise ValueError("ripe_atlas 'probes_cache_ttl_s' must be a 'float' or an 'int' in s")
+    if ripe_atlas["probes_cache_ttl_s"] < 0:
+        raise ValueError("ripe_atlas 'probes_cache_ttl_s' cannot be negative")
+    return ripe_atlas["probes_cache_ttl_s"]
+
+
+def get_ripe_probes_cache_max_entries() -> int:
+    """
+    This method returns the maximum number of client networks whose selected probes are kept in memory.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ripe_atlas" not in config:
+        raise ValueError("ripe_atlas section is missing")
+    ripe_atlas = config["ripe_atlas"]
+    if "probes_cache_max_entries" not in ripe_atlas:
+        raise ValueError("ripe_atlas 'probes_cache_max_entries' is missing")
+    if not isinstance(ripe_atlas["probes_cache_max_entries"], int):
+        raise ValueError("ripe_atlas 'probes_cache_max_entries' must be an 'int'")
+    if ripe_atlas["probes_cache_max_entries"] <= 0:
+        raise ValueError("ripe_atlas 'probes_cache_max_entries' must be > 0")
+    return ripe_atlas["probes_cache_max_entries"]
+
+
+# http_client
+def get_http_connect_timeout_s() -> float | int:
+    """
+    This method returns the timeout (seconds) for establishing a connection in outbound HTTP requests.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "http_client" not in config:
+        raise ValueError("http_client section is missing")
+    http_client = config["http_client"]
+    if "connect_timeout_s" not in http_client:
+        raise ValueError("http_client 'connect_timeout_s' is missing")
+    if not isinstance(http_client["connect_timeout_s"], float | int):
+        raise ValueError("http_client 'connect_timeout_s' must be a 'float' or an 'int' in s")
+    if http_client["connect_timeout_s"] <= 0:
+        raise ValueError("http_client 'connect_timeout_s' must be > 0")
+    return http_client["connect_timeout_s"]
+
+
+def get_http_read_timeout_s() -> float | int:
+    """
+    This method returns the timeout (seconds) for reading the response of outbound HTTP requests.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "http_client" not in config:
+        raise ValueError("http_client section is missing")
+    http_client = config["http_client"]
+    if "read_timeout_s" not in http_client:
+        raise ValueError("http_client 'read_timeout_s' is missing")
+    if not isinstance(http_client["read_timeout_s"], float | int):
+        raise ValueError("http_client 'read_timeout_s' must be a 'float' or an 'int' in s")
+    if http_client["read_timeout_s"] <= 0:
+        raise ValueError("http_client 'read_timeout_s' must be > 0")
+    return http_client["read_timeout_s"]
+
+
+def get_http_max_retries() -> int:
+    """
+    This method returns how many times an outbound HTTP request is retried after a 429 or a 5xx response.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "http_client" not in config:
+        raise ValueError("http_client section is missing")
+    http_client = config["http_client"]
+    if "max_retries" not in http_client:
+        raise ValueError("http_client 'max_retries' is missing")
+    if not isinstance(http_client["max_retries"], int):
+        raise ValueError("http_client 'max_retries' must be an 'int'")
+    if http_client["max_retries"] < 0:
+        raise ValueError("http_client 'max_retries' cannot be negative")
+    return http_client["max_retries"]
+
+
+def get_http_backoff_base_s() -> float | int:
+    """
+    This method returns the base delay (seconds) of the exponential backoff between retries.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "http_client" not in config:
+        raise ValueError("http_client section is missing")
+    http_client = config["http_client"]
+    if "backoff_base_s" not in http_client:
+        raise ValueError("http_client 'backoff_base_s' is missing")
+    if not isinstance(http_client["backoff_base_s"], float | int):
+        raise ValueError("http_client 'backoff_base_s' must be a 'float' or an 'int' in s")
+    if http_client["backoff_base_s"] < 0:
+        raise ValueError("http_client 'backoff_base_s' cannot be negative")
+    return http_client["backoff_base_s"]
+
+
+def get_http_pool_size_per_host() -> int:
+    """
+    This method returns how many keep-alive connections are kept open for each host.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "http_client" not in config:
+        raise ValueError("http_client section is missing")
+    http_client = config["http_client"]
+    if "pool_size_per_host" not in http_client:
+        raise ValueError("http_client 'pool_size_per_host' is missing")
+    if not isinstance(http_client["pool_size_per_host"], int):
+        raise ValueError("http_client 'pool_size_per_host' must be an 'int'")
+    if http_client["pool_size_per_host"] <= 0:
+        raise ValueError("http_client 'pool_size_per_host' must be > 0")
+    return http_client["pool_size_per_host"]
+
+
+def get_http_max_concurrent_requests_per_host() -> int:
+    """
+    This method returns how many outbound HTTP requests can run in parallel to the same host.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "http_client" not in config:
+        raise ValueError("http_client section is missing")
+    http_client = config["http_client"]
+    if "max_concurrent_requests_per_host" not in http_client:
+        raise ValueError("http_client 'max_concurrent_requests_per_host' is missing")
+    if not isinstance(http_client["max_concurrent_requests_per_host"], int):
+        raise ValueError("http_client 'max_concurrent_requests_per_host' must be an 'int'")
+    if http_client["max_concurrent_requests_per_host"] <= 0:
+        raise ValueError("http_client 'max_concurrent_requests_per_host' must be > 0")
+    return http_client["max_concurrent_requests_per_host"]
+
+
+# circuit_breaker
+def get_circuit_breaker_failure_threshold() -> int:
+    """
+    This method returns the number of consecutive failures after which a circuit breaker opens.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "circuit_breaker" not in config:
+        raise ValueError("circuit_breaker section is missing")
+    circuit_breaker = config["circuit_breaker"]
+    if "failure_threshold" not in circuit_breaker:
+        raise ValueError("circuit_breaker 'failure_threshold' is missing")
+    if not isinstance(circuit_breaker["failure_threshold"], int):
+        raise ValueError("circuit_breaker 'failure_threshold' must be an 'int'")
+    if circuit_breaker["failure_threshold"] <= 0:
+        raise ValueError("circuit_breaker 'failure_threshold' must be > 0")
+    return circuit_breaker["failure_threshold"]
+
+
+def get_circuit_breaker_recovery_timeout_s() -> float | int:
+    """
+    This method returns the time (seconds) an open circuit breaker waits before letting a trial request through.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "circuit_breaker" not in config:
+        raise ValueError("circuit_breaker section is missing")
+    circuit_breaker = config["circuit_breaker"]
+    if "recovery_timeout_s" not in circuit_breaker:
+        raise ValueError("circuit_breaker 'recovery_timeout_s' is missing")
+    if not isinstance(circuit_breaker["recovery_timeout_s"], float | int):
+        raise ValueError("circuit_breaker 'recovery_timeout_s' must be a 'float' or an 'int' in s")
+    if circuit_breaker["recovery_timeout_s"] <= 0:
+        raise ValueError("circuit_breaker 'recovery_timeout_s' must be > 0")
+    return circuit_breaker["recovery_timeout_s"]
+
+
+def get_history_max_page_size() -> int:
+    """
+    This method returns the maximum number of historical measurements in a page.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "history" not in config:
+        raise ValueError("history section is missing")
+    history = config["history"]
+    if "max_page_size" not in history:
+        raise ValueError("history 'max_page_size' is missing")
+    if not isinstance(history["max_page_size"], int):
+        raise ValueError("history 'max_page_size' must be an 'int'")
+    if history["max_page_size"] <= 0:
+        raise ValueError("history 'max_page_size' must be > 0")
+    return history["max_page_size"]
+
+
+def get_history_stream_chunk_size() -> int:
+    """
+    This method returns how many historical measurements are read and sent at a time, when they are streamed.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "history" not in config:
+        raise ValueError("history section is missing")
+    history = config["history"]
+    if "stream_chunk_size" not in history:
+        raise ValueError("history 'stream_chunk_size' is missing")
+    if not isinstance(history["stream_chunk_size"], int):
+        raise ValueError("history 'stream_chunk_size' must be an 'int'")
+    if history["stream_chunk_size"] <= 0:
+        raise ValueError("history 'stream_chunk_size' must be > 0")
+    return history["stream_chunk_size"]
+
+
+def get_rollups_compaction_interval_s() -> float | int:
+    """
+    This method returns how often (seconds) the new measurements are compacted into the rollups.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "rollups" not in config:
+        raise ValueError("rollups section is missing")
+    rollups = config["rollups"]
+    if "compaction_interval_s" not in rollups:
+        raise ValueError("rollups 'compaction_interval_s' is missing")
+    if not isinstance(rollups["compaction_interval_s"], float | int):
+        raise ValueError("rollups 'compaction_interval_s' must be a 'float' or an 'int' in s")
+    if rollups["compaction_interval_s"] <= 0:
+        raise ValueError("rollups 'compaction_interval_s' must be > 0")
+    return rollups["compaction_interval_s"]
+
+
+def get_rollups_compaction_batch_size() -> int:
+    """
+    This method returns how many new measurements are compacted into the rollups at a time.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "rollups" not in config:
+        raise ValueError("rollups section is missing")
+    rollups = config["rollups"]
+    if "compaction_batch_size" not in rollups:
+        raise ValueError("rollups 'compaction_batch_size' is missing")
+    if not isinstance(rollups["compaction_batch_size"], int):
+        raise ValueError("rollups 'compaction_batch_size' must be an 'int'")
+    if rollups["compaction_batch_size"] <= 0:
+        raise ValueError("rollups 'compaction_batch_size' must be > 0")
+    return rollups["compaction_batch_size"]
+
+
+def get_vantage_point_refresh_interval_s() -> float | int:
+    """
+    This method returns how often (seconds) the public IP address, ASN and location of this server are found again.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "vantage_point" not in config:
+        raise ValueError("vantage_point section is missing")
+    vantage_point = config["vantage_point"]
+    if "refresh_interval_s" not in vantage_point:
+        raise ValueError("vantage_point 'refresh_interval_s' is missing")
+    if not isinstance(vantage_point["refresh_interval_s"], float | int):
+        raise ValueError("vantage_point 'refresh_interval_s' must be a 'float' or an 'int' in s")
+    if vantage_point["refresh_interval_s"] <= 0:
+        raise ValueError("vantage_point 'refresh_interval_s' must be > 0")
+    return vantage_point["refresh_interval_s"]
+
+
+def get_vantage_point_network_check_interval_s() -> float | int:
+    """
+    This method returns how often (seconds) we check if the network of this server changed.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "vantage_point" not in config:
+        raise ValueError("vantage_point section is missing")
+    vantage_point = config["vantage_point"]
+    if "network_check_interval_s" not in vantage_point:
+        raise ValueError("vantage_point 'network_check_interval_s' is missing")
+    if not isinstance(vantage_point["network_check_interval_s"], float | int):
+        raise ValueError("vantage_point 'network_check_interval_s' must be a 'float' or an 'int' in s")
+    if vantage_point["network_check_interval_s"] <= 0:
+        raise ValueError("vantage_point 'network_check_interval_s' must be > 0")
+    return vantage_point["network_check_interval_s"]
+
+
+def get_ntp_nts_tool_request_timeout_s() -> float | int:
+    """
+    This method returns how long (seconds) we wait for the ntp-nts tool when no timeout is given.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp_nts_tool" not in config:
+        raise ValueError("ntp_nts_tool section is missing")
+    ntp_nts_tool = config["ntp_nts_tool"]
+    if "request_timeout_s" not in ntp_nts_tool:
+        raise ValueError("ntp_nts_tool 'request_timeout_s' is missing")
+    if not isinstance(ntp_nts_tool["request_timeout_s"], float | int):
+        raise ValueError("ntp_nts_tool 'request_timeout_s' must be a 'float' or an 'int' in s")
+    if ntp_nts_tool["request_timeout_s"] <= 0:
+        raise ValueError("ntp_nts_tool 'request_timeout_s' must be > 0")
+    return ntp_nts_tool["request_timeout_s"]
+
+
+def get_ntp_nts_tool_expected_sha256() -> str:
+    """
+    This method returns the expected SHA-256 checksum of the ntp-nts binary tool. It is checked once, when the server
+    starts. An empty string means that the checksum is not checked.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp_nts_tool" not in config:
+        raise ValueError("ntp_nts_tool section is missing")
+    ntp_nts_tool = config["ntp_nts_tool"]
+    if "expected_sha256" not in ntp_nts_tool:
+        raise ValueError("ntp_nts_tool 'expected_sha256' is missing")
+    if not isinstance(ntp_nts_tool["expected_sha256"], str):
+        raise ValueError("ntp_nts_tool 'expected_sha256' must be a 'str'")
+    expected = ntp_nts_tool["expected_sha256"]
+    if expected != "" and (len(expected) != 64 or any(c not in "0123456789abcdefABCDEF" for c in expected)):
+        raise ValueError("ntp_nts_tool 'expected_sha256' must be empty or 64 hexadecimal characters")
+    return expected
+
+
+def get_ntp_nts_tool_expected_version() -> str:
+    """
+    This method returns the version that the ntp-nts binary tool must print with "version". It is checked once,
+    when the server starts. An empty string means that the version is not checked.
+
+    Raises:
+        ValueError: If this variable has not been correctly set.
+    """
+    if "ntp_nts_tool" not in config:
+        raise ValueError("ntp_nts_tool section is missing")
+    ntp_nts_tool = config["ntp_nts_tool"]
+    if "expected_version" not in ntp_nts_tool:
+        raise ValueError("ntp_nts_tool 'expected_version' is missing")
+    if not isinstance(ntp_nts_tool["expected_version"], str):
+        raise ValueError("ntp_nts_tool 'expected_version' must be a 'str'")
+    return ntp_nts_tool["expected_version"]
+
+
 # bgp_tools
 def get_anycast_prefixes_v4_url() -> str:
     """
@@ -0,0 +1,136 @@
+import copy
+import hashlib
+import json
+import threading
+from typing import Any, Optional
+
+from server.app.models.CustomError import InputError
+from server.app.utils.load_config_data import get_measurement_cache_ttl_s, get_measurement_cache_default_max_age_s, \
+    get_measurement_cache_max_entries
+from server.app.utils.ripe_probes import get_client_network
+from server.app.utils.ttl_cache import TTLCache
+
+# A cache of the results of the ad-hoc measurements. When many clients of the same network measure the same server
+# with the same settings within a few seconds (refresh spam, a link shared on social media...), they all get the
+# result of the first measurement instead of measuring again. Each caller chooses how old the result can be. (max_age)
+
+# the key is (kind of measurement, target, IP type, client network, hash of the settings)
+MeasurementCacheKey = tuple[str, str, int, str, str]
+
+_measurement_cache_lock = threading.Lock()
+_measurement_cache: Optional[TTLCache[MeasurementCacheKey, Any]] = None
+
+
+def get_measurement_cache() -> TTLCache[MeasurementCacheKey, Any]:
+    """
+    It returns the cache of the measurement results, creating it (with the settings from the config) if needed.
+
+    Returns:
+        TTLCache[MeasurementCacheKey, Any]: The cache of the measurement results.
+    """
+    global _measurement_cache
+    with _measurement_cache_lock:
+        if _measurement_cache is None:
+            _measurement_cache = TTLCache("measurements", float(get_measurement_cache_ttl_s()),
+                                          get_measurement_cache_max_entries())
+        return _measurement_cache
+
+
+def invalidate_measurement_cache() -> None:
+    """
+    It forgets all the cached measurement results.
+    """
+    get_measurement_cache().invalidate()
+
+
+def get_measurement_max_age(max_age: Optional[float | int]) -> float:
+    """
+    It returns how old (seconds) a cached result can be for this request.
+
+    Args:
+        max_age (Optional[float | int]): The maximum age chosen by the caller. 0 forces a new measurement.
+            None uses the one from the config.
+
+    Returns:
+        float: The maximum age in seconds.
+
+    Raises:
+        InputError: If the maximum age is negative.
+    """
+    if max_age is None:
+        return float(get_measurement_cache_default_max_age_s())
+    if max_age < 0:
+        raise InputError("max_age cannot be negative")
+    return float(max_age)
+
+
+def get_settings_hash(settings: dict[str, Any]) -> str:
+    """
+    It returns a short hash of the settings of a measurement. Two measurements with the same settings
+    have the same hash, no matter the order of the settings.
+
+    Args:
+        settings (dict[str, Any]): The settings. (JSON serializable)
+
+    Returns:
+        str: The hash.
+    """
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def get_measurement_cache_key(kind: str, server: str, ip_type: int, client_ip: Optional[str],
+                              settings: dict[str, Any]) -> MeasurementCacheKey:
+    """
+    It returns the key of a measurement result. The clients of the same network (see get_client_network)
+    share the results, because they get the same IP addresses for a domain name and the same probes.
+
+    Args:
+        kind (str): The kind of measurement. (ex: "ntp", "full")
+        server (str): The measured server. (domain name or IP address)
+        ip_type (int): The IP type of the measurement.
+        client_ip (Optional[str]): The IP address of the client.
+        settings (dict[str, Any]): The other settings of the measurement.
+
+    Returns:
+        MeasurementCacheKey: The key.
+    """
+    client_network = ""
+    if client_ip:
+        try:
+            client_network = get_client_network(client_ip)
+        except InputError:
+            client_network = client_ip
+    return kind, server.strip().lower(), ip_type, client_network, get_settings_hash(settings)
+
+
+def get_cached_measurement(key: MeasurementCacheKey, max_age: float) -> Optional[tuple[float, Any]]:
+    """
+    It returns the cached result of a measurement, if it is not older than max_age.
+
+    Args:
+        key (MeasurementCacheKey): The key of the measurement.
+        max_age (float): How old (seconds) the result can be. 0 never returns a cached result.
+
+    Returns:
+        Optional[tuple[float, Any]]: The age of the result in seconds and a copy of the result,
+        or None if there is no result that is recent enough.
+    """
+    if max_age <= 0:
+        return None
+    entry = get_measurement_cache().get_entry(key)
+    if entry is None or entry[0] > max_age:
+        return None
+    return entry[0], copy.deepcopy(entry[1])
+
+
+def cache_measurement(key: MeasurementCacheKey, result: Any) -> None:
+    """
+    It stores the result of a measurement.
+
+    Args:
+        key (MeasurementCacheKey): The key of the measurement.
+        result (Any): The result. (it is copied)
+    """
+    cache = get_measurement_cache()
+    if cache.ttl_s > 0:
+        cache.set(key, copy.deepcopy(result))
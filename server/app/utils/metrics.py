@@ -0,0 +1,131 @@
+import threading
+from typing import Optional
+
+# a metric is identified by its name and its labels (ex: ("circuit_breaker_state", (("name", "atlas.ripe.net"),)))
+MetricKey = tuple[str, tuple[tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: dict[MetricKey, float] = {}
+_gauges: dict[MetricKey, float] = {}
+
+
+def _make_key(name: str, labels: Optional[dict[str, str]]) -> MetricKey:
+    """
+    It builds the key of a metric from its name and its labels.
+
+    Args:
+        name (str): The name of the metric.
+        labels (Optional[dict[str, str]]): The labels of the metric.
+
+    Returns:
+        MetricKey: The key of the metric.
+    """
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def increment_counter(name: str, labels: Optional[dict[str, str]] = None, amount: float = 1) -> None:
+    """
+    It increments a counter. (a value that only goes up, like the number of requests)
+
+    Args:
+        name (str): The name of the counter.
+        labels (Optional[dict[str, str]]): The labels of the counter.
+        amount (float): How much to add.
+    """
+    key = _make_key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, labels: Optional[dict[str, str]] = None) -> None:
+    """
+    It sets a gauge. (a value that can go up and down, like the state of a circuit breaker)
+
+    Args:
+        name (str): The name of the gauge.
+        value (float): The new value.
+        labels (Optional[dict[str, str]]): The labels of the gauge.
+    """
+    key = _make_key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe_duration(name: str, seconds: float, labels: Optional[dict[str, str]] = None) -> None:
+    """
+    It records how long an operation took, as two counters: "<name>_seconds_sum" and "<name>_seconds_count".
+    Dividing them gives the average duration.
+
+    Args:
+        name (str): The name of the operation.
+        seconds (float): The duration in seconds.
+        labels (Optional[dict[str, str]]): The labels of the operation.
+    """
+    increment_counter(f"{name}_seconds_sum", labels, seconds)
+    increment_counter(f"{name}_seconds_count", labels)
+
+
+def get_metric_value(name: str, labels: Optional[dict[str, str]] = None) -> float:
+    """
+    It returns the current value of a counter or a gauge.
+
+    Args:
+        name (str): The name of the metric.
+        labels (Optional[dict[str, str]]): The labels of the metric.
+
+    Returns:
+        float: The value of the metric, or 0 if it was never recorded.
+    """
+    key = _make_key(name, labels)
+    with _lock:
+        if key in _counters:
+            return _counters[key]
+        return _gauges.get(key, 0)
+
+
+def _format_key(key: MetricKey) -> str:
+    """
+    It formats a metric key in the Prometheus text format. (ex: 'circuit_breaker_state{name="atlas.ripe.net"}')
+
+    Args:
+        key (MetricKey): The key of the metric.
+
+    Returns:
+        str: The formatted key.
+    """
+    name, labels = key
+    if not labels:
+        return name
+    formatted_labels = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{formatted_labels}}}"
+
+
+def get_metrics_snapshot() -> dict[str, float]:
+    """
+    It returns all the metrics recorded so far.
+
+    Returns:
+        dict[str, float]: The value of each metric, indexed by its formatted key.
+    """
+    with _lock:
+        items = list(_counters.items()) + list(_gauges.items())
+    return {_format_key(key): value for key, value in sorted(items)}
+
+
+def render_metrics_text() -> str:
+    """
+    It renders all the metrics in the Prometheus text format, so that they can be scraped.
+
+    Returns:
+        str: One line per metric.
+    """
+    return "".join(f"{key} {value}\n" for key, value in get_metrics_snapshot().items())
+
+
+def reset_metrics() -> None:
+    """
+    It removes all the recorded metrics.
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
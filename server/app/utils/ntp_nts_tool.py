@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from server.app.utils.load_config_data import get_ntp_nts_tool_request_timeout_s
+from server.app.utils.metrics import increment_counter
+from server.app.utils.subprocess_runner import run_subprocess
+
+# the exit code reported when the tool did not answer in time (the same as the "timeout" command)
+TIMEOUT_EXIT_CODE = 124
+
+
+@dataclass
+class ToolResult:
+    """
+    The result of one run of the ntp-nts tool. It has the same fields as the result of "subprocess.run",
+    so the output can be analysed in the same way, no matter how the tool was run.
+
+    Attributes:
+        returncode (int): The exit code of the tool. (0 means success)
+        stdout (str): What the tool printed. (the JSON result, or an error message)
+        stderr (str): The errors printed by the tool.
+    """
+    returncode: int
+    stdout: str
+    stderr: str = ""
+
+
+def run_ntp_nts_tool(binary: str, args: list[str], timeout_s: Optional[float] = None) -> ToolResult:
+    """
+    It runs the ntp-nts tool with these arguments in a new process, which exits after this measurement. The process
+    is started by the shared subprocess runner, so it waits for a free CPU core and it is killed if it does not finish
+    in time.
+
+    Args:
+        binary (str): The path to the ntp-nts tool.
+        args (list[str]): The arguments of the tool. (ex: ["nts", "time.cloudflare.com", "-t", "7"])
+        timeout_s (Optional[float]): The maximum duration of the tool. By default, the one from the config.
+
+    Returns:
+        ToolResult: The result of the tool. If it did not finish in time, the exit code is TIMEOUT_EXIT_CODE.
+    """
+    timeout = float(timeout_s if timeout_s is not None else get_ntp_nts_tool_request_timeout_s())
+    increment_counter("ntp_nts_tool_requests_total")
+    try:
+        result = run_subprocess([binary, *args], timeout, name="ntp-nts-tool")
+    except OSError as e:
+        return ToolResult(1, f"Could not start the ntp-nts tool: {e}")
+    if result.timed_out:
+        increment_counter("ntp_nts_tool_timeouts_total")
+        return ToolResult(TIMEOUT_EXIT_CODE, f"The ntp-nts tool did not finish within {timeout} seconds",
+                          result.stderr)
+    return ToolResult(result.returncode, result.stdout, result.stderr)
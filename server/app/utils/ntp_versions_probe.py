@@ -0,0 +1,293 @@
+import asyncio
+import os
+import socket
+import struct
+import time
+from typing import Any
+
+from server.app.models.CustomError import NtsError
+from server.app.utils.metrics import observe_duration
+
+# An in-process probe of the NTP versions supported by a server. One request per NTP version is sent at the same
+# time (each from its own socket), so the whole analysis takes one round trip (or the timeout) instead of one run
+# of the ntp-nts tool per version. The results have the same fields as the output of the tool, so they are analysed
+# by the same functions. (analyse_ntpv1_response ... analyse_ntpv5_response)
+
+# the "Draft Identification" extension field of the NTPv5 drafts, which carries the name of the draft
+EF_NTPV5_DRAFT_IDENTIFICATION = 0xF5FF
+
+NTP_PORT = 123
+NTP_HEADER_LENGTH = 48
+NTP_EPOCH_OFFSET = 2208988800  # seconds between 1900 and 1970
+
+
+def ntp_time_now() -> int:
+    """
+    It returns the current time as a 64-bit NTP timestamp.
+
+    Returns:
+        int: The NTP timestamp. (seconds since 1900 in the high 32 bits, the fraction in the low 32 bits)
+    """
+    ns = time.time_ns() + NTP_EPOCH_OFFSET * 1_000_000_000
+    return (ns << 32) // 1_000_000_000
+
+
+def _pad4(data: bytes) -> bytes:
+    """
+    It pads the data with zeros to a multiple of 4 bytes.
+    """
+    return data + bytes(-len(data) % 4)
+
+
+def encode_extension_field(field_type: int, body: bytes) -> bytes:
+    """
+    It encodes an NTP extension field (RFC 7822). The body is padded to a multiple of 4 bytes,
+    and the field is at least 16 bytes long.
+
+    Args:
+        field_type (int): The type of the field.
+        body (bytes): The value of the field.
+
+    Returns:
+        bytes: The encoded field.
+    """
+    body = _pad4(body)
+    body += bytes(max(0, 12 - len(body)))
+    return struct.pack(">HH", field_type, len(body) + 4) + body
+
+
+def iter_extension_fields(packet: bytes, offset: int = NTP_HEADER_LENGTH) -> list[tuple[int, int, bytes]]:
+    """
+    It returns the extension fields of an NTP packet.
+
+    Args:
+        packet (bytes): The packet, or the plaintext of the NTS authenticator.
+        offset (int): Where the extension fields start.
+
+    Returns:
+        list[tuple[int, int, bytes]]: The type, the offset and the value of each field.
+
+    Raises:
+        NtsError: If a field is malformed.
+    """
+    fields = []
+    while offset + 4 <= len(packet):
+        field_type, length = struct.unpack_from(">HH", packet, offset)
+        if length < 4 or length % 4 != 0 or offset + length > len(packet):
+            raise NtsError("invalid NTP extension field")
+        fields.append((field_type, offset, packet[offset + 4:offset + length]))
+        offset += length
+    return fields
+
+
+def parse_ntp_header(packet: bytes) -> dict[str, Any]:
+    """
+    It parses the 48-byte header of an NTP packet.
+
+    Args:
+        packet (bytes): The packet.
+
+    Returns:
+        dict[str, Any]: The fields of the header. (the timestamps are 64-bit NTP timestamps)
+
+    Raises:
+        NtsError: If the packet is too short.
+    """
+    if len(packet) < NTP_HEADER_LENGTH:
+        raise NtsError("invalid NTP response: the packet is too short")
+    first, stratum, poll, precision, root_delay, root_disp, ref_id, ref_time, origin, receive, transmit = \
+        struct.unpack_from(">BBbbII4sQQQQ", packet)
+    return {
+        "leap": first >> 6, "version": (first >> 3) & 0x7, "mode": first & 0x7,
+        "stratum": stratum, "poll": poll, "precision": precision,
+        "root_delay": root_delay / 2 ** 16, "root_disp": root_disp / 2 ** 16,
+        "ref_id": int.from_bytes(ref_id, "big"),
+        "ref_time": ref_time, "origin_time": origin, "receive_time": receive, "transmit_time": transmit,
+    }
+
+
+def build_ntp_version_request(version: int, transmit_time: int, client_cookie: int = 0, ntpv5_draft: str = "") -> bytes:
+    """
+    It builds a client request of this NTP version.
+    NTPv1 has no mode field, so its mode is 0 (servers treat it as a client request).
+    NTPv5 uses the header of the draft: timescale, era, flags, root delay, root dispersion, server cookie,
+    client cookie, receive and transmit timestamps.
+
+    Args:
+        version (int): The NTP version. (from 1 to 5)
+        transmit_time (int): The transmit timestamp. (echoed by NTPv1-v4 servers as the origin timestamp)
+        client_cookie (int): The client cookie. (only for NTPv5, echoed by the server)
+        ntpv5_draft (str): The NTPv5 draft, sent in a "Draft Identification" extension field. (only for NTPv5)
+
+    Returns:
+        bytes: The request.
+    """
+    mode = 0 if version == 1 else 3
+    first = (0 << 6) | (version << 3) | mode
+    if version != 5:
+        return struct.pack(">BBbb", first, 0, 0, 0) + bytes(36) + struct.pack(">Q", transmit_time)
+    packet = struct.pack(">BBbbBBHIIQQQQ", first, 0, 0, 0, 0, 0, 0, 0, 0, 0, client_cookie, 0, transmit_time)
+    if ntpv5_draft != "":
+        packet += encode_extension_field(EF_NTPV5_DRAFT_IDENTIFICATION, ntpv5_draft.encode())
+    return packet
+
+
+def parse_ntpv5_header(packet: bytes) -> dict[str, Any]:
+    """
+    It parses the 48-byte header of an NTPv5 (draft) packet.
+
+    Args:
+        packet (bytes): The packet.
+
+    Returns:
+        dict[str, Any]: The fields of the header. (the timestamps are 64-bit NTP timestamps)
+
+    Raises:
+        NtsError: If the packet is too short.
+    """
+    if len(packet) < NTP_HEADER_LENGTH:
+        raise NtsError("invalid NTP response: the packet is too short")
+    first, stratum, poll, precision, timescale, era, flags, root_delay, root_disp, server_cookie, client_cookie, \
+        receive, transmit = struct.unpack_from(">BBbbBBHIIQQQQ", packet)
+    return {
+        "leap": first >> 6, "version": (first >> 3) & 0x7, "mode": first & 0x7,
+        "stratum": stratum, "poll": poll, "precision": precision,
+        "timescale": timescale, "era": era, "flags_raw": flags,
+        "root_delay": root_delay / 2 ** 16, "root_disp": root_disp / 2 ** 16,
+        "server_cookie": server_cookie, "client_cookie": client_cookie,
+        "receive_time": receive, "transmit_time": transmit,
+    }
+
+
+def build_ntp_version_result(wanted_version: int, response: bytes, client_sent_time: int,
+                             client_recv_time: int) -> dict[str, Any]:
+    """
+    It converts a response to the result of the ntp-nts tool for this NTP version. A response with the version 5
+    is read with the NTPv5 header, any other response with the NTPv4 header. The "ref_id" is the raw number,
+    it is translated by the analysis. Like the tool, the result of a valid NTPv1 response has no "version".
+
+    Args:
+        wanted_version (int): The NTP version of the request.
+        response (bytes): The response.
+        client_sent_time (int): When the request was sent. (NTP timestamp)
+        client_recv_time (int): When the response was received. (NTP timestamp)
+
+    Returns:
+        dict[str, Any]: The result.
+
+    Raises:
+        NtsError: If the response is too short.
+    """
+    header = parse_ntp_header(response)
+    if header["version"] == 5:
+        header = parse_ntpv5_header(response)
+        header["extensions"] = [{"type": t, "length": len(body) + 4} for t, _, body in iter_extension_fields(response)]
+    t1, t2, t3, t4 = client_sent_time, header["receive_time"], header["transmit_time"], client_recv_time
+    result: dict[str, Any] = {
+        "leap": header["leap"],
+        "version": header["version"],
+        "mode": header["mode"],
+        "stratum": header["stratum"],
+        "poll": header["poll"],
+        "precision": round(2.0 ** header["precision"], 12),
+        "root_delay": round(header["root_delay"], 9),
+        "root_disp": round(header["root_disp"], 9),
+        "orig_timestamp": t1,
+        "recv_timestamp": t2,
+        "tx_timestamp": t3,
+        "client_recv_time": t4,
+        "offset": round(((t2 - t1) + (t3 - t4)) / 2 / 2 ** 32, 9),
+        "rtt": round(((t4 - t1) - (t3 - t2)) / 2 ** 32, 9),
+    }
+    for field in ("timescale", "era", "flags_raw", "server_cookie", "client_cookie", "extensions",
+                  "ref_id", "ref_time"):
+        if field in header:
+            result[field] = header[field]
+    if "ref_time" in result:
+        result["ref_timestamp"] = result.pop("ref_time")
+    if wanted_version == 1 and header["version"] == 1:
+        del result["version"]
+    return result
+
+
+async def probe_ntp_version(address: tuple, family: int, version: int, ntpv5_draft: str,
+                            timeout_s: float) -> dict[str, Any]:
+    """
+    It sends one request of this NTP version to the server and waits for the response.
+
+    Args:
+        address (tuple): The address of the server.
+        family (int): The IP family of the address.
+        version (int): The NTP version. (from 1 to 5)
+        ntpv5_draft (str): The NTPv5 draft.
+        timeout_s (float): How long to wait for the response.
+
+    Returns:
+        dict[str, Any]: The result, or {"error": ...} if the server did not answer in time or the answer is invalid.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            # a connected socket only receives the packets of the server
+            await loop.sock_connect(sock, address)
+            client_cookie = int.from_bytes(os.urandom(8), "big")
+            client_sent_time = ntp_time_now()
+            await loop.sock_sendall(sock, build_ntp_version_request(version, client_sent_time, client_cookie,
+                                                                    ntpv5_draft))
+            response = await asyncio.wait_for(loop.sock_recv(sock, 65536), timeout_s)
+            client_recv_time = ntp_time_now()
+        return build_ntp_version_result(version, response, client_sent_time, client_recv_time)
+    except asyncio.TimeoutError:
+        return {"error": f"No response within {timeout_s} seconds."}
+    except (OSError, NtsError) as e:
+        return {"error": f"Error in measurement: {e}"}
+
+
+async def probe_ntp_versions_async(server: str, versions: list[int], ntpv5_draft: str = "",
+                                   timeout_s: float = 2.0, port: int = NTP_PORT) -> dict[int, dict[str, Any]]:
+    """
+    It sends a request of each NTP version to the server at the same time, and returns the result of each one.
+    A domain name is resolved once, so all the versions are measured on the same IP address.
+
+    Args:
+        server (str): The server. (domain name or IP address)
+        versions (list[int]): The NTP versions. (from 1 to 5)
+        ntpv5_draft (str): The NTPv5 draft.
+        timeout_s (float): How long to wait for the responses.
+        port (int): The NTP port of the server.
+
+    Returns:
+        dict[int, dict[str, Any]]: The result of each version, or {"error": ...} for the versions that failed.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        addresses = await asyncio.wait_for(loop.getaddrinfo(server, port, type=socket.SOCK_DGRAM), timeout_s)
+    except (OSError, asyncio.TimeoutError) as e:
+        return {version: {"error": f"Could not resolve {server}: {e}"} for version in versions}
+    family, _, _, _, address = addresses[0]
+    results = await asyncio.gather(*(probe_ntp_version(address, family, version, ntpv5_draft, timeout_s)
+                                     for version in versions))
+    return dict(zip(versions, results))
+
+
+def probe_ntp_versions(server: str, versions: list[int], ntpv5_draft: str = "",
+                       timeout_s: float = 2.0, port: int = NTP_PORT) -> dict[int, dict[str, Any]]:
+    """
+    It probes the NTP versions supported by the server. It is the blocking version of probe_ntp_versions_async,
+    for the code that runs in worker threads.
+
+    Args:
+        server (str): The server. (domain name or IP address)
+        versions (list[int]): The NTP versions. (from 1 to 5)
+        ntpv5_draft (str): The NTPv5 draft.
+        timeout_s (float): How long to wait for the responses.
+        port (int): The NTP port of the server.
+
+    Returns:
+        dict[int, dict[str, Any]]: The result of each version, or {"error": ...} for the versions that failed.
+    """
+    start = time.monotonic()
+    results = asyncio.run(probe_ntp_versions_async(server, versions, ntpv5_draft, timeout_s, port))
+    observe_duration("ntp_versions_probe", time.monotonic() - start)
+    return results
@@ -1,12 +1,11 @@
 import json
-import os
 import pprint
-import subprocess
 from typing import Tuple
 
 from server.app.dtos.AdvancedSettings import AdvancedSettings
 from server.app.utils.load_config_data import get_timeout_measurement_s
 from server.app.utils.load_config_data import get_right_ntp_nts_binary_tool_for_your_os
+from server.app.utils.ntp_nts_tool import run_ntp_nts_tool, ToolResult
 from server.app.models.CustomError import InputError
 from server.app.utils.validate import sanitize_string
 
@@ -62,6 +61,29 @@ def parse_nts_response_to_dict(content: str) -> dict:
         raise InputError(f"could not parse json {e}")
 
 
+def run_nts_measurement(target: str, wanted_ip_type: int, timeout: float | int) -> ToolResult:
+    """
+    It measures an NTS server with the ntp-nts tool.
+
+    Args:
+        target (str): The domain name or the IP address of the server.
+        wanted_ip_type (int): The wanted IP type (4 or 6), or -1 for any.
+        timeout (float | int): The maximum duration of the measurement. (in seconds)
+
+    Returns:
+        ToolResult: The result of the measurement. (exit code 0 and the JSON result if it succeeded,
+        exit code 6 if it only succeeded on the other IP type, another exit code with the error message if it failed)
+
+    Raises:
+        Exception: If the ntp-nts tool is not available.
+    """
+    binary_nts_tool = get_right_ntp_nts_binary_tool_for_your_os()
+    if wanted_ip_type == -1:  # if the user does not want a specific IP type
+        return run_ntp_nts_tool(str(binary_nts_tool), ["nts", target, "-t", str(timeout)])
+    # if the user wants a specific IP type
+    return run_ntp_nts_tool(str(binary_nts_tool), ["nts", target, "-ipv", str(wanted_ip_type), "-t", str(timeout)])
+
+
 def perform_nts_measurement_domain_name(server_domain_name: str, settings: AdvancedSettings) \
         -> dict[str, str]:
     """
@@ -77,22 +99,7 @@ def perform_nts_measurement_domain_name(server_domain_name: str, settings: Advan
     nts_result_short: dict = {"NTS succeeded": False, "NTS analysis": "None"}
     timeout = get_timeout_measurement_s()
     try:
-        binary_nts_tool = get_right_ntp_nts_binary_tool_for_your_os()
-        if settings.wanted_ip_type == -1:  # if the user does not want a specific IP type
-            result = subprocess.run(
-                [str(binary_nts_tool), "nts", server_domain_name,
-                 "-t", str(timeout)],
-                capture_output=True, text=True,
-                env=os.environ.copy()  # ,
-                # cwd=str(binary_nts_tool.parent)
-            )
-        else:  # if the user wants a specific IP type
-            result = subprocess.run(
-                [str(binary_nts_tool), "nts", server_domain_name,
-                 "-ipv", str(settings.wanted_ip_type), "-t", str(timeout)],
-                capture_output=True, text=True,
-                env=os.environ.copy()
-            )
+        result = run_nts_measurement(server_domain_name, settings.wanted_ip_type, timeout)
     except Exception as e:
         nts_result_short["NTS analysis"] = f"NTS test could not be performed (binary tool not available) {e}"
         return nts_result_short
@@ -151,12 +158,7 @@ def perform_nts_measurement_ip(server_ip_str: str) -> dict:
     timeout = get_timeout_measurement_s()
     nts_result_short: dict = {"NTS succeeded": False, "NTS analysis": "None"}
     try:
-        binary_nts_tool = get_right_ntp_nts_binary_tool_for_your_os()
-        result = subprocess.run(
-            [str(binary_nts_tool), "nts", server_ip_str,
-             "-t", str(timeout)],
-            capture_output=True, text=True
-        )
+        result = run_nts_measurement(server_ip_str, -1, timeout)
     except Exception as e:
         nts_result_short["NTS analysis"] = f"NTS test could not be performed (binary tool not available) {e}"
         return nts_result_short
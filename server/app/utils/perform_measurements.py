@@ -2,9 +2,7 @@ import pprint
 
 import ntplib
 from ipaddress import ip_address
-import json
 from typing import Optional, Tuple, Any
-import requests
 
 from server.app.dtos.AdvancedSettings import AdvancedSettings
 from server.app.utils.analyze_ntp_versions import *
@@ -17,7 +15,9 @@ from server.app.utils.calculations import ntp_precise_time_to_human_date, conver
 from server.app.utils.ip_utils import get_ip_family, ref_id_to_ip_or_name, get_server_ip, ip_to_str
 from server.app.utils.load_config_data import get_ripe_account_email, get_ripe_api_token, get_ntp_version, \
     get_timeout_measurement_s, get_ripe_number_of_probes_per_measurement, \
-    get_ripe_timeout_per_probe_ms, get_ripe_packets_per_probe, get_right_ntp_nts_binary_tool_for_your_os
+    get_ripe_timeout_per_probe_ms, get_ripe_packets_per_probe, get_right_ntp_nts_binary_tool_for_your_os, \
+    get_ntp_versions_native_probe
+from server.app.utils.ripe_batcher import submit_ripe_measurement
 from server.app.utils.ripe_probes import get_probes
 from server.app.utils.domain_name_to_ip import domain_name_to_ip_list
 from server.app.dtos.NtpExtraDetails import NtpExtraDetails
@@ -174,6 +174,10 @@ def analyze_supported_ntp_versions(server: str, settings: AdvancedSettings) -> d
     For example, if it truly supports an NTP version, the confidence will be 100.
     This method returns either a dictionary with an error (if running the tool fails), or a dictionary with the whole structure (requested_versions*3=15 variables)
     with each field (even though some NTP version failed, you will still have all the fields).
+    The analysis of each NTP version is cached (see "ntp_versions_cache_ttl_s"), so the tool only runs again when
+    the cached analysis expired or when "settings.refresh_ntp_versions" is set.
+    If only some versions are analysed (ntp_versions_to_analyze) and "ntp_versions_native_probe" is enabled, they are
+    probed in-process, all at the same time, instead of running the tool once per version.
     Args:
         server (str): The server to analyze (domain name or IP address).
         settings (AdvancedSettings): The settings to use for the analysis.
@@ -186,6 +190,19 @@ def analyze_supported_ntp_versions(server: str, settings: AdvancedSettings) -> d
     # 50% means: received an NTP response, but with a different NTP version (honest server)
     # 75% means: received an NTP response, correct version, but content seems to be from another NTP version (server may have lied)
     # 100% means: fully valid ntpvX response received
+    ntp_versions = NTP_VERSIONS if settings.analyse_all_ntp_versions else settings.ntp_versions_to_analyze
+    if not settings.refresh_ntp_versions:
+        cached = get_cached_ntp_versions_analysis(server, ntp_versions, settings.ntpv5_draft)
+        if cached is not None:
+            return cached[0]
+
+    if not settings.analyse_all_ntp_versions and get_ntp_versions_native_probe():
+        # all the chosen versions at the same time, without the tool
+        probed = probe_and_analyze_ntp_versions(server, ntp_versions, settings.ntpv5_draft,
+                                                not settings.refresh_ntp_versions)
+        cache_ntp_versions_analysis(server, ntp_versions, settings.ntpv5_draft, probed)
+        return probed
+
     ntp_versions_analysis: dict = {}
     try:
         binary_nts_tool = get_right_ntp_nts_binary_tool_for_your_os()
@@ -198,11 +215,14 @@ def analyze_supported_ntp_versions(server: str, settings: AdvancedSettings) -> d
         ntp_versions_analysis = directly_analyze_all_ntp_versions(server, str(binary_nts_tool), settings.ntpv5_draft)
     else:
         for ntp_version in settings.ntp_versions_to_analyze: # we assume settings has valid input
+            cached_version = None if settings.refresh_ntp_versions else \
+                get_cached_ntp_version(server, ntp_version, settings.ntpv5_draft)
             (ntp_versions_analysis[ntp_version + "_supported_confidence"],
              ntp_versions_analysis[ntp_version + "_analysis"],
              # settings.ntpv5_draft will be considered if and only if the ntp_version is "ntpv5"
-             ntp_versions_analysis[ntp_version + "_m_result"]) = run_tool_on_ntp_version(server, str(binary_nts_tool),
-                                                                                                   ntp_version, settings.ntpv5_draft)
+             ntp_versions_analysis[ntp_version + "_m_result"]) = cached_version[1] if cached_version is not None else \
+                run_tool_on_ntp_version(server, str(binary_nts_tool), ntp_version, settings.ntpv5_draft)
+    cache_ntp_versions_analysis(server, ntp_versions, settings.ntpv5_draft, ntp_versions_analysis)
     return ntp_versions_analysis
 
 
@@ -259,7 +279,9 @@ def print_ntp_measurement(measurement: NtpMeasurement) -> bool:
 
 def perform_ripe_measurement_domain_name(server_name: str, client_ip: str, wanted_ip_type: int,
                                          probes_requested: int =
-                                         get_ripe_number_of_probes_per_measurement()) -> int:
+                                         get_ripe_number_of_probes_per_measurement(),
+                                         custom_probes_asn: Optional[str] = None,
+                                         custom_probes_country: Optional[str] = None) -> int:
     """
     This method performs a RIPE measurement on a domain name. It lets the RIPE atlas probe to
     decide which IP of that domain name to use. (You can see this IP from the details of the
@@ -270,6 +292,8 @@ def perform_ripe_measurement_domain_name(server_name: str, client_ip: str, wante
         client_ip (str): The IP address of the NTP server.
         wanted_ip_type (int): The IP type that we want to measure.
         probes_requested (int): The number of probes requested.
+        custom_probes_asn (Optional[str]): The ASN from which the probes should be chosen, instead of the client's.
+        custom_probes_country (Optional[str]): The country from which the probes should be chosen, instead of the client's.
 
     Returns:
         int: It returns the ID of the measurement and the list of IPs of the domain name.
@@ -289,28 +313,18 @@ def perform_ripe_measurement_domain_name(server_name: str, client_ip: str, wante
     # measurement settings
     # we use wanted_ip_type to force to search this type
     headers, request_content = get_request_settings(ip_family_of_ntp_server=wanted_ip_type, ntp_server=server_name,
-                                                    client_ip=client_ip, probes_requested=probes_requested)
+                                                    client_ip=client_ip, probes_requested=probes_requested,
+                                                    custom_probes_asn=custom_probes_asn,
+                                                    custom_probes_country=custom_probes_country)
     # perform the measurement
-    response = requests.post(
-        "https://atlas.ripe.net/api/v2/measurements/",
-        headers=headers,
-        data=json.dumps(request_content)
-    )
-
-    data = response.json()
-    # the answer has a list of measurements, but we only did one measurement so we send one.
-    try:
-        ans: int = data["measurements"][0]
-    except Exception as e:
-        if "error" in data:
-            raise RipeMeasurementError(data["error"])
-        else:
-            raise RipeMeasurementError(f"Ripe measurement failed:{e}")
-    return ans
+    # it is sent together with the other measurements triggered at the same time (with the same probes)
+    return submit_ripe_measurement(headers, request_content)
 
 
 def perform_ripe_measurement_ip(ntp_server_ip: str, client_ip: str,
-                                probes_requested: int = get_ripe_number_of_probes_per_measurement()) -> int:
+                                probes_requested: int = get_ripe_number_of_probes_per_measurement(),
+                                custom_probes_asn: Optional[str] = None,
+                                custom_probes_country: Optional[str] = None) -> int:
     """
     This method performs a RIPE measurement and returns the ID of the measurement.
 
@@ -318,6 +332,8 @@ def perform_ripe_measurement_ip(ntp_server_ip: str, client_ip: str,
         ntp_server_ip (str): The NTP server IP.
         client_ip (str): The IP of the client.
         probes_requested (int): The number of probes requested.
+        custom_probes_asn (Optional[str]): The ASN from which the probes should be chosen, instead of the client's.
+        custom_probes_country (Optional[str]): The country from which the probes should be chosen, instead of the client's.
 
     Returns:
         int: The ID of the measurement.
@@ -335,28 +351,18 @@ def perform_ripe_measurement_ip(ntp_server_ip: str, client_ip: str,
 
     # measurement settings
     headers, request_content = get_request_settings(ip_family_of_ntp_server=ip_family, ntp_server=ntp_server_ip,
-                                                    client_ip=client_ip, probes_requested=probes_requested)
+                                                    client_ip=client_ip, probes_requested=probes_requested,
+                                                    custom_probes_asn=custom_probes_asn,
+                                                    custom_probes_country=custom_probes_country)
     # perform the measurement
-    response = requests.post(
-        "https://atlas.ripe.net/api/v2/measurements/",
-        headers=headers,
-        data=json.dumps(request_content)
-    )
-
-    data = response.json()
-    # the answer has a list of measurements, but we only did one measurement so we send one.
-    try:
-        ans: int = data["measurements"][0]
-    except Exception as e:
-        if "error" in data:
-            raise RipeMeasurementError(data["error"])
-        else:
-            raise RipeMeasurementError(f"Ripe measurement failed:{e}")
-    return ans
+    # it is sent together with the other measurements triggered at the same time (with the same probes)
+    return submit_ripe_measurement(headers, request_content)
 
 
 def get_request_settings(ip_family_of_ntp_server: int, ntp_server: str, client_ip: str,
-                         probes_requested: int = get_ripe_number_of_probes_per_measurement()) -> tuple[dict, dict]:
+                         probes_requested: int = get_ripe_number_of_probes_per_measurement(),
+                         custom_probes_asn: Optional[str] = None,
+                         custom_probes_country: Optional[str] = None) -> tuple[dict, dict]:
     """
     This method gets the RIPE measurement settings for the performing a RIPE measurement.
     Args:
@@ -364,6 +370,8 @@ def get_request_settings(ip_family_of_ntp_server: int, ntp_server: str, client_i
         ntp_server (str): The NTP server IP address or domain name.
         client_ip (str): The IP address of the client.
         probes_requested (int): The number of probes requested.
+        custom_probes_asn (Optional[str]): The ASN from which the probes should be chosen, instead of the client's.
+        custom_probes_country (Optional[str]): The country from which the probes should be chosen, instead of the client's.
 
     Returns:
         tuple[dict, dict]: Returns the RIPE measurement settings for the performing a RIPE measurement.
@@ -391,7 +399,9 @@ def get_request_settings(ip_family_of_ntp_server: int, ntp_server: str, client_i
     ],
         "is_oneoff": True,
         "bill_to": get_ripe_account_email(),
-        "probes": get_probes(client_ip, ip_family_of_ntp_server, probes_requested)  # we want probes close to the client
+        # we want probes close to the client
+        "probes": get_probes(client_ip, ip_family_of_ntp_server, probes_requested,
+                             custom_asn=custom_probes_asn, custom_country=custom_probes_country)
     }
     return headers, request_content
 
@@ -0,0 +1,270 @@
+import json
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from server.app.models.CustomError import RipeMeasurementError
+from server.app.utils.http_client import http_post
+from server.app.utils.load_config_data import get_ripe_batch_window_ms, get_ripe_max_definitions_per_batch
+from server.app.utils.metrics import increment_counter
+
+RIPE_MEASUREMENTS_URL = "https://atlas.ripe.net/api/v2/measurements/"
+
+
+@dataclass
+class RipeBatch:
+    """
+    The RIPE measurement definitions collected during one batching window. They share the same headers and the same
+    request fields (probes, bill_to, is_oneoff), so they can be sent to RIPE Atlas in a single request.
+
+    Attributes:
+        headers (dict[str, str]): The headers of the request.
+        content (dict[str, Any]): The fields of the request, without the definitions.
+        definitions (list[dict[str, Any]]): The (unique) measurement definitions.
+        waiters (list[list[Future[int]]]): For each definition, the requesters waiting for its measurement ID.
+        flushed (bool): Whether the batch was already sent.
+        timer (Optional[threading.Timer]): The timer that sends the batch at the end of the window.
+    """
+    headers: dict[str, str]
+    content: dict[str, Any]
+    definitions: list[dict[str, Any]] = field(default_factory=list)
+    waiters: list[list[Future[int]]] = field(default_factory=list)
+    flushed: bool = False
+    timer: Optional[threading.Timer] = None
+
+
+_lock = threading.Lock()
+_pending: dict[str, RipeBatch] = {}
+# the number of batches being sent to RIPE Atlas right now
+_in_flight = 0
+
+
+def get_batch_key(headers: dict[str, str], request_content: dict[str, Any]) -> str:
+    """
+    It returns the key of the batch that a request can join. Requests can only share a batch if everything except
+    their definitions is identical, because RIPE Atlas applies the probes of a request to all its definitions.
+
+    Args:
+        headers (dict[str, str]): The headers of the request.
+        request_content (dict[str, Any]): The body of the request.
+
+    Returns:
+        str: The key of the batch.
+    """
+    shared = {k: v for k, v in request_content.items() if k != "definitions"}
+    return json.dumps({"headers": headers, "content": shared}, sort_keys=True, default=str)
+
+
+def get_definition_key(definition: dict[str, Any]) -> str:
+    """
+    It returns the key of a measurement definition. Two identical definitions in the same batch (same target, same type,
+    same probes) are measured only once, and all their requesters receive the same measurement ID.
+
+    Args:
+        definition (dict[str, Any]): The measurement definition.
+
+    Returns:
+        str: The key of the definition.
+    """
+    return json.dumps(definition, sort_keys=True, default=str)
+
+
+def post_ripe_definitions(headers: dict[str, str], request_content: dict[str, Any]) -> list[int]:
+    """
+    It sends the request to RIPE Atlas and returns the IDs of the measurements it created,
+    in the same order as the definitions of the request.
+
+    Args:
+        headers (dict[str, str]): The headers of the request.
+        request_content (dict[str, Any]): The body of the request.
+
+    Returns:
+        list[int]: The IDs of the measurements.
+
+    Raises:
+        RipeMeasurementError: If RIPE Atlas refused the request or answered with unexpected data.
+        CircuitOpenError: If RIPE Atlas failed too many times recently.
+    """
+    response = http_post(RIPE_MEASUREMENTS_URL, headers=headers, data=json.dumps(request_content))
+    increment_counter("ripe_measurement_requests_total")
+    try:
+        data = response.json()
+    except ValueError:
+        raise RipeMeasurementError("Invalid JSON response from RIPE API.")
+    try:
+        ids: list[int] = [int(m_id) for m_id in data["measurements"]]
+    except Exception as e:
+        if "error" in data:
+            raise RipeMeasurementError(data["error"])
+        else:
+            raise RipeMeasurementError(f"Ripe measurement failed:{e}")
+    if len(ids) != len(request_content["definitions"]):
+        raise RipeMeasurementError(f"Ripe measurement failed: expected {len(request_content['definitions'])} "
+                                   f"measurements, received {len(ids)}")
+    return ids
+
+
+def _resolve_waiters(waiters: list[Future[int]], result: Optional[int], error: Optional[BaseException]) -> None:
+    """
+    It gives the measurement ID (or the error) to all the requesters waiting for one definition.
+
+    Args:
+        waiters (list[Future[int]]): The requesters waiting for the definition.
+        result (Optional[int]): The measurement ID, if the measurement was created.
+        error (Optional[BaseException]): The error, if the measurement could not be created.
+    """
+    for waiter in waiters:
+        if error is not None:
+            waiter.set_exception(error)
+        elif result is not None:
+            waiter.set_result(result)
+
+
+def flush_batch(key: str, batch: RipeBatch) -> None:
+    """
+    It sends a batch to RIPE Atlas and gives each requester the ID of its measurement.
+    If RIPE Atlas refuses a batch with several definitions, each definition is retried alone,
+    so that one invalid target does not make the other requesters fail.
+
+    Args:
+        key (str): The key of the batch.
+        batch (RipeBatch): The batch.
+    """
+    global _in_flight
+    with _lock:
+        if _pending.get(key) is batch:
+            del _pending[key]
+        if batch.flushed:
+            return
+        batch.flushed = True
+        _in_flight += 1
+    if batch.timer is not None:
+        batch.timer.cancel()
+    increment_counter("ripe_batched_definitions_total", amount=len(batch.definitions))
+    try:
+        send_batch(batch)
+    finally:
+        with _lock:
+            _in_flight -= 1
+
+
+def send_batch(batch: RipeBatch) -> None:
+    """
+    It sends the definitions of a batch to RIPE Atlas and gives each requester the ID of its measurement (or the error).
+
+    Args:
+        batch (RipeBatch): The batch.
+    """
+    try:
+        ids = post_ripe_definitions(batch.headers, {**batch.content, "definitions": batch.definitions})
+    except RipeMeasurementError as e:
+        if len(batch.definitions) == 1:
+            _resolve_waiters(batch.waiters[0], None, e)
+        else:
+            send_definitions_one_by_one(batch)
+        return
+    except Exception as e:
+        for waiters in batch.waiters:
+            _resolve_waiters(waiters, None, e)
+        return
+    for m_id, waiters in zip(ids, batch.waiters):
+        _resolve_waiters(waiters, m_id, None)
+
+
+def send_definitions_one_by_one(batch: RipeBatch) -> None:
+    """
+    It sends each definition of a batch in its own request. It is used when RIPE Atlas refused the whole batch,
+    so that only the requesters of the invalid definitions receive an error.
+
+    Args:
+        batch (RipeBatch): The batch.
+    """
+    for definition, waiters in zip(batch.definitions, batch.waiters):
+        try:
+            m_id = post_ripe_definitions(batch.headers, {**batch.content, "definitions": [definition]})[0]
+            _resolve_waiters(waiters, m_id, None)
+        except Exception as e:
+            _resolve_waiters(waiters, None, e)
+
+
+def submit_ripe_definitions(headers: dict[str, str], request_content: dict[str, Any]) -> list[int]:
+    """
+    It submits a RIPE measurement request through the batcher and waits for the IDs of its measurements.
+    If no other request is being sent or collected, it is sent at once (a lone request does not wait for the window).
+    Otherwise, the definitions are collected for a short window together with the definitions of other requests that
+    use the same probes, and all of them are sent to RIPE Atlas in one request. Identical definitions are measured only once.
+
+    Args:
+        headers (dict[str, str]): The headers of the request.
+        request_content (dict[str, Any]): The body of the request. (with one or more "definitions")
+
+    Returns:
+        list[int]: The IDs of the measurements, in the same order as the definitions.
+
+    Raises:
+        RipeMeasurementError: If RIPE Atlas refused the request or answered with unexpected data.
+        CircuitOpenError: If RIPE Atlas failed too many times recently.
+    """
+    window_s = get_ripe_batch_window_ms() / 1000
+    if window_s <= 0:
+        return post_ripe_definitions(headers, request_content)
+
+    max_definitions = get_ripe_max_definitions_per_batch()
+    key = get_batch_key(headers, request_content)
+    futures: list[Future[int]] = []
+    ready_batches: list[RipeBatch] = []
+    new_batches: list[RipeBatch] = []
+    with _lock:
+        idle = _in_flight == 0 and len(_pending) == 0
+        for definition in request_content["definitions"]:
+            batch = _pending.get(key)
+            if batch is None:
+                batch = RipeBatch(headers=headers,
+                                  content={k: v for k, v in request_content.items() if k != "definitions"})
+                _pending[key] = batch
+                new_batches.append(batch)
+            future: Future[int] = Future()
+            futures.append(future)
+            definition_key = get_definition_key(definition)
+            existing = [i for i, d in enumerate(batch.definitions) if get_definition_key(d) == definition_key]
+            if existing:
+                batch.waiters[existing[0]].append(future)
+                increment_counter("ripe_deduplicated_definitions_total")
+                continue
+            batch.definitions.append(definition)
+            batch.waiters.append([future])
+            if len(batch.definitions) >= max_definitions:
+                # the batch is full, the next definitions start a new one
+                del _pending[key]
+                ready_batches.append(batch)
+    for batch in new_batches:
+        if batch in ready_batches:
+            continue
+        if idle:
+            ready_batches.append(batch)
+            continue
+        batch.timer = threading.Timer(window_s, flush_batch, args=(key, batch))
+        batch.timer.daemon = True
+        batch.timer.start()
+    for batch in ready_batches:
+        flush_batch(key, batch)
+    return [future.result() for future in futures]
+
+
+def submit_ripe_measurement(headers: dict[str, str], request_content: dict[str, Any]) -> int:
+    """
+    It submits a RIPE measurement request with one definition through the batcher and returns the ID of its measurement.
+
+    Args:
+        headers (dict[str, str]): The headers of the request.
+        request_content (dict[str, Any]): The body of the request. (with one definition)
+
+    Returns:
+        int: The ID of the measurement.
+
+    Raises:
+        RipeMeasurementError: If RIPE Atlas refused the request or answered with unexpected data.
+        CircuitOpenError: If RIPE Atlas failed too many times recently.
+    """
+    return submit_ripe_definitions(headers, request_content)[0]
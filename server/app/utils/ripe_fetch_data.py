@@ -2,6 +2,7 @@ import time
 from ipaddress import ip_address, IPv4Address, IPv6Address
 import requests
 
+from server.app.utils.http_client import http_get
 from server.app.utils.ip_utils import translate_ref_id, get_ip_family, ip_to_str
 from server.app.services.NtpCalculator import NtpCalculator
 from server.app.utils.location_resolver import get_country_for_ip, get_coordinates_for_ip
@@ -43,7 +44,7 @@ def check_all_measurements_scheduled(measurement_id: str) -> bool:
         "Authorization": f"Key {get_ripe_api_token()}",
         "Content-Type": "application/json"
     }
-    response = requests.get(url, headers=headers)
+    response = http_get(url, headers=headers)
     json_data = response.json()
     if isinstance(json_data, dict) and 'error' in json_data:
         raise ValueError(
@@ -92,7 +93,7 @@ def check_all_measurements_done(measurement_id: str, measurement_req: int) -> st
     }
 
     try:
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers)
         response.raise_for_status()
         json_data = response.json()
     except requests.RequestException as e:
@@ -149,7 +150,7 @@ def get_data_from_ripe_measurement(measurement_id: str) -> list[dict[str, Any]]:
         "Content-Type": "application/json"
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers)
         response.raise_for_status()
         json_data = response.json()
     except requests.RequestException as e:
@@ -193,7 +194,7 @@ def get_probe_data_from_ripe_by_id(probe_id: str) -> dict[str, Any]:
         "Content-Type": "application/json"
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers)
         response.raise_for_status()
         json_data = response.json()
     except requests.RequestException as e:
@@ -1,18 +1,133 @@
+import copy
+import os
+import threading
+from ipaddress import ip_network
 from typing import TypeVar
 from typing import Optional
 
 from server.app.utils.location_resolver import get_coordinates_for_ip
 from server.app.utils.calculations import calculate_haversine_distance
 from server.app.models.CustomError import InputError
-from server.app.utils.load_config_data import get_ripe_number_of_probes_per_measurement
+from server.app.utils.load_config_data import get_ripe_number_of_probes_per_measurement, get_mask_ipv4, \
+    get_mask_ipv6, get_max_mind_path_city, get_max_mind_path_country, get_max_mind_path_asn, \
+    get_ripe_probes_cache_ttl_s, get_ripe_probes_cache_max_entries
 from server.app.utils.ip_utils import get_ip_network_details, get_prefix_from_ip, get_ip_family
+from server.app.utils.ttl_cache import TTLCache
 from ripe.atlas.cousteau import ProbeRequest
 
 T = TypeVar('T', int, float)  # float or int
 
+# the key is (client network, IP family of the NTP server, probes requested, custom ASN, custom country)
+ProbesCacheKey = tuple[str, int, int, Optional[str], Optional[str]]
+
+_probes_cache_lock = threading.Lock()
+_probes_cache: Optional[TTLCache[ProbesCacheKey, list[dict]]] = None
+_probes_catalogue_version: Optional[tuple[float, ...]] = None
+
+
+def get_probes_cache() -> TTLCache[ProbesCacheKey, list[dict]]:
+    """
+    It returns the cache of the selected probes, creating it (with the settings from the config) if needed.
+
+    Returns:
+        TTLCache[ProbesCacheKey, list[dict]]: The cache of the selected probes.
+    """
+    global _probes_cache
+    with _probes_cache_lock:
+        if _probes_cache is None:
+            _probes_cache = TTLCache("ripe_probes", float(get_ripe_probes_cache_ttl_s()),
+                                     get_ripe_probes_cache_max_entries())
+        return _probes_cache
+
+
+def get_probes_catalogue_version() -> tuple[float, ...]:
+    """
+    It returns the version of the data used to select the probes. The ASN, country and area of a client come from the
+    MaxMind databases, so the version is the modification time of these files. It changes when they are refreshed.
+
+    Returns:
+        tuple[float, ...]: The modification times of the MaxMind databases. (0 for a missing file)
+    """
+    version = []
+    for path in (get_max_mind_path_city(), get_max_mind_path_country(), get_max_mind_path_asn()):
+        try:
+            version.append(os.path.getmtime(path))
+        except OSError:
+            version.append(0.0)
+    return tuple(version)
+
+
+def invalidate_probes_cache() -> None:
+    """
+    It forgets all the selected probes, so that the next measurements select them again.
+    """
+    get_probes_cache().invalidate()
+
+
+def get_client_network(client_ip: str) -> str:
+    """
+    It returns the network of the client (using the same masks as the ones used to anonymize the IPs).
+    Clients from the same network get the same probes.
+
+    Args:
+        client_ip (str): The IP address of the client.
+
+    Returns:
+        str: The network of the client. (ex: "80.211.238.0/24")
+
+    Raises:
+        InputError: If the client IP address is invalid.
+    """
+    mask = get_mask_ipv4() if get_ip_family(client_ip) == 4 else get_mask_ipv6()
+    return str(ip_network(f"{client_ip}/{mask}", strict=False))
+
 
 def get_probes(client_ip: str, ip_family_of_ntp_server: int,
-               probes_requested: int = get_ripe_number_of_probes_per_measurement()) -> list[dict]:
+               probes_requested: int = get_ripe_number_of_probes_per_measurement(),
+               custom_asn: Optional[str] = None, custom_country: Optional[str] = None) -> list[dict]:
+    """
+    This method returns the probes that we should use for a measurement, near the client.
+    The probes selected for a client network are reused (for a limited time) for all the clients of the same network,
+    so most of the measurements do not need to query the MaxMind databases, stat.ripe.net and RIPE Atlas again.
+    The cache is emptied when the MaxMind databases are refreshed.
+
+    Args:
+        client_ip (str): The IP address of the client.
+        ip_family_of_ntp_server (int): The IP family of the NTP server. (4 or 6)
+        probes_requested (int): The total number of probes that we will request.
+        custom_asn (Optional[str]): The ASN from which the probes should be chosen, instead of the client's.
+        custom_country (Optional[str]): The country from which the probes should be chosen, instead of the client's.
+
+    Returns:
+        list[dict]: The list of probes that we will use for the measurement.
+
+    Raises:
+        InputError: If the client IP address is invalid.
+    """
+    global _probes_catalogue_version
+    custom_asn = custom_asn or None
+    custom_country = custom_country.upper() if custom_country else None
+    cache = get_probes_cache()
+    version = get_probes_catalogue_version()
+    with _probes_cache_lock:
+        if version != _probes_catalogue_version:
+            cache.invalidate()
+            _probes_catalogue_version = version
+
+    key: ProbesCacheKey = (get_client_network(client_ip), ip_family_of_ntp_server, probes_requested,
+                           custom_asn, custom_country)
+    cached = cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    probes = select_probes(client_ip, ip_family_of_ntp_server, probes_requested, custom_asn, custom_country)
+    # random probes mean that we could not find anything about the client, maybe only temporarily
+    if probes != [get_random_probes(probes_requested)]:
+        cache.set(key, copy.deepcopy(probes))
+    return probes
+
+
+def select_probes(client_ip: str, ip_family_of_ntp_server: int, probes_requested: int,
+                  custom_asn: Optional[str] = None, custom_country: Optional[str] = None) -> list[dict]:
     """
     This method handles all cases regarding what probes we should send.
     This method assumes all inputs are either valid or None. (If there is a typo in the input, the measurement
@@ -23,6 +138,8 @@ def get_probes(client_ip: str, ip_family_of_ntp_server: int,
         client_ip (str): The IP address of the client.
         ip_family_of_ntp_server (int): The IP family of the NTP server. (4 or 6)
         probes_requested (int): The total number of probes that we will request.
+        custom_asn (Optional[str]): The ASN from which the probes should be chosen, instead of the client's.
+        custom_country (Optional[str]): The country from which the probes should be chosen, instead of the client's.
 
     Returns:
         list[dict]: The list of probes that we will use for the measurement.
@@ -38,8 +155,13 @@ def get_probes(client_ip: str, ip_family_of_ntp_server: int,
     # Otherwise, we won't "find probes with the same prefix as the client that can perform NTP measurements for that server"
 
     # If we do not have this check, "get available" methods that involves prefix will fail
-    if ip_family == ip_family_of_ntp_server:
+    # A custom ASN means that the probes should not be in the network of the client, so its prefix is not relevant.
+    if ip_family == ip_family_of_ntp_server and custom_asn is None:
         ip_prefix = get_prefix_from_ip(client_ip)
+    if custom_asn is not None:
+        ip_asn = custom_asn
+    if custom_country is not None:
+        ip_country = custom_country
 
     # settings:
     probes: list[dict] = []
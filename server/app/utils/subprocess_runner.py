@@ -0,0 +1,161 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from server.app.utils.metrics import increment_counter, observe_duration
+
+# how long we wait for the output of a killed process
+KILL_GRACE_S = 5
+
+
+@dataclass
+class SubprocessResult:
+    """
+    The result of a process run by the subprocess runner.
+
+    Attributes:
+        returncode (int): The exit code of the process. (negative if it was killed by a signal)
+        stdout (str): What the process printed.
+        stderr (str): The errors printed by the process.
+        timed_out (bool): Whether the process was killed because it did not finish in time.
+    """
+    returncode: int
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+
+
+_loop_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_max_concurrent_processes() -> int:
+    """
+    It returns how many processes can run at the same time. (one per CPU core)
+
+    Returns:
+        int: The number of CPU cores.
+    """
+    return os.cpu_count() or 1
+
+
+def get_runner_loop() -> asyncio.AbstractEventLoop:
+    """
+    It returns the event loop that runs all the processes, starting it in a background thread if needed.
+    Using a single loop makes the limit on the number of processes global, whatever thread or loop started them.
+
+    Returns:
+        asyncio.AbstractEventLoop: The event loop of the runner.
+    """
+    global _loop, _semaphore
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            _semaphore = asyncio.Semaphore(get_max_concurrent_processes())
+            threading.Thread(target=loop.run_forever, name="subprocess-runner", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def kill_process_tree(process: asyncio.subprocess.Process) -> None:
+    """
+    It kills a process and all the processes it started. The process was started in its own process group
+    (session), so the whole group is killed. On Windows, only the process is killed.
+
+    Args:
+        process (asyncio.subprocess.Process): The process to kill.
+    """
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass  # it already exited
+
+
+async def _run(args: list[str], timeout_s: float, name: str) -> SubprocessResult:
+    """
+    It runs the process on the runner loop. See run_subprocess_async.
+    """
+    assert _semaphore is not None
+    async with _semaphore:
+        start = time.monotonic()
+        process = await asyncio.create_subprocess_exec(*args, stdin=asyncio.subprocess.DEVNULL,
+                                                       stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE,
+                                                       start_new_session=(os.name != "nt"))
+        timed_out = False
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout_s)
+        except asyncio.TimeoutError:
+            timed_out = True
+            kill_process_tree(process)
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), KILL_GRACE_S)
+            except asyncio.TimeoutError:
+                stdout, stderr = b"", b""
+        returncode = process.returncode if process.returncode is not None else -signal.SIGKILL
+        result = SubprocessResult(returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace"),
+                                  timed_out)
+        record_subprocess_metrics(name, time.monotonic() - start, result)
+        return result
+
+
+def record_subprocess_metrics(name: str, duration_s: float, result: SubprocessResult) -> None:
+    """
+    It records the duration and the exit code of a process run.
+
+    Args:
+        name (str): The name of the program.
+        duration_s (float): How long the process ran. (in seconds)
+        result (SubprocessResult): The result of the process.
+    """
+    observe_duration("subprocess", duration_s, {"tool": name})
+    increment_counter("subprocess_exits_total",
+                      {"tool": name, "exit_code": "timeout" if result.timed_out else str(result.returncode)})
+
+
+async def run_subprocess_async(args: list[str], timeout_s: float, name: str = "subprocess") -> SubprocessResult:
+    """
+    It runs a process and waits for it to finish, without blocking the event loop. At most one process
+    per CPU core runs at the same time, the others wait for their turn. If the process does not finish in time,
+    it is killed together with all the processes it started.
+
+    Args:
+        args (list[str]): The program and its arguments.
+        timeout_s (float): The maximum duration of the process (in seconds), not including the wait for a turn.
+        name (str): The name of the program, used in the metrics.
+
+    Returns:
+        SubprocessResult: The exit code and the output of the process.
+
+    Raises:
+        OSError: If the process could not be started.
+    """
+    future = asyncio.run_coroutine_threadsafe(_run(args, timeout_s, name), get_runner_loop())
+    return await asyncio.wrap_future(future)
+
+
+def run_subprocess(args: list[str], timeout_s: float, name: str = "subprocess") -> SubprocessResult:
+    """
+    It runs a process and waits for it to finish. It is the blocking version of run_subprocess_async,
+    for the code that runs in worker threads.
+
+    Args:
+        args (list[str]): The program and its arguments.
+        timeout_s (float): The maximum duration of the process (in seconds), not including the wait for a turn.
+        name (str): The name of the program, used in the metrics.
+
+    Returns:
+        SubprocessResult: The exit code and the output of the process.
+
+    Raises:
+        OSError: If the process could not be started.
+    """
+    return asyncio.run_coroutine_threadsafe(_run(args, timeout_s, name), get_runner_loop()).result()
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+from server.app.utils.metrics import increment_counter
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    A thread-safe in-memory cache where each entry expires after a time-to-live.
+    When the cache is full, the least recently used entry is removed.
+    The hits and misses are recorded in the metrics as "cache_hits_total" and "cache_misses_total" (labelled by name).
+
+    Attributes:
+        name (str): The name of the cache, used in the metrics.
+        ttl_s (float): The default time-to-live of an entry in seconds.
+        max_entries (int): The maximum number of entries kept in the cache.
+    """
+
+    def __init__(self, name: str, ttl_s: float, max_entries: int,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Initialize an empty cache.
+        """
+        self.name = name
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        # each key is mapped to (the time when it expires, the time when it was stored, the value)
+        self._entries: OrderedDict[K, tuple[float, float, V]] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        """
+        It returns the value stored for this key, if it did not expire.
+
+        Args:
+            key (K): The key.
+
+        Returns:
+            Optional[V]: The value, or None if it is missing or expired.
+        """
+        entry = self.get_entry(key)
+        return entry[1] if entry is not None else None
+
+    def get_entry(self, key: K) -> Optional[tuple[float, V]]:
+        """
+        It returns the value stored for this key and how old it is, if it did not expire.
+
+        Args:
+            key (K): The key.
+
+        Returns:
+            Optional[tuple[float, V]]: The age of the entry in seconds and the value, or None if it is missing or expired.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            increment_counter("cache_misses_total", {"cache": self.name})
+            return None
+        increment_counter("cache_hits_total", {"cache": self.name})
+        return now - entry[1], entry[2]
+
+    def set(self, key: K, value: V, ttl_s: Optional[float] = None) -> None:
+        """
+        It stores a value for this key.
+
+        Args:
+            key (K): The key.
+            value (V): The value.
+            ttl_s (Optional[float]): The time-to-live of this entry. By default, the one of the cache.
+        """
+        now = self._clock()
+        expires_at = now + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._lock:
+            self._entries[key] = (expires_at, now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[K] = None) -> None:
+        """
+        It removes one entry, or all the entries of the cache.
+
+        Args:
+            key (Optional[K]): The key to remove, or None to remove everything.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        """
+        It returns the number of entries in the cache. (including the expired ones that were not removed yet)
+        """
+        with self._lock:
+            return len(self._entries)
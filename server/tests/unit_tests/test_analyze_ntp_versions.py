@@ -2,7 +2,16 @@ import json
 from unittest.mock import patch, MagicMock
 import pytest
 
-from server.app.utils.analyze_ntp_versions import parse_ntp_versions_response_to_dict, directly_analyze_all_ntp_versions
+from server.app.utils.analyze_ntp_versions import parse_ntp_versions_response_to_dict, directly_analyze_all_ntp_versions, \
+    invalidate_ntp_versions_cache, get_cached_ntp_version, cache_ntp_version, get_cached_ntp_versions_analysis, \
+    cache_ntp_versions_analysis, get_ntp_versions_cache, probe_and_analyze_ntp_versions
+
+
+@pytest.fixture(autouse=True)
+def empty_ntp_versions_cache():
+    invalidate_ntp_versions_cache()
+    yield
+    invalidate_ntp_versions_cache()
 
 
 def test_parse_nts_response_to_dict():
@@ -14,8 +23,91 @@ def test_parse_nts_response_to_dict():
 
 
 # simulate errors
-@patch("server.app.utils.analyze_ntp_versions.subprocess.run")
+@patch("server.app.utils.analyze_ntp_versions.run_ntp_nts_tool")
 def test_directly_analyze_all_ntp_versions_no_tool_fail(mock_run):
     mock_run.side_effect = Exception("tool failed")
     result = directly_analyze_all_ntp_versions("time.cloudflare.com","/tool/ntpnts", "draft-ietf-ntp-ntpv5-05")
-    assert result["error"].find("Error") != -1
\ No newline at end of file
+    assert result["error"].find("Error") != -1
+
+
+def test_cache_ntp_version_keys():
+    cache_ntp_version("Time.Example.com", "ntpv4", "draft-a", ("100", "ok", {"version": 4}))
+    cache_ntp_version("time.example.com", "ntpv5", "draft-a", ("50", "v4 answer", None))
+    # the draft only matters for NTPv5
+    assert get_cached_ntp_version("time.example.com", "ntpv4", "draft-b")[1] == ("100", "ok", {"version": 4})
+    assert get_cached_ntp_version("time.example.com", "ntpv5", "draft-a")[1] == ("50", "v4 answer", None)
+    assert get_cached_ntp_version("time.example.com", "ntpv5", "draft-b") is None
+    assert get_cached_ntp_version("other.example.com", "ntpv4", "draft-a") is None
+
+
+def test_cached_ntp_version_is_a_copy():
+    cache_ntp_version("1.2.3.4", "ntpv4", "", ("100", "ok", {"version": 4}))
+    get_cached_ntp_version("1.2.3.4", "ntpv4", "")[1][2]["version"] = 3
+    assert get_cached_ntp_version("1.2.3.4", "ntpv4", "")[1][2] == {"version": 4}
+
+
+def test_cache_ntp_versions_analysis():
+    analysis = {"ntpv3_supported_confidence": "75", "ntpv3_analysis": "a3", "ntpv3_m_result": None,
+                "ntpv4_supported_confidence": "100", "ntpv4_analysis": "a4", "ntpv4_m_result": {"version": 4}}
+    cache_ntp_versions_analysis("1.2.3.4", ["ntpv3", "ntpv4"], "", analysis)
+    cached, age = get_cached_ntp_versions_analysis("1.2.3.4", ["ntpv3", "ntpv4"], "")
+    assert cached == analysis
+    assert age >= 0
+    # not all the versions are cached
+    assert get_cached_ntp_versions_analysis("1.2.3.4", ["ntpv3", "ntpv4", "ntpv5"], "") is None
+
+
+def test_cache_ntp_versions_analysis_error_not_cached():
+    cache_ntp_versions_analysis("1.2.3.4", ["ntpv4"], "", {"error": "Error", "ntpv4_supported_confidence": "0",
+                                                           "ntpv4_analysis": ""})
+    assert get_cached_ntp_versions_analysis("1.2.3.4", ["ntpv4"], "") is None
+
+
+@patch("server.app.utils.analyze_ntp_versions.get_ntp_versions_failure_cache_ttl_s")
+def test_cache_ntp_versions_analysis_failed_version(mock_failure_ttl):
+    # a timeout of one version is only reused for the failure TTL
+    mock_failure_ttl.return_value = 60
+    analysis = {"ntpv3_supported_confidence": "0", "ntpv3_analysis": "timeout", "ntpv3_m_result": {"error": "timeout"},
+                "ntpv4_supported_confidence": "100", "ntpv4_analysis": "a4", "ntpv4_m_result": {"version": 4}}
+    with patch.object(get_ntp_versions_cache(), "set") as mock_set:
+        cache_ntp_versions_analysis("1.2.3.4", ["ntpv3", "ntpv4"], "", analysis)
+    ttls = {call.args[0][1]: call.args[2] for call in mock_set.call_args_list}
+    assert ttls == {"ntpv3": 60, "ntpv4": get_ntp_versions_cache().ttl_s}
+
+    # or never
+    mock_failure_ttl.return_value = 0
+    cache_ntp_versions_analysis("1.2.3.4", ["ntpv3", "ntpv4"], "", analysis)
+    assert get_cached_ntp_version("1.2.3.4", "ntpv3", "") is None
+    assert get_cached_ntp_version("1.2.3.4", "ntpv4", "") is not None
+
+
+def test_cache_ntp_version_disabled():
+    cache = get_ntp_versions_cache()
+    ttl = cache.ttl_s
+    cache.ttl_s = 0
+    try:
+        cache_ntp_version("1.2.3.4", "ntpv4", "", ("100", "ok", None))
+        assert get_cached_ntp_version("1.2.3.4", "ntpv4", "") is None
+    finally:
+        cache.ttl_s = ttl
+
+
+@patch("server.app.utils.analyze_ntp_versions.probe_ntp_versions")
+def test_probe_and_analyze_ntp_versions(mock_probe):
+    responses = {3: {"version": 3, "stratum": 1, "ref_id": 1196446464},
+                 4: {"version": 4, "stratum": 1, "ref_id": 1196446464},
+                 5: {"error": "No response within 2 seconds."}}
+    mock_probe.side_effect = lambda server, versions, draft, timeout: {v: dict(responses[v]) for v in versions}
+    cache_ntp_version("1.2.3.4", "ntpv4", "", ("100", "It supports NTPv4.", {"version": 4}))
+    ans = probe_and_analyze_ntp_versions("1.2.3.4", ["ntpv3", "ntpv4", "ntpv5"])
+    # only the versions that are not cached are probed
+    assert mock_probe.call_args.args[:3] == ("1.2.3.4", [3, 5], "")
+    assert ans["ntpv3_supported_confidence"] == "100"
+    assert ans["ntpv3_m_result"]["ref_id"] == "GPS"
+    assert ans["ntpv4_analysis"] == "It supports NTPv4."
+    assert (ans["ntpv5_supported_confidence"], ans["ntpv5_analysis"]) == ("0", "No response within 2 seconds.")
+
+    probe_and_analyze_ntp_versions("1.2.3.4", ["ntpv3", "ntpv4", "ntpv5"], use_cache=False)
+    assert mock_probe.call_args.args[1] == [3, 4, 5]
+    with pytest.raises(Exception):
+        probe_and_analyze_ntp_versions("1.2.3.4", ["ntpv6"])
@@ -1,3 +1,5 @@
+import asyncio
+import json
 from unittest.mock import patch, MagicMock
 import pytest
 from fastapi.testclient import TestClient
@@ -6,9 +8,9 @@ from ipaddress import IPv4Address, ip_address
 from sqlalchemy import Engine
 from sqlalchemy.orm import sessionmaker
 
-from server.app.utils.load_config_data import get_rate_limit_per_client_ip
+from server.app.utils.load_config_data import get_rate_limit_per_client_ip, get_history_max_page_size
 from server.app.dtos.ProbeData import ServerLocation
-from server.app.models.CustomError import RipeMeasurementError, DNSError, MeasurementQueryError
+from server.app.models.CustomError import RipeMeasurementError, DNSError, MeasurementQueryError, CircuitOpenError
 from server.app.models.Base import Base
 from server.app.main import create_app
 from server.app.dtos.NtpExtraDetails import NtpExtraDetails
@@ -19,6 +21,8 @@ from server.app.dtos.NtpTimestamps import NtpTimestamps
 from server.app.dtos.PreciseTime import PreciseTime
 from datetime import datetime, timezone, timedelta
 from server.app.api.routing import get_db
+from server.app.utils.measurement_cache import invalidate_measurement_cache
+from server.app.utils.ntp_nts_tool import ToolResult
 
 engine = MagicMock(spec=Engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -45,6 +49,8 @@ def test_client():  # mock_init_engine, mock_verify_config):
         test_app.dependency_overrides[get_db] = override_get_db
 
         Base.metadata.create_all(bind=engine)
+        # the tests do not share the measurement results
+        invalidate_measurement_cache()
 
         client = TestClient(test_app)
         yield client
@@ -235,7 +241,7 @@ def test_read_root(test_client):
 # @patch("server.app.api.routing.Depends")
 @patch("server.app.api.routing.get_server_ip")
 @patch("server.app.services.api_services.perform_ntp_measurement_domain_name_list")
-@patch("server.app.services.api_services.insert_measurement")
+@patch("server.app.services.api_services.insert_measurements")
 @patch("server.app.services.api_services.is_ip_address")
 def test_read_data_measurement_success(mock_is_ip, mock_insert, mock_perform_measurement, mock_get_server_ip,
                                        test_client):
@@ -260,13 +266,32 @@ def test_read_data_measurement_success(mock_is_ip, mock_insert, mock_perform_mea
     assert response.json()["measurement"][0]["ntp_server_name"] == "pool.ntp.org"
     assert response.json()["measurement"][0]["jitter"] == 0
     mock_perform_measurement.assert_called_with("pool.ntp.org", "83.25.24.10", 4)
-    mock_insert.assert_called_once_with(measurement, mock_insert.call_args[0][1])
+    mock_insert.assert_called_once_with([measurement], mock_insert.call_args[0][1])
     client.close()
 
 
 @patch("server.app.api.routing.get_server_ip")
 @patch("server.app.services.api_services.perform_ntp_measurement_domain_name_list")
-@patch("server.app.services.api_services.insert_measurement")
+@patch("server.app.services.api_services.insert_measurements")
+def test_read_data_measurement_in_threadpool(mock_insert, mock_perform_measurement, mock_get_server_ip, test_client):
+    mock_get_server_ip.return_value = "234.22.41.9"
+
+    # the NTP requests and the DNS queries block, so they must not run on the event loop of the app
+    def perform(*args):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return [mock_measurement()]
+    mock_perform_measurement.side_effect = perform
+
+    response = test_client.post("/measurements/", json={"server": "pool.ntp.org", "max_age": 0},
+                                headers={"X-Forwarded-For": "83.25.24.10"})
+    assert response.status_code == 200
+    mock_perform_measurement.assert_called_once()
+
+
+@patch("server.app.api.routing.get_server_ip")
+@patch("server.app.services.api_services.perform_ntp_measurement_domain_name_list")
+@patch("server.app.services.api_services.insert_measurements")
 @patch("server.app.services.api_services.is_ip_address")
 def test_read_data_measurement_missing_measurement_no(mock_is_ip, mock_insert, mock_perform_measurement,
                                                       mock_get_server_ip, test_client):
@@ -283,16 +308,16 @@ def test_read_data_measurement_missing_measurement_no(mock_is_ip, mock_insert, m
 
 @patch("server.app.api.routing.get_server_ip")
 @patch("server.app.services.api_services.perform_ntp_measurement_domain_name_list")
-@patch("server.app.services.api_services.insert_measurement")
+@patch("server.app.services.api_services.insert_measurements")
 @patch("server.app.services.api_services.is_ip_address")
-@patch("server.app.services.api_services.calculate_jitter_from_measurements")
+@patch("server.app.services.api_services.calculate_jitter_for_measurements")
 def test_read_data_measurement_with_jitter(mock_jitter, mock_is_ip, mock_insert, mock_perform_measurement,
                                            mock_get_server_ip, test_client):
     mock_is_ip.return_value = None
     measurement = mock_measurement()
     mock_get_server_ip.return_value = "234.22.41.9"
     mock_perform_measurement.return_value = [measurement]
-    mock_jitter.return_value = 0.75, 4
+    mock_jitter.return_value = [(0.75, 4)]
 
     headers = {"X-Forwarded-For": "83.25.24.10"}
     response = test_client.post("/measurements/",
@@ -306,6 +331,64 @@ def test_read_data_measurement_with_jitter(mock_jitter, mock_is_ip, mock_insert,
     mock_insert.assert_called_once()
 
 
+@patch("server.app.api.routing.get_server_ip")
+@patch("server.app.services.api_services.perform_ntp_measurement_domain_name_list")
+@patch("server.app.services.api_services.insert_measurements")
+@patch("server.app.services.api_services.is_ip_address")
+def test_read_data_measurement_cached(mock_is_ip, mock_insert, mock_perform_measurement, mock_get_server_ip,
+                                      test_client):
+    mock_is_ip.return_value = None
+    mock_get_server_ip.return_value = "234.22.41.9"
+    mock_perform_measurement.return_value = [mock_measurement()]
+
+    response = test_client.post("/measurements/", json={"server": "pool.ntp.org"},
+                                headers={"X-Forwarded-For": "83.25.24.10"})
+    assert response.status_code == 200
+    assert response.json()["from_cache"] is False
+    # another client of the same network gets the same result, without a new measurement
+    response = test_client.post("/measurements/", json={"server": "pool.ntp.org"},
+                                headers={"X-Forwarded-For": "83.25.24.77"})
+    assert response.status_code == 200
+    assert response.json()["from_cache"] is True
+    assert response.json()["age_s"] >= 0
+    assert "age" in response.headers
+    assert response.json()["measurement"][0]["ntp_server_name"] == "pool.ntp.org"
+    assert mock_perform_measurement.call_count == 1
+    # another IP type, or max_age 0, performs a new measurement
+    response = test_client.post("/measurements/", json={"server": "pool.ntp.org", "max_age": 0},
+                                headers={"X-Forwarded-For": "83.25.24.10"})
+    assert response.json()["from_cache"] is False
+    assert mock_perform_measurement.call_count == 2
+    mock_insert.assert_called()
+
+
+def test_read_data_measurement_negative_max_age(test_client):
+    response = test_client.post("/measurements/", json={"server": "pool.ntp.org", "max_age": -1},
+                                headers={"X-Forwarded-For": "83.25.24.10"})
+    assert response.status_code == 422
+    assert response.json() == {"detail": "max_age cannot be negative"}
+
+
+@patch("server.app.api.routing.complete_this_measurement_ip")
+def test_trigger_full_measurement_cached(mock_complete, test_client):
+    test_client.app.dependency_overrides[get_db] = lambda: MagicMock()
+    headers = {"X-Forwarded-For": "83.25.24.10"}
+    response = test_client.post("/measurements/trigger/", json={"server": "1.2.3.4"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["from_cache"] is False
+    measurement_id = response.json()["id"]
+
+    response = test_client.post("/measurements/trigger/", json={"server": "1.2.3.4"}, headers=headers)
+    assert response.json()["from_cache"] is True
+    assert response.json()["id"] == measurement_id
+    assert mock_complete.call_count == 1
+    # other settings: another measurement
+    response = test_client.post("/measurements/trigger/", json={"server": "1.2.3.4", "measurement_type": "ntpv3"},
+                                headers=headers)
+    assert response.json()["from_cache"] is False
+    assert mock_complete.call_count == 2
+
+
 def test_read_data_measurement_missing_server(test_client):
     headers = {"X-Forwarded-For": "83.25.24.10"}
 
@@ -385,6 +468,137 @@ def test_read_historic_data_ip(mock_get_measurements, test_client):
     mock_get_measurements.assert_called_once()
 
 
+@patch("server.app.api.routing.get_ntp_v4_historical_page")
+def test_read_historic_data_page(mock_get_page, test_client):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(minutes=10)
+    mock_get_page.return_value = [get_mock_dict_data(ntp_server_ip="192.168.1.1", poll=60)], "3957337543_12"
+
+    response = test_client.get("/measurements/history/", params={
+        "server": "192.168.1.1", "start": start.isoformat(), "end": end.isoformat(), "limit": 1})
+    assert response.status_code == 200
+    assert len(response.json()["measurements"]) == 1
+    assert response.json()["next_cursor"] == "3957337543_12"
+    assert mock_get_page.call_args[0][4:] == (1, None)
+
+    # only a cursor: the page has the maximum size
+    response = test_client.get("/measurements/history/", params={
+        "server": "192.168.1.1", "start": start.isoformat(), "end": end.isoformat(), "cursor": "3957337543_12"})
+    assert response.status_code == 200
+    assert mock_get_page.call_args[0][4:] == (get_history_max_page_size(), "3957337543_12")
+
+
+def test_read_historic_data_invalid_page(test_client):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(minutes=10)
+    params = {"server": "192.168.1.1", "start": start.isoformat(), "end": end.isoformat()}
+    assert test_client.get("/measurements/history/", params={**params, "limit": 0}).status_code == 400
+    assert test_client.get("/measurements/history/",
+                           params={**params, "limit": get_history_max_page_size() + 1}).status_code == 400
+    response = test_client.get("/measurements/history/", params={**params, "cursor": "nope"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor: nope"}
+
+
+@patch("server.app.api.routing.get_ntp_v4_historical_measurements")
+def test_read_historic_data_combined_modes(mock_get_measurements, test_client):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(minutes=10)
+    params = {"server": "192.168.1.1", "start": start.isoformat(), "end": end.isoformat()}
+    combinations = [({"stream": True, "limit": 10}, "'stream', 'limit'/'cursor'"),
+                    ({"point_budget": 100, "max_points": 10}, "'point_budget', 'max_points'"),
+                    ({"point_budget": 100, "cursor": "3957337543_12"}, "'point_budget', 'limit'/'cursor'"),
+                    ({"stream": True, "max_points": 10}, "'stream', 'max_points'")]
+    for extra, modes in combinations:
+        response = test_client.get("/measurements/history/", params={**params, **extra})
+        assert response.status_code == 400
+        assert response.json() == {"detail": f"{modes} cannot be used together"}
+    mock_get_measurements.assert_not_called()
+
+    # a stream can start after a cursor
+    test_client.app.state.limiter.reset()
+    mock_get_measurements.return_value = []
+    with patch("server.app.api.routing.stream_historic_measurements") as mock_stream:
+        mock_stream.return_value = iter([b"{}"])
+        response = test_client.get("/measurements/history/",
+                                   params={**params, "stream": True, "cursor": "3957337543_12"})
+    assert response.status_code == 200
+
+
+@patch("server.app.api.routing.get_ntp_v4_historical_measurements")
+@patch("server.app.api.routing.get_rollups")
+@patch("server.app.api.routing.choose_history_resolution")
+def test_read_historic_data_point_budget(mock_choose, mock_get_rollups, mock_get_measurements, test_client):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=30)
+    params = {"server": "192.168.1.1", "start": start.isoformat(), "end": end.isoformat()}
+    mock_choose.return_value = 3600
+    mock_get_rollups.return_value = [{"bucket_start": 3957336000, "resolution_s": 3600, "count": 60}]
+
+    response = test_client.get("/measurements/history/", params={**params, "point_budget": 1000})
+    assert response.status_code == 200
+    assert response.json() == {"resolution_s": 3600, "buckets": mock_get_rollups.return_value}
+    assert mock_choose.call_args[0][1:] == ("192.168.1.1", start, end, 1000)
+    assert mock_get_rollups.call_args[0][4] == 3600
+    mock_get_measurements.assert_not_called()
+
+    # few enough raw measurements
+    mock_choose.return_value = 0
+    mock_get_measurements.return_value = [get_mock_dict_data(poll=60)]
+    response = test_client.get("/measurements/history/", params={**params, "point_budget": 1000})
+    assert response.status_code == 200
+    assert response.json()["resolution_s"] == 0
+    assert response.json()["measurements"][0]["poll"] == 60
+
+    assert test_client.get("/measurements/history/", params={**params, "point_budget": 0}).status_code == 400
+
+
+@patch("server.app.api.routing.get_ntp_v4_historical_measurements")
+def test_read_historic_data_max_points(mock_get_measurements, test_client):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=1)
+    params = {"server": "192.168.1.1", "start": start.isoformat(), "end": end.isoformat()}
+    measurements = []
+    for i in range(100):
+        m = get_mock_dict_data(poll=i)
+        m["client_sent_time"] = 3957337543 + i
+        m["offset"] = 1.0 if i == 42 else 0.0
+        measurements.append(m)
+    mock_get_measurements.return_value = measurements
+
+    response = test_client.get("/measurements/history/", params={**params, "max_points": 10})
+    assert response.status_code == 200
+    assert response.json()["total_measurements"] == 100
+    polls = [m["poll"] for m in response.json()["measurements"]]
+    assert len(polls) <= 10
+    assert 42 in polls
+
+    response = test_client.get("/measurements/history/", params={**params, "max_points": 3})
+    assert response.status_code == 400
+
+
+@patch("server.app.db_config._SessionLocal")
+@patch("server.app.services.api_services.iter_ntp_v4_historical_measurements")
+def test_read_historic_data_stream(mock_iter, mock_session_local, test_client):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(minutes=10)
+    mock_iter.return_value = iter([[get_mock_dict_data(poll=1), get_mock_dict_data(poll=2)],
+                                   [get_mock_dict_data(poll=3)]])
+
+    response = test_client.get("/measurements/history/", params={
+        "server": "pool.ntp.org", "start": start.isoformat(), "end": end.isoformat(), "stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert [m["poll"] for m in response.json()["measurements"]] == [1, 2, 3]
+    # the stream uses its own session, closed at the end
+    mock_session_local.return_value.close.assert_called_once()
+
+    mock_iter.return_value = iter([])
+    response = test_client.get("/measurements/history/", params={
+        "server": "pool.ntp.org", "start": start.isoformat(), "end": end.isoformat(), "stream": True})
+    assert response.json() == {"measurements": []}
+
+
 @patch("server.app.api.routing.get_ntp_v4_historical_measurements")
 def test_read_historic_data_dn(mock_get_measurements, test_client):
     end = datetime.now(timezone.utc)
@@ -410,6 +624,69 @@ def test_read_historic_data_dn(mock_get_measurements, test_client):
     mock_get_measurements.assert_called_once()
 
 
+@patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os", return_value="/tool/path/nts_binary")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
+def test_perform_and_read_nts_measurement_in_threadpool(mock_run, mock_binary_tool, test_client):
+    # the ntp-nts tool blocks until it exits, so it must not be run on the event loop of the app
+    def run(*args, **kwargs):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        data = {"Host": "time.cloudflare.com", "Measured server IP": "162.159.200.123", "offset": -0.5}
+        return ToolResult(0, json.dumps(data))
+    mock_run.side_effect = run
+
+    headers = {"X-Forwarded-For": "83.25.24.10"}
+    response = test_client.post("/measurements/nts/", json={"server": "time.cloudflare.com"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["NTS succeeded"] is True
+    assert response.json()["Measured server IP"] == "162.159.200.123"
+
+    response = test_client.post("/measurements/nts/", json={"server": "162.159.200.123"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["NTS succeeded"] is True
+    assert "warning_ip" in response.json()
+    assert mock_run.call_count == 2
+
+
+@patch("server.app.api.routing.get_historical_ripe_results")
+def test_read_historic_ripe_data(mock_get_results, test_client):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(minutes=10)
+    mock_get_results.return_value = [mock_fetch_ripe_data_result(), mock_fetch_ripe_data_result()]
+
+    response = test_client.get("/measurements/history/ripe/", params={
+        "server": "time.google.com",
+        "start": start.isoformat(),
+        "end": end.isoformat()
+    })
+
+    assert response.status_code == 200
+    assert response.json()["measurements"] == [mock_fetch_ripe_data_result(), mock_fetch_ripe_data_result()]
+    mock_get_results.assert_called_once()
+    assert mock_get_results.call_args.kwargs["host"] == "time.google.com"
+
+
+@patch("server.app.api.routing.get_historical_ripe_results")
+def test_read_historic_ripe_data_errors(mock_get_results, test_client):
+    end = datetime.now(timezone.utc)
+    response = test_client.get("/measurements/history/ripe/", params={
+        "server": "time.google.com",
+        "start": (end + timedelta(minutes=10)).isoformat(),
+        "end": end.isoformat()
+    })
+    assert response.status_code == 400
+    assert response.json() == {"detail": "'start' must be earlier than 'end'"}
+
+    mock_get_results.side_effect = MeasurementQueryError("db down")
+    response = test_client.get("/measurements/history/ripe/", params={
+        "server": "time.google.com",
+        "start": (end - timedelta(minutes=10)).isoformat(),
+        "end": end.isoformat()
+    })
+    assert response.status_code == 500
+    assert "db down" in response.json()["detail"]
+
+
 def test_read_historic_data_missing_server(test_client):
     end = datetime.now(timezone.utc)
 
@@ -448,7 +725,7 @@ def test_read_historic_data_wrong_end(test_client):
 
 @patch("server.app.api.routing.get_server_ip")
 @patch("server.app.services.api_services.perform_ntp_measurement_domain_name_list")
-@patch("server.app.services.api_services.insert_measurement")
+@patch("server.app.services.api_services.insert_measurements")
 @patch("server.app.services.api_services.is_ip_address")
 def test_perform_measurement_with_rate_limiting(mock_is_ip, mock_insert, mock_perform_measurement,
                                                 mock_get_server_ip, test_client):
@@ -462,7 +739,9 @@ def test_perform_measurement_with_rate_limiting(mock_is_ip, mock_insert, mock_pe
     test_client.app.state.limiter.reset()  # reset the rate limit
     for _ in range(n):
         headers = {"X-Forwarded-For": "83.25.24.10"}
-        response = test_client.post("/measurements/", json={"server": "pool.ntp.org", "ipv6_measurement": False},
+        # max_age 0: each request performs a new measurement
+        response = test_client.post("/measurements/", json={"server": "pool.ntp.org", "ipv6_measurement": False,
+                                                            "max_age": 0},
                                     headers=headers)
         assert response.status_code == 200
         assert "measurement" in response.json()
@@ -607,6 +886,53 @@ def test_trigger_ripe_measurement_server_error(mock_perform_ripe_measurement, te
                "detail"] == "Failed to initiate measurement: Could not find any IP address for time.server_some.com."
 
 
+@patch("server.app.api.routing.perform_ripe_measurement")
+def test_trigger_ripe_measurement_circuit_open(mock_perform_ripe_measurement, test_client):
+    mock_perform_ripe_measurement.side_effect = CircuitOpenError("atlas.ripe.net is temporarily unavailable",
+                                                                 retry_after_s=12.3)
+    headers = {"X-Forwarded-For": "83.25.24.10"}
+    response = test_client.post("/measurements/ripe/trigger/",
+                                json={"server": "83.25.24.10", "ipv6_measurement": False},
+                                headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
+    assert "temporarily unavailable" in response.json()["detail"]
+
+
+@patch("server.app.api.routing.fetch_ripe_data")
+def test_get_ripe_measurement_result_circuit_open(mock_fetch_ripe_data, test_client):
+    mock_fetch_ripe_data.side_effect = CircuitOpenError("atlas.ripe.net is temporarily unavailable", retry_after_s=2)
+    response = test_client.get("/measurements/ripe/123456")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+
+
+@patch("server.app.api.routing.get_circuit_breakers_status")
+def test_read_health(mock_status, test_client):
+    mock_status.return_value = {}
+    response = test_client.get("/health/")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "dependencies": {}}
+
+    mock_status.return_value = {
+        "atlas.ripe.net": {"state": "open", "consecutive_failures": 5, "retry_after_s": 10.0},
+        "edns:8.8.8.8": {"state": "closed", "consecutive_failures": 0, "retry_after_s": 0.0},
+    }
+    response = test_client.get("/health/")
+    assert response.status_code == 200
+    assert response.json()["status"] == "degraded"
+    assert response.json()["dependencies"]["atlas.ripe.net"]["state"] == "open"
+
+
+@patch("server.app.api.routing.render_metrics_text")
+def test_read_metrics(mock_render, test_client):
+    mock_render.return_value = 'circuit_breaker_state{name="atlas.ripe.net"} 2\n'
+    response = test_client.get("/metrics/")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.text == 'circuit_breaker_state{name="atlas.ripe.net"} 2\n'
+
+
 @patch("server.app.api.routing.fetch_ripe_data")
 def test_get_ripe_measurement_result_pending(mock_fetch_ripe_data, test_client):
     mock_fetch_ripe_data.return_value = None, "Timeout"
@@ -642,3 +968,23 @@ def test_get_ripe_measurement_result_error(mock_fetch_ripe_data, test_client):
     assert response.status_code == 405
     assert response.json()[
                "detail"] == "RIPE call failed: RIPE API error: Bad Request - There was a problem with your request. Try again later!"
+
+
+@patch("server.app.api.routing.get_ntp_versions_capabilities")
+def test_read_ntp_capabilities(mock_capabilities, test_client):
+    mock_capabilities.return_value = {"server": "1.2.3.4", "from_cache": True}
+    headers = {"X-Forwarded-For": "83.25.24.10"}
+    response = test_client.get("/measurements/ntp-capabilities/?server=1.2.3.4&refresh=true", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"server": "1.2.3.4", "from_cache": True}
+    mock_capabilities.assert_called_once_with("1.2.3.4", "", True)
+
+
+@patch("server.app.api.routing.get_ntp_versions_capabilities")
+def test_read_ntp_capabilities_errors(mock_capabilities, test_client):
+    headers = {"X-Forwarded-For": "83.25.24.11"}
+    response = test_client.get("/measurements/ntp-capabilities/?server=%20", headers=headers)
+    assert response.status_code == 400
+    mock_capabilities.side_effect = MeasurementQueryError("tool not available")
+    response = test_client.get("/measurements/ntp-capabilities/?server=1.2.3.4", headers=headers)
+    assert response.status_code == 503
@@ -87,8 +87,8 @@ def test_measure_with_ip(mock_measure_ip, mock_measure_domain, mock_insert, mock
     mock_measure_domain.assert_not_called()
 
 
-@patch("server.app.services.api_services.calculate_jitter_from_measurements")
-@patch("server.app.services.api_services.insert_measurement")
+@patch("server.app.services.api_services.calculate_jitter_for_measurements")
+@patch("server.app.services.api_services.insert_measurements")
 @patch("server.app.services.api_services.perform_ntp_measurement_domain_name_list")
 @patch("server.app.services.api_services.perform_ntp_measurement_ip")
 def test_measure_with_domain(mock_measure_ip, mock_measure_domain, mock_insert, mock_jitter):
@@ -97,13 +97,13 @@ def test_measure_with_domain(mock_measure_ip, mock_measure_domain, mock_insert,
     fake_measurement.server_info.ntp_server_ref_parent_ip = ip_address("1.2.3.4")
     mock_measure_domain.return_value = [fake_measurement]
     mock_measure_ip.return_value = None
-    mock_jitter.return_value = (0, 1)
+    mock_jitter.return_value = [(0, 1)]
     fake_session = MagicMock(spec=Session)
     result = measure("pool.ntp.org", 4, fake_session)
 
     assert result == [(fake_measurement, 0, 1)]
     mock_measure_domain.assert_called_once_with("pool.ntp.org", None, 4)
-    mock_insert.assert_called_once_with(fake_measurement, mock_insert.call_args[0][1])  # pool
+    mock_insert.assert_called_once_with([fake_measurement], mock_insert.call_args[0][1])  # pool
     mock_measure_ip.assert_not_called()
 
 
@@ -321,6 +321,46 @@ def test_fetch_ripe_data(mock_get_data_from_ripe, mock_parse_data_from_ripe):
     assert result_data["offset"] == 0.065274
 
 
+@patch("server.app.services.api_services.insert_ripe_results")
+@patch("server.app.services.api_services.get_ripe_results")
+@patch("server.app.services.api_services.parse_data_from_ripe_measurement")
+@patch("server.app.services.api_services.get_data_from_ripe_measurement")
+def test_fetch_ripe_data_saves_complete_results(mock_get_data_from_ripe, mock_parse_data_from_ripe, mock_get_saved,
+                                                mock_insert):
+    session = MagicMock()
+    mock_get_saved.return_value = []
+    mock_get_data_from_ripe.return_value = []
+    mock_parse_data_from_ripe.return_value = [mock_ripe_parse_result()], "Ongoing"
+
+    result, status = fetch_ripe_data("123456", session)
+    assert status == "Ongoing"
+    mock_insert.assert_not_called()
+
+    mock_parse_data_from_ripe.return_value = [mock_ripe_parse_result()], "Complete"
+    result, status = fetch_ripe_data("123456", session)
+    assert status == "Complete"
+    mock_insert.assert_called_once_with(session, 123456, result)
+
+    # a database error does not prevent sending the results
+    mock_insert.side_effect = DatabaseInsertError("db down")
+    result, status = fetch_ripe_data("123456", session)
+    assert status == "Complete"
+    assert len(result) == 1
+
+
+@patch("server.app.services.api_services.get_ripe_results")
+@patch("server.app.services.api_services.get_data_from_ripe_measurement")
+def test_fetch_ripe_data_from_database(mock_get_data_from_ripe, mock_get_saved):
+    session = MagicMock()
+    mock_get_saved.return_value = [{"ripe_measurement_id": 123456, "probe_id": "9999"}]
+
+    result, status = fetch_ripe_data("123456", session)
+    assert status == "Complete"
+    assert result == [{"ripe_measurement_id": 123456, "probe_id": "9999"}]
+    mock_get_saved.assert_called_once_with(session, 123456)
+    mock_get_data_from_ripe.assert_not_called()
+
+
 def test_get_ripe_format():
     data = get_ripe_format(mock_ripe_parse_result())
     assert isinstance(data, dict)
@@ -423,3 +463,25 @@ def test_check_ripe_measurement_complete_raises_generic_exception(mock_check_sch
     with pytest.raises(ValueError, match="RIPE API error: The number of scheduled probes is negative"):
         check_ripe_measurement_scheduled("123456")
     mock_check_scheduled.assert_called_once_with(measurement_id="123456")
+
+
+@patch("server.app.services.api_services.analyze_supported_ntp_versions")
+@patch("server.app.services.api_services.get_cached_ntp_versions_analysis")
+def test_get_ntp_versions_capabilities(mock_cached, mock_analyze):
+    mock_cached.return_value = ({"ntpv4_supported_confidence": "100", "ntpv4_analysis": "ok"}, 12.3456)
+    ans = get_ntp_versions_capabilities("1.2.3.4")
+    assert ans["from_cache"] is True
+    assert ans["age_s"] == 12.346
+    assert ans["ntp_versions"]["ntpv4"] == {"supported_confidence": 100, "analysis": "ok"}
+    assert ans["ntp_versions"]["ntpv1"] == {"supported_confidence": 0, "analysis": None}
+    mock_analyze.assert_not_called()
+
+    mock_analyze.return_value = {"ntpv5_supported_confidence": "50", "ntpv5_analysis": "v4 answer"}
+    ans = get_ntp_versions_capabilities("1.2.3.4", "draft-ietf-ntp-ntpv5-05", refresh=True)
+    assert ans["from_cache"] is False
+    assert ans["ntp_versions"]["ntpv5"]["supported_confidence"] == 50
+    assert mock_analyze.call_args.args[1].refresh_ntp_versions is True
+
+    mock_analyze.return_value = {"error": "tool not available"}
+    with pytest.raises(MeasurementQueryError):
+        get_ntp_versions_capabilities("1.2.3.4", refresh=True)
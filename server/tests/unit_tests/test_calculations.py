@@ -9,7 +9,7 @@ from server.app.dtos.NtpTimestamps import NtpTimestamps
 from server.app.dtos.NtpMeasurement import NtpMeasurement
 from server.app.services.NtpCalculator import NtpCalculator
 from server.app.utils.calculations import calculate_jitter_from_measurements, calculate_haversine_distance, \
-    ntp_precise_time_to_human_date
+    calculate_jitter_for_measurements, ntp_precise_time_to_human_date
 from sqlalchemy.orm import Session
 
 
@@ -31,6 +31,7 @@ def make_mock_measurement(seconds_offset: int) -> NtpMeasurement:
     return fake_measurement
 
 
+@patch("server.app.utils.calculations.get_server_stats", MagicMock(return_value=None))
 @patch("server.app.utils.calculations.get_measurements_for_jitter_ip")
 def test_calculate_jitter_from_measurements(mock_get_measurements):
     fake_initial_measurement = make_mock_measurement(1)
@@ -56,6 +57,7 @@ def test_calculate_jitter_from_measurements(mock_get_measurements):
     assert no_measurement == 4
 
 
+@patch("server.app.utils.calculations.get_server_stats", MagicMock(return_value=None))
 @patch("server.app.utils.calculations.get_measurements_for_jitter_ip")
 def test_calculate_jitter_with_no_history(mock_get_measurements):
     fake_initial_measurement = make_mock_measurement(2)
@@ -69,6 +71,7 @@ def test_calculate_jitter_with_no_history(mock_get_measurements):
     assert no_measurement == 0
 
 
+@patch("server.app.utils.calculations.get_server_stats", MagicMock(return_value=None))
 @patch("server.app.utils.calculations.get_measurements_for_jitter_ip")
 def test_calculate_jitter_with_some_none(mock_get_measurements):
     fake_initial_measurement = make_mock_measurement(1)
@@ -95,6 +98,7 @@ def test_calculate_jitter_with_some_none(mock_get_measurements):
     assert no_measurement == 2
 
 
+@patch("server.app.utils.calculations.get_server_stats", MagicMock(return_value=None))
 @patch("server.app.utils.calculations.get_measurements_for_jitter_ip")
 def test_calculate_jitter_with_identical_offsets(mock_get_measurements):
     fake_initial_measurement = make_mock_measurement(4)
@@ -116,4 +120,29 @@ def test_ntp_precise_time_to_human_date():
 
 def test_haversine_distance():
     assert math.isclose(calculate_haversine_distance(2.3, 5.6, -0.9, 12),795.51579092, rel_tol=1e-9)
-    assert math.isclose(calculate_haversine_distance(-82, -0.006, 45, 77),14755.0306084, rel_tol=1e-9)
\ No newline at end of file
+    assert math.isclose(calculate_haversine_distance(-82, -0.006, 45, 77),14755.0306084, rel_tol=1e-9)
+
+@patch("server.app.utils.calculations.get_measurements_for_jitter_ips")
+@patch("server.app.utils.calculations.get_servers_stats")
+def test_calculate_jitter_for_measurements(mock_get_stats, mock_get_measurements):
+    fake_session = MagicMock(spec=Session)
+    with_stats = make_mock_measurement(1)
+    without_stats = make_mock_measurement(2)
+    without_stats.server_info.ntp_server_ip = IPv4Address("5.6.7.8")
+    stats = MagicMock()
+    stats.window_offsets = [1.0, 2.0]
+    stats.offset_mean, stats.offset_m2 = 1.5, 0.5
+    mock_get_stats.return_value = {"1.2.3.4": stats}
+    history = [make_mock_measurement(4), make_mock_measurement(6)]
+    mock_get_measurements.return_value = {"5.6.7.8": history}
+
+    ans = calculate_jitter_for_measurements(fake_session, [with_stats, without_stats], 7)
+
+    offset = NtpCalculator.calculate_offset(with_stats.timestamps)
+    assert ans[0][0] == pytest.approx(NtpCalculator.calculate_jitter([offset, 1.0, 2.0]))
+    assert ans[0][1] == 2
+    offsets = [NtpCalculator.calculate_offset(m.timestamps) for m in [without_stats] + history]
+    assert ans[1] == (NtpCalculator.calculate_jitter(offsets), 2)
+    # one query for the stats, one for the servers without stats
+    mock_get_stats.assert_called_once_with(fake_session, ["1.2.3.4", "5.6.7.8"])
+    mock_get_measurements.assert_called_once_with(fake_session, ["5.6.7.8"], 7)
@@ -0,0 +1,125 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from server.app.models.CustomError import CircuitOpenError
+from server.app.utils.circuit_breaker import CircuitBreaker, get_circuit_breaker, get_circuit_breakers_status, \
+    reset_circuit_breakers, CLOSED, OPEN, HALF_OPEN
+from server.app.utils.metrics import get_metric_value, reset_metrics
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    reset_circuit_breakers()
+    reset_metrics()
+    yield
+    reset_circuit_breakers()
+    reset_metrics()
+
+
+def test_breaker_opens_after_threshold():
+    clock = FakeClock()
+    breaker = CircuitBreaker("atlas.ripe.net", failure_threshold=3, recovery_timeout_s=10, clock=clock)
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow_request()
+    # a success resets the consecutive failures
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after_s() == 10
+    assert get_metric_value("circuit_breaker_state", {"name": "atlas.ripe.net"}) == 2
+    assert get_metric_value("circuit_breaker_rejections_total", {"name": "atlas.ripe.net"}) == 1
+
+
+def test_breaker_half_open_lets_one_trial_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker("stat.ripe.net", failure_threshold=1, recovery_timeout_s=5, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    clock.now += 5
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    # the other callers still fail fast while the trial is running
+    assert not breaker.allow_request()
+    # the trial failed, so it opens again for another recovery timeout
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now += 4
+    assert not breaker.allow_request()
+    clock.now += 1
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_breaker_call():
+    breaker = CircuitBreaker("api.ipify.org", failure_threshold=2, recovery_timeout_s=30)
+    assert breaker.call(lambda x: x + 1, 1) == 2
+
+    def fail() -> None:
+        raise ConnectionError("down")
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.call(fail)
+    assert 0 < e.value.retry_after_s <= 30
+
+
+def test_breaker_cancelled_trial_is_released():
+    clock = FakeClock()
+    breaker = CircuitBreaker("atlas.ripe.net", failure_threshold=1, recovery_timeout_s=5, clock=clock)
+    breaker.record_failure()
+    clock.now += 5
+
+    def cancelled() -> None:
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        breaker.call(cancelled)
+    # the cancellation is neither a success nor a failure, but the next caller can make a new trial call
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release_trial()
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
+
+
+@patch("server.app.utils.circuit_breaker.get_circuit_breaker_recovery_timeout_s")
+@patch("server.app.utils.circuit_breaker.get_circuit_breaker_failure_threshold")
+def test_get_circuit_breaker_registry(mock_threshold, mock_timeout):
+    mock_threshold.return_value = 1
+    mock_timeout.return_value = 60
+    breaker = get_circuit_breaker("edns:8.8.8.8")
+    assert get_circuit_breaker("edns:8.8.8.8") is breaker
+    assert breaker.failure_threshold == 1
+    get_circuit_breaker("atlas.ripe.net").record_failure()
+
+    status = get_circuit_breakers_status()
+    assert list(status.keys()) == ["atlas.ripe.net", "edns:8.8.8.8"]
+    assert status["atlas.ripe.net"]["state"] == OPEN
+    assert status["atlas.ripe.net"]["consecutive_failures"] == 1
+    assert 0 < status["atlas.ripe.net"]["retry_after_s"] <= 60
+    assert status["edns:8.8.8.8"] == {"state": CLOSED, "consecutive_failures": 0, "retry_after_s": 0.0}
+
+    reset_circuit_breakers("atlas.ripe.net")
+    assert list(get_circuit_breakers_status().keys()) == ["edns:8.8.8.8"]
@@ -0,0 +1,166 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from server.app.db.db_interaction import get_full_historical_domain_measurements
+from server.app.dtos.full_ntp_measurement import FullMeasurementDN, FullMeasurementIP, NTSMeasurement, NTPVersions, \
+    NTPv4Measurement, NTPv4ServerInfo, NTPv5Measurement, NTPv5ServerInfo
+from server.app.models.Base import Base
+from server.app.utils.convert_measurement_to_format import full_measurement_dn_to_dict, full_measurement_ip_to_dict, \
+    ntp_versions_to_dict, ntpv4_or_v5_measurement_to_dict, load_measurements
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self)
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+
+
+def add_ntp_measurement(db, ip: str, version: str) -> int:
+    if version == "ntpv5":
+        m5 = NTPv5Measurement(host="time.example.com", measured_server_ip=ip, offset=0.5, rtt=0.02, version=5,
+                              client_sent_time=100, draft_name="draft-ietf-ntp-ntpv5-05")
+        db.add(m5)
+        db.flush()
+        db.add(NTPv5ServerInfo(m_id=m5.id, country_code="NL", vantage_point_ip="83.25.24.1"))
+        return m5.id
+    m4 = NTPv4Measurement(host="time.example.com", measured_server_ip=ip, offset=0.1, rtt=0.01,
+                          version=int(version[-1]), client_sent_time=100, analysis="ok")
+    db.add(m4)
+    db.flush()
+    db.add(NTPv4ServerInfo(m_id=m4.id, country_code="NL", asn_ntp_server="1136", vantage_point_ip="83.25.24.1"))
+    return m4.id
+
+
+def add_ntp_versions(db, ip: str) -> NTPVersions:
+    vs = NTPVersions(
+        id_v4_1=add_ntp_measurement(db, ip, "ntpv1"), ntpv1_response_version="ntpv1", ntpv1_supported_conf=100,
+        id_v4_2=add_ntp_measurement(db, ip, "ntpv2"), ntpv2_response_version="ntpv2", ntpv2_supported_conf=100,
+        id_v4_3=add_ntp_measurement(db, ip, "ntpv3"), ntpv3_response_version="ntpv3", ntpv3_supported_conf=100,
+        id_v4_4=add_ntp_measurement(db, ip, "ntpv4"), ntpv4_response_version="ntpv4", ntpv4_supported_conf=100,
+        id_v5=add_ntp_measurement(db, ip, "ntpv5"), ntpv5_response_version="ntpv5", ntpv5_supported_conf=50)
+    db.add(vs)
+    db.flush()
+    return vs
+
+
+def add_full_measurement_dn(db, nr_ips: int, created_at_time: datetime | None = None) -> FullMeasurementDN:
+    nts = NTSMeasurement(succeeded=True, host="time.example.com", analysis="NTS is supported")
+    db.add(nts)
+    db.flush()
+    dn = FullMeasurementDN(status="finished", server="time.example.com", id_nts=nts.id_nts,
+                           id_vs=add_ntp_versions(db, "83.25.24.100").id_vs, settings={"wanted_ip_type": 4},
+                           created_at_time=created_at_time or datetime.now(timezone.utc))
+    for i in range(nr_ips):
+        ip = f"83.25.24.{100 + i}"
+        ip_nts = NTSMeasurement(succeeded=False, analysis="no NTS")
+        db.add(ip_nts)
+        db.flush()
+        dn.ip_measurements.append(FullMeasurementIP(
+            status="finished", server_ip=ip, id_nts=ip_nts.id_nts, id_vs=add_ntp_versions(db, ip).id_vs,
+            response_version="ntpv4", id_main_measurement=add_ntp_measurement(db, ip, "ntpv4")))
+    db.add(dn)
+    db.commit()
+    return dn
+
+
+def test_full_measurement_dn_to_dict(session):
+    dn = add_full_measurement_dn(session, 2)
+    ans = full_measurement_dn_to_dict(session, dn)
+    assert ans["search_id"] == "dn" + str(dn.id_m_dn)
+    assert ans["nts"]["nts_analysis"] == "NTS is supported"
+    assert ans["ntp_versions"]["ntpv5_data"]["draft_name"] == "draft-ietf-ntp-ntpv5-05"
+    assert "analysis" not in ans["ntp_versions"]["ntpv3_data"]
+    assert [m["server"] for m in ans["ip_measurements"]] == ["83.25.24.100", "83.25.24.101"]
+    m_ip = ans["ip_measurements"][1]
+    assert m_ip["main_measurement"]["measured_server_ip"] == "83.25.24.101"
+    assert m_ip["main_measurement"]["analysis"] == "ok"
+    assert m_ip["main_measurement"]["ntp_server_location"]["asn_ntp_server"] == "1136"
+    assert m_ip["nts"]["nts_succeeded"] is False
+    assert "settings" not in m_ip
+    # the loaded rows give the same result as the queries of each ID
+    vs = session.get(NTPVersions, dn.id_vs)
+    assert ans["ntp_versions"]["ntpv5_data"] == ntpv4_or_v5_measurement_to_dict(session, vs.id_v5, "ntpv5", True)
+    assert ans["ntp_versions"]["ntpv1_data"] == ntpv4_or_v5_measurement_to_dict(session, vs.id_v4_1, "ntpv1", True)
+
+
+def test_full_measurement_dn_to_dict_query_count(engine, session):
+    small = add_full_measurement_dn(session, 1)
+    large = add_full_measurement_dn(session, 4)
+    session.expire_all()
+
+    counter = QueryCounter(engine)
+    full_measurement_dn_to_dict(session, session.get(FullMeasurementDN, small.id_m_dn))
+    queries_small = counter.count
+    counter.count = 0
+    ans = full_measurement_dn_to_dict(session, session.get(FullMeasurementDN, large.id_m_dn))
+    # the number of queries does not depend on the number of IP addresses
+    assert counter.count == queries_small
+    # measurement, its IPs, NTS, NTP versions, NTPv4, NTPv5 and their server information
+    assert counter.count <= 8
+    assert len(ans["ip_measurements"]) == 4
+    assert all(m["ntp_versions"]["ntpv4_data"] is not None for m in ans["ip_measurements"])
+
+
+def test_full_measurement_ip_and_ntp_versions_query_count(engine, session):
+    dn = add_full_measurement_dn(session, 1)
+    m_ip_id, vs_id = dn.ip_measurements[0].id_m_ip, dn.id_vs
+    session.expire_all()
+
+    counter = QueryCounter(engine)
+    ans = full_measurement_ip_to_dict(session, session.get(FullMeasurementIP, m_ip_id))
+    assert counter.count <= 7
+    assert ans["settings"] is None
+    assert ans["ntp_versions"]["ntpv2_data"]["version"] == 2
+
+    counter.count = 0
+    versions = ntp_versions_to_dict(session, session.get(NTPVersions, vs_id))
+    # the versions, NTPv4, NTPv5 and their server information
+    assert counter.count <= 5
+    assert versions["ntpv5_supported_conf"] == 50
+
+
+def test_get_full_historical_domain_measurements_query_count(engine, session):
+    now = datetime.now(timezone.utc)
+    for _ in range(5):
+        add_full_measurement_dn(session, 3, now)
+    session.expire_all()
+
+    counter = QueryCounter(engine)
+    ans = get_full_historical_domain_measurements(session, "time.example.com", now - timedelta(minutes=1),
+                                                  now + timedelta(minutes=1))
+    assert len(ans) == 5
+    assert all(len(m["ip_measurements"]) == 3 for m in ans)
+    assert counter.count <= 8
+
+
+def test_load_measurements_without_references(session):
+    m_ip = FullMeasurementIP(status="pending", server_ip="83.25.24.10")
+    session.add(m_ip)
+    session.commit()
+    loaded = load_measurements(session, [m_ip])
+    assert loaded.nts == {} and loaded.ntpv4 == {}
+    ans = full_measurement_ip_to_dict(session, m_ip, loaded=loaded)
+    assert ans["main_measurement"] is None
+    assert ans["nts"] is None
+    assert ans["ntp_versions"] is None
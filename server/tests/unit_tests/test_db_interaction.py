@@ -0,0 +1,296 @@
+from datetime import datetime, timedelta, timezone
+from ipaddress import IPv4Address
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from server.app.db.db_interaction import insert_ripe_results, get_ripe_results, get_historical_ripe_results, \
+    get_ntp_v4_historical_measurements, get_ntp_v4_historical_page, iter_ntp_v4_historical_measurements, \
+    decode_history_cursor, get_measurements_for_jitter_ips, bulk_insert_measurement_rows, insert_measurements
+from server.app.dtos.NtpExtraDetails import NtpExtraDetails
+from server.app.dtos.NtpMainDetails import NtpMainDetails
+from server.app.dtos.NtpMeasurement import NtpMeasurement
+from server.app.dtos.NtpServerInfo import NtpServerInfo
+from server.app.dtos.NtpTimestamps import NtpTimestamps
+from server.app.dtos.PreciseTime import PreciseTime
+from server.app.dtos.ProbeData import ServerLocation
+from server.app.dtos.full_ntp_measurement import RipeProbeResult, NTPv4Measurement, NTPv4ServerInfo
+from server.app.utils.convert_measurement_to_format import ntpv4_or_v5_measurement_to_dict
+from server.app.models.Base import Base
+from server.app.models.Measurement import Measurement
+from server.app.models.Time import Time
+from server.app.models.CustomError import DatabaseInsertError, MeasurementQueryError, InputError
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def ripe_result(probe_id: str, ntp_server_ip: str = "18.252.12.124", offset: float = 0.065274,
+                client_sent_seconds: int = 3957337543) -> dict:
+    return {
+        "ntp_version": 4,
+        "vantage_point_ip": "83.231.3.54",
+        "ripe_measurement_id": 123456,
+        "ntp_server_ip": ntp_server_ip,
+        "ntp_server_name": "time.some_server.com",
+        "ntp_server_location": {
+            "ip_is_anycast": False,
+            "country_code": "US",
+            "coordinates": (47.6062, -122.3321)
+        },
+        "probe_addr": {
+            "ipv4": "83.231.3.54",
+            "ipv6": None
+        },
+        "probe_id": probe_id,
+        "probe_location": {
+            "country_code": "CZ",
+            "coordinates": (16.5995, 49.1605)
+        },
+        "time_to_result": 5014.4233,
+        "stratum": 1,
+        "poll": 1,
+        "precision": 9.53674e-07,
+        "root_delay": 0.0,
+        "root_dispersion": 7.62939e-05,
+        "asn_ntp_server": "16509",
+        "ref_id": "GPSs",
+        "result": [
+            {
+                "client_sent_time": {"seconds": client_sent_seconds, "fraction": 1},
+                "server_recv_time": {"seconds": 3957337543, "fraction": 2},
+                "server_sent_time": {"seconds": 3957337543, "fraction": 3},
+                "client_recv_time": {"seconds": 3957337543, "fraction": 4},
+                "rtt": 0.027344,
+                "offset": offset
+            }
+        ]
+    }
+
+
+def test_insert_and_get_ripe_results(session):
+    results = [ripe_result("9999"), ripe_result("1234", offset=-0.5)]
+    insert_ripe_results(session, 123456, results)
+    assert get_ripe_results(session, 123456) == results
+    assert get_ripe_results(session, 654321) == []
+
+    # the results of a measurement are only saved once, even if they are fetched again (or concurrently)
+    insert_ripe_results(session, 123456, results)
+    insert_ripe_results(session, 123456, [ripe_result("5555"), ripe_result("9999", offset=1.0)])
+    assert session.query(RipeProbeResult).count() == 3
+    assert [r["result"][0]["offset"] for r in get_ripe_results(session, 123456)] == [0.065274, -0.5, 0.065274]
+
+
+def test_get_historical_ripe_results(session):
+    # the probes measured at 2025-05-27 12:25:43 UTC, whenever the results were saved
+    measured = datetime(2025, 5, 27, 12, 25, 43, tzinfo=timezone.utc)
+    insert_ripe_results(session, 1, [ripe_result("9999")])
+    insert_ripe_results(session, 2, [ripe_result("1234", ntp_server_ip="1.2.3.4", client_sent_seconds=3957337603)])
+    start, end = measured - timedelta(minutes=5), measured + timedelta(minutes=5)
+
+    by_ip = get_historical_ripe_results(session, "18.252.12.124", start, end)
+    assert [r["probe_id"] for r in by_ip] == ["9999"]
+    # the most recent first
+    by_name = get_historical_ripe_results(session, "time.some_server.com", start, end)
+    assert [r["probe_id"] for r in by_name] == ["1234", "9999"]
+    assert [r["probe_id"] for r in get_historical_ripe_results(session, "time.some_server.com", start,
+                                                                measured + timedelta(seconds=30))] == ["9999"]
+    now = datetime.now(timezone.utc)
+    assert get_historical_ripe_results(session, "time.some_server.com", now - timedelta(minutes=10), now) == []
+
+
+def test_ripe_results_database_errors():
+    session = MagicMock()
+    session.query.side_effect = Exception("db down")
+    session.execute.side_effect = Exception("db down")
+    with pytest.raises(DatabaseInsertError):
+        insert_ripe_results(session, 1, [ripe_result("9999")])
+    session.rollback.assert_called_once()
+    with pytest.raises(MeasurementQueryError):
+        get_ripe_results(session, 1)
+    with pytest.raises(MeasurementQueryError):
+        get_historical_ripe_results(session, "1.2.3.4", datetime.now(timezone.utc), datetime.now(timezone.utc))
+
+
+def unix_seconds(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+
+# SQLite cannot store the 64-bit NTP timestamps, so the test uses seconds
+@patch("server.app.db.db_interaction.datetime_to_ntp_timestamp", unix_seconds)
+def test_get_ntp_v4_historical_measurements(session):
+    now = datetime.now(timezone.utc)
+    for minutes, ip in [(3, "83.25.24.10"), (1, "83.25.24.10"), (2, "83.25.24.11"), (60, "83.25.24.10")]:
+        m = NTPv4Measurement(host="time.example.com", measured_server_ip=ip, offset=0.1, rtt=0.01, version=4,
+                             client_sent_time=unix_seconds(now - timedelta(minutes=minutes)),
+                             analysis="ok", extensions={"a": 1})
+        session.add(m)
+        session.flush()
+        if ip == "83.25.24.10":
+            session.add(NTPv4ServerInfo(m_id=m.id, country_code="NL", asn_ntp_server="1136"))
+    session.commit()
+    queries = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    by_ip = get_ntp_v4_historical_measurements(session, "83.25.24.10", now - timedelta(minutes=10), now)
+    # a single query, ordered by time
+    assert len(queries) == 1
+    assert len(by_ip) == 2
+    assert by_ip[0]["client_sent_time"] < by_ip[1]["client_sent_time"]
+    # the same format as the measurements queried one by one
+    assert by_ip[0] == ntpv4_or_v5_measurement_to_dict(session, by_ip[0]["id"], "ntpv4")
+    assert by_ip[0]["ntp_server_location"]["asn_ntp_server"] == "1136"
+
+    by_name = get_ntp_v4_historical_measurements(session, "time.example.com", now - timedelta(minutes=10), now)
+    assert [m["measured_server_ip"] for m in by_name] == ["83.25.24.10", "83.25.24.11", "83.25.24.10"]
+    assert "ntp_server_location" not in by_name[1]
+    assert by_name[1] == ntpv4_or_v5_measurement_to_dict(session, by_name[1]["id"], "ntpv4")
+
+
+@patch("server.app.db.db_interaction.datetime_to_ntp_timestamp", unix_seconds)
+def test_get_ntp_v4_historical_page(session):
+    now = datetime.now(timezone.utc)
+    # some measurements have the same client_sent_time
+    for minutes in (5, 4, 4, 4, 3, 2, 1):
+        session.add(NTPv4Measurement(host="time.example.com", measured_server_ip="83.25.24.10",
+                                     client_sent_time=unix_seconds(now - timedelta(minutes=minutes))))
+    session.commit()
+    start, end = now - timedelta(minutes=10), now
+    everything = get_ntp_v4_historical_measurements(session, "83.25.24.10", start, end)
+
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = get_ntp_v4_historical_page(session, "83.25.24.10", start, end, 3, cursor)
+        pages.append(page)
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [m for page in pages for m in page] == everything
+    # the last page is exactly full
+    page, cursor = get_ntp_v4_historical_page(session, "time.example.com", start, end, 7)
+    assert len(page) == 7 and cursor is None
+
+    chunks = list(iter_ntp_v4_historical_measurements(session, "time.example.com", start, end, 2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 2, 1]
+    assert [m for chunk in chunks for m in chunk] == everything
+    # the stream can start after a cursor
+    _, cursor = get_ntp_v4_historical_page(session, "time.example.com", start, end, 5)
+    chunks = list(iter_ntp_v4_historical_measurements(session, "time.example.com", start, end, 10, cursor))
+    assert chunks == [everything[5:]]
+
+
+@patch("server.app.db.db_interaction.datetime_to_ntp_timestamp", unix_seconds)
+def test_get_ntp_v4_historical_page_several_server_infos(session):
+    now = datetime.now(timezone.utc)
+    for minutes in (3, 2, 1):
+        m = NTPv4Measurement(host="time.example.com", measured_server_ip="83.25.24.10",
+                             client_sent_time=unix_seconds(now - timedelta(minutes=minutes)))
+        session.add(m)
+        session.flush()
+        # a measurement with more than one server information is still one measurement of the page
+        for asn in ("1136", "1137", "1138"):
+            session.add(NTPv4ServerInfo(m_id=m.id, country_code="NL", asn_ntp_server=asn))
+    session.commit()
+    start, end = now - timedelta(minutes=10), now
+
+    page, cursor = get_ntp_v4_historical_page(session, "83.25.24.10", start, end, 2)
+    assert len(page) == 2 and cursor is not None
+    assert [m["ntp_server_location"]["asn_ntp_server"] for m in page] == ["1136", "1136"]
+    page, cursor = get_ntp_v4_historical_page(session, "83.25.24.10", start, end, 2, cursor)
+    assert len(page) == 1 and cursor is None
+    assert len(get_ntp_v4_historical_measurements(session, "time.example.com", start, end)) == 3
+
+
+def test_decode_history_cursor():
+    assert decode_history_cursor("3957337543_12") == (3957337543, 12)
+    for cursor in ("", "12", "a_b", "1_2_3"):
+        with pytest.raises(InputError):
+            decode_history_cursor(cursor)
+
+
+def test_get_measurements_for_jitter_ips(session):
+    # SQLite does not generate the BIGINT keys of these tables
+    for i, (ip, client_sent) in enumerate([("83.25.24.10", 100), ("83.25.24.10", 300), ("83.25.24.11", 200),
+                                           ("83.25.24.10", 200), ("83.25.24.12", 50), ("83.25.24.11", 100)]):
+        session.add(Time(id=i + 1, client_sent=client_sent, client_sent_prec=0, server_recv=client_sent,
+                         server_recv_prec=i, server_sent=client_sent, server_sent_prec=i, client_recv=client_sent,
+                         client_recv_prec=0))
+        session.add(Measurement(id=i + 1, time_id=i + 1, ntp_server_ip=ip, ntp_version=4, time_offset=0.1, rtt=0.02,
+                                stratum=2, precision=-20.0, reachability="", root_delay=0, root_delay_prec=0,
+                                root_dispersion=0, root_dispersion_prec=0, ntp_last_sync_time=0,
+                                ntp_last_sync_time_prec=0, poll=i))
+    session.commit()
+
+    counter = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: counter.append(1))
+    ans = get_measurements_for_jitter_ips(session, ["83.25.24.10", "83.25.24.11", "83.25.24.99"], 2)
+    assert len(counter) == 1
+    assert sorted(ans) == ["83.25.24.10", "83.25.24.11"]
+    # the most recent ones first
+    assert [m.extra_details.poll for m in ans["83.25.24.10"]] == [1, 3]
+    assert [m.extra_details.poll for m in ans["83.25.24.11"]] == [2, 5]
+    assert get_measurements_for_jitter_ips(session, [], 2) == {}
+
+
+def test_get_measurements_for_jitter_ips_error():
+    failing_session = MagicMock()
+    failing_session.query.side_effect = Exception("connection lost")
+    with pytest.raises(MeasurementQueryError):
+        get_measurements_for_jitter_ips(failing_session, ["83.25.24.10"], 2)
+
+
+def ntp_measurement(ip: str, poll: int) -> NtpMeasurement:
+    return NtpMeasurement(
+        vantage_point_ip=IPv4Address("127.0.0.1"),
+        server_info=NtpServerInfo(ntp_version=4, ntp_server_ip=IPv4Address(ip), ntp_server_name="pool.ntp.org",
+                                  ntp_server_ref_parent_ip=None, ref_name="GPS\x00",
+                                  ntp_server_location=ServerLocation(country_code="NL", coordinates=(52.0, 4.0))),
+        timestamps=NtpTimestamps(PreciseTime(3957337543 + poll, 0), PreciseTime(3957337543 + poll, 1000),
+                                 PreciseTime(3957337543 + poll, 2000), PreciseTime(3957337543 + poll, 3000)),
+        main_details=NtpMainDetails(offset=0.001 * poll, rtt=0.02, stratum=2, precision=-20.0, reachability=""),
+        extra_details=NtpExtraDetails(root_delay=PreciseTime(0, 0), ntp_last_sync_time=PreciseTime(0, 0),
+                                      root_dispersion=PreciseTime(0, 0), poll=poll, leap=0))
+
+
+def test_bulk_insert_measurement_rows(session):
+    measurements = [ntp_measurement(f"83.25.24.{10 + i % 3}", i) for i in range(10)]
+    counter = []
+    event.listen(session.get_bind(), "before_execute", lambda *args: counter.append(1))
+    ids = bulk_insert_measurement_rows(session, measurements)
+    # one INSERT ... RETURNING for the times and one for the measurements (PostgreSQL sends them as multi-row VALUES)
+    assert len(counter) == 2
+    session.commit()
+    assert len(ids) == 10 and ids == sorted(ids)
+    for m_id, m in zip(ids, measurements):
+        row = session.get(Measurement, m_id)
+        assert row.poll == m.extra_details.poll
+        assert row.ntp_server_ip == str(m.server_info.ntp_server_ip)
+        assert row.ref_name == "GPS"
+        # each measurement is linked to its own timestamps
+        assert row.timestamps.client_sent == m.timestamps.client_sent_time.seconds
+    assert bulk_insert_measurement_rows(session, []) == []
+
+    ans = get_measurements_for_jitter_ips(session, ["83.25.24.10"], 2)
+    assert [m.extra_details.poll for m in ans["83.25.24.10"]] == [9, 6]
+
+
+def test_insert_measurements(session):
+    ids = insert_measurements([ntp_measurement("83.25.24.10", 1), ntp_measurement("83.25.24.11", 2)], session)
+    assert len(ids) == 2
+    assert session.query(Measurement).count() == 2
+    failing_session = MagicMock()
+    failing_session.execute.side_effect = Exception("connection lost")
+    with pytest.raises(DatabaseInsertError):
+        insert_measurements([ntp_measurement("83.25.24.10", 3)], failing_session)
+    failing_session.rollback.assert_called_once()
+    failing_session.commit.assert_not_called()
@@ -0,0 +1,170 @@
+from unittest.mock import patch
+
+import dns.edns
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+import pytest
+
+from server.app.utils.dns_cache import DnsAnswer, get_cached_dns_answer, cache_dns_answer, get_response_scope, \
+    get_response_ttl, get_cached_system_answer, cache_system_answer, invalidate_dns_cache, normalize_domain_name, \
+    get_cache_ttl, get_cached_reverse_dns, cache_reverse_dns, ReverseDnsAnswer
+from server.app.utils.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def empty_dns_cache():
+    invalidate_dns_cache()
+    yield
+    invalidate_dns_cache()
+
+
+def make_response(domain_name: str, rdtype: str, records: list[tuple[str, int, str, list[str]]],
+                  scope: int | None = None, client: str = "10.11.12.13", srclen: int = 24) -> dns.message.Message:
+    query = dns.message.make_query(domain_name, rdtype)
+    response = dns.message.make_response(query)
+    if scope is not None:
+        response.use_edns(edns=True, options=[dns.edns.ECSOption(client, srclen, scope)])
+    for name, ttl, record_type, values in records:
+        response.answer.append(dns.rrset.from_text_list(name + ".", ttl, "IN", record_type, values))
+    return response
+
+
+def test_normalize_domain_name():
+    assert normalize_domain_name(" Pool.NTP.org. ") == "pool.ntp.org"
+
+
+def test_get_response_scope():
+    ecs = dns.edns.ECSOption("10.11.12.13", 24)
+    assert get_response_scope(make_response("pool.ntp.org", "A", [], scope=16), ecs) == 16
+    # a scope longer than what we sent is reduced to it
+    assert get_response_scope(make_response("pool.ntp.org", "A", [], scope=32), ecs) == 24
+    # no ECS support: the answer is valid for everyone
+    assert get_response_scope(make_response("pool.ntp.org", "A", []), ecs) == 0
+
+
+def test_get_response_ttl():
+    response = make_response("time.example.com", "A", [("time.example.com", 300, "CNAME", ["a.example.com."]),
+                                                       ("a.example.com", 20, "A", ["1.2.3.4"])])
+    assert get_response_ttl(response, False) == 20
+    # limited by the config
+    response = make_response("pool.ntp.org", "A", [("pool.ntp.org", 86400, "A", ["1.2.3.4"])])
+    assert get_response_ttl(response, False) == 300
+    # negative answer: the SOA says how long it can be cached
+    response = make_response("nope.example.com", "A", [])
+    response.set_rcode(dns.rcode.NXDOMAIN)
+    assert get_response_ttl(response, True) == 60
+    response.authority.append(dns.rrset.from_text("example.com.", 30, "IN", "SOA",
+                                                  "ns.example.com. admin.example.com. 1 7200 3600 1209600 10"))
+    assert get_response_ttl(response, True) == 10
+
+
+def test_cache_dns_answer_reused_in_the_scope():
+    ecs = dns.edns.ECSOption("10.11.12.13", 24)
+    response = make_response("pool.ntp.org", "A", [("pool.ntp.org", 100, "A", ["1.2.3.4"])], scope=24)
+    cache_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs, response, DnsAnswer(("1.2.3.4",)))
+
+    assert get_cached_dns_answer("Pool.ntp.org.", dns.rdatatype.A, ecs) == DnsAnswer(("1.2.3.4",))
+    # another client of the same network
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A,
+                                 dns.edns.ECSOption("10.11.12.200", 24)) == DnsAnswer(("1.2.3.4",))
+    # a client of another network, another record type, or another IP family
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A, dns.edns.ECSOption("10.11.13.1", 24)) is None
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.AAAA, ecs) is None
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A,
+                                 dns.edns.ECSOption("2a06:93c0::21", 56)) is None
+
+
+def test_cache_dns_answer_wider_scope():
+    ecs = dns.edns.ECSOption("10.11.12.13", 24)
+    response = make_response("pool.ntp.org", "A", [("pool.ntp.org", 100, "A", ["1.2.3.4"])], scope=0)
+    cache_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs, response, DnsAnswer(("1.2.3.4",)))
+    # the resolver said that the answer is valid for all the clients
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A,
+                                 dns.edns.ECSOption("80.1.2.3", 24)) == DnsAnswer(("1.2.3.4",))
+    # a more specific answer is preferred
+    specific = make_response("pool.ntp.org", "A", [("pool.ntp.org", 100, "A", ["5.6.7.8"])], scope=24)
+    cache_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs, specific, DnsAnswer(("5.6.7.8",)))
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs) == DnsAnswer(("5.6.7.8",))
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A,
+                                 dns.edns.ECSOption("80.1.2.3", 24)) == DnsAnswer(("1.2.3.4",))
+
+
+def test_cache_dns_answer_expires():
+    clock = FakeClock()
+    cache = TTLCache("dns", 300, 100, clock=clock)
+    scopes = TTLCache("dns_scopes", 300, 100, clock=clock)
+    ecs = dns.edns.ECSOption("10.11.12.13", 24)
+    response = make_response("pool.ntp.org", "A", [("pool.ntp.org", 20, "A", ["1.2.3.4"])], scope=24)
+    with patch("server.app.utils.dns_cache.get_dns_cache", return_value=cache), \
+            patch("server.app.utils.dns_cache.get_dns_scopes_cache", return_value=scopes):
+        cache_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs, response, DnsAnswer(("1.2.3.4",)))
+        clock.now += 19
+        assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs) is not None
+        clock.now += 1
+        assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs) is None
+
+
+def test_cache_dns_answer_negative_and_cname():
+    ecs = dns.edns.ECSOption("10.11.12.13", 24)
+    response = make_response("nope.example.com", "A", [], scope=24)
+    response.set_rcode(dns.rcode.NXDOMAIN)
+    cache_dns_answer("nope.example.com", dns.rdatatype.A, ecs, response, DnsAnswer(()))
+    answer = get_cached_dns_answer("nope.example.com", dns.rdatatype.A, ecs)
+    assert answer is not None and answer.is_negative()
+
+    response = make_response("time.example.com", "A", [("time.example.com", 50, "CNAME", ["a.example.net."])])
+    cache_dns_answer("time.example.com", dns.rdatatype.A, ecs, response, DnsAnswer((), "a.example.net"))
+    answer = get_cached_dns_answer("time.example.com", dns.rdatatype.A, ecs)
+    assert answer == DnsAnswer((), "a.example.net")
+    assert not answer.is_negative()
+
+
+@patch("server.app.utils.dns_cache.get_dns_cache_max_ttl_s")
+def test_cache_dns_answer_disabled(mock_max_ttl):
+    mock_max_ttl.return_value = 0
+    ecs = dns.edns.ECSOption("10.11.12.13", 24)
+    response = make_response("pool.ntp.org", "A", [("pool.ntp.org", 100, "A", ["1.2.3.4"])], scope=24)
+    cache_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs, response, DnsAnswer(("1.2.3.4",)))
+    cache_system_answer("pool.ntp.org", DnsAnswer(("1.2.3.4",)))
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A, ecs) is None
+    assert get_cached_system_answer("pool.ntp.org") is None
+
+
+def test_cache_system_answer():
+    assert get_cached_system_answer("pool.ntp.org") is None
+    cache_system_answer("pool.ntp.org", DnsAnswer(("1.2.3.4", "2a06:93c0::24")))
+    assert get_cached_system_answer("POOL.ntp.org") == DnsAnswer(("1.2.3.4", "2a06:93c0::24"))
+    # the system answers are not mixed with the EDNS answers
+    assert get_cached_dns_answer("pool.ntp.org", dns.rdatatype.A, dns.edns.ECSOption("10.11.12.13", 24)) is None
+
+
+def test_get_cache_ttl():
+    assert get_cache_ttl(20, False) == 20
+    assert get_cache_ttl(86400, False) == 300
+    # unknown TTL (getaddrinfo) or negative answer: the ones from the config
+    assert get_cache_ttl(None, False) == 60
+    assert get_cache_ttl(300, True) == 60
+
+
+def test_cache_reverse_dns():
+    assert get_cached_reverse_dns("83.25.24.10") is None
+    cache_reverse_dns("83.25.24.10", "host.example.com", 100)
+    cache_reverse_dns("2A06:93C0::24", None)
+    assert get_cached_reverse_dns("83.25.24.10") == ReverseDnsAnswer("host.example.com")
+    # the IP addresses without PTR record are cached too
+    assert get_cached_reverse_dns("2a06:93c0::24") == ReverseDnsAnswer(None)
+    # the forward answers of the DNS of this server are cached by record type
+    cache_system_answer("host.example.com", DnsAnswer(("83.25.24.10",)), dns.rdatatype.A, 100)
+    assert get_cached_system_answer("host.example.com", dns.rdatatype.A) == DnsAnswer(("83.25.24.10",))
+    assert get_cached_system_answer("host.example.com", dns.rdatatype.AAAA) is None
+    assert get_cached_system_answer("host.example.com") is None
@@ -1,11 +1,35 @@
+import asyncio
 import socket
-from unittest.mock import patch, MagicMock
+import time
+from unittest.mock import patch, MagicMock, AsyncMock
 import pytest
 
 from server.app.models.CustomError import DNSError
+from server.app.utils.circuit_breaker import get_circuit_breaker, reset_circuit_breakers
+from server.app.utils.dns_cache import invalidate_dns_cache
 from server.app.utils.domain_name_to_ip import domain_name_to_ip_default, domain_name_to_ip_close_to_client, \
-    edns_response_to_ips, perform_edns_query, domain_name_to_ip_list
+    edns_response_to_ips, perform_edns_query_async, domain_name_to_ip_list, domain_name_to_ip_list_async, \
+    query_resolvers_async
+import dns.edns
+import dns.flags
+import dns.message
+import dns.rcode
 import dns.rdatatype
+import dns.rrset
+
+
+@pytest.fixture(autouse=True)
+def empty_dns_cache():
+    invalidate_dns_cache()
+    yield
+    invalidate_dns_cache()
+
+
+def make_response(domain_name: str, rdtype: str, records: list[tuple[str, str, list[str]]]) -> dns.message.Message:
+    response = dns.message.make_response(dns.message.make_query(domain_name, rdtype))
+    for name, record_type, values in records:
+        response.answer.append(dns.rrset.from_text_list(name + ".", 300, "IN", record_type, values))
+    return response
 
 
 @patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client")
@@ -134,7 +158,7 @@ def test_domain_name_to_ip_close_to_client_invalid_input():
 
 @patch("server.app.utils.domain_name_to_ip.dns.edns.ECSOption")
 @patch("server.app.utils.domain_name_to_ip.edns_response_to_ips")
-@patch("server.app.utils.domain_name_to_ip.perform_edns_query")
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async", new_callable=AsyncMock)
 @patch("server.app.utils.domain_name_to_ip.get_mask_ipv6")
 @patch("server.app.utils.domain_name_to_ip.get_mask_ipv4")
 def test_domain_name_to_ip_close_to_client_first_resolver(mock_mask4, mock_mask6,
@@ -142,8 +166,8 @@ def test_domain_name_to_ip_close_to_client_first_resolver(mock_mask4, mock_mask6
                                             mock_edns_option):
     mock_mask4.return_value = 24
     mock_mask6.return_value = 56
-    mock_perform_edns_query.return_value = MagicMock()
-    mock_edns_response_to_ips.return_value = ["1.2.5.78", "2.3.4.5"]
+    mock_perform_edns_query.return_value = make_response("nl.pool.ntp.org", "A", [])
+    mock_edns_response_to_ips.return_value = (["1.2.5.78", "2.3.4.5"], None)
     mock_edns_option.return_value = MagicMock()
     # ipv4 wants ipv4
     result = domain_name_to_ip_close_to_client("nl.pool.ntp.org", "10.11.12.13", 4, ["8.8.8.8", "1.1.1.1"])
@@ -155,7 +179,7 @@ def test_domain_name_to_ip_close_to_client_first_resolver(mock_mask4, mock_mask6
     mock_perform_edns_query.reset_mock()
     mock_edns_response_to_ips.reset_mock()
     mock_edns_option.reset_mock()
-    mock_edns_response_to_ips.return_value = ["2a06:93c0::2f", "2b06:93c0::2f"]
+    mock_edns_response_to_ips.return_value = (["2a06:93c0::2f", "2b06:93c0::2f"], None)
     result = domain_name_to_ip_close_to_client("nl.pool.ntp.org", "2a06:93c0::21", 6, ["8.8.8.8", "1.1.1.1"])
     assert set(result) == {"2a06:93c0::2f", "2b06:93c0::2f"}
     mock_perform_edns_query.assert_called_once()
@@ -165,7 +189,7 @@ def test_domain_name_to_ip_close_to_client_first_resolver(mock_mask4, mock_mask6
 
 @patch("server.app.utils.domain_name_to_ip.dns.edns.ECSOption")
 @patch("server.app.utils.domain_name_to_ip.edns_response_to_ips")
-@patch("server.app.utils.domain_name_to_ip.perform_edns_query")
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async", new_callable=AsyncMock)
 @patch("server.app.utils.domain_name_to_ip.get_mask_ipv6")
 @patch("server.app.utils.domain_name_to_ip.get_mask_ipv4")
 def test_domain_name_to_ip_close_to_client_ipv4_wants_ipv6_and_reverse(mock_mask4, mock_mask6,
@@ -173,30 +197,30 @@ def test_domain_name_to_ip_close_to_client_ipv4_wants_ipv6_and_reverse(mock_mask
                                             mock_edns_option):
     mock_mask4.return_value = 24
     mock_mask6.return_value = 56
-    mock_perform_edns_query.return_value = MagicMock()
-    mock_edns_response_to_ips.return_value = ["1.2.5.78", "2.3.4.5"]
+    mock_perform_edns_query.return_value = make_response("nl.pool.ntp.org", "A", [])
+    mock_edns_response_to_ips.return_value = (["1.2.5.78", "2.3.4.5"], None)
     mock_edns_option.return_value = MagicMock()
     # ipv6 wants ipv4
     result = domain_name_to_ip_close_to_client("nl.pool.ntp.org", "2a06:93c0::24", 4, ["8.8.8.8", "1.1.1.1"])
     assert set(result) == {"1.2.5.78", "2.3.4.5"}
     mock_perform_edns_query.assert_called_once()
-    mock_edns_response_to_ips.assert_called_once()
+    assert mock_perform_edns_query.call_args.args[3] == 4
     mock_edns_option.assert_called_once_with(address="2a06:93c0::24", srclen=56, scopelen=0)
-    # ipv6 wants ipv6
+    # ipv4 wants ipv6
     mock_perform_edns_query.reset_mock()
     mock_edns_response_to_ips.reset_mock()
     mock_edns_option.reset_mock()
-    mock_edns_response_to_ips.return_value = ["2a06:93c0::2f", "2b06:93c0::2f"]
-    result = domain_name_to_ip_close_to_client("nl.pool.ntp.org", "2.3.4.5", 4, ["8.8.8.8", "1.1.1.1"])
+    mock_edns_response_to_ips.return_value = (["2a06:93c0::2f", "2b06:93c0::2f"], None)
+    result = domain_name_to_ip_close_to_client("nl.pool.ntp.org", "2.3.4.5", 6, ["8.8.8.8", "1.1.1.1"])
     assert set(result) == {"2a06:93c0::2f", "2b06:93c0::2f"}
     mock_perform_edns_query.assert_called_once()
-    mock_edns_response_to_ips.assert_called_once()
+    assert mock_perform_edns_query.call_args.args[3] == 6
     mock_edns_option.assert_called_once_with(address="2.3.4.5", srclen=24, scopelen=0)
 
 
 @patch("server.app.utils.domain_name_to_ip.dns.edns.ECSOption")
 @patch("server.app.utils.domain_name_to_ip.edns_response_to_ips")
-@patch("server.app.utils.domain_name_to_ip.perform_edns_query")
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async", new_callable=AsyncMock)
 @patch("server.app.utils.domain_name_to_ip.get_mask_ipv6")
 @patch("server.app.utils.domain_name_to_ip.get_mask_ipv4")
 def test_domain_name_to_ip_close_to_client_none_exception(mock_mask4, mock_mask6,
@@ -204,10 +228,10 @@ def test_domain_name_to_ip_close_to_client_none_exception(mock_mask4, mock_mask6
                                             mock_edns_option):
     mock_mask4.return_value = 24
     mock_mask6.return_value = 56
-    mock_perform_edns_query.side_effect  = [None, MagicMock()]
-    mock_edns_response_to_ips.return_value = ["1.2.5.78", "2.3.4.5"]
+    mock_perform_edns_query.side_effect = [None, make_response("nl.pool.ntp.org", "A", [])]
+    mock_edns_response_to_ips.return_value = (["1.2.5.78", "2.3.4.5"], None)
     mock_edns_option.return_value = MagicMock()
-    # ipv4 with perform_edns_query returning None the first time and a list of IPs second time
+    # ipv4 with the first resolver failing: the second one is asked immediately
     result = domain_name_to_ip_close_to_client("nl.pool.ntp.org", "10.11.12.13", 4, ["8.8.8.8", "1.1.1.1"])
     assert set(result) == {"1.2.5.78", "2.3.4.5"}
     assert mock_perform_edns_query.call_count == 2
@@ -218,51 +242,109 @@ def test_domain_name_to_ip_close_to_client_none_exception(mock_mask4, mock_mask6
     mock_edns_response_to_ips.reset_mock()
     mock_edns_option.reset_mock()
     mock_perform_edns_query.side_effect = Exception("exception")
-    mock_edns_response_to_ips.return_value = ["1.2.5.78", "2.3.4.5"]
     mock_edns_option.return_value = MagicMock()
 
     result = domain_name_to_ip_close_to_client("nl.pool.ntp.org", "2a06:93c0::2f", 6,["8.8.8.8", "1.1.1.1"])
     assert result is None
-    assert mock_perform_edns_query.call_count == 1
     assert mock_edns_option.call_count == 1
     assert mock_edns_response_to_ips.call_count == 0
 
-@patch("server.app.utils.domain_name_to_ip.dns.query.tcp")
-@patch("server.app.utils.domain_name_to_ip.dns.query.udp")
+
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async")
+def test_query_resolvers_hedged(mock_query):
+    # the first resolver is down (it never answers), the second one answers quickly
+    async def query(domain_name, resolver, ecs, wanted_ip_type, timeout):
+        if resolver == "8.8.8.8":
+            await asyncio.sleep(3)
+        return make_response(domain_name, "A", [(domain_name, "A", ["1.2.3.4"])])
+    mock_query.side_effect = query
+    ecs = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
+    start = time.monotonic()
+    ips, next_name = asyncio.run(query_resolvers_async("pool.ntp.org", ecs, 4, ["8.8.8.8", "1.1.1.1"],
+                                                       hedge_delay_s=0.05))
+    assert time.monotonic() - start < 1
+    assert (ips, next_name) == (["1.2.3.4"], None)
+    assert [c.args[1] for c in mock_query.call_args_list] == ["8.8.8.8", "1.1.1.1"]
+
+
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async")
+def test_query_resolvers_first_answer_wins(mock_query):
+    async def query(domain_name, resolver, ecs, wanted_ip_type, timeout):
+        return make_response(domain_name, "A", [(domain_name, "A", ["1.2.3.4"])])
+    mock_query.side_effect = query
+    ecs = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
+    # the first resolver answers before the hedge delay, so the others are not asked
+    ips, _ = asyncio.run(query_resolvers_async("pool.ntp.org", ecs, 4, ["8.8.8.8", "1.1.1.1"], hedge_delay_s=1))
+    assert ips == ["1.2.3.4"]
+    mock_query.assert_called_once()
+
+
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async")
+def test_query_resolvers_no_valid_answer(mock_query):
+    async def query(domain_name, resolver, ecs, wanted_ip_type, timeout):
+        if resolver == "8.8.8.8":
+            response = make_response(domain_name, "A", [])
+            response.set_rcode(dns.rcode.SERVFAIL)
+            return response
+        return None
+    mock_query.side_effect = query
+    ecs = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
+    assert asyncio.run(query_resolvers_async("pool.ntp.org", ecs, 4, ["8.8.8.8", "1.1.1.1"], 0)) == ([], None)
+    assert mock_query.call_count == 2
+
+
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async")
+def test_domain_name_to_ip_close_to_client_cname_chain(mock_query):
+    # the first answer ends with an alias that the resolver did not resolve, so it is queried again
+    async def query(domain_name, resolver, ecs, wanted_ip_type, timeout):
+        if domain_name == "time.example.com":
+            return make_response(domain_name, "A", [("time.example.com", "CNAME", ["a.example.net."]),
+                                                    ("a.example.net", "CNAME", ["b.example.org."])])
+        return make_response(domain_name, "A", [(domain_name, "A", ["5.6.7.8"])])
+    mock_query.side_effect = query
+    assert domain_name_to_ip_close_to_client("time.example.com", "1.2.3.4", 4, ["8.8.8.8"]) == ["5.6.7.8"]
+    assert [c.args[0] for c in mock_query.call_args_list] == ["time.example.com", "b.example.org"]
+    # the chain is too long
+    mock_query.reset_mock()
+    assert domain_name_to_ip_close_to_client("time.example.com", "1.2.3.4", 4, ["8.8.8.8"], max_depth=0) == []
+
+
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.tcp", new_callable=AsyncMock)
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.udp", new_callable=AsyncMock)
 def test_perform_edns_query_udp_succeeds(mock_udp, mock_tcp):
     # tcp response
-    mock_response = MagicMock()
+    mock_response = make_response("pool.ntp.org", "A", [])
     ecs4 = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
     ecs6 = dns.edns.ECSOption(address="2a06:93c0::2f", srclen=56)
     # udp succeeds, tcp not called
     mock_udp.return_value = mock_response
 
-    result = perform_edns_query("pool.ntp.org", "8.8.8.8", ecs4, 4, 3)
+    result = asyncio.run(perform_edns_query_async("pool.ntp.org", "8.8.8.8", ecs4, 4, 3))
     assert result is mock_response
     mock_udp.assert_called_once()
     mock_tcp.assert_not_called()
 
     # ip v6
-    mock_response.reset_mock()
     mock_udp.reset_mock()
     mock_tcp.reset_mock()
-    result = perform_edns_query("pool.ntp.org", "8.8.8.8", ecs6, 6, 3)
+    result = asyncio.run(perform_edns_query_async("pool.ntp.org", "8.8.8.8", ecs6, 6, 3))
     assert result is mock_response
     mock_udp.assert_called_once()
     mock_tcp.assert_not_called()
 
-@patch("server.app.utils.domain_name_to_ip.dns.query.tcp")
-@patch("server.app.utils.domain_name_to_ip.dns.query.udp")
+
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.tcp", new_callable=AsyncMock)
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.udp", new_callable=AsyncMock)
 def test_perform_edns_query_udp_fails_tcp_saves(mock_udp, mock_tcp):
     # tcp response
-    mock_response = MagicMock()
+    mock_response = make_response("pool.ntp.org", "A", [])
     ecs4 = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
     ecs6 = dns.edns.ECSOption(address="2a06:93c0::2f", srclen=56)
     # udp fails, tcp succeeds
     mock_udp.side_effect = Exception("UDP failed")
     mock_tcp.return_value = mock_response
 
-    result = perform_edns_query("pool.ntp.org", "8.8.8.8", ecs4, 4, 3)
+    result = asyncio.run(perform_edns_query_async("pool.ntp.org", "8.8.8.8", ecs4, 4, 3))
     assert result is mock_response
     # how udp request was sent
     mock_udp.assert_called_once()
@@ -283,10 +365,9 @@ def test_perform_edns_query_udp_fails_tcp_saves(mock_udp, mock_tcp):
     assert any(q.rdtype == dns.rdatatype.A for q in query_sent.question)
 
     # ip v6
-    mock_response.reset_mock()
     mock_udp.reset_mock()
     mock_tcp.reset_mock()
-    result = perform_edns_query("pool.ntp.org", "8.8.8.8", ecs6, 6, 3)
+    result = asyncio.run(perform_edns_query_async("pool.ntp.org", "8.8.8.8", ecs6, 6, 3))
     assert result is mock_response
     # how udp request was sent
     mock_udp.assert_called_once()
@@ -306,16 +387,28 @@ def test_perform_edns_query_udp_fails_tcp_saves(mock_udp, mock_tcp):
     assert ecs_option.srclen == 56
     assert any(q.rdtype == dns.rdatatype.AAAA for q in query_sent.question)
 
-@patch("server.app.utils.domain_name_to_ip.dns.query.tcp")
-@patch("server.app.utils.domain_name_to_ip.dns.query.udp")
+
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.tcp", new_callable=AsyncMock)
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.udp", new_callable=AsyncMock)
+def test_perform_edns_query_truncated_uses_tcp(mock_udp, mock_tcp):
+    truncated = make_response("pool.ntp.org", "A", [])
+    truncated.flags |= dns.flags.TC
+    mock_udp.return_value = truncated
+    mock_tcp.return_value = make_response("pool.ntp.org", "A", [("pool.ntp.org", "A", ["1.2.3.4"])])
+    ecs4 = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
+    assert asyncio.run(perform_edns_query_async("pool.ntp.org", "8.8.8.8", ecs4, 4, 3)) is mock_tcp.return_value
+    mock_tcp.assert_called_once()
+
+
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.tcp", new_callable=AsyncMock)
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.udp", new_callable=AsyncMock)
 def test_perform_edns_query_udp_and_tcp_fail(mock_udp, mock_tcp):
     ecs4 = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
-    ecs6 = dns.edns.ECSOption(address="2a06:93c0::2f", srclen=56)
     #udp and tcp both fails
     mock_udp.side_effect = Exception("UDP failed")
     mock_tcp.side_effect = Exception("TCP failed")
 
-    result = perform_edns_query("pool.ntp.org", "8.8.8.8", ecs4, 4, 3)
+    result = asyncio.run(perform_edns_query_async("pool.ntp.org", "8.8.8.8", ecs4, 4, 3))
     assert result is None
     # how udp request was sent
     mock_udp.assert_called_once()
@@ -327,154 +420,175 @@ def test_perform_edns_query_udp_and_tcp_fail(mock_udp, mock_tcp):
     assert ecs_option.srclen == 24
     # how tcp request was sent
     mock_tcp.assert_called_once()
-    query_sent = mock_tcp.call_args[0][0]
-    # get the ecs option from all the fields it has
-    ecs_option = next((opt for opt in query_sent.options if isinstance(opt, dns.edns.ECSOption)), None)
-    assert ecs_option is not None
-    assert ecs_option.address == "1.2.3.4"
-    assert ecs_option.srclen == 24
     assert any(q.rdtype == dns.rdatatype.A for q in query_sent.question)
 
-    # ip v6
+
+def test_edns_response_to_ips_only_ips():
+    response = make_response("pool.ntp.org", "A", [("pool.ntp.org", "A", ["123.43.12.9", "124.11.13.19"]),
+                                                   ("pool.ntp.org", "AAAA", ["2a06:93c0::24", "2a36:93c0::24"])])
+    ips, next_name = edns_response_to_ips(response, "pool.ntp.org")
+    assert set(ips) == {"123.43.12.9", "124.11.13.19", "2a06:93c0::24", "2a36:93c0::24"}
+    assert next_name is None
+
+
+def test_edns_response_to_ips_cname_in_the_same_answer():
+    # the resolver sent the chain and the IPs of its end: no other query is needed
+    response = make_response("time.example.com", "A", [("time.example.com", "CNAME", ["redirected.example.com."]),
+                                                       ("redirected.example.com", "A", ["33.44.56.78", "2.2.2.2"])])
+    ips, next_name = edns_response_to_ips(response, "time.example.com")
+    assert set(ips) == {"33.44.56.78", "2.2.2.2"}
+    assert next_name is None
+
+
+def test_edns_response_to_ips_cname_not_resolved():
+    response = make_response("time.example.com", "A", [("time.example.com", "CNAME", ["a.example.com."]),
+                                                       ("a.example.com", "CNAME", ["b.example.com."])])
+    assert edns_response_to_ips(response, "time.example.com") == ([], "b.example.com")
+
+
+def test_edns_response_to_ips_cname_loop():
+    response = make_response("a.example.com", "A", [("a.example.com", "CNAME", ["b.example.com."]),
+                                                    ("b.example.com", "CNAME", ["a.example.com."])])
+    ips, next_name = edns_response_to_ips(response, "a.example.com")
+    assert ips == []
+    assert next_name in ("a.example.com", "b.example.com")
+
+
+def test_edns_response_to_ips_ptr():
+    response = make_response("pool.ntp.org", "A", [("pool.ntp.org", "A", ["123.43.12.9", "124.11.13.19"]),
+                                                   ("pool.ntp.org", "PTR", ["redirected.example.com."])])
+    ips, next_name = edns_response_to_ips(response, "pool.ntp.org")
+    assert set(ips) == {"123.43.12.9", "124.11.13.19"}
+    assert next_name is None
+
+
+def test_edns_response_to_ips_empty():
+    assert edns_response_to_ips(make_response("pool.ntp.org", "A", []), "pool.ntp.org") == ([], None)
+
+
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.tcp", new_callable=AsyncMock)
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.udp", new_callable=AsyncMock)
+def test_perform_edns_query_circuit_breaker(mock_udp, mock_tcp):
+    reset_circuit_breakers()
+    ecs4 = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
+    mock_udp.side_effect = Exception("UDP failed")
+    mock_tcp.side_effect = Exception("TCP failed")
+    breaker = get_circuit_breaker("edns:9.9.9.9")
+    for _ in range(breaker.failure_threshold):
+        assert asyncio.run(perform_edns_query_async("pool.ntp.org", "9.9.9.9", ecs4, 4, 3)) is None
+    # the resolver keeps failing, so we stop asking it
     mock_udp.reset_mock()
     mock_tcp.reset_mock()
-    result = perform_edns_query("pool.ntp.org", "8.8.8.8", ecs6, 6, 3)
-    assert result is None
-    # how udp request was sent
-    mock_udp.assert_called_once()
-    query_sent = mock_udp.call_args[0][0]
-    # get the ecs option from all the fields it has
-    ecs_option = next((opt for opt in query_sent.options if isinstance(opt, dns.edns.ECSOption)), None)
-    assert ecs_option is not None
-    assert ecs_option.address == "2a06:93c0::2f"
-    assert ecs_option.srclen == 56
-    # how tcp request was sent
-    mock_tcp.assert_called_once()
-    query_sent = mock_tcp.call_args[0][0]
-    # get the ecs option from all the fields it has
-    ecs_option = next((opt for opt in query_sent.options if isinstance(opt, dns.edns.ECSOption)), None)
-    assert ecs_option is not None
-    assert ecs_option.address == "2a06:93c0::2f"
-    assert ecs_option.srclen == 56
-    assert any(q.rdtype == dns.rdatatype.AAAA for q in query_sent.question)
+    assert asyncio.run(perform_edns_query_async("pool.ntp.org", "9.9.9.9", ecs4, 4, 3)) is None
+    mock_udp.assert_not_called()
+    mock_tcp.assert_not_called()
+    # other resolvers are still used
+    mock_udp.side_effect = None
+    mock_udp.return_value = make_response("pool.ntp.org", "A", [])
+    assert asyncio.run(perform_edns_query_async("pool.ntp.org", "1.1.1.1", ecs4, 4, 3)) is mock_udp.return_value
+    reset_circuit_breakers()
 
 
-@patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client")
-def test_edns_response_to_ips_only_ips(mock_domain_name):
-    # answers with IPv4 (A)
-    a_rrset = MagicMock()
-    a_rrset.rdtype = dns.rdatatype.A
-    a_rrset.items = [MagicMock(address="123.43.12.9"), MagicMock(address="124.11.13.19")]
-    # answers with IPv4 (A)
-    a_rrset2 = MagicMock()
-    a_rrset2.rdtype = dns.rdatatype.A
-    a_rrset2.items = [MagicMock(address="11.43.12.9")]
-
-    # answers with IPv6 (AAAA)
-    aaaa_rrset = MagicMock()
-    aaaa_rrset.rdtype = dns.rdatatype.AAAA
-    aaaa_rrset.items = [MagicMock(address="2a06:93c0::24"), MagicMock(address="2a36:93c0::24")]
-    # response
-    mock_response = MagicMock()
-    mock_response.answer = [a_rrset, aaaa_rrset, a_rrset2]
-
-    result = edns_response_to_ips(mock_response, client_ip="83.25.24.10", wanted_ip_type=4, resolvers=["8.8.8.8"])
-
-    assert set(result) == {"123.43.12.9",
-                      "124.11.13.19",
-                      "11.43.12.9",
-                      "2a06:93c0::24",
-                      "2a36:93c0::24"}
+@patch("server.app.utils.domain_name_to_ip.dns.asyncquery.udp", new_callable=AsyncMock)
+def test_perform_edns_query_cancelled_trial(mock_udp):
+    reset_circuit_breakers()
+    ecs4 = dns.edns.ECSOption(address="1.2.3.4", srclen=24)
+    breaker = get_circuit_breaker("edns:1.1.1.1")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker._opened_at -= breaker.recovery_timeout_s  # the breaker is now half-open
+
+    async def slow_query(*args, **kwargs):
+        await asyncio.sleep(10)
+    mock_udp.side_effect = slow_query
+
+    async def cancel_the_trial():
+        task = asyncio.create_task(perform_edns_query_async("pool.ntp.org", "1.1.1.1", ecs4, 4, 3))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(cancel_the_trial())
+    mock_udp.assert_called_once()
+    # the cancelled trial is released, so the resolver can be tried again
+    assert breaker.allow_request()
+    reset_circuit_breakers()
 
-@patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client")
-def test_edns_response_to_ips_cname(mock_domain_name):
-    mock_domain_name.return_value = ["33.44.56.78", "44.44.55.75", "2.2.2.2"]
-    # answers with IPv4 (A)
-    a_rrset = MagicMock()
-    a_rrset.rdtype = dns.rdatatype.A
-    a_rrset.items = [MagicMock(address="123.43.12.9"), MagicMock(address="124.11.13.19")]
-    # answers with CNAME
-    cname_rrset = MagicMock()
-    cname_rrset.rdtype = dns.rdatatype.CNAME
-    cname_item = MagicMock()
-    cname_item.__str__.return_value = "redirected.example.com."
-    cname_rrset.items = [cname_item]
-
-    # response
-    mock_response = MagicMock()
-    mock_response.answer = [a_rrset, cname_rrset]
-
-    result = edns_response_to_ips(mock_response, client_ip="83.25.24.10", wanted_ip_type=4, resolvers=["8.8.8.8"])
-    mock_domain_name.assert_called_with("redirected.example.com", "83.25.24.10", 4, ["8.8.8.8"], 1, 2)
-    assert set(result) == {"123.43.12.9",
-                      "124.11.13.19",
-                      "33.44.56.78",
-                      "44.44.55.75",
-                      "2.2.2.2"}
 
-@patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client")
-def test_edns_response_to_ips_cname_none(mock_domain_name):
-    mock_domain_name.return_value = None
-    # answers with IPv4 (A)
-    a_rrset = MagicMock()
-    a_rrset.rdtype = dns.rdatatype.A
-    a_rrset.items = [MagicMock(address="123.43.12.9"), MagicMock(address="124.11.13.19")]
-    # answers with CNAME
-    cname_rrset = MagicMock()
-    cname_rrset.rdtype = dns.rdatatype.CNAME
-    cname_item = MagicMock()
-    cname_item.__str__.return_value = "redirected.example.com."
-    cname_rrset.items = [cname_item]
-
-    # response
-    mock_response = MagicMock()
-    mock_response.answer = [a_rrset, cname_rrset]
-
-    result = edns_response_to_ips(mock_response, client_ip="83.25.24.10", wanted_ip_type=4, resolvers=["8.8.8.8"])
-    mock_domain_name.assert_called_with("redirected.example.com", "83.25.24.10", 4, ["8.8.8.8"], 1, 2)
-    assert set(result) == {"123.43.12.9",
-                      "124.11.13.19"}
+@patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client_async", new_callable=AsyncMock)
+def test_domain_name_to_ip_list_async(mock_close):
+    mock_close.return_value = ["1.2.3.4"]
+    assert asyncio.run(domain_name_to_ip_list_async("pool.ntp.org", "5.6.7.8", 4)) == ["1.2.3.4"]
+    mock_close.return_value = []
+    with pytest.raises(DNSError):
+        asyncio.run(domain_name_to_ip_list_async("pool.ntp.org", "5.6.7.8", 4))
+
+
+@patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client_async", new_callable=AsyncMock)
+def test_domain_name_to_ip_close_to_client_inside_event_loop(mock_close):
+    mock_close.return_value = ["1.2.3.4"]
+
+    async def call_from_the_loop():
+        return domain_name_to_ip_close_to_client("pool.ntp.org", "5.6.7.8", 4)
+    # the blocking version never blocks a running event loop
+    with pytest.raises(RuntimeError):
+        asyncio.run(call_from_the_loop())
+    mock_close.assert_not_awaited()
+
+    async def call_from_a_worker_thread():
+        return await asyncio.to_thread(domain_name_to_ip_close_to_client, "pool.ntp.org", "5.6.7.8", 4)
+    assert asyncio.run(call_from_a_worker_thread()) == ["1.2.3.4"]
+
+
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async")
+def test_domain_name_to_ip_close_to_client_cached_for_the_network(mock_query):
+    async def query(domain_name, resolver, ecs, wanted_ip_type, timeout):
+        response = make_response(domain_name, "A", [(domain_name, "A", ["1.2.3.4"])])
+        response.use_edns(edns=True, options=[dns.edns.ECSOption(ecs.address, ecs.srclen, 24)])
+        return response
+    mock_query.side_effect = query
+    assert domain_name_to_ip_close_to_client("pool.ntp.org", "10.11.12.13", 4, ["8.8.8.8"]) == ["1.2.3.4"]
+    # another client of the same /24 does not cost any query
+    assert domain_name_to_ip_close_to_client("pool.ntp.org", "10.11.12.99", 4, ["8.8.8.8"]) == ["1.2.3.4"]
+    mock_query.assert_called_once()
+    # a client of another network is resolved again
+    assert domain_name_to_ip_close_to_client("pool.ntp.org", "10.11.99.13", 4, ["8.8.8.8"]) == ["1.2.3.4"]
+    assert mock_query.call_count == 2
+
+
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async")
+def test_domain_name_to_ip_close_to_client_cname_chain_cached(mock_query):
+    async def query(domain_name, resolver, ecs, wanted_ip_type, timeout):
+        if domain_name == "time.example.com":
+            return make_response(domain_name, "A", [("time.example.com", "CNAME", ["b.example.org."])])
+        return make_response(domain_name, "A", [(domain_name, "A", ["5.6.7.8"])])
+    mock_query.side_effect = query
+    for _ in range(3):
+        assert domain_name_to_ip_close_to_client("time.example.com", "1.2.3.4", 4, ["8.8.8.8"]) == ["5.6.7.8"]
+    assert [c.args[0] for c in mock_query.call_args_list] == ["time.example.com", "b.example.org"]
+
+
+@patch("server.app.utils.domain_name_to_ip.perform_edns_query_async")
+def test_domain_name_to_ip_close_to_client_negative_cached(mock_query):
+    async def query(domain_name, resolver, ecs, wanted_ip_type, timeout):
+        response = make_response(domain_name, "A", [])
+        response.set_rcode(dns.rcode.NXDOMAIN)
+        return response
+    mock_query.side_effect = query
+    assert domain_name_to_ip_close_to_client("nope.example.com", "1.2.3.4", 4, ["8.8.8.8", "1.1.1.1"], 0) == []
+    assert mock_query.call_count == 2
+    assert domain_name_to_ip_close_to_client("nope.example.com", "1.2.3.4", 4, ["8.8.8.8", "1.1.1.1"], 0) == []
+    assert mock_query.call_count == 2
 
-@patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client")
-def test_edns_response_to_ips_ptr(mock_domain_name):
-    mock_domain_name.return_value = None
-    # answers with IPv4 (A)
-    a_rrset = MagicMock()
-    a_rrset.rdtype = dns.rdatatype.A
-    a_rrset.items = [MagicMock(address="123.43.12.9"), MagicMock(address="124.11.13.19")]
-    # answers with PTR
-    cname_rrset = MagicMock()
-    cname_rrset.rdtype = dns.rdatatype.PTR
-    cname_item = MagicMock()
-    cname_item.__str__.return_value = "redirected.example.com."
-    cname_rrset.items = [cname_item]
-
-    # response
-    mock_response = MagicMock()
-    mock_response.answer = [a_rrset, cname_rrset]
-
-    result = edns_response_to_ips(mock_response, client_ip="83.25.24.10", wanted_ip_type=4, resolvers=["8.8.8.8"])
-    mock_domain_name.assert_not_called()
-    assert set(result) == {"123.43.12.9",
-                      "124.11.13.19"}
-@patch("server.app.utils.domain_name_to_ip.domain_name_to_ip_close_to_client")
-def test_edns_response_to_ips_cname_too_large_depth(mock_domain_name):
-    mock_domain_name.return_value = ["33.44.56.78", "44.44.55.75", "2.2.2.2"] # it should not arrive there because depth is max_depth
-    # answers with IPv4 (A)
-    a_rrset = MagicMock()
-    a_rrset.rdtype = dns.rdatatype.A
-    a_rrset.items = [MagicMock(address="123.43.12.9"), MagicMock(address="124.11.13.19")]
-    # answers with CNAME
-    cname_rrset = MagicMock()
-    cname_rrset.rdtype = dns.rdatatype.CNAME
-    cname_item = MagicMock()
-    cname_item.__str__.return_value = "redirected.example.com."
-    cname_rrset.items = [cname_item]
-
-    # response
-    mock_response = MagicMock()
-    mock_response.answer = [a_rrset, cname_rrset]
-
-    result = edns_response_to_ips(mock_response, client_ip="83.25.24.10", wanted_ip_type=4, resolvers=["8.8.8.8"], depth=2, max_depth=2)
-    mock_domain_name.assert_not_called()
-    assert set(result) == {"123.43.12.9", "124.11.13.19"}
\ No newline at end of file
+
+@patch("server.app.utils.domain_name_to_ip.socket.getaddrinfo")
+def test_domain_name_to_ip_default_cached(mock_getaddrinfo):
+    mock_getaddrinfo.return_value = [(None, None, None, None, ("83.25.24.10", 0))]
+    assert domain_name_to_ip_default("it.pool.ntp.org") == ["83.25.24.10"]
+    assert domain_name_to_ip_default("it.pool.ntp.org") == ["83.25.24.10"]
+    mock_getaddrinfo.assert_called_once()
+    # the names that do not exist are cached too
+    mock_getaddrinfo.side_effect = socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    assert domain_name_to_ip_default("nope.example.com") is None
+    assert domain_name_to_ip_default("nope.example.com") is None
+    assert mock_getaddrinfo.call_count == 2
@@ -0,0 +1,57 @@
+import numpy as np
+
+from server.app.utils.downsampling import lttb_indices, downsample_measurements
+
+
+def test_lttb_indices_small_series():
+    x = np.arange(5, dtype=float)
+    assert lttb_indices(x, x, 5).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(x, x, 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(x, x, 2).tolist() == [0, 4]
+    assert lttb_indices(x, x, 1).tolist() == [0]
+
+
+def test_lttb_indices_keeps_peaks():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[137] = 5.0
+    y[731] = -3.0
+    indices = lttb_indices(x, y, 20)
+    assert len(indices) == 20
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+    assert 137 in indices and 731 in indices
+
+
+def test_lttb_indices_one_point_per_bucket():
+    x = np.arange(10, dtype=float)
+    y = np.array([0, 1, 0, 1, 0, 1, 0, 1, 0, 1], dtype=float)
+    indices = lttb_indices(x, y, 6)
+    # 8 inner points in 4 buckets of 2
+    assert len(indices) == 6
+    assert all(1 + 2 * i <= indices[i + 1] <= 2 + 2 * i for i in range(4))
+
+
+def get_measurement(i: int, offset, rtt) -> dict:
+    return {"id": i, "client_sent_time": (3957337543 << 32) + (i << 32), "offset": offset, "rtt": rtt}
+
+
+def test_downsample_measurements():
+    measurements = [get_measurement(i, 0.001, 0.02) for i in range(500)]
+    measurements[100]["offset"] = 0.5
+    measurements[400]["rtt"] = 0.9
+    measurements[250]["offset"] = None
+    ans = downsample_measurements(measurements, 40)
+    assert len(ans) <= 40
+    ids = [m["id"] for m in ans]
+    assert ids == sorted(ids)
+    # the peaks of both series are kept
+    assert 100 in ids and 400 in ids
+    assert ids[0] == 0 and ids[-1] == 499
+
+
+def test_downsample_measurements_few_points():
+    measurements = [get_measurement(i, None, None) for i in range(3)]
+    assert downsample_measurements(measurements, 4) == measurements
+    # nothing can be plotted
+    assert downsample_measurements(measurements * 3, 4) == []
@@ -0,0 +1,217 @@
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, MagicMock
+
+import httpx
+import pytest
+import requests
+
+from server.app.models.CustomError import CircuitOpenError
+from server.app.utils.circuit_breaker import reset_circuit_breakers, get_circuit_breaker, OPEN, CLOSED, HALF_OPEN
+from server.app.utils.http_client import get_host_key, parse_retry_after, compute_retry_delay, should_retry, \
+    http_get, http_post, get_session, get_host_semaphore, close_http_clients, async_http_get, MAX_RETRY_DELAY_S
+
+
+@pytest.fixture(autouse=True)
+def clean_circuit_breakers():
+    reset_circuit_breakers()
+    yield
+    reset_circuit_breakers()
+
+
+def make_response(status_code: int, headers: dict | None = None) -> MagicMock:
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+def test_get_host_key():
+    assert get_host_key("https://atlas.ripe.net/api/v2/measurements/1/") == "https://atlas.ripe.net"
+    assert get_host_key("https://Stat.Ripe.Net/data/x.json?resource=1.1.1.1") == "https://stat.ripe.net"
+    assert get_host_key("http://localhost:8000/a") == "http://localhost:8000"
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("not a date") is None
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=20), usegmt=True)
+    assert 15 <= parse_retry_after(future) <= 20
+
+
+@patch("server.app.utils.http_client.get_http_backoff_base_s")
+def test_compute_retry_delay(mock_base):
+    mock_base.return_value = 1
+    for attempt in range(4):
+        assert 0 <= compute_retry_delay(attempt) <= 2 ** attempt
+    assert compute_retry_delay(0, retry_after=7) == 7
+    assert compute_retry_delay(0, retry_after=1000) == MAX_RETRY_DELAY_S
+
+
+def test_should_retry():
+    assert should_retry(429, "GET")
+    assert should_retry(503, "GET")
+    assert not should_retry(404, "GET")
+    assert not should_retry(200, "GET")
+    assert should_retry(429, "POST")
+    assert not should_retry(500, "POST")
+
+
+def test_get_session_is_shared_per_host():
+    close_http_clients()
+    first = get_session("https://atlas.ripe.net/api/v2/measurements/1/")
+    assert get_session("https://atlas.ripe.net/api/v2/probes/2/") is first
+    assert get_session("https://stat.ripe.net/data/") is not first
+    assert get_host_semaphore("https://atlas.ripe.net/a") is get_host_semaphore("https://atlas.ripe.net/b")
+    close_http_clients()
+
+
+@patch("server.app.utils.http_client.time.sleep")
+@patch("server.app.utils.http_client.get_http_max_retries")
+@patch("server.app.utils.http_client.get_session")
+def test_http_get_retries_on_server_errors(mock_get_session, mock_max_retries, mock_sleep):
+    mock_max_retries.return_value = 3
+    session = MagicMock()
+    session.request.side_effect = [make_response(503), make_response(429, {"Retry-After": "2"}), make_response(200)]
+    mock_get_session.return_value = session
+
+    response = http_get("https://atlas.ripe.net/api/v2/measurements/1/", headers={"a": "b"}, timeout=(1, 2))
+    assert response.status_code == 200
+    assert session.request.call_count == 3
+    session.request.assert_called_with("GET", "https://atlas.ripe.net/api/v2/measurements/1/", timeout=(1, 2),
+                                       headers={"a": "b"}, params=None)
+    assert mock_sleep.call_count == 2
+    assert mock_sleep.call_args_list[1][0][0] >= 2
+
+
+@patch("server.app.utils.http_client.time.sleep")
+@patch("server.app.utils.http_client.get_http_max_retries")
+@patch("server.app.utils.http_client.get_session")
+def test_http_get_gives_up_after_max_retries(mock_get_session, mock_max_retries, mock_sleep):
+    mock_max_retries.return_value = 2
+    session = MagicMock()
+    session.request.return_value = make_response(500)
+    mock_get_session.return_value = session
+
+    assert http_get("https://stat.ripe.net/data/").status_code == 500
+    assert session.request.call_count == 3
+
+    session.reset_mock()
+    session.request.side_effect = requests.ConnectionError("down")
+    with pytest.raises(requests.ConnectionError):
+        http_get("https://stat.ripe.net/data/")
+    assert session.request.call_count == 3
+
+
+@patch("server.app.utils.http_client.time.sleep")
+@patch("server.app.utils.http_client.get_http_max_retries")
+@patch("server.app.utils.http_client.get_session")
+def test_http_post_only_retries_when_not_processed(mock_get_session, mock_max_retries, mock_sleep):
+    mock_max_retries.return_value = 3
+    session = MagicMock()
+    session.request.return_value = make_response(500)
+    mock_get_session.return_value = session
+    # a 5xx may mean that the measurement was created, so we do not retry
+    assert http_post("https://atlas.ripe.net/api/v2/measurements/", data="{}").status_code == 500
+    assert session.request.call_count == 1
+
+    session.reset_mock()
+    session.request.return_value = None
+    session.request.side_effect = [make_response(429), make_response(201)]
+    assert http_post("https://atlas.ripe.net/api/v2/measurements/", data="{}").status_code == 201
+    assert session.request.call_count == 2
+
+    session.reset_mock()
+    session.request.side_effect = requests.ConnectionError("reset by peer")
+    with pytest.raises(requests.ConnectionError):
+        http_post("https://atlas.ripe.net/api/v2/measurements/", data="{}")
+    assert session.request.call_count == 1
+
+    session.reset_mock()
+    session.request.side_effect = [requests.ConnectTimeout("timeout"), make_response(201)]
+    assert http_post("https://atlas.ripe.net/api/v2/measurements/", data="{}").status_code == 201
+
+
+@patch("server.app.utils.http_client.asyncio.sleep")
+@patch("server.app.utils.http_client.get_http_max_retries")
+@patch("server.app.utils.http_client.get_async_client")
+def test_async_http_get_retries(mock_get_async_client, mock_max_retries, mock_sleep):
+    mock_max_retries.return_value = 3
+    statuses = iter([503, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), json={"ip": "1.2.3.4"})
+
+    async def run() -> httpx.Response:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        mock_get_async_client.return_value = (client, asyncio.Semaphore(2))
+        try:
+            return await async_http_get("https://api.ipify.org", params={"format": "json"})
+        finally:
+            await client.aclose()
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.json() == {"ip": "1.2.3.4"}
+    mock_sleep.assert_called_once()
+
+
+@patch("server.app.utils.http_client.time.sleep")
+@patch("server.app.utils.http_client.get_http_max_retries")
+@patch("server.app.utils.http_client.get_session")
+def test_http_get_fails_fast_when_circuit_is_open(mock_get_session, mock_max_retries, mock_sleep):
+    mock_max_retries.return_value = 0
+    session = MagicMock()
+    session.request.side_effect = requests.ConnectTimeout("timeout")
+    mock_get_session.return_value = session
+    breaker = get_circuit_breaker("stat.ripe.net")
+
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(requests.ConnectTimeout):
+            http_get("https://stat.ripe.net/data/prefix-overview/data.json")
+    assert breaker.state == OPEN
+    session.reset_mock()
+    with pytest.raises(CircuitOpenError):
+        http_get("https://stat.ripe.net/data/prefix-overview/data.json")
+    session.request.assert_not_called()
+    # other hosts are not affected, and a client error does not count as a failure
+    session.request.side_effect = None
+    session.request.return_value = make_response(404)
+    assert http_get("https://atlas.ripe.net/api/v2/measurements/1/").status_code == 404
+    assert get_circuit_breaker("atlas.ripe.net").state == CLOSED
+
+
+@patch("server.app.utils.http_client.get_http_max_retries")
+@patch("server.app.utils.http_client.get_async_client")
+def test_async_http_get_cancelled_trial(mock_get_async_client, mock_max_retries):
+    mock_max_retries.return_value = 0
+    breaker = get_circuit_breaker("api.ipify.org")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    # the recovery timeout passed
+    breaker._opened_at -= breaker.recovery_timeout_s
+
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    async def run() -> None:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(slow_handler))
+        mock_get_async_client.return_value = (client, asyncio.Semaphore(2))
+        try:
+            task = asyncio.create_task(async_http_get("https://api.ipify.org"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    # the cancelled trial does not keep the breaker half-open forever
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
@@ -1,11 +1,26 @@
+import asyncio
 from ipaddress import IPv4Address, IPv6Address
 from unittest.mock import patch, MagicMock, mock_open
+import dns.resolver
+import dns.rdatatype
 import pytest
 from fastapi import HTTPException, Request
 
+from server.app.models.CustomError import CircuitOpenError
 from server.app.utils.load_config_data import get_mask_ipv4, get_mask_ipv6
 from server.app.utils.ip_utils import ref_id_to_ip_or_name, get_ip_family, get_area_of_ip, get_ip_network_details, \
-    ip_to_str, is_this_ip_anycast, randomize_ip, get_server_ip_if_possible, is_private_ip, client_ip_fetch
+    ip_to_str, is_this_ip_anycast, randomize_ip, get_server_ip_if_possible, is_private_ip, client_ip_fetch, \
+    get_server_ip_from_ipify, client_ip_fetch_async, try_converting_ip, try_converting_ip_to_domain_name, \
+    get_server_ip, get_vantage_point, get_vantage_point_if_possible, forget_vantage_points, \
+    check_vantage_point_network, run_vantage_point_refresher, detect_server_ip, get_server_ip_from_ipify_async
+from server.app.utils.dns_cache import invalidate_dns_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_dns_cache():
+    invalidate_dns_cache()
+    yield
+    invalidate_dns_cache()
 
 
 def test_ip_to_str():
@@ -262,3 +277,202 @@ def test_randomize_ip_not_ip():
     ip = "no ip"
     res = randomize_ip(ip)
     assert res is None
+
+
+@patch("server.app.utils.ip_utils._last_ipify_ips", new_callable=dict)
+@patch("server.app.utils.ip_utils.http_get")
+def test_get_server_ip_from_ipify_uses_last_ip_when_unavailable(mock_http_get, mock_last_ips):
+    mock_http_get.return_value.json.return_value = {"ip": "83.25.24.10"}
+    assert get_server_ip_from_ipify(4) == IPv4Address("83.25.24.10")
+    assert mock_http_get.call_args[0][0] == "https://api.ipify.org"
+    # ipify is down (or its circuit breaker is open), so we use the last IP it gave us
+    mock_http_get.side_effect = CircuitOpenError("api.ipify.org is temporarily unavailable")
+    assert get_server_ip_from_ipify(4) == IPv4Address("83.25.24.10")
+    assert get_server_ip_from_ipify(6) is None
+
+
+@patch("server.app.utils.ip_utils._last_ipify_ips", new_callable=dict)
+@patch("server.app.utils.ip_utils.async_http_get")
+def test_get_server_ip_from_ipify_async(mock_http_get, mock_last_ips):
+    mock_http_get.return_value = MagicMock()
+    mock_http_get.return_value.json.return_value = {"ip": "2a06:93c0::24"}
+    assert asyncio.run(get_server_ip_from_ipify_async(6)) == IPv6Address("2a06:93c0::24")
+    assert mock_http_get.call_args[0][0] == "https://api6.ipify.org"
+    mock_http_get.side_effect = CircuitOpenError("api6.ipify.org is temporarily unavailable")
+    assert asyncio.run(get_server_ip_from_ipify_async(6)) == IPv6Address("2a06:93c0::24")
+    assert asyncio.run(get_server_ip_from_ipify_async(4)) is None
+
+
+def make_dns_answer(records: list[str], ttl: int = 300):
+    answer = MagicMock()
+    answer.__getitem__.side_effect = lambda i: records[i]
+    answer.__iter__.side_effect = lambda: iter(records)
+    answer.rrset.ttl = ttl
+    return answer
+
+
+def fake_dns(records: dict):
+    # (name, record type) -> records, a missing name does not exist
+    async def resolve(name, rdtype, lifetime=None):
+        key = (str(name).rstrip("."), dns.rdatatype.to_text(dns.rdatatype.RdataType.make(rdtype)))
+        if key not in records:
+            raise dns.resolver.NXDOMAIN()
+        return make_dns_answer(records[key])
+    return resolve
+
+
+CLIENT_DNS = {
+    ("10.24.25.83.in-addr.arpa", "PTR"): ["host.example.com."],
+    ("host.example.com", "A"): ["83.25.24.10"],
+    ("host.example.com", "AAAA"): ["2a06:93c0::24"],
+}
+
+
+@patch("server.app.utils.ip_utils.dns.asyncresolver.resolve")
+def test_try_converting_ip_cached(mock_resolve):
+    mock_resolve.side_effect = fake_dns(CLIENT_DNS)
+    assert try_converting_ip("83.25.24.10", 6) == "2a06:93c0::24"
+    assert mock_resolve.call_count == 3
+    # the next requests of this client do not need any DNS query
+    assert try_converting_ip("83.25.24.10", 6) == "2a06:93c0::24"
+    assert asyncio.run(client_ip_fetch_async(make_request("83.25.24.10"), 6)) == "2a06:93c0::24"
+    assert mock_resolve.call_count == 3
+
+
+def make_request(ip: str):
+    mock_request = MagicMock()
+    mock_request.headers.get.return_value = ip
+    return mock_request
+
+
+@patch("server.app.utils.ip_utils.dns.asyncresolver.resolve")
+def test_try_converting_ip_without_ptr_cached(mock_resolve):
+    mock_resolve.side_effect = fake_dns({})
+    assert try_converting_ip("83.25.24.11", 6) == "83.25.24.11"
+    assert try_converting_ip("83.25.24.11", 6) == "83.25.24.11"
+    # the missing PTR record is remembered
+    mock_resolve.assert_called_once()
+
+
+@patch("server.app.utils.ip_utils.dns.asyncresolver.resolve")
+def test_try_converting_ip_not_forward_confirmed(mock_resolve):
+    # the PTR record points to a name that does not point back to the client
+    mock_resolve.side_effect = fake_dns({("10.24.25.83.in-addr.arpa", "PTR"): ["victim.example.com."],
+                                         ("victim.example.com", "A"): ["99.1.2.3"],
+                                         ("victim.example.com", "AAAA"): ["2a06:93c0::99"]})
+    assert try_converting_ip("83.25.24.10", 6) == "83.25.24.10"
+    assert try_converting_ip(None, 6) is None
+
+
+@patch("server.app.utils.ip_utils.dns.asyncresolver.resolve")
+def test_try_converting_ip_dns_failure_not_cached(mock_resolve):
+    mock_resolve.side_effect = dns.resolver.LifetimeTimeout(timeout=3, errors=[])
+    assert try_converting_ip("83.25.24.10", 6) == "83.25.24.10"
+    mock_resolve.side_effect = fake_dns(CLIENT_DNS)
+    assert try_converting_ip("83.25.24.10", 6) == "2a06:93c0::24"
+
+
+@patch("server.app.utils.ip_utils.get_server_ip")
+@patch("server.app.utils.ip_utils.dns.asyncresolver.resolve")
+def test_client_ip_fetch_async(mock_resolve, mock_server_ip):
+    mock_resolve.side_effect = fake_dns(CLIENT_DNS)
+    mock_server_ip.return_value = "3.4.5.6"
+    assert asyncio.run(client_ip_fetch_async(make_request("83.25.24.10"), 4)) == "83.25.24.10"
+    assert asyncio.run(client_ip_fetch_async(make_request("192.168.0.1"), 4)) == "3.4.5.6"
+    mock_resolve.assert_not_called()
+    mock_server_ip.side_effect = Exception("fail")
+    with pytest.raises(HTTPException):
+        asyncio.run(client_ip_fetch_async(make_request("192.168.0.1"), 4))
+
+
+@patch("server.app.utils.ip_utils.dns.asyncresolver.resolve")
+def test_try_converting_ip_to_domain_name(mock_resolve):
+    mock_resolve.side_effect = fake_dns(CLIENT_DNS)
+    assert try_converting_ip_to_domain_name("83.25.24.10") == "host.example.com"
+    assert try_converting_ip_to_domain_name("83.25.24.10") == "host.example.com"
+    assert try_converting_ip_to_domain_name("83.25.24.99") == "83.25.24.99"
+    assert mock_resolve.call_count == 2
+
+
+@pytest.fixture
+def vantage_point_network():
+    forget_vantage_points()
+    with patch("server.app.utils.ip_utils.get_local_ip") as mock_local_ip, \
+            patch("server.app.utils.ip_utils.get_server_ip_from_ipify") as mock_ipify, \
+            patch("server.app.utils.ip_utils.get_server_ip_from_ipify_async") as mock_ipify_async, \
+            patch("server.app.utils.ip_utils.get_asn_for_ip") as mock_asn, \
+            patch("server.app.utils.ip_utils.get_country_for_ip") as mock_country, \
+            patch("server.app.utils.ip_utils.get_coordinates_for_ip") as mock_coordinates:
+        mock_local_ip.side_effect = lambda ip_type: "83.25.24.10" if ip_type == 4 else None
+        mock_ipify.return_value = None
+        mock_ipify_async.return_value = None
+        mock_asn.return_value = "1136"
+        mock_country.return_value = "NL"
+        mock_coordinates.return_value = (52.0, 4.3)
+        yield mock_local_ip, mock_ipify
+    forget_vantage_points()
+
+
+def test_detect_server_ip():
+    assert detect_server_ip(4, "83.25.24.10") == IPv4Address("83.25.24.10")
+    with patch("server.app.utils.ip_utils.get_server_ip_from_ipify") as mock_ipify:
+        mock_ipify.return_value = IPv4Address("83.25.24.11")
+        # a private address (behind a NAT) or no address: ask ipify
+        assert detect_server_ip(4, "192.168.0.2") == IPv4Address("83.25.24.11")
+        assert detect_server_ip(4, None) == IPv4Address("83.25.24.11")
+
+
+def test_get_vantage_point_from_memory(vantage_point_network):
+    mock_local_ip, mock_ipify = vantage_point_network
+    vantage_point = get_vantage_point(4)
+    assert vantage_point.ip == IPv4Address("83.25.24.10")
+    assert (vantage_point.asn, vantage_point.country_code, vantage_point.coordinates) == ("1136", "NL", (52.0, 4.3))
+    for _ in range(5):
+        assert get_server_ip(4) == IPv4Address("83.25.24.10")
+    # the socket was opened once
+    assert mock_local_ip.call_count == 1
+    # no IPv6: the other type is used
+    assert get_server_ip(6) is None
+    assert get_vantage_point_if_possible(6).ip == IPv4Address("83.25.24.10")
+    mock_ipify.assert_called_once_with(6)
+
+
+def test_get_vantage_point_expires(vantage_point_network):
+    mock_local_ip, _ = vantage_point_network
+    with patch("server.app.utils.ip_utils.time.monotonic") as mock_time:
+        mock_time.return_value = 1000.0
+        get_vantage_point(4)
+        mock_time.return_value = 1599.0
+        get_vantage_point(4)
+        assert mock_local_ip.call_count == 1
+        # too old (the refresher is not running)
+        mock_time.return_value = 1600.0
+        get_vantage_point(4)
+        assert mock_local_ip.call_count == 2
+
+
+def test_check_vantage_point_network(vantage_point_network):
+    mock_local_ip, _ = vantage_point_network
+    get_vantage_point(4)
+    assert check_vantage_point_network() is False
+    # a new network
+    mock_local_ip.side_effect = lambda ip_type: "83.25.99.10" if ip_type == 4 else None
+    assert check_vantage_point_network() is True
+    assert get_server_ip(4) == IPv4Address("83.25.99.10")
+
+
+@patch("server.app.utils.ip_utils.get_vantage_point_network_check_interval_s")
+def test_run_vantage_point_refresher(mock_interval, vantage_point_network):
+    mock_interval.return_value = 0.01
+
+    async def run_for_a_while():
+        task = asyncio.create_task(run_vantage_point_refresher())
+        await asyncio.sleep(0.2)
+        task.cancel()
+    asyncio.run(run_for_a_while())
+    mock_local_ip, mock_ipify = vantage_point_network
+    # both IP types were found when it started (without a public IPv6 address, ipify was asked with the async client),
+    # and then the network was checked
+    assert get_server_ip(4) == IPv4Address("83.25.24.10")
+    assert mock_local_ip.call_count > 2
+    mock_ipify.assert_not_called()
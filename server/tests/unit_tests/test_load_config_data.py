@@ -11,7 +11,7 @@ def test_load_config(mock):
 
 
 @patch("server.app.utils.load_config_data.Path.exists")
-@patch("server.app.utils.load_config_data.get_right_ntp_nts_binary_tool_for_your_os")
+@patch("server.app.utils.load_config_data.resolve_ntp_nts_binary_tool")
 @patch("server.app.utils.load_config_data.check_geolite_account_id_and_key")
 @patch("server.app.utils.load_config_data.get_max_mind_path_asn")
 @patch("server.app.utils.load_config_data.get_max_mind_path_country")
@@ -75,6 +75,8 @@ def test_verify_if_config_is_set(mock_ripe_account_email, mock_ripe_api_token, m
     mock_ripe_packets_per_probe.assert_called_once()
     mock_ripe_number_of_probes_per_measurement.assert_called_once()
     mock_ripe_server_timeout.assert_called_once()
+    # the tool can be compiled when the server starts
+    mock_get_binary.assert_called_once_with(build_if_missing=True)
 
 
 @patch("server.app.utils.load_config_data.os.getenv")
@@ -438,6 +440,65 @@ def test_get_edns_timeout_s_boundaries(mock_config):
     assert get_edns_timeout_s() == 0
 
 
+# edns edns_hedge_delay_s
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_edns_hedge_delay_s_ok(mock_config):
+    mock_config["edns"] = {"edns_hedge_delay_s": 0.2}
+    assert get_edns_hedge_delay_s() == 0.2
+    mock_config["edns"] = {"edns_hedge_delay_s": 0}
+    assert get_edns_hedge_delay_s() == 0
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_edns_hedge_delay_s_errors(mock_config):
+    with pytest.raises(ValueError, match="edns section is missing"):
+        get_edns_hedge_delay_s()
+    mock_config["edns"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="edns 'edns_hedge_delay_s' is missing"):
+        get_edns_hedge_delay_s()
+    mock_config["edns"] = {"edns_hedge_delay_s": "yes"}
+    with pytest.raises(ValueError, match="edns 'edns_hedge_delay_s' must be a 'float' or an 'int' in s"):
+        get_edns_hedge_delay_s()
+    mock_config["edns"] = {"edns_hedge_delay_s": -0.1}
+    with pytest.raises(ValueError, match="edns 'edns_hedge_delay_s' cannot be negative"):
+        get_edns_hedge_delay_s()
+
+
+# edns dns_cache_*
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_dns_cache_ttls(mock_config):
+    mock_config["edns"] = {"dns_cache_max_ttl_s": 300, "dns_cache_negative_ttl_s": 60.5, "dns_cache_default_ttl_s": 0}
+    assert get_dns_cache_max_ttl_s() == 300
+    assert get_dns_cache_negative_ttl_s() == 60.5
+    assert get_dns_cache_default_ttl_s() == 0
+    for getter, key in ((get_dns_cache_max_ttl_s, "dns_cache_max_ttl_s"),
+                        (get_dns_cache_negative_ttl_s, "dns_cache_negative_ttl_s"),
+                        (get_dns_cache_default_ttl_s, "dns_cache_default_ttl_s")):
+        mock_config["edns"] = {key: "yes"}
+        with pytest.raises(ValueError, match=f"edns '{key}' must be a 'float' or an 'int' in s"):
+            getter()
+        mock_config["edns"] = {key: -1}
+        with pytest.raises(ValueError, match=f"edns '{key}' cannot be negative"):
+            getter()
+        mock_config["edns"] = {}
+        with pytest.raises(ValueError, match=f"edns '{key}' is missing"):
+            getter()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_dns_cache_max_entries(mock_config):
+    with pytest.raises(ValueError, match="edns section is missing"):
+        get_dns_cache_max_entries()
+    mock_config["edns"] = {"dns_cache_max_entries": 10}
+    assert get_dns_cache_max_entries() == 10
+    mock_config["edns"] = {"dns_cache_max_entries": 1.5}
+    with pytest.raises(ValueError, match="edns 'dns_cache_max_entries' must be an 'int'"):
+        get_dns_cache_max_entries()
+    mock_config["edns"] = {"dns_cache_max_entries": 0}
+    with pytest.raises(ValueError, match="edns 'dns_cache_max_entries' must be > 0"):
+        get_dns_cache_max_entries()
+
+
 # ripe_atlas timeout_per_probe_ms
 @patch("server.app.utils.load_config_data.config", new_callable=dict)
 def test_get_ripe_timeout_per_probe_ms_ok(mock_config):
@@ -596,6 +657,396 @@ def test_get_ripe_server_timeout_boundaries(mock_config):
     assert get_ripe_server_timeout() == 60
 
 
+# ripe_atlas batch_window_ms
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_batch_window_ms_ok(mock_config):
+    mock_config["ripe_atlas"] = {"batch_window_ms": 200}
+    assert get_ripe_batch_window_ms() == 200
+    mock_config["ripe_atlas"] = {"batch_window_ms": 0}
+    assert get_ripe_batch_window_ms() == 0
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_batch_window_ms_missing(mock_config):
+    with pytest.raises(ValueError, match="ripe_atlas section is missing"):
+        get_ripe_batch_window_ms()
+    mock_config["ripe_atlas"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="ripe_atlas 'batch_window_ms' is missing"):
+        get_ripe_batch_window_ms()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_batch_window_ms_wrong_value(mock_config):
+    mock_config["ripe_atlas"] = {"batch_window_ms": "yes"}
+    with pytest.raises(ValueError, match="ripe_atlas 'batch_window_ms' must be a 'float' or an 'int' in ms"):
+        get_ripe_batch_window_ms()
+    mock_config["ripe_atlas"] = {"batch_window_ms": -1}
+    with pytest.raises(ValueError, match="ripe_atlas 'batch_window_ms' cannot be negative"):
+        get_ripe_batch_window_ms()
+
+
+# ripe_atlas max_definitions_per_batch
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_max_definitions_per_batch_ok(mock_config):
+    mock_config["ripe_atlas"] = {"max_definitions_per_batch": 20}
+    assert get_ripe_max_definitions_per_batch() == 20
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_max_definitions_per_batch_missing(mock_config):
+    with pytest.raises(ValueError, match="ripe_atlas section is missing"):
+        get_ripe_max_definitions_per_batch()
+    mock_config["ripe_atlas"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="ripe_atlas 'max_definitions_per_batch' is missing"):
+        get_ripe_max_definitions_per_batch()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_max_definitions_per_batch_wrong_value(mock_config):
+    mock_config["ripe_atlas"] = {"max_definitions_per_batch": 2.5}
+    with pytest.raises(ValueError, match="ripe_atlas 'max_definitions_per_batch' must be an 'int'"):
+        get_ripe_max_definitions_per_batch()
+    mock_config["ripe_atlas"] = {"max_definitions_per_batch": 0}
+    with pytest.raises(ValueError, match="ripe_atlas 'max_definitions_per_batch' must be > 0"):
+        get_ripe_max_definitions_per_batch()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_probes_cache_ttl_s_ok(mock_config):
+    mock_config["ripe_atlas"] = {"probes_cache_ttl_s": 3600}
+    assert get_ripe_probes_cache_ttl_s() == 3600
+    mock_config["ripe_atlas"] = {"probes_cache_ttl_s": 0}
+    assert get_ripe_probes_cache_ttl_s() == 0
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_probes_cache_ttl_s_missing(mock_config):
+    with pytest.raises(ValueError, match="ripe_atlas section is missing"):
+        get_ripe_probes_cache_ttl_s()
+    mock_config["ripe_atlas"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="ripe_atlas 'probes_cache_ttl_s' is missing"):
+        get_ripe_probes_cache_ttl_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_probes_cache_ttl_s_wrong_value(mock_config):
+    mock_config["ripe_atlas"] = {"probes_cache_ttl_s": "1h"}
+    with pytest.raises(ValueError, match="ripe_atlas 'probes_cache_ttl_s' must be a 'float' or an 'int' in s"):
+        get_ripe_probes_cache_ttl_s()
+    mock_config["ripe_atlas"] = {"probes_cache_ttl_s": -1}
+    with pytest.raises(ValueError, match="ripe_atlas 'probes_cache_ttl_s' cannot be negative"):
+        get_ripe_probes_cache_ttl_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_probes_cache_max_entries_ok(mock_config):
+    mock_config["ripe_atlas"] = {"probes_cache_max_entries": 10000}
+    assert get_ripe_probes_cache_max_entries() == 10000
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_probes_cache_max_entries_missing(mock_config):
+    with pytest.raises(ValueError, match="ripe_atlas section is missing"):
+        get_ripe_probes_cache_max_entries()
+    mock_config["ripe_atlas"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="ripe_atlas 'probes_cache_max_entries' is missing"):
+        get_ripe_probes_cache_max_entries()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ripe_probes_cache_max_entries_wrong_value(mock_config):
+    mock_config["ripe_atlas"] = {"probes_cache_max_entries": 2.5}
+    with pytest.raises(ValueError, match="ripe_atlas 'probes_cache_max_entries' must be an 'int'"):
+        get_ripe_probes_cache_max_entries()
+    mock_config["ripe_atlas"] = {"probes_cache_max_entries": 0}
+    with pytest.raises(ValueError, match="ripe_atlas 'probes_cache_max_entries' must be > 0"):
+        get_ripe_probes_cache_max_entries()
+
+
+# http_client connect_timeout_s
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_connect_timeout_s_ok(mock_config):
+    mock_config["http_client"] = {"connect_timeout_s": 3}
+    assert get_http_connect_timeout_s() == 3
+    mock_config["http_client"] = {"connect_timeout_s": 2.5}
+    assert get_http_connect_timeout_s() == 2.5
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_connect_timeout_s_missing_section(mock_config):
+    with pytest.raises(ValueError, match="http_client section is missing"):
+        get_http_connect_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_connect_timeout_s_missing_var(mock_config):
+    mock_config["http_client"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="http_client 'connect_timeout_s' is missing"):
+        get_http_connect_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_connect_timeout_s_different_type(mock_config):
+    mock_config["http_client"] = {"connect_timeout_s": "yes"}
+    with pytest.raises(ValueError, match="http_client 'connect_timeout_s' must be a 'float' or an 'int' in s"):
+        get_http_connect_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_connect_timeout_s_boundaries(mock_config):
+    mock_config["http_client"] = {"connect_timeout_s": 0}
+    with pytest.raises(ValueError, match="http_client 'connect_timeout_s' must be > 0"):
+        get_http_connect_timeout_s()
+
+
+# http_client read_timeout_s
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_read_timeout_s_ok(mock_config):
+    mock_config["http_client"] = {"read_timeout_s": 10}
+    assert get_http_read_timeout_s() == 10
+    mock_config["http_client"] = {"read_timeout_s": 0.5}
+    assert get_http_read_timeout_s() == 0.5
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_read_timeout_s_missing_section(mock_config):
+    with pytest.raises(ValueError, match="http_client section is missing"):
+        get_http_read_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_read_timeout_s_missing_var(mock_config):
+    mock_config["http_client"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="http_client 'read_timeout_s' is missing"):
+        get_http_read_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_read_timeout_s_different_type(mock_config):
+    mock_config["http_client"] = {"read_timeout_s": "yes"}
+    with pytest.raises(ValueError, match="http_client 'read_timeout_s' must be a 'float' or an 'int' in s"):
+        get_http_read_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_read_timeout_s_boundaries(mock_config):
+    mock_config["http_client"] = {"read_timeout_s": -1}
+    with pytest.raises(ValueError, match="http_client 'read_timeout_s' must be > 0"):
+        get_http_read_timeout_s()
+
+
+# http_client max_retries
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_retries_ok(mock_config):
+    mock_config["http_client"] = {"max_retries": 3}
+    assert get_http_max_retries() == 3
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_retries_missing_section(mock_config):
+    with pytest.raises(ValueError, match="http_client section is missing"):
+        get_http_max_retries()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_retries_missing_var(mock_config):
+    mock_config["http_client"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="http_client 'max_retries' is missing"):
+        get_http_max_retries()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_retries_different_type(mock_config):
+    mock_config["http_client"] = {"max_retries": 1.5}
+    with pytest.raises(ValueError, match="http_client 'max_retries' must be an 'int'"):
+        get_http_max_retries()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_retries_boundaries(mock_config):
+    mock_config["http_client"] = {"max_retries": -1}
+    with pytest.raises(ValueError, match="http_client 'max_retries' cannot be negative"):
+        get_http_max_retries()
+    mock_config["http_client"] = {"max_retries": 0}
+    assert get_http_max_retries() == 0
+
+
+# http_client backoff_base_s
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_backoff_base_s_ok(mock_config):
+    mock_config["http_client"] = {"backoff_base_s": 1}
+    assert get_http_backoff_base_s() == 1
+    mock_config["http_client"] = {"backoff_base_s": 0.25}
+    assert get_http_backoff_base_s() == 0.25
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_backoff_base_s_missing_section(mock_config):
+    with pytest.raises(ValueError, match="http_client section is missing"):
+        get_http_backoff_base_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_backoff_base_s_missing_var(mock_config):
+    mock_config["http_client"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="http_client 'backoff_base_s' is missing"):
+        get_http_backoff_base_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_backoff_base_s_different_type(mock_config):
+    mock_config["http_client"] = {"backoff_base_s": "yes"}
+    with pytest.raises(ValueError, match="http_client 'backoff_base_s' must be a 'float' or an 'int' in s"):
+        get_http_backoff_base_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_backoff_base_s_boundaries(mock_config):
+    mock_config["http_client"] = {"backoff_base_s": -0.5}
+    with pytest.raises(ValueError, match="http_client 'backoff_base_s' cannot be negative"):
+        get_http_backoff_base_s()
+    mock_config["http_client"] = {"backoff_base_s": 0}
+    assert get_http_backoff_base_s() == 0
+
+
+# http_client pool_size_per_host
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_pool_size_per_host_ok(mock_config):
+    mock_config["http_client"] = {"pool_size_per_host": 10}
+    assert get_http_pool_size_per_host() == 10
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_pool_size_per_host_missing_section(mock_config):
+    with pytest.raises(ValueError, match="http_client section is missing"):
+        get_http_pool_size_per_host()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_pool_size_per_host_missing_var(mock_config):
+    mock_config["http_client"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="http_client 'pool_size_per_host' is missing"):
+        get_http_pool_size_per_host()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_pool_size_per_host_different_type(mock_config):
+    mock_config["http_client"] = {"pool_size_per_host": "10"}
+    with pytest.raises(ValueError, match="http_client 'pool_size_per_host' must be an 'int'"):
+        get_http_pool_size_per_host()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_pool_size_per_host_boundaries(mock_config):
+    mock_config["http_client"] = {"pool_size_per_host": 0}
+    with pytest.raises(ValueError, match="http_client 'pool_size_per_host' must be > 0"):
+        get_http_pool_size_per_host()
+
+
+# http_client max_concurrent_requests_per_host
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_concurrent_requests_per_host_ok(mock_config):
+    mock_config["http_client"] = {"max_concurrent_requests_per_host": 8}
+    assert get_http_max_concurrent_requests_per_host() == 8
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_concurrent_requests_per_host_missing_section(mock_config):
+    with pytest.raises(ValueError, match="http_client section is missing"):
+        get_http_max_concurrent_requests_per_host()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_concurrent_requests_per_host_missing_var(mock_config):
+    mock_config["http_client"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="http_client 'max_concurrent_requests_per_host' is missing"):
+        get_http_max_concurrent_requests_per_host()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_concurrent_requests_per_host_different_type(mock_config):
+    mock_config["http_client"] = {"max_concurrent_requests_per_host": 2.0}
+    with pytest.raises(ValueError, match="http_client 'max_concurrent_requests_per_host' must be an 'int'"):
+        get_http_max_concurrent_requests_per_host()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_http_max_concurrent_requests_per_host_boundaries(mock_config):
+    mock_config["http_client"] = {"max_concurrent_requests_per_host": 0}
+    with pytest.raises(ValueError, match="http_client 'max_concurrent_requests_per_host' must be > 0"):
+        get_http_max_concurrent_requests_per_host()
+
+
+# circuit_breaker failure_threshold
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_failure_threshold_ok(mock_config):
+    mock_config["circuit_breaker"] = {"failure_threshold": 5}
+    assert get_circuit_breaker_failure_threshold() == 5
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_failure_threshold_missing_section(mock_config):
+    with pytest.raises(ValueError, match="circuit_breaker section is missing"):
+        get_circuit_breaker_failure_threshold()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_failure_threshold_missing_var(mock_config):
+    mock_config["circuit_breaker"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="circuit_breaker 'failure_threshold' is missing"):
+        get_circuit_breaker_failure_threshold()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_failure_threshold_different_type(mock_config):
+    mock_config["circuit_breaker"] = {"failure_threshold": 2.5}
+    with pytest.raises(ValueError, match="circuit_breaker 'failure_threshold' must be an 'int'"):
+        get_circuit_breaker_failure_threshold()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_failure_threshold_boundaries(mock_config):
+    mock_config["circuit_breaker"] = {"failure_threshold": 0}
+    with pytest.raises(ValueError, match="circuit_breaker 'failure_threshold' must be > 0"):
+        get_circuit_breaker_failure_threshold()
+
+
+# circuit_breaker recovery_timeout_s
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_recovery_timeout_s_ok(mock_config):
+    mock_config["circuit_breaker"] = {"recovery_timeout_s": 30}
+    assert get_circuit_breaker_recovery_timeout_s() == 30
+    mock_config["circuit_breaker"] = {"recovery_timeout_s": 0.5}
+    assert get_circuit_breaker_recovery_timeout_s() == 0.5
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_recovery_timeout_s_missing_section(mock_config):
+    with pytest.raises(ValueError, match="circuit_breaker section is missing"):
+        get_circuit_breaker_recovery_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_recovery_timeout_s_missing_var(mock_config):
+    mock_config["circuit_breaker"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="circuit_breaker 'recovery_timeout_s' is missing"):
+        get_circuit_breaker_recovery_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_recovery_timeout_s_different_type(mock_config):
+    mock_config["circuit_breaker"] = {"recovery_timeout_s": "yes"}
+    with pytest.raises(ValueError, match="circuit_breaker 'recovery_timeout_s' must be a 'float' or an 'int' in s"):
+        get_circuit_breaker_recovery_timeout_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_circuit_breaker_recovery_timeout_s_boundaries(mock_config):
+    mock_config["circuit_breaker"] = {"recovery_timeout_s": 0}
+    with pytest.raises(ValueError, match="circuit_breaker 'recovery_timeout_s' must be > 0"):
+        get_circuit_breaker_recovery_timeout_s()
+
+
 # bgp tools
 @patch("server.app.utils.load_config_data.config", new_callable=dict)
 def test_get_anycast_prefixes_v4_url(mock_config):
@@ -684,3 +1135,245 @@ def test_check_geolite_account_id_and_key(mock):
     # with pytest.raises(ValueError):
     #     get_ripe_account_email()
     # mock.assert_called_with("ripe_account_email")
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ntp_nts_tool_request_timeout_s(mock_config):
+    with pytest.raises(ValueError, match="ntp_nts_tool section is missing"):
+        get_ntp_nts_tool_request_timeout_s()
+    mock_config["ntp_nts_tool"] = {"blabla": 5}
+    with pytest.raises(ValueError, match="ntp_nts_tool 'request_timeout_s' is missing"):
+        get_ntp_nts_tool_request_timeout_s()
+    mock_config["ntp_nts_tool"] = {"request_timeout_s": "30"}
+    with pytest.raises(ValueError, match="ntp_nts_tool 'request_timeout_s' must be a 'float' or an 'int' in s"):
+        get_ntp_nts_tool_request_timeout_s()
+    mock_config["ntp_nts_tool"] = {"request_timeout_s": 0}
+    with pytest.raises(ValueError, match="ntp_nts_tool 'request_timeout_s' must be > 0"):
+        get_ntp_nts_tool_request_timeout_s()
+    mock_config["ntp_nts_tool"] = {"request_timeout_s": 30}
+    assert get_ntp_nts_tool_request_timeout_s() == 30
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ntp_versions_cache_ttl_s(mock_config):
+    mock_config["ntp"] = {"ntp_versions_cache_ttl_s": 0}
+    assert get_ntp_versions_cache_ttl_s() == 0
+    mock_config["ntp"] = {"ntp_versions_cache_ttl_s": 60.5}
+    assert get_ntp_versions_cache_ttl_s() == 60.5
+    mock_config["ntp"] = {"ntp_versions_cache_ttl_s": -1}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_cache_ttl_s' cannot be negative"):
+        get_ntp_versions_cache_ttl_s()
+    mock_config["ntp"] = {"ntp_versions_cache_ttl_s": "1h"}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_cache_ttl_s' must be a 'float' or an 'int' in s"):
+        get_ntp_versions_cache_ttl_s()
+    mock_config["ntp"] = {}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_cache_ttl_s' is missing"):
+        get_ntp_versions_cache_ttl_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ntp_versions_failure_cache_ttl_s(mock_config):
+    mock_config["ntp"] = {"ntp_versions_failure_cache_ttl_s": 0}
+    assert get_ntp_versions_failure_cache_ttl_s() == 0
+    mock_config["ntp"] = {"ntp_versions_failure_cache_ttl_s": 30.5}
+    assert get_ntp_versions_failure_cache_ttl_s() == 30.5
+    mock_config["ntp"] = {"ntp_versions_failure_cache_ttl_s": -1}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_failure_cache_ttl_s' cannot be negative"):
+        get_ntp_versions_failure_cache_ttl_s()
+    mock_config["ntp"] = {"ntp_versions_failure_cache_ttl_s": "1m"}
+    with pytest.raises(ValueError,
+                       match="ntp 'ntp_versions_failure_cache_ttl_s' must be a 'float' or an 'int' in s"):
+        get_ntp_versions_failure_cache_ttl_s()
+    mock_config["ntp"] = {}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_failure_cache_ttl_s' is missing"):
+        get_ntp_versions_failure_cache_ttl_s()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ntp_versions_cache_max_entries(mock_config):
+    mock_config["ntp"] = {"ntp_versions_cache_max_entries": 100}
+    assert get_ntp_versions_cache_max_entries() == 100
+    mock_config["ntp"] = {"ntp_versions_cache_max_entries": 0}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_cache_max_entries' must be > 0"):
+        get_ntp_versions_cache_max_entries()
+    mock_config["ntp"] = {"ntp_versions_cache_max_entries": 1.5}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_cache_max_entries' must be an 'int'"):
+        get_ntp_versions_cache_max_entries()
+    del mock_config["ntp"]
+    with pytest.raises(ValueError, match="ntp section is missing"):
+        get_ntp_versions_cache_max_entries()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ntp_versions_native_probe(mock_config):
+    mock_config["ntp"] = {"ntp_versions_native_probe": False}
+    assert get_ntp_versions_native_probe() is False
+    mock_config["ntp"] = {"ntp_versions_native_probe": "yes"}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_native_probe' must be a 'bool'"):
+        get_ntp_versions_native_probe()
+    mock_config["ntp"] = {}
+    with pytest.raises(ValueError, match="ntp 'ntp_versions_native_probe' is missing"):
+        get_ntp_versions_native_probe()
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_measurement_cache_settings(mock_config):
+    mock_config["ntp"] = {"measurement_cache_ttl_s": 0, "measurement_cache_default_max_age_s": 2.5,
+                          "measurement_cache_max_entries": 100}
+    assert get_measurement_cache_ttl_s() == 0
+    assert get_measurement_cache_default_max_age_s() == 2.5
+    assert get_measurement_cache_max_entries() == 100
+    mock_config["ntp"] = {"measurement_cache_ttl_s": -1, "measurement_cache_default_max_age_s": "10",
+                          "measurement_cache_max_entries": 0}
+    with pytest.raises(ValueError, match="ntp 'measurement_cache_ttl_s' cannot be negative"):
+        get_measurement_cache_ttl_s()
+    with pytest.raises(ValueError, match="ntp 'measurement_cache_default_max_age_s' must be a 'float' or an 'int'"):
+        get_measurement_cache_default_max_age_s()
+    with pytest.raises(ValueError, match="ntp 'measurement_cache_max_entries' must be > 0"):
+        get_measurement_cache_max_entries()
+    mock_config["ntp"] = {}
+    with pytest.raises(ValueError, match="ntp 'measurement_cache_ttl_s' is missing"):
+        get_measurement_cache_ttl_s()
+
+
+@pytest.fixture
+def forget_tool():
+    forget_ntp_nts_binary_tool()
+    yield
+    forget_ntp_nts_binary_tool()
+
+
+@patch("server.app.utils.load_config_data.get_ntp_nts_tool_expected_version")
+@patch("server.app.utils.load_config_data.get_ntp_nts_tool_expected_sha256")
+@patch("server.app.utils.load_config_data.get_ntp_nts_binary_path_for_your_os")
+def test_resolve_ntp_nts_binary_tool_once(mock_path, mock_sha256, mock_version, tmp_path, forget_tool):
+    binary = tmp_path / "ntpnts"
+    binary.write_text("#!/bin/sh\necho 'ntpnts v1.2.0'\n")
+    binary.chmod(0o755)
+    mock_path.return_value = binary
+    mock_sha256.return_value = hashlib.sha256(binary.read_bytes()).hexdigest()
+    mock_version.return_value = "v1.2.0" if os.name != "nt" else ""
+    assert resolve_ntp_nts_binary_tool() == binary
+    # the requests use the path found at startup
+    assert get_right_ntp_nts_binary_tool_for_your_os() == binary
+    assert get_right_ntp_nts_binary_tool_for_your_os() == binary
+    mock_path.assert_called_once()
+
+
+@patch("server.app.utils.load_config_data.build_ntp_nts_binary_tool")
+@patch("server.app.utils.load_config_data.get_ntp_nts_binary_path_for_your_os")
+def test_ntp_nts_binary_tool_missing(mock_path, mock_build, tmp_path, forget_tool):
+    mock_path.return_value = tmp_path / "missing"
+    with pytest.raises(RuntimeError, match="was not found"):
+        get_right_ntp_nts_binary_tool_for_your_os()
+    # the error is remembered, the tool is not looked for (or compiled) again
+    with pytest.raises(RuntimeError, match="was not found"):
+        get_right_ntp_nts_binary_tool_for_your_os()
+    mock_path.assert_called_once()
+    mock_build.assert_not_called()
+
+
+@patch("server.app.utils.load_config_data.get_ntp_nts_tool_expected_version")
+@patch("server.app.utils.load_config_data.get_ntp_nts_tool_expected_sha256")
+@patch("server.app.utils.load_config_data.get_ntp_nts_binary_path_for_your_os")
+def test_ntp_nts_binary_tool_wrong_checksum(mock_path, mock_sha256, mock_version, tmp_path, forget_tool):
+    binary = tmp_path / "ntpnts"
+    binary.write_bytes(b"binary")
+    mock_path.return_value = binary
+    mock_sha256.return_value = "0" * 64
+    mock_version.return_value = ""
+    with pytest.raises(RuntimeError, match="checksum"):
+        resolve_ntp_nts_binary_tool()
+    with pytest.raises(RuntimeError, match="checksum"):
+        get_right_ntp_nts_binary_tool_for_your_os()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="uses a shell script as the tool")
+@patch("server.app.utils.load_config_data.get_ntp_nts_tool_expected_version")
+@patch("server.app.utils.load_config_data.get_ntp_nts_tool_expected_sha256")
+def test_verify_ntp_nts_binary_tool_wrong_version(mock_sha256, mock_version, tmp_path):
+    binary = tmp_path / "ntpnts"
+    binary.write_text("#!/bin/sh\necho 'ntpnts v1.1.0'\n")
+    binary.chmod(0o755)
+    mock_sha256.return_value = ""
+    mock_version.return_value = "v1.2.0"
+    with pytest.raises(RuntimeError, match="expected v1.2.0"):
+        verify_ntp_nts_binary_tool(binary)
+
+
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_ntp_nts_tool_expected_sha256_and_version(mock_config):
+    mock_config["ntp_nts_tool"] = {"expected_sha256": "", "expected_version": ""}
+    assert get_ntp_nts_tool_expected_sha256() == ""
+    assert get_ntp_nts_tool_expected_version() == ""
+    mock_config["ntp_nts_tool"] = {"expected_sha256": "ab" * 32, "expected_version": "v1"}
+    assert get_ntp_nts_tool_expected_sha256() == "ab" * 32
+    assert get_ntp_nts_tool_expected_version() == "v1"
+    mock_config["ntp_nts_tool"] = {"expected_sha256": "abc", "expected_version": 1}
+    with pytest.raises(ValueError, match="ntp_nts_tool 'expected_sha256' must be empty or 64 hexadecimal characters"):
+        get_ntp_nts_tool_expected_sha256()
+    with pytest.raises(ValueError, match="ntp_nts_tool 'expected_version' must be a 'str'"):
+        get_ntp_nts_tool_expected_version()
+    mock_config["ntp_nts_tool"] = {}
+    with pytest.raises(ValueError, match="ntp_nts_tool 'expected_sha256' is missing"):
+        get_ntp_nts_tool_expected_sha256()
+
+
+# history
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_history_settings(mock_config):
+    for getter, key in ((get_history_max_page_size, "max_page_size"),
+                        (get_history_stream_chunk_size, "stream_chunk_size")):
+        mock_config.clear()
+        with pytest.raises(ValueError, match="history section is missing"):
+            getter()
+        mock_config["history"] = {}
+        with pytest.raises(ValueError, match=f"history '{key}' is missing"):
+            getter()
+        mock_config["history"] = {key: 2.5}
+        with pytest.raises(ValueError, match=f"history '{key}' must be an 'int'"):
+            getter()
+        mock_config["history"] = {key: 0}
+        with pytest.raises(ValueError, match=f"history '{key}' must be > 0"):
+            getter()
+        mock_config["history"] = {key: 500}
+        assert getter() == 500
+
+
+# rollups
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_rollups_settings(mock_config):
+    with pytest.raises(ValueError, match="rollups section is missing"):
+        get_rollups_compaction_interval_s()
+    mock_config["rollups"] = {"compaction_interval_s": 0, "compaction_batch_size": 1.5}
+    with pytest.raises(ValueError, match="rollups 'compaction_interval_s' must be > 0"):
+        get_rollups_compaction_interval_s()
+    with pytest.raises(ValueError, match="rollups 'compaction_batch_size' must be an 'int'"):
+        get_rollups_compaction_batch_size()
+    mock_config["rollups"] = {"compaction_interval_s": 30, "compaction_batch_size": 100}
+    assert get_rollups_compaction_interval_s() == 30
+    assert get_rollups_compaction_batch_size() == 100
+    mock_config["rollups"] = {}
+    with pytest.raises(ValueError, match="rollups 'compaction_batch_size' is missing"):
+        get_rollups_compaction_batch_size()
+
+
+# vantage_point
+@patch("server.app.utils.load_config_data.config", new_callable=dict)
+def test_get_vantage_point_intervals(mock_config):
+    for getter, key in ((get_vantage_point_refresh_interval_s, "refresh_interval_s"),
+                        (get_vantage_point_network_check_interval_s, "network_check_interval_s")):
+        mock_config.clear()
+        with pytest.raises(ValueError, match="vantage_point section is missing"):
+            getter()
+        mock_config["vantage_point"] = {}
+        with pytest.raises(ValueError, match=f"vantage_point '{key}' is missing"):
+            getter()
+        mock_config["vantage_point"] = {key: "10"}
+        with pytest.raises(ValueError, match=f"vantage_point '{key}' must be a 'float' or an 'int' in s"):
+            getter()
+        mock_config["vantage_point"] = {key: 0}
+        with pytest.raises(ValueError, match=f"vantage_point '{key}' must be > 0"):
+            getter()
+        mock_config["vantage_point"] = {key: 2.5}
+        assert getter() == 2.5
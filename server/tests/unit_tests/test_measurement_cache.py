@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+import pytest
+
+from server.app.models.CustomError import InputError
+from server.app.utils.measurement_cache import get_measurement_cache_key, get_measurement_max_age, \
+    get_settings_hash, get_cached_measurement, cache_measurement, invalidate_measurement_cache
+from server.app.utils.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def empty_measurement_cache():
+    invalidate_measurement_cache()
+    yield
+    invalidate_measurement_cache()
+
+
+def test_get_measurement_max_age():
+    assert get_measurement_max_age(None) == 10
+    assert get_measurement_max_age(0) == 0
+    assert get_measurement_max_age(2.5) == 2.5
+    with pytest.raises(InputError):
+        get_measurement_max_age(-1)
+
+
+def test_get_settings_hash():
+    assert get_settings_hash({"a": 1, "b": [1, 2]}) == get_settings_hash({"b": [1, 2], "a": 1})
+    assert get_settings_hash({"a": 1}) != get_settings_hash({"a": 2})
+
+
+def test_get_measurement_cache_key():
+    key = get_measurement_cache_key("live", "Pool.ntp.org ", 4, "83.25.24.10", {})
+    # the clients of the same network share the results
+    assert key == get_measurement_cache_key("live", "pool.ntp.org", 4, "83.25.24.200", {})
+    assert key != get_measurement_cache_key("live", "pool.ntp.org", 4, "83.25.99.10", {})
+    assert key != get_measurement_cache_key("live", "pool.ntp.org", 6, "83.25.24.10", {})
+    assert key != get_measurement_cache_key("full", "pool.ntp.org", 4, "83.25.24.10", {})
+    assert key != get_measurement_cache_key("live", "pool.ntp.org", 4, "83.25.24.10", {"measurement_type": "nts"})
+    # no client IP
+    assert get_measurement_cache_key("live", "pool.ntp.org", 4, None, {})[3] == ""
+
+
+def test_cached_measurement_max_age():
+    clock = FakeClock()
+    cache = TTLCache("measurements", 60, 100, clock=clock)
+    key = get_measurement_cache_key("live", "pool.ntp.org", 4, "83.25.24.10", {})
+    with patch("server.app.utils.measurement_cache.get_measurement_cache", return_value=cache):
+        assert get_cached_measurement(key, 10) is None
+        result = [{"offset": 0.1}]
+        cache_measurement(key, result)
+        result[0]["offset"] = 5
+        clock.now += 4
+        assert get_cached_measurement(key, 10) == (4, [{"offset": 0.1}])
+        # 0 forces a new measurement
+        assert get_cached_measurement(key, 0) is None
+        clock.now += 7
+        assert get_cached_measurement(key, 10) is None
+        assert get_cached_measurement(key, 30) == (11, [{"offset": 0.1}])
+        # the callers get their own copy
+        get_cached_measurement(key, 30)[1][0]["offset"] = 7
+        assert get_cached_measurement(key, 30)[1] == [{"offset": 0.1}]
+
+
+def test_cache_measurement_disabled():
+    cache = TTLCache("measurements", 0, 100)
+    key = get_measurement_cache_key("live", "pool.ntp.org", 4, "83.25.24.10", {})
+    with patch("server.app.utils.measurement_cache.get_measurement_cache", return_value=cache):
+        cache_measurement(key, [1])
+        assert get_cached_measurement(key, 10) is None
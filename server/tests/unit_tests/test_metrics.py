@@ -0,0 +1,26 @@
+from server.app.utils.metrics import increment_counter, set_gauge, observe_duration, get_metric_value, \
+    get_metrics_snapshot, render_metrics_text, reset_metrics
+
+
+def test_counters_and_gauges():
+    reset_metrics()
+    increment_counter("requests_total", {"host": "atlas.ripe.net", "status": "200"})
+    increment_counter("requests_total", {"status": "200", "host": "atlas.ripe.net"}, 2)
+    set_gauge("state", 2, {"name": "x"})
+    set_gauge("state", 1, {"name": "x"})
+    observe_duration("request", 0.5)
+    observe_duration("request", 1.5)
+
+    assert get_metric_value("requests_total", {"host": "atlas.ripe.net", "status": "200"}) == 3
+    assert get_metric_value("state", {"name": "x"}) == 1
+    assert get_metric_value("request_seconds_sum") == 2.0
+    assert get_metric_value("request_seconds_count") == 2
+    assert get_metric_value("missing") == 0
+
+    snapshot = get_metrics_snapshot()
+    assert snapshot['requests_total{host="atlas.ripe.net",status="200"}'] == 3
+    assert snapshot['state{name="x"}'] == 1
+    assert 'request_seconds_count 2\n' in render_metrics_text()
+
+    reset_metrics()
+    assert get_metrics_snapshot() == {}
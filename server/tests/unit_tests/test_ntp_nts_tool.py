@@ -0,0 +1,51 @@
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+from server.app.utils.metrics import get_metric_value
+from server.app.utils.ntp_nts_tool import run_ntp_nts_tool, TIMEOUT_EXIT_CODE
+
+# a fake ntp-nts tool that prints its arguments
+FAKE_TOOL = f"""#!{sys.executable}
+import json, sys
+print(json.dumps({{"args": sys.argv[1:]}}))
+sys.exit(1 if sys.argv[1] == "fail" else 0)
+"""
+
+
+def write_tool(tmp_path, content: str) -> str:
+    path = tmp_path / "ntpnts_fake"
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="the fake tool is a script")
+def test_run_ntp_nts_tool(tmp_path):
+    tool = write_tool(tmp_path, FAKE_TOOL)
+    result = run_ntp_nts_tool(tool, ["nts", "time.cloudflare.com", "-t", "7"], timeout_s=5)
+    assert result.returncode == 0
+    assert json.loads(result.stdout) == {"args": ["nts", "time.cloudflare.com", "-t", "7"]}
+    # the runs are counted in the metrics of the shared subprocess runner
+    before = get_metric_value("subprocess_exits_total", {"tool": "ntp-nts-tool", "exit_code": "1"}) or 0
+    assert run_ntp_nts_tool(tool, ["fail"], timeout_s=5).returncode == 1
+    assert get_metric_value("subprocess_exits_total", {"tool": "ntp-nts-tool", "exit_code": "1"}) == before + 1
+
+
+@pytest.mark.skipif(os.name == "nt", reason="the fake tool is a script")
+def test_run_ntp_nts_tool_timeout(tmp_path):
+    tool = write_tool(tmp_path, f"#!{sys.executable}\nimport time\ntime.sleep(10)\n")
+    before = get_metric_value("ntp_nts_tool_timeouts_total") or 0
+    result = run_ntp_nts_tool(tool, ["nts", "time.cloudflare.com"], timeout_s=0.3)
+    assert result.returncode == TIMEOUT_EXIT_CODE
+    assert "did not finish" in result.stdout
+    assert get_metric_value("ntp_nts_tool_timeouts_total") == before + 1
+
+
+def test_run_ntp_nts_tool_missing_binary(tmp_path):
+    result = run_ntp_nts_tool(str(tmp_path / "missing"), ["ntpv4", "time.cloudflare.com"], timeout_s=5)
+    assert result.returncode == 1
+    assert "Could not start" in result.stdout
@@ -0,0 +1,137 @@
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from server.app.models.CustomError import NtsError
+from server.app.utils.analyze_ntp_versions import analyse_ntp_version_response
+from server.app.utils.ntp_versions_probe import build_ntp_version_request, build_ntp_version_result, \
+    parse_ntpv5_header, probe_ntp_versions, EF_NTPV5_DRAFT_IDENTIFICATION, NTP_HEADER_LENGTH, parse_ntp_header, \
+    encode_extension_field, iter_extension_fields, ntp_time_now
+
+
+class FakeNtpServer:
+    """
+    A local NTP server that answers NTPv2-v4 requests with the same version, NTPv5 requests with NTPv4
+    (like most servers), and ignores NTPv1 requests.
+    """
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.requests: list[bytes] = []
+        self._stop = False
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stop:
+            try:
+                request, address = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            self.requests.append(request)
+            version = (request[0] >> 3) & 0x7
+            if version == 1:
+                continue
+            threading.Timer(self.delay_s, self._answer, (request, address, min(version, 4))).start()
+
+    def _answer(self, request: bytes, address, version: int):
+        now = ntp_time_now()
+        transmit = struct.unpack_from(">Q", request, 40)[0]
+        response = struct.pack(">BBbbII4sQQQQ", (version << 3) | 4, 2, 6, -20, 1 << 16, 1 << 15,
+                               socket.inet_aton("10.0.0.1"), now, transmit, now, now)
+        self.sock.sendto(response, address)
+
+    def close(self):
+        self._stop = True
+        self._thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def ntp_server():
+    server = FakeNtpServer()
+    yield server
+    server.close()
+
+
+def test_build_ntp_version_request():
+    packet = build_ntp_version_request(3, 12345)
+    header = parse_ntp_header(packet)
+    assert len(packet) == 48
+    assert (header["version"], header["mode"], header["transmit_time"]) == (3, 3, 12345)
+    # NTPv1 has no mode
+    assert parse_ntp_header(build_ntp_version_request(1, 1))["mode"] == 0
+
+
+def test_extension_fields():
+    ef = encode_extension_field(EF_NTPV5_DRAFT_IDENTIFICATION, b"abc")
+    assert len(ef) == 16  # padded to the minimum length
+    fields = iter_extension_fields(bytes(NTP_HEADER_LENGTH) + ef + encode_extension_field(0x0204, b"x" * 20))
+    assert [(t, o) for t, o, _ in fields] == [(EF_NTPV5_DRAFT_IDENTIFICATION, 48), (0x0204, 64)]
+    assert fields[1][2] == b"x" * 20
+    with pytest.raises(NtsError):
+        iter_extension_fields(bytes(NTP_HEADER_LENGTH) + struct.pack(">HH", 0x0204, 100) + b"x" * 8)
+
+
+def test_build_ntpv5_request():
+    packet = build_ntp_version_request(5, 12345, client_cookie=777, ntpv5_draft="draft-ietf-ntp-ntpv5-05")
+    header = parse_ntpv5_header(packet)
+    assert (header["version"], header["mode"], header["client_cookie"], header["transmit_time"]) == (5, 3, 777, 12345)
+    fields = iter_extension_fields(packet)
+    assert fields[0][0] == EF_NTPV5_DRAFT_IDENTIFICATION
+    assert fields[0][2].rstrip(b"\x00") == b"draft-ietf-ntp-ntpv5-05"
+    assert len(build_ntp_version_request(5, 1)) == 48
+
+
+def test_build_ntp_version_result_ntpv5():
+    response = struct.pack(">BBbbBBHIIQQQQ", (5 << 3) | 4, 1, 4, -20, 0, 0, 0, 0, 0, 99, 777, 2 << 32, 2 << 32)
+    result = build_ntp_version_result(5, response, 1 << 32, 3 << 32)
+    assert result["version"] == 5
+    assert result["client_cookie"] == 777
+    assert result["server_cookie"] == 99
+    assert result["rtt"] == 2
+    assert result["offset"] == 0
+    assert analyse_ntp_version_response(result, "ntpv5")[0] == "100"
+
+
+def test_build_ntp_version_result_ntpv1():
+    response = struct.pack(">BBbbII4sQQQQ", 1 << 3, 1, 4, -20, 0, 0, b"GPS\x00", 0, 0, 0, 0)
+    assert "version" not in build_ntp_version_result(1, response, 0, 0)
+    response = struct.pack(">BBbbII4sQQQQ", (4 << 3) | 4, 1, 4, -20, 0, 0, b"GPS\x00", 0, 0, 0, 0)
+    assert build_ntp_version_result(1, response, 0, 0)["version"] == 4
+
+
+def test_probe_ntp_versions(ntp_server):
+    results = probe_ntp_versions("127.0.0.1", [1, 2, 3, 4, 5], timeout_s=0.5, port=ntp_server.port)
+    assert "error" in results[1]
+    assert [results[v]["version"] for v in (2, 3, 4)] == [2, 3, 4]
+    assert results[4]["ref_id"] == int.from_bytes(socket.inet_aton("10.0.0.1"), "big")
+    assert results[4]["stratum"] == 2
+    assert results[5]["version"] == 4
+    assert analyse_ntp_version_response(results[4], "ntpv4") == ("100", "It supports NTPv4.")
+    assert analyse_ntp_version_response(results[5], "ntpv5")[0] == "50"
+    assert analyse_ntp_version_response(results[1], "ntpv1")[0] == "0"
+
+
+def test_probe_ntp_versions_concurrently():
+    server = FakeNtpServer(delay_s=0.3)
+    try:
+        start = time.monotonic()
+        results = probe_ntp_versions("127.0.0.1", [2, 3, 4], timeout_s=2, port=server.port)
+        # the versions are probed at the same time, not one after the other
+        assert time.monotonic() - start < 0.8
+        assert all("error" not in results[v] for v in (2, 3, 4))
+    finally:
+        server.close()
+
+
+def test_probe_ntp_versions_unresolvable():
+    results = probe_ntp_versions("does-not-exist.invalid", [4], timeout_s=2)
+    assert "Could not resolve" in results[4]["error"]
@@ -5,7 +5,7 @@ import pytest
 from server.app.dtos.AdvancedSettings import AdvancedSettings
 from server.app.models.CustomError import InputError
 from server.app.utils.nts_check import parse_nts_response_to_dict, did_ke_performed_on_different_ip, \
-    perform_nts_measurement_domain_name, perform_nts_measurement_ip
+    perform_nts_measurement_domain_name, perform_nts_measurement_ip, run_nts_measurement
 
 nts_example = {
       "Host": "time.cloudflare.com",
@@ -41,7 +41,7 @@ def test_parse_nts_response_to_dict():
         parse_nts_response_to_dict("{a 2, ff}")
 
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_domain_name_success(mock_run, mock_binary_tool):
     settings = AdvancedSettings()
     settings.wanted_ip_type = -1
@@ -54,7 +54,7 @@ def test_perform_nts_measurement_domain_name_success(mock_run, mock_binary_tool)
     assert result["Host"] == "time.cloudflare.com"
 
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_domain_name_success6(mock_run, mock_binary_tool):
     settings = AdvancedSettings()
     settings.wanted_ip_type = 6
@@ -69,7 +69,7 @@ def test_perform_nts_measurement_domain_name_success6(mock_run, mock_binary_tool
 
 # simulate errors
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_domain_name_no_tool_fail(mock_run, mock_binary_tool):
     settings = AdvancedSettings()
     settings.wanted_ip_type = -1
@@ -80,7 +80,7 @@ def test_perform_nts_measurement_domain_name_no_tool_fail(mock_run, mock_binary_
     assert str(result["NTS analysis"]).find("NTS test could not be performed (binary tool not available)") != -1
 
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_domain_name_KEfails(mock_run, mock_binary_tool):
     settings = AdvancedSettings()
     settings.wanted_ip_type = -1
@@ -92,7 +92,7 @@ def test_perform_nts_measurement_domain_name_KEfails(mock_run, mock_binary_tool)
 
 @patch("server.app.utils.nts_check.parse_nts_response_to_dict")
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_domain_name_read_binary_fails_on_retCode0(mock_run, mock_binary_tool, mock_parse):
     settings = AdvancedSettings()
     settings.wanted_ip_type = -1
@@ -105,7 +105,7 @@ def test_perform_nts_measurement_domain_name_read_binary_fails_on_retCode0(mock_
 
 @patch("server.app.utils.nts_check.parse_nts_response_to_dict")
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_domain_name_read_binary_fails_on_retCode6(mock_run, mock_binary_tool, mock_parse):
     settings = AdvancedSettings()
     settings.wanted_ip_type = 6
@@ -119,7 +119,7 @@ def test_perform_nts_measurement_domain_name_read_binary_fails_on_retCode6(mock_
 
 @patch("server.app.utils.nts_check.sanitize_string")
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_domain_name_read_binary_fails_on_retCode2(mock_run, mock_binary_tool, mock_sanitize):
     settings = AdvancedSettings()
     settings.wanted_ip_type = 6
@@ -157,7 +157,7 @@ nts_ip_example = {
     }
 # nts on specific IP
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_ip_success(mock_run, mock_binary_tool):
     mock_run.return_value = MagicMock(returncode=0, stdout=json.dumps(nts_ip_example))
     mock_binary_tool.return_value = "/tool/path/nts_binary"
@@ -169,7 +169,7 @@ def test_perform_nts_measurement_ip_success(mock_run, mock_binary_tool):
 
 @patch("server.app.utils.nts_check.did_ke_performed_on_different_ip")
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_ip_successKESwitch(mock_run, mock_binary_tool, mock_did_ke):
     mock_run.return_value = MagicMock(returncode=0, stdout=json.dumps(nts_ip_example))
     mock_binary_tool.return_value = "/tool/path/nts_binary"
@@ -181,7 +181,7 @@ def test_perform_nts_measurement_ip_successKESwitch(mock_run, mock_binary_tool,
     assert result["Host"] == "162.159.200.123" # the original host
 
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_ip_fail_no_tool(mock_run, mock_binary_tool):
     mock_run.return_value = MagicMock(returncode=0, stdout=json.dumps(nts_ip_example))
     mock_binary_tool.side_effect = Exception("not found")
@@ -190,7 +190,7 @@ def test_perform_nts_measurement_ip_fail_no_tool(mock_run, mock_binary_tool):
     assert str(result["NTS analysis"]).find("NTS test could not be performed (binary tool not available)") != -1
 
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_ip_fail_measurement1(mock_run, mock_binary_tool):
     mock_run.return_value = MagicMock(returncode=1, stdout="  KE failed  ")
     mock_binary_tool.return_value = "/tool/path/nts_binary"
@@ -200,7 +200,7 @@ def test_perform_nts_measurement_ip_fail_measurement1(mock_run, mock_binary_tool
 
 @patch("server.app.utils.nts_check.parse_nts_response_to_dict")
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_ip_parsing_tool_response_fail_on_success(mock_run, mock_binary_tool, mock_parse):
     mock_run.return_value = MagicMock(returncode=0, stdout=json.dumps(nts_ip_example))
     mock_binary_tool.return_value = "/tool/path/nts_binary"
@@ -211,7 +211,7 @@ def test_perform_nts_measurement_ip_parsing_tool_response_fail_on_success(mock_r
 
 @patch("server.app.utils.nts_check.sanitize_string")
 @patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
-@patch("server.app.utils.nts_check.subprocess.run")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
 def test_perform_nts_measurement_ip_parsing_tool_response_fail_on_fail2(mock_run, mock_binary_tool, mock_sanitize):
     mock_run.return_value = MagicMock(returncode=2, stdout=json.dumps(nts_ip_example))
     mock_binary_tool.return_value = "/tool/path/nts_binary"
@@ -227,3 +227,16 @@ def test_did_ke_performed_on_different_ip():
     d = {"Measured server IP": "123.23.23.23"}
     assert did_ke_performed_on_different_ip("223.23.23.23", d) == (True, "123.23.23.23")
     assert did_ke_performed_on_different_ip("123.23.23.23", d) == (False, "123.23.23.23")
+
+
+@patch("server.app.utils.nts_check.get_right_ntp_nts_binary_tool_for_your_os")
+@patch("server.app.utils.nts_check.run_ntp_nts_tool")
+def test_run_nts_measurement(mock_run, mock_binary_tool):
+    mock_binary_tool.return_value = "/tool/path/nts_binary"
+    mock_run.return_value = MagicMock(returncode=0)
+    assert run_nts_measurement("time.cloudflare.com", -1, 7) is mock_run.return_value
+    mock_run.assert_called_once_with("/tool/path/nts_binary", ["nts", "time.cloudflare.com", "-t", "7"])
+
+    mock_run.reset_mock()
+    assert run_nts_measurement("time.cloudflare.com", 4, 7) is mock_run.return_value
+    mock_run.assert_called_once_with("/tool/path/nts_binary", ["nts", "time.cloudflare.com", "-ipv", "4", "-t", "7"])
@@ -219,49 +219,41 @@ def test_convert_ntp_response_to_measurement_exception(mock_server_ip):
     assert convert_ntp_response_to_measurement(mock_response, "something else", "ntp server", 4) is None
 
 
-@patch("server.app.utils.perform_measurements.requests.post")
+@patch("server.app.utils.perform_measurements.submit_ripe_measurement")
 @patch("server.app.utils.perform_measurements.get_request_settings")
 def test_perform_ripe_measurement_domain_name_normal(mock_settings, mock_post):
     mock_settings.return_value = ({"Authorization": "Key"}, {"some": 36, "other": "other"})
-    mock_response = MagicMock()
-    mock_response.json.return_value = {"measurements": [85439]}
-    mock_post.return_value = mock_response
+    mock_post.return_value = 85439
 
     result = perform_ripe_measurement_domain_name("time.apple.com", "2.3.4.5", 4, 10)
 
     assert result == 85439
 
 
-@patch("server.app.utils.perform_measurements.requests.post")
+@patch("server.app.utils.perform_measurements.submit_ripe_measurement")
 @patch("server.app.utils.perform_measurements.get_request_settings")
 def test_perform_ripe_measurement_domain_name_normal_want_ipv6(mock_settings, mock_post):
     mock_settings.return_value = ({"Authorization": "Key"}, {"some": 36, "other": "other"})
-    mock_response = MagicMock()
-    mock_response.json.return_value = {"measurements": [85439]}
-    mock_post.return_value = mock_response
+    mock_post.return_value = 85439
 
     result = perform_ripe_measurement_domain_name("time.apple.com", "2.3.4.5", 6, 10)
 
     assert result == 85439
 
-@patch("server.app.utils.perform_measurements.requests.post")
+@patch("server.app.utils.perform_measurements.submit_ripe_measurement")
 @patch("server.app.utils.perform_measurements.get_request_settings")
 def test_perform_ripe_measurement_domain_name_try_catch(mock_settings, mock_post):
     mock_settings.return_value = ({"Authorization": "Key"}, {"somefield": 3, "other": "no"})
-    mock_response = MagicMock()
-    mock_response.json.return_value = {"error": "not found"}
-    mock_post.return_value = mock_response
+    mock_post.side_effect = RipeMeasurementError("not found")
 
     with pytest.raises(RipeMeasurementError, match="not found"):
         perform_ripe_measurement_domain_name("time.apple.com", "2.3.4.5", 4, 10)
 
-    mock_response2 = MagicMock()
-    mock_response2.json.return_value = {"something": "error, not found"}
-    mock_post.return_value = mock_response2
+    mock_post.side_effect = RipeMeasurementError("Ripe measurement failed:'measurements'")
     with pytest.raises(RipeMeasurementError, match=r"Ripe measurement failed:.*"):
         perform_ripe_measurement_domain_name("time.apple.com", "2.3.4.5", 4, 10)
 
-@patch("server.app.utils.perform_measurements.requests.post")
+@patch("server.app.utils.perform_measurements.submit_ripe_measurement")
 @patch("server.app.utils.perform_measurements.get_request_settings")
 def test_perform_ripe_measurement_domain_name_exceptions(mock_settings, mock_post):
     # invalid "probes requested"
@@ -276,37 +268,31 @@ def test_perform_ripe_measurement_domain_name_exceptions(mock_settings, mock_pos
         perform_ripe_measurement_domain_name("ntp.pool.org", "blabla", 4, 3)
 
 
-@patch("server.app.utils.perform_measurements.requests.post")
+@patch("server.app.utils.perform_measurements.submit_ripe_measurement")
 @patch("server.app.utils.perform_measurements.get_request_settings")
 def test_perform_ripe_measurement_ip_normal(mock_settings, mock_post):
     mock_settings.return_value = ({"Authorization": "Key"}, {"somefield": 3, "other": "no"})
-    mock_response = MagicMock()
-    mock_response.json.return_value = {"measurements": [12412]}
-    mock_post.return_value = mock_response
+    mock_post.return_value = 12412
 
     result = perform_ripe_measurement_ip("123.45.67.89", "2.3.4.5", 10)
 
     assert result == 12412
 
-@patch("server.app.utils.perform_measurements.requests.post")
+@patch("server.app.utils.perform_measurements.submit_ripe_measurement")
 @patch("server.app.utils.perform_measurements.get_request_settings")
 def test_perform_ripe_measurement_ip_try_catch(mock_settings, mock_post):
     mock_settings.return_value = ({"Authorization": "Key"}, {"somefield": 3, "other": "no"})
-    mock_response = MagicMock()
-    mock_response.json.return_value = {"error": "not found"}
-    mock_post.return_value = mock_response
+    mock_post.side_effect = RipeMeasurementError("not found")
 
     with pytest.raises(RipeMeasurementError, match="not found"):
         perform_ripe_measurement_ip("123.45.67.89", "2.3.4.5", 10)
 
-    mock_response2 = MagicMock()
-    mock_response2.json.return_value = {"something": "error, not found"}
-    mock_post.return_value = mock_response2
+    mock_post.side_effect = RipeMeasurementError("Ripe measurement failed:'measurements'")
     with pytest.raises(RipeMeasurementError, match=r"Ripe measurement failed:.*"):
         perform_ripe_measurement_ip("123.45.67.89", "2.3.4.5", 10)
 
 
-@patch("server.app.utils.perform_measurements.requests.post")
+@patch("server.app.utils.perform_measurements.submit_ripe_measurement")
 @patch("server.app.utils.perform_measurements.get_request_settings")
 def test_perform_ripe_measurement_ip_exceptions(mock_settings, mock_post):
     # invalid "probes requested"
@@ -391,3 +377,69 @@ def test_get_request_settings_exception(mock_ripe_api_token, mock_packets, mock_
     mock_timeout.side_effect = ValueError("env problem")
     with pytest.raises(ValueError):
         get_request_settings(4, "ntp.server.com", "74.22.34.47", 28)
+
+
+@pytest.fixture
+def empty_ntp_versions_cache():
+    invalidate_ntp_versions_cache()
+    yield
+    invalidate_ntp_versions_cache()
+
+
+@patch("server.app.utils.perform_measurements.directly_analyze_all_ntp_versions")
+@patch("server.app.utils.perform_measurements.get_right_ntp_nts_binary_tool_for_your_os")
+def test_analyze_supported_ntp_versions_cached(mock_binary, mock_analyze, empty_ntp_versions_cache):
+    mock_binary.return_value = "/tool/ntpnts"
+    analysis = {}
+    for v in NTP_VERSIONS:
+        analysis.update({v + "_supported_confidence": "100", v + "_analysis": "ok", v + "_m_result": None})
+    mock_analyze.return_value = analysis
+    settings = AdvancedSettings(analyse_all_ntp_versions=True)
+    assert analyze_supported_ntp_versions("1.2.3.4", settings) == analysis
+    assert analyze_supported_ntp_versions("1.2.3.4", settings) == analysis
+    mock_analyze.assert_called_once()
+    # an explicit refresh runs the tool again
+    settings.refresh_ntp_versions = True
+    assert analyze_supported_ntp_versions("1.2.3.4", settings) == analysis
+    assert mock_analyze.call_count == 2
+
+
+@patch("server.app.utils.perform_measurements.get_ntp_versions_native_probe")
+@patch("server.app.utils.perform_measurements.run_tool_on_ntp_version")
+@patch("server.app.utils.perform_measurements.get_right_ntp_nts_binary_tool_for_your_os")
+def test_analyze_supported_ntp_versions_cached_per_version(mock_binary, mock_run, mock_native,
+                                                           empty_ntp_versions_cache):
+    mock_binary.return_value = "/tool/ntpnts"
+    mock_native.return_value = False
+    mock_run.side_effect = lambda server, binary, v, draft: ("100", v + " ok", None)
+    settings = AdvancedSettings(analyse_all_ntp_versions=False, ntp_versions_to_analyze=["ntpv4"])
+    analyze_supported_ntp_versions("1.2.3.4", settings)
+    settings.ntp_versions_to_analyze = ["ntpv3", "ntpv4"]
+    ans = analyze_supported_ntp_versions("1.2.3.4", settings)
+    assert ans["ntpv3_analysis"] == "ntpv3 ok"
+    assert ans["ntpv4_analysis"] == "ntpv4 ok"
+    # NTPv4 was only analysed once
+    assert [c.args[2] for c in mock_run.call_args_list] == ["ntpv4", "ntpv3"]
+
+
+@patch("server.app.utils.perform_measurements.get_right_ntp_nts_binary_tool_for_your_os")
+def test_analyze_supported_ntp_versions_no_tool_not_cached(mock_binary, empty_ntp_versions_cache):
+    mock_binary.side_effect = Exception("no tool")
+    settings = AdvancedSettings(analyse_all_ntp_versions=True)
+    assert "error" in analyze_supported_ntp_versions("1.2.3.4", settings)
+    assert get_cached_ntp_versions_analysis("1.2.3.4", NTP_VERSIONS, "") is None
+
+
+@patch("server.app.utils.perform_measurements.get_ntp_versions_native_probe")
+@patch("server.app.utils.perform_measurements.probe_and_analyze_ntp_versions")
+@patch("server.app.utils.perform_measurements.get_right_ntp_nts_binary_tool_for_your_os")
+def test_analyze_supported_ntp_versions_native_probe(mock_binary, mock_probe, mock_native, empty_ntp_versions_cache):
+    mock_native.return_value = True
+    mock_probe.return_value = {"ntpv4_supported_confidence": "100", "ntpv4_analysis": "ok", "ntpv4_m_result": {}}
+    settings = AdvancedSettings(analyse_all_ntp_versions=False, ntp_versions_to_analyze=["ntpv4"],
+                                refresh_ntp_versions=True)
+    assert analyze_supported_ntp_versions("1.2.3.4", settings) == mock_probe.return_value
+    mock_probe.assert_called_once_with("1.2.3.4", ["ntpv4"], "", False)
+    # the tool is not needed
+    mock_binary.assert_not_called()
+    assert get_cached_ntp_version("1.2.3.4", "ntpv4", "")[1] == ("100", "ok", {})
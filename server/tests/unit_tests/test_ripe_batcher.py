@@ -0,0 +1,169 @@
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from server.app.models.CustomError import RipeMeasurementError
+from server.app.utils.ripe_batcher import get_batch_key, post_ripe_definitions, submit_ripe_measurement, \
+    submit_ripe_definitions
+
+HEADERS = {"Authorization": "Key abc", "Content-Type": "application/json"}
+PROBES = [{"type": "asn", "value": 1136, "requested": 3}]
+
+
+def make_request(target: str, probes=None) -> dict:
+    return {
+        "definitions": [{"type": "ntp", "af": 4, "target": target, "description": f"NTP measurement to {target}"}],
+        "is_oneoff": True,
+        "bill_to": "e@email.com",
+        "probes": probes or PROBES
+    }
+
+
+def make_response(data: dict) -> MagicMock:
+    response = MagicMock()
+    response.json.return_value = data
+    return response
+
+
+def run_concurrently(functions: list) -> list:
+    results: list = [None] * len(functions)
+
+    def run(i: int) -> None:
+        try:
+            results[i] = functions[i]()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(functions))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_get_batch_key():
+    assert get_batch_key(HEADERS, make_request("1.1.1.1")) == get_batch_key(HEADERS, make_request("8.8.8.8"))
+    other_probes = [{"type": "asn", "value": 3333, "requested": 3}]
+    assert get_batch_key(HEADERS, make_request("1.1.1.1")) != get_batch_key(HEADERS, make_request("1.1.1.1", other_probes))
+
+
+@patch("server.app.utils.ripe_batcher.http_post")
+def test_post_ripe_definitions(mock_post):
+    mock_post.return_value = make_response({"measurements": [11, 12]})
+    content = make_request("1.1.1.1")
+    content["definitions"] = content["definitions"] * 2
+    assert post_ripe_definitions(HEADERS, content) == [11, 12]
+
+    mock_post.return_value = make_response({"error": "not found"})
+    with pytest.raises(RipeMeasurementError, match="not found"):
+        post_ripe_definitions(HEADERS, make_request("1.1.1.1"))
+    mock_post.return_value = make_response({"something": "else"})
+    with pytest.raises(RipeMeasurementError, match="Ripe measurement failed:.*"):
+        post_ripe_definitions(HEADERS, make_request("1.1.1.1"))
+    mock_post.return_value = make_response({"measurements": [1, 2]})
+    with pytest.raises(RipeMeasurementError, match="expected 1 measurements, received 2"):
+        post_ripe_definitions(HEADERS, make_request("1.1.1.1"))
+    mock_post.return_value.json.side_effect = ValueError("no json")
+    with pytest.raises(RipeMeasurementError, match="Invalid JSON"):
+        post_ripe_definitions(HEADERS, make_request("1.1.1.1"))
+
+
+@patch("server.app.utils.ripe_batcher.get_ripe_batch_window_ms")
+@patch("server.app.utils.ripe_batcher.http_post")
+def test_submit_without_window(mock_post, mock_window):
+    mock_window.return_value = 0
+    mock_post.return_value = make_response({"measurements": [85439]})
+    assert submit_ripe_measurement(HEADERS, make_request("1.1.1.1")) == 85439
+    mock_post.assert_called_once()
+
+
+@patch("server.app.utils.ripe_batcher.get_ripe_max_definitions_per_batch")
+@patch("server.app.utils.ripe_batcher.get_ripe_batch_window_ms")
+@patch("server.app.utils.ripe_batcher.http_post")
+def test_concurrent_requests_share_one_post(mock_post, mock_window, mock_max):
+    mock_window.return_value = 200
+    mock_max.return_value = 20
+    release_first = threading.Event()
+
+    def answer(url, headers, data):
+        if "9.9.9.9" in data:
+            release_first.wait(5)
+            return make_response({"measurements": [99]})
+        return make_response({"measurements": [100, 200]})
+
+    mock_post.side_effect = answer
+    # the first request is sent at once, the next ones are collected while it is in flight
+    first = threading.Thread(target=submit_ripe_measurement, args=(HEADERS, make_request("9.9.9.9")))
+    first.start()
+    while mock_post.call_count == 0:
+        time.sleep(0.001)
+    results = run_concurrently([
+        lambda: submit_ripe_measurement(HEADERS, make_request("1.1.1.1")),
+        lambda: submit_ripe_measurement(HEADERS, make_request("8.8.8.8")),
+        # the same target with the same probes is measured only once
+        lambda: submit_ripe_measurement(HEADERS, make_request("1.1.1.1")),
+    ])
+    release_first.set()
+    first.join(5)
+    assert mock_post.call_count == 2
+    sent = mock_post.call_args[1]["data"]
+    assert sent.count('"target": "1.1.1.1"') == 1
+    assert sent.count('"target": "8.8.8.8"') == 1
+    first_target = "1.1.1.1" if sent.index("1.1.1.1") < sent.index("8.8.8.8") else "8.8.8.8"
+    expected = {first_target: 100, ("8.8.8.8" if first_target == "1.1.1.1" else "1.1.1.1"): 200}
+    assert results == [expected["1.1.1.1"], expected["8.8.8.8"], expected["1.1.1.1"]]
+
+
+@patch("server.app.utils.ripe_batcher.get_ripe_batch_window_ms")
+@patch("server.app.utils.ripe_batcher.http_post")
+def test_lone_request_is_sent_without_waiting(mock_post, mock_window):
+    mock_window.return_value = 60000  # the test would time out if we waited for the window
+    mock_post.return_value = make_response({"measurements": [85439]})
+    assert submit_ripe_measurement(HEADERS, make_request("1.1.1.1")) == 85439
+    mock_post.assert_called_once()
+
+
+@patch("server.app.utils.ripe_batcher.get_ripe_max_definitions_per_batch")
+@patch("server.app.utils.ripe_batcher.get_ripe_batch_window_ms")
+@patch("server.app.utils.ripe_batcher.http_post")
+def test_full_batch_is_sent_without_waiting(mock_post, mock_window, mock_max):
+    mock_window.return_value = 60000  # the test would time out if we waited for the window
+    mock_max.return_value = 2
+    mock_post.return_value = make_response({"measurements": [1, 2]})
+    content = make_request("1.1.1.1")
+    content["definitions"].append({"type": "ntp", "af": 4, "target": "8.8.8.8"})
+    assert submit_ripe_definitions(HEADERS, content) == [1, 2]
+    mock_post.assert_called_once()
+
+
+@patch("server.app.utils.ripe_batcher.get_ripe_max_definitions_per_batch")
+@patch("server.app.utils.ripe_batcher.get_ripe_batch_window_ms")
+@patch("server.app.utils.ripe_batcher.http_post")
+def test_refused_batch_is_retried_one_by_one(mock_post, mock_window, mock_max):
+    mock_window.return_value = 10
+    mock_max.return_value = 2
+
+    def answer(url, headers, data):
+        if data.count('"target"') > 1:
+            return make_response({"error": {"detail": "one target is invalid"}})
+        if "bad.target" in data:
+            return make_response({"error": "bad.target is invalid"})
+        return make_response({"measurements": [7]})
+
+    mock_post.side_effect = answer
+    content = make_request("1.1.1.1")
+    content["definitions"].append({"type": "ntp", "af": 4, "target": "bad.target"})
+    with pytest.raises(RipeMeasurementError, match="bad.target is invalid"):
+        submit_ripe_definitions(HEADERS, content)
+    assert mock_post.call_count == 3
+
+    mock_post.reset_mock()
+    results = run_concurrently([
+        lambda: submit_ripe_measurement(HEADERS, make_request("1.1.1.1")),
+        lambda: submit_ripe_measurement(HEADERS, make_request("bad.target")),
+    ])
+    assert results[0] == 7
+    assert isinstance(results[1], RipeMeasurementError)
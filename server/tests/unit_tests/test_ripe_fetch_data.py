@@ -373,7 +373,7 @@ MOCK_UNEXPECTED_STRING_RESPONSE = "This is not a list or an error dict."
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_data_from_ripe_measurement(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -391,7 +391,7 @@ def test_get_data_from_ripe_measurement(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_data_from_ripe_measurement_raises_on_error_response(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=400)
@@ -409,7 +409,7 @@ def test_get_data_from_ripe_measurement_raises_on_error_response(mock_get, mock_
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_probe_data_from_ripe_by_id(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -551,7 +551,7 @@ def test_parse_data_from_ripe_measurement_with_no_response(mock_get_probe, mock_
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_scheduled(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -562,7 +562,7 @@ def test_check_all_measurement_scheduled(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_not_scheduled(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -573,7 +573,7 @@ def test_check_all_measurement_not_scheduled(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_probes_error(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -584,7 +584,7 @@ def test_check_all_measurement_probes_error(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_scheduled_error_get(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -596,7 +596,7 @@ def test_check_all_measurement_scheduled_error_get(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -607,7 +607,7 @@ def test_check_all_measurement_done(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_stopped(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -620,7 +620,7 @@ def test_check_all_measurement_done_stopped(mock_get, mock_get_token):
 
 @patch("server.app.utils.ripe_fetch_data.time.time")
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_ongoing(mock_get, mock_get_token, mock_time):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -633,7 +633,7 @@ def test_check_all_measurement_done_ongoing(mock_get, mock_get_token, mock_time)
 
 @patch("server.app.utils.ripe_fetch_data.time.time")
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_timeout(mock_get, mock_get_token, mock_time):
     mock_get_token.return_value = "token"
     mock_time.return_value = 1748876770
@@ -645,7 +645,7 @@ def test_check_all_measurement_done_timeout(mock_get, mock_get_token, mock_time)
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_no_status_name_from_ripe(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -656,7 +656,7 @@ def test_check_all_measurement_done_no_status_name_from_ripe(mock_get, mock_get_
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_error_get(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.return_value = Mock(status_code=200)
@@ -671,7 +671,7 @@ def test_check_all_measurement_done_error_get(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_request_exception(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_get.side_effect = requests.exceptions.ConnectionError("Mocked network error")
@@ -683,7 +683,7 @@ def test_check_all_measurement_done_request_exception(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_http_error(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_response = Mock()
@@ -697,7 +697,7 @@ def test_check_all_measurement_done_http_error(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_check_all_measurement_done_invalid_json(mock_get, mock_get_token):
     mock_get_token.return_value = "token"
     mock_response = Mock()
@@ -713,7 +713,7 @@ def test_check_all_measurement_done_invalid_json(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_data_from_ripe_measurement_network_error(mock_get, mock_get_token):
     """
     Tests if RipeMeasurementError is raised when requests.get encounters a network issue.
@@ -730,7 +730,7 @@ def test_get_data_from_ripe_measurement_network_error(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_data_from_ripe_measurement_http_status_error(mock_get, mock_get_token):
     mock_get_token.return_value = "fake_token"
     mock_response = Mock()
@@ -747,7 +747,7 @@ def test_get_data_from_ripe_measurement_http_status_error(mock_get, mock_get_tok
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_data_from_ripe_measurement_invalid_json(mock_get, mock_get_token):
     mock_get_token.return_value = "fake_token"
     mock_response = Mock()
@@ -764,7 +764,7 @@ def test_get_data_from_ripe_measurement_invalid_json(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_data_from_ripe_measurement_unexpected_json_format_dict(mock_get, mock_get_token):
     mock_get_token.return_value = "fake_token"
     mock_get.return_value = Mock(status_code=200)
@@ -778,7 +778,7 @@ def test_get_data_from_ripe_measurement_unexpected_json_format_dict(mock_get, mo
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_data_from_ripe_measurement_unexpected_json_format_string(mock_get, mock_get_token):
     mock_get_token.return_value = "fake_token"
     mock_get.return_value = Mock(status_code=200)
@@ -792,7 +792,7 @@ def test_get_data_from_ripe_measurement_unexpected_json_format_string(mock_get,
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_probe_data_from_ripe_by_id_network_error(mock_get, mock_get_token):
     mock_get_token.return_value = "fake_token"
     mock_get.side_effect = requests.exceptions.ConnectionError("Network is unreachable")
@@ -806,7 +806,7 @@ def test_get_probe_data_from_ripe_by_id_network_error(mock_get, mock_get_token):
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_probe_data_from_ripe_by_id_http_status_error(mock_get, mock_get_token):
     mock_get_token.return_value = "fake_token"
 
@@ -825,7 +825,7 @@ def test_get_probe_data_from_ripe_by_id_http_status_error(mock_get, mock_get_tok
 
 
 @patch("server.app.utils.ripe_fetch_data.get_ripe_api_token")
-@patch("server.app.utils.ripe_fetch_data.requests.get")
+@patch("server.app.utils.ripe_fetch_data.http_get")
 def test_get_probe_data_from_ripe_by_id_invalid_json(mock_get, mock_get_token):
     mock_get_token.return_value = "fake_token"
     mock_response = Mock()
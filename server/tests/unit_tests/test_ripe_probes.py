@@ -4,10 +4,18 @@ from server.app.utils.ripe_probes import get_random_probes, get_area_probes, get
     get_country_probes, get_best_probes_with_multiple_attributes, get_probes, get_available_probes_asn, \
     get_available_probes_prefix, \
     get_available_probes_country, get_best_probes_matched_by_single_attribute, get_available_probes_asn_and_prefix, \
-    get_available_probes_asn_and_country, get_probes_by_ids, consume_probes
+    get_available_probes_asn_and_country, get_probes_by_ids, consume_probes, invalidate_probes_cache, \
+    get_client_network
 from unittest.mock import patch, MagicMock
 
 
+@pytest.fixture(autouse=True)
+def clean_probes_cache():
+    invalidate_probes_cache()
+    yield
+    invalidate_probes_cache()
+
+
 @patch("server.app.utils.ripe_probes.get_coordinates_for_ip")
 @patch("server.app.utils.ripe_probes.get_probes_by_ids")
 @patch("server.app.utils.ripe_probes.get_best_probes_with_multiple_attributes")
@@ -854,3 +862,85 @@ def test_consume_probes():
     assert (0, {1, 34, 12, 23}) == consume_probes(2, {34, 1}, [12, 23, 67, 67, 900])
     with pytest.raises(InputError):
         consume_probes(-7, {34}, [67, 900])
+
+
+def test_get_client_network():
+    assert get_client_network("80.211.238.247") == "80.211.238.0/24"
+    assert get_client_network("2001:db8:1234:5678::1") == "2001:db8:1234:5600::/56"
+    with pytest.raises(InputError):
+        get_client_network("not an ip")
+
+
+@patch("server.app.utils.ripe_probes.get_probes_catalogue_version")
+@patch("server.app.utils.ripe_probes.select_probes")
+def test_get_probes_is_cached_per_client_network(mock_select, mock_version):
+    mock_version.return_value = (1.0, 1.0, 1.0)
+    mock_select.return_value = [{"type": "asn", "value": "AS15169", "requested": 10}]
+
+    first = get_probes("80.211.238.247", 4, 10)
+    # a client of the same network gets the same probes without selecting them again
+    second = get_probes("80.211.238.12", 4, 10)
+    assert first == second == [{"type": "asn", "value": "AS15169", "requested": 10}]
+    assert mock_select.call_count == 1
+    # the cached list cannot be modified by a caller
+    second[0]["requested"] = 3
+    assert get_probes("80.211.238.12", 4, 10)[0]["requested"] == 10
+
+    # another network, another IP family, another number of probes or custom probes are selected separately
+    get_probes("80.211.239.1", 4, 10)
+    get_probes("80.211.238.247", 6, 10)
+    get_probes("80.211.238.247", 4, 5)
+    get_probes("80.211.238.247", 4, 10, custom_asn="AS3333")
+    get_probes("80.211.238.247", 4, 10, custom_country="nl")
+    assert mock_select.call_count == 6
+    mock_select.assert_called_with("80.211.238.247", 4, 10, None, "NL")
+    # empty custom settings (the defaults of the advanced settings) are the same as no custom settings
+    get_probes("80.211.238.247", 4, 10, custom_asn="", custom_country="")
+    assert mock_select.call_count == 6
+
+
+@patch("server.app.utils.ripe_probes.get_probes_catalogue_version")
+@patch("server.app.utils.ripe_probes.select_probes")
+def test_get_probes_cache_invalidation(mock_select, mock_version):
+    mock_version.return_value = (1.0, 1.0, 1.0)
+    mock_select.return_value = [{"type": "country", "value": "IT", "requested": 10}]
+    get_probes("80.211.238.247", 4, 10)
+    get_probes("80.211.238.247", 4, 10)
+    assert mock_select.call_count == 1
+    # the MaxMind databases were refreshed
+    mock_version.return_value = (2.0, 2.0, 2.0)
+    get_probes("80.211.238.247", 4, 10)
+    assert mock_select.call_count == 2
+    invalidate_probes_cache()
+    get_probes("80.211.238.247", 4, 10)
+    assert mock_select.call_count == 3
+
+
+@patch("server.app.utils.ripe_probes.get_probes_catalogue_version")
+@patch("server.app.utils.ripe_probes.select_probes")
+def test_get_probes_does_not_cache_random_probes(mock_select, mock_version):
+    mock_version.return_value = (1.0, 1.0, 1.0)
+    mock_select.return_value = [get_random_probes(10)]
+    get_probes("80.211.238.247", 4, 10)
+    get_probes("80.211.238.247", 4, 10)
+    assert mock_select.call_count == 2
+
+
+@patch("server.app.utils.ripe_probes.get_best_probes_with_multiple_attributes")
+@patch("server.app.utils.ripe_probes.get_best_probes_matched_by_single_attribute")
+@patch("server.app.utils.ripe_probes.get_ip_network_details")
+@patch("server.app.utils.ripe_probes.get_prefix_from_ip")
+def test_get_probes_with_custom_asn_and_country(mock_get_prefix_from_ip, mock_get_network_details,
+                                                mock_get_best_single, mock_get_multiple_attributes):
+    mock_get_network_details.return_value = ("AS15169", "IT", "North-Central")
+    mock_get_multiple_attributes.return_value = (10, set())
+    mock_get_best_single.return_value = (10, set())
+
+    probes = get_probes("80.211.238.247", 4, 10, custom_asn="AS3333", custom_country="nl")
+    # the prefix of the client is not used, the probes are taken from the custom ASN and country
+    mock_get_prefix_from_ip.assert_not_called()
+    _, kwargs = mock_get_multiple_attributes.call_args
+    assert kwargs["ip_asn"] == "AS3333"
+    assert kwargs["ip_country"] == "NL"
+    assert kwargs["ip_prefix"] is None
+    assert probes == [get_area_probes("North-Central", 10)]
@@ -0,0 +1,156 @@
+from datetime import datetime, timezone, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from server.app.db.rollups import compute_bucket_stats, get_bucket_start, get_rollup_keys, compact_rollups, \
+    choose_history_resolution, get_rollups, get_missing_ids, LATE_COMMIT_WINDOW_S, MAX_MISSING_ID_GAP
+from server.app.dtos.full_ntp_measurement import NTPv4Measurement, NTPv4Rollup, NTPv4RollupState
+from server.app.models.Base import Base
+
+
+def unix_seconds(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def seconds_timestamps():
+    # SQLite cannot store the 64-bit NTP timestamps, so the tests use seconds
+    with patch("server.app.db.rollups.NTP_FRACTION_BITS", 0), \
+            patch("server.app.db.rollups.datetime_to_ntp_timestamp", unix_seconds), \
+            patch("server.app.db.db_interaction.datetime_to_ntp_timestamp", unix_seconds):
+        yield
+
+
+def add_measurement(db, client_sent_time: int, offset: float, rtt: float, stratum: int,
+                    ip: str = "83.25.24.10", host: str = "time.example.com", m_id=None) -> None:
+    db.add(NTPv4Measurement(id=m_id, host=host, measured_server_ip=ip, client_sent_time=client_sent_time,
+                            offset=offset, rtt=rtt, stratum=stratum))
+
+
+def test_get_bucket_start():
+    assert get_bucket_start(3959, 60) == 3900
+    assert get_bucket_start(3600, 3600) == 3600
+    assert get_bucket_start(86399, 86400) == 0
+
+
+def test_compute_bucket_stats():
+    stats = compute_bucket_stats([0.1, 0.3, None], [0.01, 0.02, 0.03], [2, 2, 3])
+    assert stats["count"] == 3
+    assert stats["offset_min"] == 0.1 and stats["offset_max"] == 0.3
+    assert stats["offset_mean"] == pytest.approx(0.2)
+    assert stats["offset_stddev"] == pytest.approx(0.1)
+    assert stats["rtt_p50"] == pytest.approx(0.02)
+    assert stats["rtt_p99"] == pytest.approx(0.0298)
+    assert (stats["stratum_min"], stats["stratum_max"], stats["stratum_changes"]) == (2, 3, 1)
+    # nothing known
+    stats = compute_bucket_stats([None], [None], [None])
+    assert stats == {"count": 1, "stratum_changes": 0}
+
+
+def test_get_rollup_keys():
+    m = NTPv4Measurement(host="time.example.com", measured_server_ip="83.25.24.10", client_sent_time=3661)
+    keys = get_rollup_keys([m, NTPv4Measurement(host=None, measured_server_ip="83.25.24.10", client_sent_time=None)])
+    assert len(keys) == 6
+    assert (60, "ip", "83.25.24.10", 3660) in keys
+    assert (3600, "host", "time.example.com", 3600) in keys
+    assert (86400, "ip", "83.25.24.10", 0) in keys
+
+
+def test_compact_rollups(session):
+    day = 86400 * 20000
+    for i, (offset, stratum) in enumerate([(0.1, 2), (0.3, 2), (0.2, 3)]):
+        add_measurement(session, day + 10 * i, offset, 0.01 * (i + 1), stratum)
+    add_measurement(session, day + 3600, 0.5, 0.05, 1, ip="83.25.24.11")
+    session.commit()
+
+    assert compact_rollups(session, 2) == 4
+    assert session.get(NTPv4RollupState, 1).last_m_id == 4
+    minute = session.query(NTPv4Rollup).filter_by(resolution_s=60, key_type="ip", server="83.25.24.10").one()
+    assert (minute.bucket_start, minute.count, minute.stratum_changes) == (day, 3, 1)
+    assert minute.offset_mean == pytest.approx(0.2)
+    daily = session.query(NTPv4Rollup).filter_by(resolution_s=86400, key_type="host").one()
+    assert daily.count == 4
+    assert daily.offset_max == 0.5
+
+    # the new measurements update their buckets, the other buckets are not touched
+    add_measurement(session, day + 30, 0.4, 0.04, 3)
+    session.commit()
+    assert compact_rollups(session, 100) == 1
+    minute = session.query(NTPv4Rollup).filter_by(resolution_s=60, key_type="ip", server="83.25.24.10").one()
+    assert minute.count == 4
+    assert session.query(NTPv4Rollup).filter_by(resolution_s=86400, key_type="host").one().count == 5
+    assert session.query(NTPv4Rollup).filter_by(server="83.25.24.11").count() == 3
+    assert compact_rollups(session, 100) == 0
+
+
+def test_get_missing_ids():
+    assert get_missing_ids(3, [4, 7, 8, 10]) == [5, 6, 9]
+    assert get_missing_ids(0, []) == []
+    # a jump of the sequence is not tracked
+    assert get_missing_ids(10, [11 + MAX_MISSING_ID_GAP + 1, 11 + MAX_MISSING_ID_GAP + 3]) == \
+        [11 + MAX_MISSING_ID_GAP + 2]
+
+
+def test_compact_rollups_late_commits(session):
+    day = 86400 * 20000
+    # the transaction of the measurement 2 is still in progress
+    add_measurement(session, day, 0.1, 0.01, 2, m_id=1)
+    add_measurement(session, day + 10, 0.3, 0.01, 2, m_id=3)
+    session.commit()
+    assert compact_rollups(session, 100, now=1000.0) == 2
+    state = session.get(NTPv4RollupState, 1)
+    assert (state.last_m_id, state.missing_m_ids) == (3, {"2": 1000.0})
+
+    # it commits after the compaction, with a lower ID than the position
+    add_measurement(session, day + 20, 0.5, 0.01, 2, m_id=2)
+    session.commit()
+    assert compact_rollups(session, 100, now=1060.0) == 1
+    minute = session.query(NTPv4Rollup).filter_by(resolution_s=60, key_type="ip", server="83.25.24.10").one()
+    assert minute.count == 3
+    assert minute.offset_max == 0.5
+    assert session.get(NTPv4RollupState, 1).missing_m_ids == {}
+
+    # a missing ID that never comes (rolled back) is forgotten after a while
+    add_measurement(session, day + 30, 0.2, 0.01, 2, m_id=5)
+    session.commit()
+    assert compact_rollups(session, 100, now=2000.0) == 1
+    assert session.get(NTPv4RollupState, 1).missing_m_ids == {"4": 2000.0}
+    assert compact_rollups(session, 100, now=2000.0 + LATE_COMMIT_WINDOW_S) == 0
+    assert session.get(NTPv4RollupState, 1).missing_m_ids == {}
+
+
+def test_choose_history_resolution_and_get_rollups(session):
+    end = datetime.now(timezone.utc).replace(microsecond=0)
+    for minutes in range(0, 600, 2):
+        add_measurement(session, unix_seconds(end - timedelta(minutes=minutes)), 0.001 * minutes, 0.01, 2)
+    session.commit()
+    compact_rollups(session, 1000)
+
+    start = end - timedelta(hours=10)
+    # few enough raw measurements
+    assert choose_history_resolution(session, "83.25.24.10", start, end, 300) == 0
+    # 600 minutes do not fit in 100 points, 10 hours do
+    assert choose_history_resolution(session, "time.example.com", start, end, 100) == 3600
+    assert choose_history_resolution(session, "83.25.24.10", start, end, 5) == 86400
+    assert choose_history_resolution(session, "83.25.24.10", end - timedelta(hours=1), end, 31) == 0
+
+    buckets = get_rollups(session, "83.25.24.10", start, end, 3600)
+    assert 10 <= len(buckets) <= 11
+    assert sum(b["count"] for b in buckets) == 300
+    assert [b["bucket_start"] for b in buckets] == sorted(b["bucket_start"] for b in buckets)
+    assert buckets[0]["resolution_s"] == 3600
+    assert get_rollups(session, "time.example.com", start, end, 3600) == buckets
+    assert get_rollups(session, "83.25.24.99", start, end, 3600) == []
@@ -0,0 +1,151 @@
+from ipaddress import IPv4Address
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, Session
+
+from server.app.db.db_interaction import insert_measurement, insert_measurements
+from server.app.db.server_stats import welford_add, welford_remove, update_server_stats, get_server_stats, \
+    calculate_jitter_from_server_stats, get_servers_stats, lock_or_create_servers_stats
+from server.app.dtos.NtpExtraDetails import NtpExtraDetails
+from server.app.dtos.NtpMainDetails import NtpMainDetails
+from server.app.dtos.NtpMeasurement import NtpMeasurement
+from server.app.dtos.NtpServerInfo import NtpServerInfo
+from server.app.dtos.NtpTimestamps import NtpTimestamps
+from server.app.dtos.PreciseTime import PreciseTime
+from server.app.dtos.ProbeData import ServerLocation
+from server.app.models.Base import Base
+from server.app.models.CustomError import DatabaseInsertError
+from server.app.services.NtpCalculator import NtpCalculator
+from server.app.utils.calculations import calculate_jitter_from_measurements
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def make_measurement(server_recv_fraction: int, rtt: float = 0.02, stratum: int = 2) -> NtpMeasurement:
+    return NtpMeasurement(
+        vantage_point_ip=IPv4Address("127.0.0.1"),
+        server_info=NtpServerInfo(ntp_version=4, ntp_server_ip=IPv4Address("192.168.0.1"),
+                                  ntp_server_name="pool.ntp.org", ntp_server_ref_parent_ip=None, ref_name="GPS",
+                                  ntp_server_location=ServerLocation(country_code="NL", coordinates=(52.0, 4.0))),
+        timestamps=NtpTimestamps(
+            client_sent_time=PreciseTime(3957337543, 0),
+            server_recv_time=PreciseTime(3957337543, server_recv_fraction),
+            server_sent_time=PreciseTime(3957337543, server_recv_fraction),
+            client_recv_time=PreciseTime(3957337543, 0)),
+        main_details=NtpMainDetails(offset=0.0, rtt=rtt, stratum=stratum, precision=-20.0, reachability=""),
+        extra_details=NtpExtraDetails(root_delay=PreciseTime(0, 0), ntp_last_sync_time=PreciseTime(0, 0),
+                                      root_dispersion=PreciseTime(0, 0), poll=5, leap=0))
+
+
+def test_welford_sliding_window():
+    values = [0.5, -1.25, 3.0, 0.125, 2.5, -0.75]
+    mean, m2 = 0.0, 0.0
+    for i, x in enumerate(values):
+        mean, m2 = welford_add(i, mean, m2, x)
+    assert mean == pytest.approx(np.mean(values))
+    assert m2 == pytest.approx(np.var(values) * len(values))
+
+    mean, m2 = welford_remove(len(values), mean, m2, values[0])
+    mean, m2 = welford_remove(len(values) - 1, mean, m2, values[1])
+    assert mean == pytest.approx(np.mean(values[2:]))
+    assert m2 == pytest.approx(np.var(values[2:]) * 4)
+    assert welford_remove(1, 3.0, 0.0, 3.0) == (0.0, 0.0)
+
+
+def test_calculate_jitter_from_window():
+    window = [0.1, 0.4, -0.2, 0.3]
+    m2 = float(np.var(window) * len(window))
+    assert NtpCalculator.calculate_jitter_from_window(0.05, len(window), float(np.mean(window)), m2) == \
+        pytest.approx(NtpCalculator.calculate_jitter([0.05] + window))
+    assert NtpCalculator.calculate_jitter_from_window(0.05, 0, 0.0, 0.0) == 0.0
+
+
+@patch("server.app.db.server_stats.get_nr_of_measurements_for_jitter", return_value=3)
+def test_update_server_stats(mock_window, session):
+    for offset, rtt, stratum in [(0.1, 0.03, 2), (0.2, 0.01, 2), (None, None, 3), (0.4, 0.02, 1), (0.8, 0.05, 1)]:
+        update_server_stats(session, "192.168.0.1", offset, rtt, stratum, "GPS", None)
+        session.commit()
+    stats = get_server_stats(session, "192.168.0.1")
+    assert stats.nr_measurements == 5
+    assert stats.window_offsets == [0.2, 0.4, 0.8]
+    assert stats.offset_mean == pytest.approx(np.mean([0.2, 0.4, 0.8]))
+    assert stats.offset_m2 == pytest.approx(np.var([0.2, 0.4, 0.8]) * 3)
+    assert stats.min_rtt == 0.01
+    assert (stats.last_stratum, stats.last_ref_name) == (1, "GPS")
+
+    assert calculate_jitter_from_server_stats(stats, 0.3, 3) == \
+        pytest.approx((NtpCalculator.calculate_jitter([0.3, 0.2, 0.4, 0.8]), 3))
+    assert calculate_jitter_from_server_stats(stats, 0.3, 2) == \
+        pytest.approx((NtpCalculator.calculate_jitter([0.3, 0.4, 0.8]), 2))
+    assert calculate_jitter_from_server_stats(stats, 0.3, 0) == (0.0, 0)
+
+    # a smaller window in the config shrinks it at the next update
+    mock_window.return_value = 1
+    update_server_stats(session, "192.168.0.1", 1.0, None, 1, None, None)
+    assert stats.window_offsets == [1.0]
+    assert stats.offset_m2 == pytest.approx(0.0)
+    update_server_stats(session, None, 1.0, 0.01, 1, None, None)
+    assert get_server_stats(session, None) is None
+
+
+def test_insert_measurements_updates_server_stats(session):
+    measurements = [make_measurement(2 ** 28, rtt=0.03, stratum=3), make_measurement(2 ** 29, rtt=0.01)]
+    insert_measurements(measurements, session)
+    stats = get_server_stats(session, "192.168.0.1")
+    assert stats.nr_measurements == 2
+    assert stats.window_offsets == [NtpCalculator.calculate_offset(m.timestamps) for m in measurements]
+    assert (stats.min_rtt, stats.last_stratum, stats.last_ref_name) == (0.01, 2, "GPS")
+
+
+def test_insert_measurements_rollback():
+    session = MagicMock(spec=Session)
+    session.commit.side_effect = Exception("connection lost")
+    with patch("server.app.db.db_interaction.lock_or_create_servers_stats", return_value={}):
+        with pytest.raises(DatabaseInsertError):
+            insert_measurement(make_measurement(2 ** 28), session)
+    session.rollback.assert_called_once()
+    # nothing to store
+    session = MagicMock(spec=Session)
+    insert_measurements([], session)
+    session.commit.assert_not_called()
+
+
+@patch("server.app.db.server_stats.get_nr_of_measurements_for_jitter", return_value=7)
+def test_lock_or_create_servers_stats(mock_window, session):
+    update_server_stats(session, "192.168.0.1", 0.1, 0.02, 2, None, None)
+    session.commit()
+    all_stats = lock_or_create_servers_stats(session, ["192.168.0.2", None, "192.168.0.1", "192.168.0.2"])
+    assert sorted(all_stats) == ["192.168.0.1", "192.168.0.2"]
+    assert all_stats["192.168.0.1"].window_offsets == [0.1]
+    assert all_stats["192.168.0.2"].nr_measurements == 0
+    session.commit()
+    assert sorted(get_servers_stats(session, ["192.168.0.1", "192.168.0.2", "192.168.0.3"])) == \
+        ["192.168.0.1", "192.168.0.2"]
+    assert get_servers_stats(session, [None]) == {}
+
+
+def test_calculate_jitter_from_measurements_with_server_stats(session):
+    measurements = [make_measurement(fraction) for fraction in (2 ** 28, 2 ** 29, 2 ** 27)]
+    for m in measurements:
+        update_server_stats(session, "192.168.0.1", NtpCalculator.calculate_offset(m.timestamps), 0.02, 2, None, None)
+    session.commit()
+
+    # the jitter is the same as with the last measurements read from the database
+    new_measurement = make_measurement(2 ** 30)
+    with_stats = calculate_jitter_from_measurements(session, new_measurement, 7)
+    with patch("server.app.utils.calculations.get_server_stats", return_value=None), \
+            patch("server.app.utils.calculations.get_measurements_for_jitter_ip", return_value=measurements):
+        from_rows = calculate_jitter_from_measurements(session, new_measurement, 7)
+    assert with_stats == pytest.approx(from_rows)
+    assert with_stats[1] == 3
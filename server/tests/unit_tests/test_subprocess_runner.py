@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from server.app.utils.metrics import get_metric_value
+from server.app.utils.subprocess_runner import run_subprocess, run_subprocess_async, get_max_concurrent_processes
+
+
+def is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_run_subprocess_output_and_metrics():
+    before = get_metric_value("subprocess_exits_total", {"tool": "test-exit", "exit_code": "3"}) or 0
+    result = run_subprocess([sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr); "
+                                                   "sys.exit(3)"], 5, name="test-exit")
+    assert result.returncode == 3
+    assert result.stdout.strip() == "out"
+    assert result.stderr.strip() == "err"
+    assert result.timed_out is False
+    assert get_metric_value("subprocess_exits_total", {"tool": "test-exit", "exit_code": "3"}) == before + 1
+
+
+def test_run_subprocess_missing_program(tmp_path):
+    with pytest.raises(OSError):
+        run_subprocess([str(tmp_path / "missing")], 5)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="it reads /proc")
+def test_run_subprocess_timeout_kills_process_group(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    script = (f"import subprocess, sys, time\n"
+              f"child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+              f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+              f"time.sleep(30)\n")
+    start = time.monotonic()
+    result = run_subprocess([sys.executable, "-c", script], 1, name="test-timeout")
+    assert time.monotonic() - start < 10
+    assert result.timed_out is True
+    assert result.returncode < 0
+    child_pid = int(pid_file.read_text())
+    for _ in range(50):
+        if not is_running(child_pid):
+            break
+        time.sleep(0.1)
+    assert not is_running(child_pid)
+    assert get_metric_value("subprocess_exits_total", {"tool": "test-timeout", "exit_code": "timeout"}) >= 1
+
+
+def test_run_subprocess_async_limits_concurrency():
+    limit = get_max_concurrent_processes()
+    script = "import time; print(time.monotonic()); time.sleep(0.3); print(time.monotonic())"
+
+    async def run_all():
+        return await asyncio.gather(*[run_subprocess_async([sys.executable, "-c", script], 10)
+                                      for _ in range(limit + 1)])
+
+    results = asyncio.run(run_all())
+    intervals = sorted(tuple(float(x) for x in r.stdout.split()) for r in results)
+    # never more processes at the same time than the limit
+    for start, _ in intervals:
+        running = sum(1 for s, e in intervals if s <= start < e)
+        assert running <= limit
+    assert os.cpu_count() is None or limit == os.cpu_count()
@@ -0,0 +1,56 @@
+from server.app.utils.metrics import reset_metrics, get_metric_value
+from server.app.utils.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_get_and_set():
+    reset_metrics()
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache("test", ttl_s=10, max_entries=5, clock=clock)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    clock.now += 4
+    assert cache.get_entry("a") == (4.0, 1)
+    assert get_metric_value("cache_hits_total", {"cache": "test"}) == 2
+    assert get_metric_value("cache_misses_total", {"cache": "test"}) == 1
+
+
+def test_ttl_cache_expiration():
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache("test", ttl_s=10, max_entries=5, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_s=30)
+    clock.now += 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache: TTLCache[str, int] = TTLCache("test", ttl_s=10, max_entries=2, clock=FakeClock())
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_invalidate():
+    cache: TTLCache[str, int] = TTLCache("test", ttl_s=10, max_entries=5, clock=FakeClock())
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    cache.invalidate()
+    assert len(cache) == 0